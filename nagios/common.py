@@ -13,12 +13,11 @@
 # Standard modules
 import os
 import logging
-import pprint
 
 __author__ = 'Frank Brehm <frank.brehm@profitbricks.com>'
 __copyright__ = '© 2010 - 2015 by profitbricks.com'
 __contact__ = 'frank.brehm@profitbricks.com'
-__version__ = '0.1.2'
+__version__ = '0.2.0'
 __license__ = 'GPL3'
 
 log = logging.getLogger(__name__)
@@ -37,6 +36,8 @@ def pp(value):
     @rtype: str
     """
 
+    import pprint
+
     pretty_printer = pprint.PrettyPrinter(indent=4)
     return pretty_printer.pformat(value)
 
@@ -107,6 +108,27 @@ def caller_search_path(prepend=None, append=None):
 
     return path_list
 
+
+# =============================================================================
+def debian_version(version):
+    """
+    Returns a comparable Debian version object of the given version string.
+
+    The module debian.debian_support is imported on the first call,
+    so plugins are only loading it, if a version compare is needed.
+
+    @param version: the version string to parse
+    @type version: str
+
+    @return: the parsed version
+    @rtype: debian.debian_support.Version
+
+    """
+
+    import debian.debian_support
+
+    return debian.debian_support.Version(version)
+
 # =============================================================================
 
 if __name__ == "__main__":
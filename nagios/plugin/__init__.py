@@ -13,8 +13,6 @@ import sys
 import logging
 import signal
 import errno
-import traceback
-import datetime
 
 from numbers import Number
 
@@ -37,10 +35,12 @@ from nagios.plugin.threshold import NagiosThreshold
 
 from nagios.plugin.performance import NagiosPerformance
 
+from nagios.plugin.timing import Timings
+
 # --------------------------------------------
 # Some module variables
 
-__version__ = '0.5.1'
+__version__ = '0.6.1'
 
 log = logging.getLogger(__name__)
 
@@ -180,6 +180,12 @@ class NagiosPlugin(object):
 
         self.threshold = None
 
+        self.timings = Timings()
+        """
+        @ivar: the timed spans of the current run of the plugin
+        @type: Timings
+        """
+
     # -----------------------------------------------------------
     @property
     def shortname(self):
@@ -320,7 +326,8 @@ class NagiosPlugin(object):
 
         if self.argparser:
             log.debug("Parsing commandline arguments: %r", args)
-            self.argparser.parse_args(args)
+            with self.timings.span('argparse'):
+                self.argparser.parse_args(args)
         else:
             log.warn("Called parse_args() without a valid NagiosPluginArgparse object.")
 
@@ -415,28 +422,55 @@ class NagiosPlugin(object):
 
         return self.threshold.get_status(value)
 
+    # ------------------------------------------------------------------------
+    def report_timings(self):
+        """
+        Appends the summed up durations of the timed spans as performance
+        data and dumps the spans as JSON, if it was requested by the
+        options --timings and --timings-json. It is called before exiting.
+        """
+
+        if not self.argparser:
+            return
+
+        if getattr(self.argparser.args, 'timings', False):
+            for (name, count, duration) in self.timings.totals():
+                self.add_perfdata(
+                    label=('time_' + name), value=round(duration * 1000.0, 3), uom='ms')
+
+        filename = getattr(self.argparser.args, 'timings_json', None)
+        if filename:
+            try:
+                self.timings.dump(filename, plugin=self.shortname)
+            except (IOError, OSError) as e:
+                log.warning("Could not write the timings to %r: %s", filename, e)
+
     # ------------------------------------------------------------------------
     def nagios_exit(self, code, message):
         """Wrapper method for nagios.plugin.functions.nagios_exit()."""
 
+        self.report_timings()
         return nagios.plugin.functions.nagios_exit(code, message, self)
 
     # ------------------------------------------------------------------------
     def nagios_die(self, message):
         """Wrapper method for nagios.plugin.functions.nagios_die()."""
 
+        self.report_timings()
         return nagios.plugin.functions.nagios_die(message, self)
 
     # ------------------------------------------------------------------------
     def exit(self, code, message):
         """Wrapper method for nagios.plugin.functions.nagios_exit()."""
 
+        self.report_timings()
         return nagios.plugin.functions.nagios_exit(code, message, self)
 
     # ------------------------------------------------------------------------
     def die(self, message):
         """Wrapper method for nagios.plugin.functions.nagios_die()."""
 
+        self.report_timings()
         return nagios.plugin.functions.nagios_die(message, self)
 
     # -------------------------------------------------------------------------
@@ -592,10 +626,11 @@ class NagiosPlugin(object):
         signal.alarm(timeout)
 
         content = ''
-        fh = open(filename, 'r')
-        for line in fh.readlines():
-            content += line
-        fh.close()
+        with self.timings.span('read_file'):
+            fh = open(filename, 'r')
+            for line in fh.readlines():
+                content += line
+            fh.close()
 
         signal.alarm(0)
 
@@ -635,11 +670,14 @@ class NagiosPlugin(object):
         if root_log.handlers:
             has_handlers = True
 
+        import traceback
+
         if has_handlers:
             log.error(msg)
             if do_traceback:
                 log.error(traceback.format_exc())
         else:
+            import datetime
             curdate = datetime.datetime.now()
             curdate_str = "[" + curdate.isoformat(' ') + "]: "
             msg = curdate_str + msg + "\n"
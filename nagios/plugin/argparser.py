@@ -12,10 +12,11 @@
 import os
 import sys
 import logging
-import pprint
 import textwrap
 import re
 
+from functools import partial
+
 import argparse
 
 from argparse import Namespace
@@ -27,15 +28,17 @@ from argparse import Namespace
 import nagios
 from nagios import BaseNagiosError
 
+from nagios.common import pp
+
 from nagios.plugin.functions import nagios_die, nagios_exit
 
 from nagios.plugin.config import NoConfigfileFound
-from nagios.plugin.config import NagiosPluginConfig
+from nagios.plugin.config import get_config_section
 
 # --------------------------------------------
 # Some module variables
 
-__version__ = '0.5.4'
+__version__ = '0.7.0'
 
 log = logging.getLogger(__name__)
 
@@ -49,6 +52,57 @@ http://www.gnu.org/licenses/lgpl).
 default_timeout = 15
 default_verbose = 0
 
+# the parsers already built by their definitions, see
+# NagiosPluginArgparse.get_parser()
+_parser_cache = {}
+max_cached_parsers = 64
+
+
+# =============================================================================
+def clear_parser_cache():
+    """Removes all cached argument parsers."""
+
+    _parser_cache.clear()
+
+
+# =============================================================================
+def render_help_texts(blurb, version_str, extra, licence):
+    """
+    Renders the description and the epilog of the --help output, wrapped
+    to the width of the terminal.
+
+    @return: the description and the epilog
+    @rtype: tuple of str
+
+    """
+
+    width = 0
+    try:
+        width = int(os.environ['COLUMNS'])
+    except (KeyError, ValueError):
+        width = 80
+    width -= 2
+
+    wrapper = textwrap.TextWrapper(
+        width=width,
+        replace_whitespace=False,
+        fix_sentence_endings=False,
+        break_long_words=False,
+    )
+    re_ws = re.compile(r'\s+')
+
+    desc = None
+    if blurb:
+        desc = wrapper.fill(re_ws.sub(' ', blurb))
+
+    epilog = version_str + "\n\n"
+    if extra:
+        epilog += extra.strip() + "\n\n"
+    if licence:
+        epilog += wrapper.fill(re_ws.sub(' ', licence))
+
+    return (desc, epilog)
+
 
 # =============================================================================
 class NagiosPluginArgparseError(BaseNagiosError):
@@ -112,9 +166,34 @@ class NpHelpAction(NagiosPluginArgparseAction):
 class NpArgParser(argparse.ArgumentParser):
     """
     Wrapper class to argparse.ArgumentParser to modify the error() and
-    the exit() method.
+    the exit() method and to render the description and the epilog
+    not before they are needed for the --help output.
     """
 
+    # -------------------------------------------------------------------------
+    def __init__(self, *args, **kwargs):
+        """
+        Constructor, takes the same arguments as argparse.ArgumentParser
+        and additionally:
+
+        @param help_texts: a callable giving back the description and the
+                           epilog, called on the first output of the help
+        @type help_texts: callable or None
+
+        """
+
+        self._help_texts = kwargs.pop('help_texts', None)
+        super(NpArgParser, self).__init__(*args, **kwargs)
+
+    # -------------------------------------------------------------------------
+    def format_help(self):
+        """Renders the complete help text."""
+
+        if self._help_texts:
+            (self.description, self.epilog) = self._help_texts()
+            self._help_texts = None
+        return super(NpArgParser, self).format_help()
+
     # -------------------------------------------------------------------------
     def error(self, message):
         """
@@ -422,8 +501,7 @@ class NagiosPluginArgparse(object):
 
         """
 
-        pretty_printer = pprint.PrettyPrinter(indent=4)
-        return pretty_printer.pformat(self.as_dict())
+        return pp(self.as_dict())
 
     # -------------------------------------------------------------------------
     def _get_version_str(self):
@@ -467,40 +545,7 @@ class NagiosPluginArgparse(object):
 
         """
 
-        width = 0
-        try:
-            width = int(os.environ['COLUMNS'])
-        except (KeyError, ValueError):
-            width = 80
-        width -= 2
-
-        wrapper = textwrap.TextWrapper(
-            width=width,
-            replace_whitespace=False,
-            fix_sentence_endings=False,
-            break_long_words=False,
-        )
-        re_ws = re.compile(r'\s+')
-
-        desc = wrapper.fill(re_ws.sub(' ', self.blurb))
-
-        epilog = self._get_version_str() + "\n\n"
-        if self.extra:
-            epilog += self.extra.strip() + "\n\n"
-        if self.licence:
-            epilog += wrapper.fill(re_ws.sub(' ', self.licence))
-
-        parser = NpArgParser(
-            prog=self.plugin,
-            usage=self.usage,
-            description=desc,
-            epilog=epilog,
-            add_help=False,
-            formatter_class=argparse.RawDescriptionHelpFormatter,
-        )
-
-        self._add_plugin_args(parser)
-        self._add_std_args(parser)
+        parser = self.get_parser()
 
         # log.debug("NpArgParser object: %r", parser)
 
@@ -535,6 +580,58 @@ class NagiosPluginArgparse(object):
 
         self._has_parsed = True
 
+    # -------------------------------------------------------------------------
+    def _parser_key(self):
+        """
+        Gives back a key identifying the definition of the parser, equal for
+        all instances of the same plugin class.
+        """
+
+        arguments = []
+        for arg in self.arguments:
+            arguments.append((arg['names'], sorted(arg['kwargs'].items())))
+
+        return (
+            self.plugin, self.usage, self.version, self.url, self.blurb,
+            self.licence, self.extra, self.timeout, repr(arguments))
+
+    # -------------------------------------------------------------------------
+    def get_parser(self):
+        """
+        Gives back the argument parser with all standard and plugin arguments.
+        It is built on the first call and cached for all further instances
+        with the same definition, the help texts are rendered not before
+        they are needed.
+
+        @return: the argument parser
+        @rtype: NpArgParser
+
+        """
+
+        key = self._parser_key()
+        parser = _parser_cache.get(key)
+        if parser is not None:
+            return parser
+
+        parser = NpArgParser(
+            prog=self.plugin,
+            usage=self.usage,
+            add_help=False,
+            formatter_class=argparse.RawDescriptionHelpFormatter,
+            help_texts=partial(
+                render_help_texts, self.blurb, self._get_version_str(),
+                self.extra, self.licence),
+        )
+
+        self._add_plugin_args(parser)
+        self._add_std_args(parser)
+
+        if len(_parser_cache) >= max_cached_parsers:
+            _parser_cache.clear()
+        _parser_cache[key] = parser
+
+        return parser
+
     # -------------------------------------------------------------------------
     def _process_extra_opts(self, args, extra_opts):
         """
@@ -630,33 +727,11 @@ class NagiosPluginArgparse(object):
         # log.debug(
         #     "Trying to load extra options from section %r of file %r.", section, cfg_file)
 
-        cfg = NagiosPluginConfig()
-        configs = []
         try:
-            configs = cfg.read(cfg_file)
+            return get_config_section(section, cfg_file)
         except NoConfigfileFound:
             return {}
 
-        configs_str = str(configs)
-        if len(configs):
-            configs_str = ', '.join(["'" + x + "'" for x in configs])
-        else:
-            configs_str = '<None>'
-
-        if section not in cfg.sections():
-            if False:
-                log.debug(
-                    "Section %r not found in ini-files %s.", section, configs_str)
-            return {}
-
-        ini_opts = {}
-        for option in cfg.options(section):
-
-            val = cfg.get(section, option)
-            ini_opts[option] = val
-
-        return ini_opts
-
     # -------------------------------------------------------------------------
     def add_arg(self, *names, **kwargs):
         """
@@ -783,6 +858,20 @@ class NagiosPluginArgparse(object):
             help=('Show details for command-line debugging (can repeat up to 3 times)'),
         )
 
+        std_group.add_argument(
+            '--timings',
+            action='store_true',
+            dest='timings',
+            help='Append the durations of the timed spans of the check as performance data',
+        )
+
+        std_group.add_argument(
+            '--timings-json',
+            dest='timings_json',
+            metavar='FILE',
+            help="Append the timed spans of the check as JSON to FILE, '-' for STDERR",
+        )
+
 # =============================================================================
 
 if __name__ == "__main__":
@@ -4,13 +4,15 @@
 @author: Frank Brehm
 @contact: frank.brehm@profitbricks.com
 @copyright: © 2010 - 2015 by Frank Brehm, Berlin
-@summary: Module for a NagiosPluginConfig class
+@summary: Module for a NagiosPluginConfig class and a process wide cache
+          of the parsed configuration files
 """
 
 # Standard modules
 import os
 import sys
 import logging
+import threading
 
 try:
     import configparser as cfgparser
@@ -23,10 +25,12 @@ except ImportError:
 
 from nagios import BaseNagiosError
 
+from nagios.plugin.timing import monotonic
+
 # --------------------------------------------
 # Some module variables
 
-__version__ = '0.3.1'
+__version__ = '0.4.1'
 
 cfgfile_basenames = ('plugins.ini', 'nagios-plugins.ini')
 nagios_cfgdirs = (
@@ -41,8 +45,22 @@ general_cfgdirs = (
     '/etc/opt',
 )
 
+# the time in seconds, after which the standard locations are searched
+# again for a configuration file
+search_cache_time = 60.0
+
 log = logging.getLogger(__name__)
 
+_cache_lock = threading.Lock()
+
+# the found default configuration file by the value of $NAGIOS_CONFIG_PATH
+# as tuples of the time of the search and the filename
+_search_cache = {}
+
+# the parsed configurations by the resolved filenames as tuples of the
+# signatures of the files and the NagiosPluginConfig object
+_config_cache = {}
+
 
 # =============================================================================
 class NoConfigfileFound(BaseNagiosError):
@@ -59,6 +77,152 @@ class NoConfigfileFound(BaseNagiosError):
             "found on standard locations.")
 
 
+# =============================================================================
+def _search_config_file(config_path=None):
+
+    if config_path:
+        for path in config_path.split(':'):
+            for bname in cfgfile_basenames:
+                fname = os.path.join(path, bname)
+                log.debug("Searching for config in %r ...", fname)
+                if os.path.isfile(fname):
+                    return fname
+
+    for path in nagios_cfgdirs:
+        fname = os.path.join(path, cfgfile_basenames[0])
+        log.debug("Searching for config in %r ...", fname)
+        if os.path.isfile(fname):
+            return fname
+
+    for path in general_cfgdirs:
+        fname = os.path.join(path, cfgfile_basenames[1])
+        log.debug("Searching for config in %r ...", fname)
+        if os.path.isfile(fname):
+            return fname
+
+    return None
+
+
+# =============================================================================
+def search_config_file():
+    """
+    Searches for the default configuration file in the directories of
+    $NAGIOS_CONFIG_PATH and on the standard locations. The result is cached
+    for search_cache_time seconds.
+
+    @return: the filename of the found configuration file or None
+    @rtype: str or None
+
+    """
+
+    config_path = os.environ.get('NAGIOS_CONFIG_PATH')
+    now = monotonic()
+    with _cache_lock:
+        cached = _search_cache.get(config_path)
+    if cached is not None and now - cached[0] < search_cache_time:
+        if cached[1] is None or os.path.isfile(cached[1]):
+            return cached[1]
+
+    fname = _search_config_file(config_path)
+    with _cache_lock:
+        _search_cache[config_path] = (now, fname)
+    return fname
+
+
+# =============================================================================
+def _file_signature(filename):
+
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+    return (st.st_dev, st.st_ino, st.st_size, st.st_mtime, st.st_ctime)
+
+
+# =============================================================================
+def get_config(filenames=None):
+    """
+    Gives back the parsed configuration out of the given files or out of the
+    default configuration file. Every configuration is parsed only once per
+    process and again only after a change of one of its files.
+
+    The returned object is shared by all callers and must not be changed.
+
+    @raise NoConfigfileFound: if no filenames are given and no default
+                              configuration file was found
+
+    @param filenames: the configuration files to read
+    @type filenames: str or list of str or None
+
+    @return: the parsed configuration with the list of the really read
+             files in its attribute files_read
+    @rtype: NagiosPluginConfig
+
+    """
+
+    if isinstance(filenames, str):
+        filenames = [filenames]
+    elif not filenames:
+        fname = search_config_file()
+        if fname is None:
+            raise NoConfigfileFound('')
+        filenames = [fname]
+
+    key = tuple(os.path.realpath(x) for x in filenames)
+    signature = tuple(_file_signature(x) for x in key)
+    with _cache_lock:
+        cached = _config_cache.get(key)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+
+    cfg = NagiosPluginConfig()
+    cfg.files_read = cfg.read(list(filenames))
+    with _cache_lock:
+        _config_cache[key] = (signature, cfg)
+
+    return cfg
+
+
+# =============================================================================
+def get_config_section(section, filenames=None):
+    """
+    Gives back the options of a section of a configuration, see get_config().
+
+    @raise NoConfigfileFound: if no filenames are given and no default
+                              configuration file was found
+
+    @param section: the name of the section
+    @type section: str
+    @param filenames: the configuration files to read
+    @type filenames: str or list of str or None
+
+    @return: the options of the section, an empty dict, if the section
+             doesn't exists
+    @rtype: dict
+
+    """
+
+    cfg = get_config(filenames)
+    options = cfg.section_cache.get(section)
+    if options is None:
+        options = {}
+        if cfg.has_section(section):
+            for option in cfg.options(section):
+                options[option] = cfg.get(section, option)
+        cfg.section_cache[section] = options
+
+    return dict(options)
+
+
+# =============================================================================
+def clear_config_cache():
+    """Removes all cached configurations and search results."""
+
+    with _cache_lock:
+        _search_cache.clear()
+        _config_cache.clear()
+
+
 # =============================================================================
 class NagiosPluginConfig(cfgparser.ConfigParser, object):
     """
@@ -92,6 +256,19 @@ class NagiosPluginConfig(cfgparser.ConfigParser, object):
 
         log.debug("Keyword arguments for __init__(): %r", kwords)
 
+        self.files_read = []
+        """
+        @ivar: the configuration files really read by get_config()
+        @type: list of str
+        """
+
+        self.section_cache = {}
+        """
+        @ivar: the options of the sections already requested by
+               get_config_section()
+        @type: dict
+        """
+
         # Note: ConfigParser is an old-style class!! super() doesn't work.
         return cfgparser.ConfigParser.__init__(self, **kwords)
 
@@ -109,47 +286,10 @@ class NagiosPluginConfig(cfgparser.ConfigParser, object):
             filenames = []
 
         if not len(filenames):
-
-            found = False
-
-            if 'NAGIOS_CONFIG_PATH' in os.environ:
-                paths = os.environ['NAGIOS_CONFIG_PATH']
-                for path in paths.split(':'):
-                    for bname in cfgfile_basenames:
-                        fname = os.path.join(path, bname)
-                        log.debug("Searching for config in %r ...", fname)
-                        if os.path.isfile(fname):
-                            filenames.insert(0, fname)
-                            found = True
-                        if found:
-                            break
-                    if found:
-                        break
-
-            if not found:
-                for path in nagios_cfgdirs:
-                    bname = cfgfile_basenames[0]
-                    fname = os.path.join(path, bname)
-                    log.debug("Searching for config in %r ...", fname)
-                    if os.path.isfile(fname):
-                        filenames.insert(0, fname)
-                        found = True
-                    if found:
-                        break
-
-            if not found:
-                for path in general_cfgdirs:
-                    bname = cfgfile_basenames[1]
-                    fname = os.path.join(path, bname)
-                    log.debug("Searching for config in %r ...", fname)
-                    if os.path.isfile(fname):
-                        filenames.insert(0, fname)
-                        found = True
-                    if found:
-                        break
-
-            if not found:
+            fname = search_config_file()
+            if fname is None:
                 raise NoConfigfileFound('')
+            filenames.insert(0, fname)
 
         log.debug("Using config files: %r", filenames)
         # Note: ConfigParser is an old-style class!! super() doesn't work.
@@ -11,7 +11,6 @@
 import os
 import sys
 import logging
-import subprocess
 import signal
 
 # Third party modules
@@ -29,10 +28,12 @@ from nagios.plugin import NagiosPlugin
 
 from nagios.plugin.argparser import lgpl3_licence_text, default_timeout
 
+from nagios.plugin.logguard import refresh_log_guards
+
 # --------------------------------------------
 # Some module variables
 
-__version__ = '0.3.1'
+__version__ = '0.5.0'
 
 log = logging.getLogger(__name__)
 
@@ -372,6 +373,8 @@ class ExtNagiosPlugin(NagiosPlugin):
 
         """
 
+        import subprocess
+
         cmd_list = cmd
         if isinstance(cmd, str):
             cmd_list = [cmd]
@@ -415,20 +418,23 @@ class ExtNagiosPlugin(NagiosPlugin):
         signal.signal(signal.SIGALRM, exec_alarm_caller)
         signal.alarm(timeout)
 
+        span_name = 'exec:' + os.path.basename(cmd_list[0].split(' ')[0])
+
         # And execute it ...
         try:
-            cmd_obj = subprocess.Popen(
-                cmd_list,
-                shell=use_shell,
-                close_fds=close_fds,
-                stderr=used_stderr,
-                stdout=used_stdout,
-                bufsize=bufsize,
-                **kwargs
-            )
-
-            (stdoutdata, stderrdata) = cmd_obj.communicate()
-            ret = cmd_obj.wait()
+            with self.timings.span(span_name):
+                cmd_obj = subprocess.Popen(
+                    cmd_list,
+                    shell=use_shell,
+                    close_fds=close_fds,
+                    stderr=used_stderr,
+                    stdout=used_stdout,
+                    bufsize=bufsize,
+                    **kwargs
+                )
+
+                (stdoutdata, stderrdata) = cmd_obj.communicate()
+                ret = cmd_obj.wait()
 
         except ExecutionTimeoutError as e:
             self.die(str(e))
@@ -510,6 +516,8 @@ class ExtNagiosPlugin(NagiosPlugin):
 
         root_log.addHandler(lh_console)
 
+        refresh_log_guards()
+
 # =============================================================================
 
 if __name__ == "__main__":
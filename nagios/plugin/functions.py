@@ -19,9 +19,8 @@ import re
 import nagios
 
 from nagios import FakeExitError
-import collections
 
-__version__ = '0.3.0'
+__version__ = '0.3.1'
 
 # --------------------------------------------
 # Some module variables
@@ -86,8 +85,8 @@ def max_state(*args):
         return nagios.state.ok
     if nagios.state.unknown in args:
         return nagios.state.unknown
-    if nagios.state.dependend in args:
-        return nagios.state.dependend
+    if nagios.state.dependent in args:
+        return nagios.state.dependent
 
     return nagios.state.unknown
 
@@ -101,8 +100,8 @@ def max_state_alt(*args):
         return nagios.state.warning
     if nagios.state.unknown in args:
         return nagios.state.unknown
-    if nagios.state.dependend in args:
-        return nagios.state.dependend
+    if nagios.state.dependent in args:
+        return nagios.state.dependent
     if nagios.state.ok in args:
         return nagios.state.ok
 
@@ -148,7 +147,7 @@ def nagios_exit(code, message, plugin_object=None, no_status_line=False):
             perfdata = getattr(plugin_object, 'perfdata', None)
             if perfdata and hasattr(plugin_object, 'all_perfoutput'):
                 all_perfoutput = getattr(plugin_object, 'all_perfoutput')
-                if isinstance(all_perfoutput, collections.Callable):
+                if callable(all_perfoutput):
                     output += ' | ' + all_perfoutput()
 
     if _fake_exit:
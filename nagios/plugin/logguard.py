@@ -0,0 +1,180 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+@author: Frank Brehm
+@contact: frank.brehm@profitbricks.com
+@copyright: © 2010 - 2016 by Frank Brehm, Berlin
+@summary: Module for cached guards of the log levels of loggers and for
+          deferred formatting of log messages in often passed code
+"""
+
+# Standard modules
+import logging
+
+# Third party modules
+
+# Own modules
+
+from nagios.common import pp
+
+# --------------------------------------------
+# Some module variables
+
+__version__ = '0.1.0'
+
+log = logging.getLogger(__name__)
+
+# All created log guards, they are refreshed together after changing
+# the configuration of the logging
+_log_guards = []
+
+
+# =============================================================================
+def refresh_log_guards():
+    """
+    Evaluates again the enabled log levels of all created log guards.
+    It has to be called after changing the log levels of the loggers
+    or the handlers, e.g. after initializing the root logger.
+    """
+
+    for guard in _log_guards:
+        guard.refresh()
+
+
+# =============================================================================
+class LogGuard(object):
+    """
+    Cached checks, whether the log levels DEBUG and INFO of a logger are
+    enabled. They are evaluated once on creation and by refresh(), so
+    a disabled log call in a loop costs only a test of an attribute, e.g.::
+
+        log_guard = LogGuard(log)
+        ...
+        if log_guard.debug:
+            log.debug("Found %r.", item)
+
+    """
+
+    __slots__ = ('logger', 'debug', 'info')
+
+    # -------------------------------------------------------------------------
+    def __init__(self, logger):
+        """
+        Constructor.
+
+        @param logger: the logger or the name of the logger to guard
+        @type logger: logging.Logger or str
+
+        """
+
+        if not isinstance(logger, logging.Logger):
+            logger = logging.getLogger(logger)
+
+        self.logger = logger
+        """
+        @ivar: the guarded logger
+        @type: logging.Logger
+        """
+
+        self.debug = False
+        """
+        @ivar: the level DEBUG is enabled for the logger
+        @type: bool
+        """
+
+        self.info = False
+        """
+        @ivar: the level INFO is enabled for the logger
+        @type: bool
+        """
+
+        self.refresh()
+        _log_guards.append(self)
+
+    # -------------------------------------------------------------------------
+    def refresh(self):
+        """Evaluates again the enabled log levels of the logger."""
+
+        self.debug = self.logger.isEnabledFor(logging.DEBUG)
+        self.info = self.logger.isEnabledFor(logging.INFO)
+
+    # -------------------------------------------------------------------------
+    def verbose_debug(self, verbose, level):
+        """
+        Gives back, whether debug messages should be logged for the given
+        verbosity level of a plugin, which shows them only above the given
+        level. The result should be taken once before a loop.
+
+        @param verbose: the verbosity level of the plugin
+        @type verbose: int
+        @param level: the level, above them the messages are shown
+        @type level: int
+
+        @return: the messages should be logged
+        @rtype: bool
+
+        """
+
+        return self.debug and verbose > level
+
+    # -------------------------------------------------------------------------
+    def __repr__(self):
+
+        return "%s(%r)" % (self.__class__.__name__, self.logger.name)
+
+
+# =============================================================================
+class LazyPP(object):
+    """
+    A pretty print string of a value, which is evaluated only, if the
+    log message containing it is really formatted, e.g.::
+
+        log.debug("Current object:\\n%s", LazyPP(self.as_dict()))
+
+    """
+
+    __slots__ = ('value',)
+
+    # -------------------------------------------------------------------------
+    def __init__(self, value):
+
+        self.value = value
+
+    # -------------------------------------------------------------------------
+    def __str__(self):
+
+        return pp(self.value)
+
+
+# =============================================================================
+class LazyStr(object):
+    """
+    The string of the result of a function call, which is evaluated only,
+    if the log message containing it is really formatted, e.g.::
+
+        log.debug("Found processes:\\n%s", LazyStr(format_processes, procs))
+
+    """
+
+    __slots__ = ('func', 'args')
+
+    # -------------------------------------------------------------------------
+    def __init__(self, func, *args):
+
+        self.func = func
+        self.args = args
+
+    # -------------------------------------------------------------------------
+    def __str__(self):
+
+        return str(self.func(*self.args))
+
+# =============================================================================
+
+if __name__ == "__main__":
+
+    pass
+
+# =============================================================================
+
+# vim: fileencoding=utf-8 filetype=python ts=4 expandtab shiftwidth=4 softtabstop=4
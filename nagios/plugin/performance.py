@@ -19,6 +19,8 @@ from numbers import Number
 
 from nagios import BaseNagiosError
 
+from nagios.plugin.logguard import LogGuard
+
 from nagios.plugin.range import NagiosRange
 
 from nagios.plugin.threshold import NagiosThreshold
@@ -26,9 +28,10 @@ from nagios.plugin.threshold import NagiosThreshold
 # --------------------------------------------
 # Some module variables
 
-__version__ = '0.1.1'
+__version__ = '0.1.2'
 
 log = logging.getLogger(__name__)
+log_guard = LogGuard(log)
 
 # Some regular expressions ...
 re_ws = re.compile(r'\s')
@@ -335,13 +338,15 @@ class NagiosPerformance(object):
     @classmethod
     def _parse(cls, string):
 
-        log.debug("Parsing string %r for performance data", string)
+        if log_guard.debug:
+            log.debug("Parsing string %r for performance data", string)
         match = re_perfstring.search(string)
         if not match:
             log.warn("String %r was not a valid performance output.", string)
             return None
 
-        log.debug("Found parsed performance output: %r", match.groups())
+        if log_guard.debug:
+            log.debug("Found parsed performance output: %r", match.groups())
 
         if match.group(1) is None or match.group(1) == '':
             log.warn(
@@ -373,7 +378,8 @@ class NagiosPerformance(object):
             info.append(val)
             i += 1
 
-        log.debug("Found parfdata fields: %r", info)
+        if log_guard.debug:
+            log.debug("Found parfdata fields: %r", info)
 
         obj = cls(
             label=info[0], value=info[1], uom=info[2], warning=info[3],
@@ -436,7 +442,8 @@ class NagiosPerformance(object):
             if obj:
                 perfs.append(obj)
 
-        log.debug("Found performance data: %r", perfs)
+        if log_guard.debug:
+            log.debug("Found performance data: %r", perfs)
         return perfs
 
 
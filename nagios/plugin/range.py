@@ -19,12 +19,15 @@ from numbers import Number
 
 from nagios import BaseNagiosError
 
+from nagios.plugin.logguard import LogGuard
+
 # --------------------------------------------
 # Some module variables
 
-__version__ = '0.2.3'
+__version__ = '0.2.4'
 
 log = logging.getLogger(__name__)
+log_guard = LogGuard(log)
 
 match_num_val = r'[+-]?\d+(?:\.\d*)?'
 match_range = r'^(\@)?(?:(' + match_num_val + r'|~)?:)?(' + match_num_val + r')?$'
@@ -303,7 +306,8 @@ class NagiosRange(object):
 
         # strip out any whitespace
         rstr = re_ws.sub('', range_str)
-        log.debug("Parsing given range %r ...", rstr)
+        if log_guard.debug:
+            log.debug("Parsing given range %r ...", rstr)
 
         self._start = None
         self._end = None
@@ -314,12 +318,14 @@ class NagiosRange(object):
         if not match:
             raise InvalidRangeError(range_str)
 
-        log.debug("Parsing range with regex %r ...", match_range)
+        if log_guard.debug:
+            log.debug("Parsing range with regex %r ...", match_range)
         match = re_range.search(rstr)
         if not match:
             raise InvalidRangeError(range_str)
 
-        log.debug("Found range parts: %r.", match.groups())
+        if log_guard.debug:
+            log.debug("Found range parts: %r.", match.groups())
         invert = match.group(1)
         start = match.group(2)
         end = match.group(3)
@@ -344,7 +350,7 @@ class NagiosRange(object):
                     start = int(start)
                 valid = True
 
-        if start is None:
+        if start is None and log_guard.debug:
             if start_should_infinity:
                 log.debug("The start is None, but should be infinity.")
             else:
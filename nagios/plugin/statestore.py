@@ -0,0 +1,441 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+@author: Frank Brehm
+@contact: frank.brehm@profitbricks.com
+@copyright: © 2010 - 2016 by Frank Brehm, Berlin
+@summary: Module for the StateStore class, a local store of samples of
+          counters between the runs of a plugin for evaluating their rates
+"""
+
+# Standard modules
+import os
+import errno
+import fcntl
+import struct
+import logging
+import tempfile
+import binascii
+import time
+
+from collections import namedtuple
+
+# Third party modules
+
+# Own modules
+
+from nagios.plugin import NagiosPluginError
+
+from nagios.plugin.timing import monotonic
+
+# --------------------------------------------
+# Some module variables
+
+__version__ = '0.1.2'
+
+log = logging.getLogger(__name__)
+
+DEFAULT_STATE_DIR = '/var/lib/nagios'
+
+BOOT_ID_FILE = '/proc/sys/kernel/random/boot_id'
+
+STATE_MAGIC = b'NPSS'
+STATE_VERSION = 1
+
+# magic, version, number of counter names, boot ID, time of saving
+HEADER = struct.Struct('!4sBxH16sd')
+NAME_LEN = struct.Struct('!B')
+COUNT = struct.Struct('!I')
+KEY_LEN = struct.Struct('!H')
+# timestamp, number of counters
+RECORD = struct.Struct('!dH')
+# index of the counter name, value
+COUNTER = struct.Struct('!HQ')
+
+MAX_COUNTER = (1 << 64) - 1
+
+
+# =============================================================================
+def get_boot_id():
+    """
+    Gives back the ID of the current boot of the system.
+
+    @return: the boot ID as 16 bytes, zeroes, if it is unknown
+    @rtype: bytes
+
+    """
+
+    try:
+        with open(BOOT_ID_FILE, 'r') as fh:
+            return binascii.unhexlify(fh.read().strip().replace('-', ''))
+    except (IOError, OSError, TypeError, ValueError, binascii.Error):
+        return b'\0' * 16
+
+
+# =============================================================================
+def counter_delta(old, new, width=None):
+    """
+    Computes the difference between two samples of a counter.
+
+    @param old: the previous value of the counter
+    @type old: int
+    @param new: the current value of the counter
+    @type new: int
+    @param width: the width of the counter in bits, if it is wrapping around,
+                  None for counters, which are not wrapping around
+    @type width: int or None
+
+    @return: the difference, None, if the counter was reset
+    @rtype: int or None
+
+    """
+
+    if new >= old:
+        return new - old
+
+    # A wrapped counter - if the old value doesn't fit into the width,
+    # it is a counter of a greater width, which was reset
+    if width and old < (1 << width):
+        return new + (1 << width) - old
+
+    return None
+
+
+# =============================================================================
+def counter_rates(old, new, widths=None):
+    """
+    Computes the per second rates of all counters found in both samples.
+
+    @param old: the previous sample
+    @type old: Sample
+    @param new: the current sample
+    @type new: Sample
+    @param widths: the widths in bits of the counters wrapping around
+                   by their names
+    @type widths: dict or None
+
+    @return: the rates by the names of the counters, rates of reset
+             counters are omitted, an empty dict, if the time between the
+             samples isn't positive
+    @rtype: dict
+
+    """
+
+    rates = {}
+    interval = new.timestamp - old.timestamp
+    if interval <= 0:
+        return rates
+
+    if widths is None:
+        widths = {}
+    for (name, value) in new.counters.items():
+        if name not in old.counters:
+            continue
+        delta = counter_delta(old.counters[name], value, widths.get(name))
+        if delta is not None:
+            rates[name] = float(delta) / interval
+
+    return rates
+
+
+# =============================================================================
+class StateStoreError(NagiosPluginError):
+    """
+    Special error class for errors on accessing the state file.
+    """
+
+    pass
+
+
+# =============================================================================
+class Sample(namedtuple('Sample', ['timestamp', 'counters'])):
+    """
+    A sample of the counters of an instance of a plugin, the timestamp is
+    taken from the monotonic clock.
+    """
+
+    __slots__ = ()
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def now(cls, counters):
+        """Gives back a sample of the given counters taken now."""
+
+        return cls(monotonic(), counters)
+
+
+# =============================================================================
+class StateStore(object):
+    """
+    A store of the last sample of the counters of every instance checked by
+    a plugin (e.g. a port or a device) in a compact binary state file.
+
+    The file is updated under an exclusive lock and written atomically, so
+    concurrent checks of different instances can share the same file.
+    Because the timestamps of the samples are taken from the monotonic clock,
+    samples of a previous boot of the system are discarded.
+    """
+
+    # -------------------------------------------------------------------------
+    def __init__(self, name, filename=None, state_dir=DEFAULT_STATE_DIR):
+        """
+        Constructor.
+
+        @param name: the name of the plugin owning the state file
+        @type name: str
+        @param filename: the filename of the state file, if not given
+                         '<state_dir>/<name>.state' is used
+        @type filename: str or None
+        @param state_dir: the directory of the state files
+        @type state_dir: str
+
+        """
+
+        self.name = name
+        """
+        @ivar: the name of the plugin owning the state file
+        @type: str
+        """
+
+        if filename is None:
+            filename = os.path.join(state_dir, name + '.state')
+        self.filename = filename
+        """
+        @ivar: the filename of the state file
+        @type: str
+        """
+
+        self._lock_fh = None
+
+    # -------------------------------------------------------------------------
+    def as_dict(self):
+        """
+        Typecasting into a dictionary.
+
+        @return: structure as dict
+        @rtype:  dict
+
+        """
+
+        d = {
+            '__class__': self.__class__.__name__,
+            'name': self.name,
+            'filename': self.filename,
+            'locked': self._lock_fh is not None,
+        }
+
+        return d
+
+    # -------------------------------------------------------------------------
+    def lock(self):
+        """
+        Acquires an exclusive lock on the lock file beside the state file.
+
+        @raise StateStoreError: on errors creating the lock file
+
+        """
+
+        dirname = os.path.dirname(self.filename)
+        if dirname and not os.path.isdir(dirname):
+            raise StateStoreError(
+                "Directory %r for the state of %s doesn't exists." % (dirname, self.name))
+
+        lock_file = self.filename + '.lock'
+        try:
+            self._lock_fh = open(lock_file, 'a')
+            fcntl.flock(self._lock_fh.fileno(), fcntl.LOCK_EX)
+        except (IOError, OSError) as e:
+            self._lock_fh = None
+            raise StateStoreError(
+                "Could not lock state file %r: %s" % (self.filename, e))
+
+    # -------------------------------------------------------------------------
+    def unlock(self):
+        """
+        Releases the lock acquired by lock().
+        """
+
+        if self._lock_fh is None:
+            return
+        fcntl.flock(self._lock_fh.fileno(), fcntl.LOCK_UN)
+        self._lock_fh.close()
+        self._lock_fh = None
+
+    # -------------------------------------------------------------------------
+    def load(self):
+        """
+        Reads all samples out of the state file. An invalid state file or
+        a state file of a previous boot is ignored.
+
+        @raise StateStoreError: on errors reading the state file
+
+        @return: the samples by the instance, an empty dict, if there is
+                 no valid state file
+        @rtype: dict of Sample
+
+        """
+
+        try:
+            with open(self.filename, 'rb') as fh:
+                data = fh.read()
+        except (IOError, OSError) as e:
+            if e.errno == errno.ENOENT:
+                return {}
+            raise StateStoreError(
+                "Could not read state file %r: %s" % (self.filename, e))
+
+        try:
+            return self._decode(data)
+        except (struct.error, UnicodeDecodeError, IndexError, ValueError) as e:
+            log.warning("Ignoring invalid state file %r: %s", self.filename, e)
+            return {}
+
+    # -------------------------------------------------------------------------
+    def _decode(self, data):
+
+        (magic, version, name_count, boot_id, saved) = HEADER.unpack_from(data, 0)
+        if magic != STATE_MAGIC or version != STATE_VERSION:
+            raise ValueError("unknown format")
+        current_boot_id = get_boot_id()
+        if boot_id != current_boot_id and current_boot_id != b'\0' * 16:
+            log.debug("Ignoring state file %r of a previous boot.", self.filename)
+            return {}
+        offset = HEADER.size
+
+        names = []
+        for i in range(name_count):
+            (length,) = NAME_LEN.unpack_from(data, offset)
+            offset += NAME_LEN.size
+            names.append(data[offset:offset + length].decode('utf-8'))
+            offset += length
+
+        (count,) = COUNT.unpack_from(data, offset)
+        offset += COUNT.size
+
+        samples = {}
+        for i in range(count):
+            (length,) = KEY_LEN.unpack_from(data, offset)
+            offset += KEY_LEN.size
+            key = data[offset:offset + length].decode('utf-8')
+            offset += length
+            (timestamp, counter_count) = RECORD.unpack_from(data, offset)
+            offset += RECORD.size
+            counters = {}
+            for j in range(counter_count):
+                (index, value) = COUNTER.unpack_from(data, offset)
+                offset += COUNTER.size
+                counters[names[index]] = value
+            samples[key] = Sample(timestamp, counters)
+
+        if offset != len(data):
+            raise ValueError("%d bytes of garbage at the end" % (len(data) - offset))
+
+        return samples
+
+    # -------------------------------------------------------------------------
+    def _encode(self, samples):
+
+        name_index = {}
+        names = []
+        records = []
+        for key in sorted(samples.keys()):
+            (timestamp, counters) = samples[key]
+            key = key.encode('utf-8')
+            record = [KEY_LEN.pack(len(key)), key, RECORD.pack(timestamp, len(counters))]
+            for name in sorted(counters.keys()):
+                index = name_index.get(name)
+                if index is None:
+                    index = len(names)
+                    name_index[name] = index
+                    names.append(name)
+                value = counters[name]
+                if value < 0 or value > MAX_COUNTER:
+                    raise StateStoreError(
+                        "Value %r of counter %r of %r out of range." % (value, name, key))
+                record.append(COUNTER.pack(index, value))
+            records.append(b''.join(record))
+
+        chunks = [HEADER.pack(
+            STATE_MAGIC, STATE_VERSION, len(names), get_boot_id(), time.time())]
+        for name in names:
+            name = name.encode('utf-8')
+            chunks.append(NAME_LEN.pack(len(name)))
+            chunks.append(name)
+        chunks.append(COUNT.pack(len(records)))
+        chunks += records
+
+        return b''.join(chunks)
+
+    # -------------------------------------------------------------------------
+    def save(self, samples):
+        """
+        Writes the given samples atomically into the state file.
+
+        @raise StateStoreError: on errors writing the state file
+
+        @param samples: the samples by the instance as Sample objects or
+                        tuples of the timestamp and a dict of the counters
+        @type samples: dict
+
+        """
+
+        data = self._encode(samples)
+
+        dirname = os.path.dirname(os.path.abspath(self.filename))
+        tmp_file = None
+        try:
+            (fd, tmp_file) = tempfile.mkstemp(
+                prefix='.' + os.path.basename(self.filename), dir=dirname)
+            with os.fdopen(fd, 'wb') as fh:
+                fh.write(data)
+                fh.flush()
+                os.fsync(fh.fileno())
+            os.rename(tmp_file, self.filename)
+        except (IOError, OSError) as e:
+            if tmp_file and os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            raise StateStoreError(
+                "Could not write state file %r: %s" % (self.filename, e))
+
+    # -------------------------------------------------------------------------
+    def update(self, samples, replace=False):
+        """
+        Replaces the samples of the given instances in the state file by the
+        given ones under the lock and gives back the previous samples.
+
+        @raise StateStoreError: on errors accessing the state file
+
+        @param samples: the current samples by the instance
+        @type samples: dict
+        @param replace: remove the samples of all other instances out of
+                        the state file
+        @type replace: bool
+
+        @return: the previous samples of all instances in the state file
+        @rtype: dict of Sample
+
+        """
+
+        self.lock()
+        try:
+            previous = self.load()
+            if replace:
+                current = samples
+            else:
+                current = dict(previous)
+                current.update(samples)
+            self.save(current)
+        finally:
+            self.unlock()
+
+        return previous
+
+# =============================================================================
+
+if __name__ == "__main__":
+
+    pass
+
+# =============================================================================
+
+# vim: fileencoding=utf-8 filetype=python ts=4 et sw=4
@@ -0,0 +1,348 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+@author: Frank Brehm
+@contact: frank.brehm@profitbricks.com
+@copyright: © 2010 - 2016 by Frank Brehm, Berlin
+@summary: Module for measuring the durations of timed spans of a plugin run,
+          e.g. executing commands, reading files or calling an API
+"""
+
+# Standard modules
+import os
+import sys
+import time
+import logging
+import threading
+import functools
+
+from collections import namedtuple
+
+# Third party modules
+
+# Own modules
+
+# --------------------------------------------
+# Some module variables
+
+__version__ = '0.1.0'
+
+log = logging.getLogger(__name__)
+
+
+# =============================================================================
+def _get_monotonic():
+    """
+    Gives back a function returning the time of the monotonic clock, which
+    doesn't jump with the system time. In Python 2 it is taken by ctypes,
+    if this fails the system time is used.
+    """
+
+    if hasattr(time, 'monotonic'):
+        return time.monotonic
+
+    try:
+        import ctypes
+        import ctypes.util
+
+        class Timespec(ctypes.Structure):
+            _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        clock_gettime = libc.clock_gettime
+        clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(Timespec)]
+    except (ImportError, OSError, AttributeError):
+        return time.time
+
+    clock_monotonic = 1
+
+    def monotonic():
+        ts = Timespec()
+        if clock_gettime(clock_monotonic, ctypes.byref(ts)):
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e))
+        return ts.tv_sec + ts.tv_nsec * 1e-9
+
+    return monotonic
+
+
+monotonic = _get_monotonic()
+
+
+# =============================================================================
+class Span(namedtuple('Span', ['name', 'start', 'duration', 'depth'])):
+    """
+    A finished timed span. The start is given in seconds since the creation
+    of the Timings object, the depth is the number of the enclosing spans
+    in the same thread.
+    """
+
+    __slots__ = ()
+
+
+# =============================================================================
+class TimedSpan(object):
+    """
+    A running timed span, the context manager given back by Timings.span().
+    """
+
+    __slots__ = ('timings', 'name', 'begin', 'duration')
+
+    # -------------------------------------------------------------------------
+    def __init__(self, timings, name):
+
+        self.timings = timings
+        self.name = name
+        self.begin = None
+
+        self.duration = None
+        """
+        @ivar: the duration of the span in seconds, after it was finished
+        @type: float or None
+        """
+
+    # -------------------------------------------------------------------------
+    def __enter__(self):
+
+        self.timings._enter()
+        self.begin = monotonic()
+        return self
+
+    # -------------------------------------------------------------------------
+    def __exit__(self, exc_type, exc_value, traceback):
+
+        self.duration = monotonic() - self.begin
+        self.timings._exit(self)
+
+
+# =============================================================================
+class Timings(object):
+    """
+    The timed spans of a plugin run. A span is measured by a with
+    statement, e.g.::
+
+        with self.timings.span('parse_output'):
+            ...
+
+    or by decorating a method of a plugin with timed().
+    """
+
+    # -------------------------------------------------------------------------
+    def __init__(self):
+
+        self.begin = monotonic()
+        """
+        @ivar: the time of the monotonic clock, when the timings were created
+        @type: float
+        """
+
+        self.spans = []
+        """
+        @ivar: all finished spans in the order of their end
+        @type: list of Span
+        """
+
+        self._local = threading.local()
+
+    # -------------------------------------------------------------------------
+    def span(self, name):
+        """
+        Gives back a context manager measuring the duration of a span.
+
+        @param name: the name of the span, spans with the same name are
+                     summed up in the performance data
+        @type name: str
+
+        @return: the context manager, its duration is set after leaving it
+        @rtype: TimedSpan
+
+        """
+
+        return TimedSpan(self, name)
+
+    # -------------------------------------------------------------------------
+    def add(self, name, duration, begin=None):
+        """
+        Adds a span, which was measured outside, e.g. by an API client.
+
+        @param name: the name of the span
+        @type name: str
+        @param duration: the duration of the span in seconds
+        @type duration: float
+        @param begin: the time of the monotonic clock at the begin of the
+                      span, if not given, the span is ending now
+        @type begin: float or None
+
+        """
+
+        if begin is None:
+            begin = monotonic() - duration
+        depth = getattr(self._local, 'depth', 0)
+        self.spans.append(Span(name, begin - self.begin, duration, depth))
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Span %r took %0.6f seconds.", name, duration)
+
+    # -------------------------------------------------------------------------
+    def timed_iter(self, name, iterable):
+        """
+        Gives back the items of the given iterable and adds a span with
+        the time spent for getting them, without the time for processing
+        them between, e.g. for records of a list streamed from an API.
+        The span is added after the last item or on aborting the iteration.
+
+        @param name: the name of the span
+        @type name: str
+        @param iterable: the iterable to measure
+        @type iterable: iterable
+
+        @return: the items of the iterable
+        @rtype: iterator
+
+        """
+
+        iterator = iter(iterable)
+        begin = monotonic()
+        duration = 0.0
+        try:
+            while True:
+                start = monotonic()
+                try:
+                    item = next(iterator)
+                finally:
+                    duration += monotonic() - start
+                yield item
+        except StopIteration:
+            return
+        finally:
+            self.add(name, duration, begin)
+
+    # -------------------------------------------------------------------------
+    def _enter(self):
+
+        self._local.depth = getattr(self._local, 'depth', 0) + 1
+
+    # -------------------------------------------------------------------------
+    def _exit(self, timed_span):
+
+        self._local.depth -= 1
+        self.add(timed_span.name, timed_span.duration, timed_span.begin)
+
+    # -------------------------------------------------------------------------
+    def totals(self):
+        """
+        Sums up the durations of the spans with the same name.
+
+        @return: tuples of the name, the number and the summed up duration
+                 of the spans in the order of their first end
+        @rtype: list of tuple
+
+        """
+
+        totals = {}
+        names = []
+        for span in self.spans:
+            if span.name not in totals:
+                totals[span.name] = [0, 0.0]
+                names.append(span.name)
+            totals[span.name][0] += 1
+            totals[span.name][1] += span.duration
+
+        return [(name, totals[name][0], totals[name][1]) for name in names]
+
+    # -------------------------------------------------------------------------
+    def as_dict(self):
+        """
+        Typecasting into a dictionary.
+
+        @return: structure as dict
+        @rtype:  dict
+
+        """
+
+        d = {
+            'elapsed': monotonic() - self.begin,
+            'spans': [],
+            'totals': {},
+        }
+
+        for span in self.spans:
+            d['spans'].append({
+                'name': span.name,
+                'start': span.start,
+                'duration': span.duration,
+                'depth': span.depth,
+            })
+
+        for (name, count, duration) in self.totals():
+            d['totals'][name] = {'count': count, 'duration': duration}
+
+        return d
+
+    # -------------------------------------------------------------------------
+    def dump(self, filename, plugin=None):
+        """
+        Writes the spans as JSON in one line into the given file, it is
+        appended to the file, so it may collect the spans of many runs.
+
+        @param filename: the file to append to, '-' for STDERR
+        @type filename: str
+        @param plugin: the name of the plugin to write with the spans
+        @type plugin: str or None
+
+        """
+
+        import json
+
+        d = self.as_dict()
+        if plugin:
+            d['plugin'] = plugin
+        data = json.dumps(d, sort_keys=True)
+
+        if filename == '-':
+            sys.stderr.write(data + '\n')
+            return
+
+        with open(filename, 'a') as fh:
+            fh.write(data + '\n')
+
+
+# =============================================================================
+def timed(name=None):
+    """
+    Decorator for methods of a plugin, which measures every call as
+    a span of the timings of the plugin object, e.g.::
+
+        @timed('get_lvs')
+        def get_lvm_lvs(self):
+            ...
+
+    @param name: the name of the span, the name of the method if not given
+    @type name: str or None
+
+    """
+
+    def decorator(func):
+
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            timings = getattr(self, 'timings', None)
+            if timings is None:
+                return func(self, *args, **kwargs)
+            with timings.span(span_name):
+                return func(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+# =============================================================================
+
+if __name__ == "__main__":
+
+    pass
+
+# =============================================================================
+
+# vim: fileencoding=utf-8 filetype=python ts=4 expandtab shiftwidth=4 softtabstop=4
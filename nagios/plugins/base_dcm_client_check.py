@@ -11,6 +11,7 @@
 # Standard modules
 import os
 import sys
+import base64
 import logging
 
 # Third party modules
@@ -19,7 +20,7 @@ import logging
 
 import nagios
 
-from nagios.common import pp
+from nagios.plugin.logguard import LazyPP
 
 from nagios.plugin import NagiosPluginError
 
@@ -28,15 +29,18 @@ from nagios.plugin.argparser import lgpl3_licence_text, default_timeout
 from nagios.plugin.extended import ExtNagiosPlugin
 
 from nagios.plugin.config import NoConfigfileFound
-from nagios.plugin.config import NagiosPluginConfig
+from nagios.plugin.config import get_config
 
-from dcmanagerclient.client import DEFAULT_CFG_FILES, DEFAULT_API_URL
-from dcmanagerclient.client import RestApi
+from nagios.plugins.rest_session import RestSessionError
+from nagios.plugins.rest_session import RestConnectionError
+from nagios.plugins.rest_session import RestHttpError
+from nagios.plugins.rest_session import RestSession
+from nagios.plugins.rest_session import TimedApiClient
 
 # --------------------------------------------
 # Some module variables
 
-__version__ = '0.3.2'
+__version__ = '0.7.2'
 __copyright__ = 'Copyright (c) 2015 Frank Brehm, Berlin.'
 
 DEFAULT_TIMEOUT = 60
@@ -48,6 +52,109 @@ BACKUP_LV = 'zzz_backup'
 
 log = logging.getLogger(__name__)
 
+if sys.version_info[0] > 2:
+    STRING_TYPES = (str, )
+else:
+    STRING_TYPES = (str, unicode)                                       # noqa
+
+# REST API clients of the process, reused by further runs of a plugin
+# in a persistent executor
+_api_clients = {}
+
+# Lists of the REST API, which could not be streamed and are taken
+# from the REST API client object instead
+_unstreamable_lists = set()
+
+# The module dcmanagerclient.client, imported on first use
+_dcm_client_module = None
+
+
+# =============================================================================
+def dcm_client():
+    """
+    Gives back the module dcmanagerclient.client. It is imported on the
+    first call, so it is not loaded for showing the help or the version
+    of a plugin or for evaluating its command line arguments.
+
+    @return: the module dcmanagerclient.client
+    @rtype: module
+
+    """
+
+    global _dcm_client_module
+
+    if _dcm_client_module is None:
+        import dcmanagerclient.client
+        _dcm_client_module = dcmanagerclient.client
+
+    return _dcm_client_module
+
+
+# =============================================================================
+def api_auth_headers(client):
+    """
+    Gives back the headers for authenticating requests of a RestSession
+    like the given REST API client object does. They are taken from the
+    headers of the client or of its HTTP session, else from its token
+    (as a token authorization) or from its credentials (as a basic
+    authorization).
+
+    @param client: the REST API client object
+    @type client: dcmanagerclient.client.RestApi
+
+    @return: the authentication headers, maybe empty
+    @rtype: dict
+
+    """
+
+    session = getattr(client, 'session', None)
+
+    headers = {}
+    for obj in (session, client):
+        client_headers = getattr(obj, 'headers', None)
+        if not client_headers:
+            continue
+        for name in client_headers:
+            lname = name.lower()
+            if lname == 'authorization' or 'token' in lname:
+                headers[name] = client_headers[name]
+    if headers:
+        return headers
+
+    for attr in ('auth_token', 'token'):
+        token = getattr(client, attr, None)
+        if token and isinstance(token, STRING_TYPES):
+            return {'Authorization': 'Token %s' % (token)}
+
+    for obj in (client, session):
+        auth = getattr(obj, 'auth', None)
+        if isinstance(auth, (tuple, list)) and len(auth) == 2:
+            credentials = ('%s:%s' % tuple(auth)).encode('utf-8')
+            value = base64.b64encode(credentials).decode('ascii')
+            return {'Authorization': 'Basic %s' % (value)}
+
+    return headers
+
+
+# =============================================================================
+def api_error_message(e):
+    """
+    Gives back the message for terminating a plugin after an error of
+    the REST API. The module of the DcManager client isn't imported for
+    this, a RestApiError can't be raised without it.
+
+    @param e: the error raised by a call of the REST API
+    @type e: Exception
+
+    @return: the message
+    @rtype: str
+
+    """
+
+    if _dcm_client_module is not None and isinstance(e, _dcm_client_module.RestApiError):
+        return str(e)
+    return "%s: %s" % (e.__class__.__name__, e)
+
 
 # =============================================================================
 class FunctionNotImplementedError(NagiosPluginError, NotImplementedError):
@@ -164,8 +271,16 @@ class BaseDcmClientPlugin(ExtNagiosPlugin):
 
         self.api = None
         """
-        @ivar: an initialized REST API client object
-        @type: RestApi
+        @ivar: an initialized REST API client object, measuring
+               the duration of its calls
+        @type: TimedApiClient
+        """
+
+        self.rest_session = None
+        """
+        @ivar: a HTTP session to the REST API with keep-alive connections
+               shared by all requests of the process
+        @type: RestSession
         """
 
         self.add_args()
@@ -184,7 +299,12 @@ class BaseDcmClientPlugin(ExtNagiosPlugin):
 
         d['api'] = None
         if self.api:
-            d['api'] = self.api.__dict__
+            d['api'] = self.api.client.__dict__
+            d['api_calls'] = self.api.calls
+
+        d['rest_session'] = None
+        if self.rest_session:
+            d['rest_session'] = self.rest_session.as_dict()
 
         return d
 
@@ -199,17 +319,18 @@ class BaseDcmClientPlugin(ExtNagiosPlugin):
             dest='extra_config_file',
             metavar='FILE',
             help=(
-                ("An extra configuration file, which overrides the settings from "
-                    "the standard configuration files %r and from environment.") % (
-                    DEFAULT_CFG_FILES,)),
+                "An extra configuration file, which overrides the settings from "
+                "the standard configuration files of the DcManager client and "
+                "from environment."),
         )
 
         self.add_arg(
             '--api-url',
             dest="api_url",
             metavar='URL',
-            help=("The URL of the REST API (Default: %(default)r)." % {
-                'default': DEFAULT_API_URL}),
+            help=(
+                "The URL of the REST API (Default: the URL from the configuration "
+                "of the DcManager client)."),
         )
 
     # -------------------------------------------------------------------------
@@ -243,16 +364,15 @@ class BaseDcmClientPlugin(ExtNagiosPlugin):
         Read configuration from an optional configuration file.
         """
 
-        cfg = NagiosPluginConfig()
         try:
-            configs = cfg.read()
-            log.debug("Read configuration files:\n%s", pp(configs))
+            cfg = get_config()
+            log.debug("Read configuration files:\n%s", LazyPP(cfg.files_read))
         except NoConfigfileFound as e:
             log.debug("Could not read NagiosPluginConfig: %s", e)
             return
 
         if self.verbose > 2:
-            log.debug("Read configuration:\n%s", pp(cfg.__dict__))
+            log.debug("Read configuration:\n%s", LazyPP(cfg.__dict__))
         self.read_config(cfg)
 
     # -------------------------------------------------------------------------
@@ -268,6 +388,125 @@ class BaseDcmClientPlugin(ExtNagiosPlugin):
 
         return
 
+    # -------------------------------------------------------------------------
+    def get_api_client(self):
+        """
+        Gives back the REST API client object for the current configuration.
+        It is created only once per process, so further runs of the plugin
+        inside a persistent executor reuse it and its connections.
+
+        @return: the REST API client object
+        @rtype: dcmanagerclient.client.RestApi
+
+        """
+
+        key = (self.argparser.args.extra_config_file, self.argparser.args.api_url, self.timeout)
+        api = _api_clients.get(key)
+        if api is None:
+            log.debug("Creating REST API client object ...")
+            api = dcm_client().RestApi.from_config(
+                extra_config_file=self.argparser.args.extra_config_file,
+                api_url=self.argparser.args.api_url,
+                timeout=self.timeout,
+            )
+            _api_clients[key] = api
+        else:
+            log.debug("Reusing REST API client object.")
+
+        return api
+
+    # -------------------------------------------------------------------------
+    def get_rest_session(self):
+        """
+        Gives back a HTTP session to the REST API, which authenticates its
+        requests like the REST API client object in self.api.
+
+        @return: the HTTP session
+        @rtype: RestSession
+
+        """
+
+        return RestSession(
+            self.api.url, timeout=self.timeout, headers=api_auth_headers(self.api.client))
+
+    # -------------------------------------------------------------------------
+    def iter_api_list(self, name, **params):
+        """
+        Gives back the records of a list of the REST API one by one, while
+        they are received and decoded, so large lists (e.g. all volumes of
+        a storage server) are never held completely in memory.
+
+        The list is requested by the REST session from the path named like
+        the appropriate method of the REST API client object. If this
+        fails before the first record, the method of the client object
+        is used instead (for the rest of the process, unless it was
+        a network error).
+
+        @param name: the name of the list, e.g. 'vstorages'
+        @type name: str
+        @param params: the filter parameters of the list
+
+        @return: the records of the list
+        @rtype: iterator of dict
+
+        """
+
+        if self.rest_session and name not in _unstreamable_lists:
+            query = {}
+            for key in params:
+                value = params[key]
+                if isinstance(value, bool):
+                    value = 'true' if value else 'false'
+                query[key] = value
+            try:
+                records = self.timings.timed_iter(
+                    'api:' + name, self.rest_session.iter_json(name + '/', params=query))
+                first = next(records)
+            except StopIteration:
+                return
+            except RestSessionError as e:
+                if isinstance(e, RestHttpError) and e.status in (401, 403):
+                    log.warning("Could not stream list %r from REST API: %s", name, e)
+                else:
+                    log.debug("Could not stream list %r from REST API: %s", name, e)
+                if not isinstance(e, RestConnectionError):
+                    _unstreamable_lists.add(name)
+            else:
+                yield first
+                for record in records:
+                    yield record
+                return
+
+        for record in getattr(self.api, name)(**params):
+            yield record
+
+    # -------------------------------------------------------------------------
+    def iter_api_records(self, name, **params):
+        """
+        Gives back the records of a list of the REST API one by one like
+        iter_api_list(), but terminates the plugin by die() on errors of
+        the REST API. Errors on processing the records by the caller are
+        not caught here.
+
+        @param name: the name of the list, e.g. 'vstorages'
+        @type name: str
+        @param params: the filter parameters of the list
+
+        @return: the records of the list
+        @rtype: iterator of dict
+
+        """
+
+        records = self.iter_api_list(name, **params)
+        while True:
+            try:
+                record = next(records)
+            except StopIteration:
+                return
+            except Exception as e:
+                self.die(api_error_message(e))
+            yield record
+
     # -------------------------------------------------------------------------
     def __call__(self):
         """
@@ -282,15 +521,11 @@ class BaseDcmClientPlugin(ExtNagiosPlugin):
             self._read_config()
             self.parse_args_second()
 
-            log.debug("Creating REST API client object ...")
-            self.api = RestApi.from_config(
-                extra_config_file=self.argparser.args.extra_config_file,
-                api_url=self.argparser.args.api_url,
-                timeout=self.timeout,
-            )
+            self.api = TimedApiClient(self.get_api_client(), timings=self.timings)
+            self.rest_session = self.get_rest_session()
 
             if self.verbose > 2:
-                log.debug("Current object:\n%s", pp(self.as_dict()))
+                log.debug("Current object:\n%s", LazyPP(self.as_dict()))
 
             self.pre_run()
             self.run()
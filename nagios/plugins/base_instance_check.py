@@ -0,0 +1,669 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+@author: Frank Brehm
+@contact: frank.brehm@profitbricks.com
+@copyright: © 2010 - 2016 by Frank Brehm, Berlin
+@summary: Module for BaseInstanceCheckPlugin class for a base class
+          of plugin classes checking running instances of provisioning
+          daemons (PPD, VCB) over their PJD socket
+"""
+
+# Standard modules
+import sys
+import logging
+import signal
+
+# Third party modules
+
+# Own modules
+
+import nagios
+
+from nagios.plugin.logguard import LazyPP
+
+from nagios.plugin.functions import STATUS_TEXT
+
+from nagios.plugin.extended import ExtNagiosPlugin
+
+from nagios.plugins.socket_transport import SocketTransportError
+from nagios.plugins.socket_transport import RequestStatus
+from nagios.plugins.socket_transport import SocketTransport
+from nagios.plugins.socket_transport import SIGNAL_NAMES
+from nagios.plugins.socket_transport import re_parse_result
+from nagios.plugin.timing import monotonic
+from nagios.plugins.socket_transport import DEFAULT_BUFFER_SIZE
+
+from nagios.plugins.instance_prober import InstanceProber
+from nagios.plugins.instance_prober import passive_check_result
+from nagios.plugins.instance_prober import DEFAULT_CONCURRENCY, DEFAULT_COMMAND_FILE
+
+# Some module variables
+__version__ = '0.1.2'
+
+log = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 30
+DEFAULT_POLLING_INTERVAL = 0.5
+
+# The phases of a request for the performance data:
+# (key in SocketTransport.timings, label)
+TIMING_PERFDATA = (
+    ('dns', 'time_dns'),
+    ('connect', 'time_connect'),
+    ('firstbyte', 'time_firstbyte'),
+    ('total', 'time'),
+)
+
+
+class BaseInstanceCheckPlugin(ExtNagiosPlugin):
+    """
+    A base NagiosPlugin class for checking running instances of a
+    provisioning daemon on one or more hosts by sending a PJD request.
+
+    Descendant classes have to set the class attributes daemon_name,
+    default_port and xml_template and to implement eval_result().
+    """
+
+    daemon_name = 'Daemon'
+    default_port = None
+    default_job_id = 1
+    default_polling_interval = DEFAULT_POLLING_INTERVAL
+
+    xml_template = None
+    re_parse_result = re_parse_result
+    re_version = None
+
+    def __init__(self, shortname, blurb):
+        """
+        Constructor of the BaseInstanceCheckPlugin class.
+
+        @param shortname: the shortname of the plugin
+        @type shortname: str
+        @param blurb: Short plugin description, included in the longer
+                      --help output.
+        @type blurb: str
+
+        """
+
+        usage = "%%(prog)s [options] -H <server_address> [-P <%s port>]" % (
+            self.daemon_name)
+        usage += '\n       %(prog)s [options] -H <address> -H <address> ... '
+        usage += '[--passive <service>]'
+        usage += '\n       %(prog)s --usage'
+        usage += '\n       %(prog)s --help'
+
+        super(BaseInstanceCheckPlugin, self).__init__(
+            shortname=shortname,
+            usage=usage, blurb=blurb,
+            timeout=DEFAULT_TIMEOUT,
+        )
+
+        self._hosts = []
+        """
+        @ivar: the DNS names or IP addresses of the hosts, running the daemon
+        @type: list of str
+        """
+
+        self._port = self.default_port
+        """
+        @ivar: the TCP port of the daemon on the host to check
+        @type: int
+        """
+
+        self._min_version = None
+        """
+        @ivar: the minimum version number of the running daemon
+        @type: str or None
+        """
+
+        self._job_id = self.default_job_id
+        """
+        @ivar: the Job-Id to use in PJD to send to the daemon
+        @type: int
+        """
+
+        self._polling_interval = self.default_polling_interval
+
+        self._buffer_size = DEFAULT_BUFFER_SIZE
+
+        self._should_shutdown = False
+
+        self._cancel_signal = None
+
+        self._concurrency = DEFAULT_CONCURRENCY
+
+        self._passive_service = None
+        """
+        @ivar: the service description for submitting the results of all
+               hosts as passive check results
+        @type: str or None
+        """
+
+        self._command_file = DEFAULT_COMMAND_FILE
+
+        self._transport = None
+
+        self._add_args()
+
+    @property
+    def host_address(self):
+        """The DNS name or IP address of the (first) host, running the daemon."""
+        if not self._hosts:
+            return None
+        return self._hosts[0]
+
+    @property
+    def hosts(self):
+        """The DNS names or IP addresses of all hosts, running the daemon."""
+        return self._hosts
+
+    @property
+    def port(self):
+        """The TCP port of the daemon on the host to check."""
+        return self._port
+
+    @port.setter
+    def port(self, value):
+        v = abs(int(value))
+        if v == 0:
+            raise ValueError("The port must not be zero.")
+        if v >= 2 ** 16:
+            raise ValueError("The port must not greater than %d." % ((2 ** 16 - 1)))
+        self._port = v
+
+    @property
+    def concurrency(self):
+        """The maximum number of hosts to check at the same time."""
+        return self._concurrency
+
+    @concurrency.setter
+    def concurrency(self, value):
+        v = int(value)
+        if v < 1:
+            raise ValueError("The concurrency must be at least 1.")
+        self._concurrency = v
+
+    @property
+    def passive_service(self):
+        """The service description for submitting passive check results."""
+        return self._passive_service
+
+    @property
+    def command_file(self):
+        """The external command file of Nagios for the passive check results."""
+        return self._command_file
+
+    @property
+    def min_version(self):
+        """The minimum version number of the running daemon."""
+        return self._min_version
+
+    @property
+    def cancel_signal(self):
+        """Which signal got the process to cancel it."""
+        return self._cancel_signal
+
+    @property
+    def job_id(self):
+        """The Job-Id to use in PJD to send to the daemon."""
+        return self._job_id
+
+    @job_id.setter
+    def job_id(self, value):
+        v = int(value)
+        self._job_id = abs(v)
+
+    @property
+    def timeout(self):
+        """Seconds before plugin times out."""
+        if not hasattr(self, 'argparser'):
+            return DEFAULT_TIMEOUT
+        return self.argparser.args.timeout
+
+    @property
+    def polling_interval(self):
+        """The polling interval on network socket."""
+        return self._polling_interval
+
+    @polling_interval.setter
+    def polling_interval(self, value):
+        v = float(value)
+        if v == 0:
+            raise ValueError("The polling interval must not be zero.")
+        self._polling_interval = abs(v)
+
+    @property
+    def buffer_size(self):
+        """The size of the buffer for the socket operation."""
+        return self._buffer_size
+
+    @buffer_size.setter
+    def buffer_size(self, value):
+        v = abs(int(value))
+        if v < 512:
+            raise ValueError("The buffer size must be greater than 512 bytes.")
+        self._buffer_size = v
+
+    @property
+    def should_shutdown(self):
+        """Should the current process shutdown by a signal from outside."""
+        return self._should_shutdown
+
+    @should_shutdown.setter
+    def should_shutdown(self, value):
+        self._should_shutdown = bool(value)
+
+    def as_dict(self):
+        """
+        Typecasting into a dictionary.
+
+        @return: structure as dict
+        @rtype:  dict
+
+        """
+
+        d = super(BaseInstanceCheckPlugin, self).as_dict()
+
+        d['daemon_name'] = self.daemon_name
+        d['host_address'] = self.host_address
+        d['hosts'] = self.hosts
+        d['port'] = self.port
+        d['concurrency'] = self.concurrency
+        d['passive_service'] = self.passive_service
+        d['command_file'] = self.command_file
+        d['min_version'] = self.min_version
+        d['job_id'] = self.job_id
+        d['timeout'] = self.timeout
+        d['polling_interval'] = self.polling_interval
+        d['should_shutdown'] = self.should_shutdown
+        d['buffer_size'] = self.buffer_size
+        d['cancel_signal'] = self.cancel_signal
+        d['transport'] = None
+        if self._transport:
+            d['transport'] = self._transport.as_dict()
+
+        return d
+
+    def _add_args(self):
+        """
+        Adding all necessary arguments to the commandline argument parser.
+        """
+
+        name = self.daemon_name
+
+        self.add_arg(
+            '-H', '--host-address', '--host',
+            metavar='ADDRESS',
+            dest='host_address',
+            action='append',
+            required=True,
+            help=("The DNS name or IP address of the host, " +
+                  "running the %s (mandantory). May be given multiple " +
+                  "times to check the %s on all given hosts at the same time.") % (
+                name, name),
+        )
+
+        self.add_arg(
+            '-P', '--port',
+            metavar='PORT',
+            dest='port',
+            type=int,
+            default=self.default_port,
+            help=("The TCP port of %s on the host to check " % (name) +
+                  "(Default: %(default)d)."),
+        )
+
+        self.add_arg(
+            '--min-version',
+            metavar='VERSION',
+            dest='min_version',
+            help=("The minimum version number of the running %s. " +
+                  "If given and the %s version is less then this, " +
+                  "a warning is generated.") % (name, name),
+        )
+
+        self.add_arg(
+            '-J', '--job-id',
+            metavar='ID',
+            dest='job_id',
+            type=int,
+            default=self.default_job_id,
+            help=("The Job-Id to use in PJD to send to %s " % (name) +
+                  "(Default: %(default)d)."),
+        )
+
+        self.add_arg(
+            '-b', '--buffer',
+            metavar='SIZE',
+            dest='buffer_size',
+            type=int,
+            default=DEFAULT_BUFFER_SIZE,
+            help=("The size of the buffer for the socket operation in " +
+                  "bytes (Default: %(default)d)."),
+        )
+
+        self.add_arg(
+            '-C', '--concurrency',
+            metavar='NUMBER',
+            dest='concurrency',
+            type=int,
+            default=DEFAULT_CONCURRENCY,
+            help=("The maximum number of hosts to check at the same time " +
+                  "(Default: %(default)d)."),
+        )
+
+        self.add_arg(
+            '--passive',
+            metavar='SERVICE',
+            dest='passive_service',
+            help=("Submitting the results of all hosts as passive check results " +
+                  "of the given service to Nagios, the plugin output is the " +
+                  "summary of all hosts."),
+        )
+
+        self.add_arg(
+            '--command-file',
+            metavar='FILE',
+            dest='command_file',
+            default=DEFAULT_COMMAND_FILE,
+            help=("The external command file of Nagios for submitting the " +
+                  "passive check results, '-' for printing them to STDOUT " +
+                  "(Default: %(default)r)."),
+        )
+
+    def parse_args(self, args=None):
+        """
+        Executes self.argparser.parse_args().
+
+        @param args: the argument strings to parse. If not given, they are
+                     taken from sys.argv.
+        @type args: list of str or None
+
+        """
+
+        super(BaseInstanceCheckPlugin, self).parse_args(args)
+
+        self._hosts = self.argparser.args.host_address
+        if self.argparser.args.port:
+            self.port = self.argparser.args.port
+        if self.argparser.args.min_version:
+            self._min_version = self.argparser.args.min_version
+        if self.argparser.args.job_id:
+            self.job_id = self.argparser.args.job_id
+        if self.argparser.args.buffer_size is not None:
+            self.buffer_size = self.argparser.args.buffer_size
+        if self.argparser.args.concurrency is not None:
+            self.concurrency = self.argparser.args.concurrency
+        self._passive_service = self.argparser.args.passive_service
+        if self.argparser.args.command_file:
+            self._command_file = self.argparser.args.command_file
+
+    def __call__(self):
+        """
+        Method to call the plugin directly.
+        """
+
+        self.parse_args()
+        self.init_root_logger()
+
+        if self.verbose > 2:
+            log.debug("Current object:\n%s", LazyPP(self.as_dict()))
+
+        signal.signal(signal.SIGHUP, self.exit_signal_handler)
+        signal.signal(signal.SIGINT, self.exit_signal_handler)
+        signal.signal(signal.SIGABRT, self.exit_signal_handler)
+        signal.signal(signal.SIGTERM, self.exit_signal_handler)
+        signal.signal(signal.SIGUSR1, self.exit_signal_handler)
+        signal.signal(signal.SIGUSR2, self.exit_signal_handler)
+
+        xml = self.xml_template % (self.job_id)
+        if self.verbose > 3:
+            log.debug("XML to send:\n%s", xml)
+
+        if len(self.hosts) > 1 or self.passive_service:
+            (state, out) = self.check_hosts(xml)
+            self.exit(state, out)
+
+        result = None
+        error = None
+        try:
+            result = self.send(xml)
+        except SocketTransportError as e:
+            error = e
+        except Exception as e:
+            error = ("Error %s on checking %s on %r port %d: %s" % (
+                e.__class__.__name__, self.daemon_name, self.host_address, self.port, e))
+        finally:
+            self.close()
+
+        (state, out) = self.eval_result(result, error)
+
+        self.exit(state, out)
+
+    def eval_result(self, result, error=None):
+        """
+        Evaluates the reply of a daemon or the error on requesting it.
+        Has to be implemented by descendant classes.
+
+        @param result: the reply of the daemon
+        @type result: str or None
+        @param error: the error on requesting the daemon
+        @type error: Exception or str or None
+
+        @return: the state and the output for this daemon
+        @rtype: tuple of int and str
+
+        """
+
+        raise NotImplementedError(
+            "Method eval_result() has to be overridden in class %r." % (
+                self.__class__.__name__))
+
+    def reply_complete(self, data):
+        """
+        Checks, whether the given data received from the daemon are complete.
+        Without an end mark of the replies the reply is complete, if no
+        further data are coming for one polling interval.
+
+        @param data: the data received so far
+        @type data: str
+
+        @return: the reply is complete
+        @rtype: bool
+
+        """
+
+        return False
+
+    def check_hosts(self, xml):
+        """
+        Sends the request to the daemon on all hosts at the same time and
+        evaluates their replies.
+
+        @param xml: the request to send
+        @type xml: str
+
+        @return: the summarized state and output of all hosts
+        @rtype: tuple of int and str
+
+        """
+
+        prober = InstanceProber(
+            self.timeout, concurrency=self.concurrency, buffer_size=self.buffer_size,
+            idle_interval=self.polling_interval, is_complete=self.reply_complete,
+            should_stop=lambda: self.should_shutdown, name=self.daemon_name)
+        begin = monotonic()
+        probes = prober.run([(x, self.port) for x in self.hosts], xml)
+        duration = monotonic() - begin
+
+        state = nagios.state.ok
+        counts = {}
+        failed = []
+        passive = []
+        for probe in probes:
+            (host_state, host_out) = self.eval_result(probe.result, probe.error)
+            if self.verbose > 1:
+                log.debug("%s on %r: %s", self.daemon_name, probe.host, host_out)
+            state = self.max_state(state, host_state)
+            counts[host_state] = counts.get(host_state, 0) + 1
+            if host_state != nagios.state.ok:
+                failed.append("%s: %s" % (probe.host, host_out))
+            if self.passive_service:
+                passive.append(passive_check_result(
+                    probe.host, self.passive_service, host_state, host_out))
+
+        if passive:
+            self.submit_passive_results(passive)
+
+        summary = []
+        for st in (nagios.state.ok, nagios.state.warning,
+                   nagios.state.critical, nagios.state.unknown):
+            if counts.get(st):
+                summary.append("%d %s" % (counts[st], STATUS_TEXT[st].lower()))
+        out = "%s on %d hosts: %s." % (self.daemon_name, len(probes), ', '.join(summary))
+        if failed and not self.passive_service:
+            out += ' ' + '; '.join(failed)
+
+        self.add_perfdata(label='hosts', value=len(probes))
+        self.add_perfdata(label='hosts_ok', value=counts.get(nagios.state.ok, 0))
+        self.add_perfdata(label='probe_time', value=round(duration, 3), uom='s', min_data=0)
+
+        return (state, out)
+
+    def submit_passive_results(self, commands):
+        """
+        Writes the given external commands into the command file of Nagios.
+
+        @param commands: the external commands to write
+        @type commands: list of str
+
+        """
+
+        content = ''.join([x + '\n' for x in commands])
+        if self.command_file == '-':
+            sys.stdout.write(content)
+            return
+
+        try:
+            with open(self.command_file, 'a') as fh:
+                fh.write(content)
+        except (IOError, OSError) as e:
+            self.die("Could not write passive check results into %r: %s" % (
+                self.command_file, e))
+
+    def parse_for_version(self, msg):
+        """
+        Parses in the given message for a version string.
+        """
+
+        match = self.re_version.search(msg)
+        if not match:
+            return None
+        return match.group(1)
+
+    def exit_signal_handler(self, signum, frame):
+        """
+        Handler as a callback function for getting a signal from somewhere.
+
+        @param signum: the gotten signal number
+        @type signum: int
+        @param frame: the current stack frame
+        @type frame: None or a frame object
+
+        """
+
+        signame = "%d" % (signum)
+        if signum in SIGNAL_NAMES:
+            signame = SIGNAL_NAMES[signum]
+
+        log.debug("Got a signal %r.", signame)
+
+        if (signum == signal.SIGUSR1) or (signum == signal.SIGUSR2):
+            log.debug("Nothing to do on signal USR1 or USR2.")
+            return
+
+        log.info("Canceled.")
+        self._cancel_signal = signame
+
+        self.should_shutdown = True
+
+    def send(self, message):
+        """
+        Sends the message over network socket to the daemon on the (first)
+        host and waits for its reply. The connection is kept for further
+        messages, if the daemon doesn't close it. The durations of the
+        phases of the request are added as performance data.
+
+        @raise NoListeningError: if the daemon isn't listening on the given port
+        @raise SocketTransportError: on some communication errors or timeouts
+
+        @param message: the message to send over the network
+        @type message: str
+
+        @return: response from server
+        @rtype: str
+
+        """
+
+        if self.verbose > 2:
+            msg = "Sending message to %r, port %d with a timeout of %d seconds."
+            log.debug(msg, self.host_address, self.port, self.timeout)
+
+        if self._transport is None:
+            self._transport = SocketTransport(
+                self.host_address, self.port, self.timeout, buffer_size=self.buffer_size,
+                idle_interval=self.polling_interval, is_complete=self.reply_complete,
+                should_stop=lambda: self.should_shutdown, name=self.daemon_name)
+
+        try:
+            result = self._transport.send(message)
+        finally:
+            self.add_timing_perfdata(self._transport.timings)
+
+        if self.verbose > 3:
+            log.debug("Got result line: %r", result)
+
+        return result
+
+    def close(self):
+        """
+        Closes a kept connection to the daemon.
+        """
+
+        if self._transport is not None:
+            self._transport.close()
+
+    def add_timing_perfdata(self, timings):
+        """
+        Adds the durations of the phases of a request as performance data.
+
+        @param timings: the durations of the phases by their names
+                        in SocketTransport.timings
+        @type timings: dict
+
+        """
+
+        for (key, label) in TIMING_PERFDATA:
+            if key in timings:
+                self.add_perfdata(
+                    label=label, value=round(timings[key], 4), uom='s', min_data=0)
+
+    def parse_result(self, message):
+        """
+        Parses the given string to get an instance of a RequestStatus object.
+
+        @raise RequestStatusError: if not successful.
+
+        @param message: the message to parse into a RequestStatus object.
+        @type message: str
+
+        @return: the parsed status reply
+        @rtype: RequestStatus
+
+        """
+
+        return RequestStatus.from_message(message, self.re_parse_result)
+
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
@@ -11,9 +11,9 @@
 # Standard modules
 import logging
 import textwrap
-import time
+import math
 
-from numbers import Number
+from multiprocessing.pool import ThreadPool
 
 # Third party modules
 
@@ -24,13 +24,12 @@ import nagios
 from nagios.plugin.range import NagiosRange
 
 from nagios.plugins.base_dcm_client_check import BaseDcmClientPlugin
-
-from dcmanagerclient.client import RestApiError
+from nagios.plugins.base_dcm_client_check import api_error_message
 
 # --------------------------------------------
 # Some module variables
 
-__version__ = '0.2.1'
+__version__ = '0.4.1'
 __copyright__ = 'Copyright (c) 2015 Frank Brehm, Berlin.'
 
 DEFAULT_TIMEOUT = 60
@@ -38,9 +37,36 @@ DEFAULT_TIMEOUT = 60
 DEFAULT_WARN_TIME = 10.0
 DEFAULT_CRIT_TIME = 20.0
 
+DEFAULT_REQUESTS = 5
+DEFAULT_CONCURRENCY = 5
+DEFAULT_PERCENTILE = 95.0
+DEFAULT_ENDPOINTS = ['clusters']
+
 log = logging.getLogger(__name__)
 
 
+# =============================================================================
+def percentile(values, percent):
+    """
+    Gives back the percentile of the given values by the nearest rank method,
+    percentile 0 is the minimum, percentile 100 the maximum.
+
+    @param values: the sorted values
+    @type values: list of float
+    @param percent: the percentile to give back, between 0 and 100
+    @type percent: float
+
+    @return: the percentile or None, if there are no values
+    @rtype: float or None
+
+    """
+
+    if not values:
+        return None
+    rank = int(math.ceil(len(values) * percent / 100.0))
+    return values[min(max(rank - 1, 0), len(values) - 1)]
+
+
 # =============================================================================
 class CheckDcmanagerApiPlugin(BaseDcmClientPlugin):
     """
@@ -55,9 +81,10 @@ class CheckDcmanagerApiPlugin(BaseDcmClientPlugin):
         """
 
         usage = """\
-                %(prog)s [options] [--api-url <api_url>] [-c <critical_time>] [-w <warning_time>]
+                %(prog)s [options] [--api-url <api_url>] [-n <requests>] [-P <percentile>]
                 """
         usage = textwrap.dedent(usage).strip()
+        usage += ' [-c <critical_time>] [-w <warning_time>]'
         usage += '\n       %(prog)s --usage'
         usage += '\n       %(prog)s --help'
 
@@ -84,6 +111,18 @@ class CheckDcmanagerApiPlugin(BaseDcmClientPlugin):
         @type: NagiosRange
         """
 
+        self.durations = []
+        """
+        @ivar: the sorted response times of all successful requests in seconds
+        @type: list of float
+        """
+
+        self.errors = []
+        """
+        @ivar: the messages of all failed requests
+        @type: list of str
+        """
+
     # -----------------------------------------------------------
     @property
     def warning(self):
@@ -109,6 +148,8 @@ class CheckDcmanagerApiPlugin(BaseDcmClientPlugin):
         d = super(CheckDcmanagerApiPlugin, self).as_dict()
         d['warning'] = self.warning
         d['critical'] = self.critical
+        d['durations'] = self.durations
+        d['errors'] = self.errors
 
         return d
 
@@ -119,8 +160,9 @@ class CheckDcmanagerApiPlugin(BaseDcmClientPlugin):
         """
 
         msg_tpl = (
-            "Generate %s state if the response time of the DcManager API "
-            "is higher (Default: %%(default)0.1f seconds).")
+            "Generate %s state if the percentile of the response times of "
+            "the DcManager API given by --percentile is higher "
+            "(Default: %%(default)0.1f seconds).")
 
         msg = msg_tpl % ('warning')
         self.add_arg(
@@ -128,7 +170,7 @@ class CheckDcmanagerApiPlugin(BaseDcmClientPlugin):
             metavar='SECONDS',
             dest='warning',
             required=True,
-            type=Number,
+            type=float,
             default=DEFAULT_WARN_TIME,
             help=msg,
         )
@@ -138,12 +180,53 @@ class CheckDcmanagerApiPlugin(BaseDcmClientPlugin):
             '-c', '--critical',
             metavar='SECONDS',
             dest='critical',
-            type=Number,
+            type=float,
             required=True,
             default=DEFAULT_CRIT_TIME,
             help=msg,
         )
 
+        self.add_arg(
+            '-n', '--requests',
+            metavar='NUMBER',
+            dest='requests',
+            type=int,
+            default=DEFAULT_REQUESTS,
+            help=(
+                "The number of requests to the DcManager API, "
+                "distributed over all endpoints (Default: %(default)d)."),
+        )
+
+        self.add_arg(
+            '--endpoint',
+            metavar='NAME',
+            dest='endpoints',
+            action='append',
+            help=(
+                "The name of a list of the DcManager API to request, may be given "
+                "multiple times (Default: %r)." % (DEFAULT_ENDPOINTS)),
+        )
+
+        self.add_arg(
+            '--concurrency',
+            metavar='NUMBER',
+            dest='concurrency',
+            type=int,
+            default=DEFAULT_CONCURRENCY,
+            help="The maximum number of concurrent requests (Default: %(default)d).",
+        )
+
+        self.add_arg(
+            '-P', '--percentile',
+            metavar='PERCENT',
+            dest='percentile',
+            type=float,
+            default=DEFAULT_PERCENTILE,
+            help=(
+                "The percentile of the response times, the thresholds are applied "
+                "to, 0 means the minimum, 100 the maximum (Default: %(default)0.0f)."),
+        )
+
         super(CheckDcmanagerApiPlugin, self).add_args()
 
     # -------------------------------------------------------------------------
@@ -167,30 +250,101 @@ class CheckDcmanagerApiPlugin(BaseDcmClientPlugin):
             critical=self.critical,
         )
 
+        if self.argparser.args.requests < 1:
+            self.die("The number of requests must be at least 1.")
+        if self.argparser.args.concurrency < 1:
+            self.die("The number of concurrent requests must be at least 1.")
+        if not 0 <= self.argparser.args.percentile <= 100:
+            self.die("The percentile must be between 0 and 100.")
+        if not self.argparser.args.endpoints:
+            self.argparser.args.endpoints = DEFAULT_ENDPOINTS
+
     # -------------------------------------------------------------------------
-    def run(self):
-        """Main execution method."""
+    def request(self, endpoint):
+        """
+        Requests the given list of the DcManager API once. The REST API
+        client object is used directly without repeating failed requests,
+        so every request is measured once and every failure is counted.
+
+        @param endpoint: the name of the list
+        @type endpoint: str
+
+        @return: the response time in seconds and the error message
+                 of a failed request
+        @rtype: tuple of float and str or None
 
-        state = nagios.state.ok
-        out = "DcManager API %r seems to be okay." % (
-            self.api.url)
+        """
+
+        error = None
+        with self.timings.span('request') as span:
+            try:
+                getattr(self.api.client, endpoint)()
+            except Exception as e:
+                error = "%s: %s" % (endpoint, api_error_message(e))
 
-        end_time = None
-        start_time = time.time()
-        try:
-            clusters = self.api.clusters()
-        except RestApiError as e:
-            state = nagios.state.critical
-            self.exit(state, str(e))
+        return (span.duration, error)
 
-        end_time = time.time()
-        duration = end_time - start_time
+    # -------------------------------------------------------------------------
+    def run(self):
+        """Main execution method."""
 
-        nr_clusters = len(clusters)
+        endpoints = self.argparser.args.endpoints
+        for endpoint in endpoints:
+            if not callable(getattr(self.api.client, endpoint, None)):
+                self.die("Unknown endpoint %r of the DcManager API." % (endpoint))
+
+        nr_requests = self.argparser.args.requests
+        requests = [endpoints[i % len(endpoints)] for i in range(nr_requests)]
+        concurrency = min(self.argparser.args.concurrency, nr_requests)
+
+        self.durations = []
+        self.errors = []
+        if concurrency > 1:
+            pool = ThreadPool(concurrency)
+            try:
+                results = pool.map(self.request, requests)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [self.request(x) for x in requests]
+
+        for (duration, error) in results:
+            if error:
+                log.debug("Request failed after %0.3f sec: %s", duration, error)
+                self.errors.append(error)
+            else:
+                self.durations.append(duration)
+        self.durations.sort()
+
+        error_rate = 100.0 * len(self.errors) / nr_requests
+        self.add_perfdata(
+            label='errors', uom='%', value=round(error_rate, 1), min_data=0, max_data=100)
+
+        if not self.durations:
+            self.exit(nagios.state.critical, self.errors[0])
+
+        percent = self.argparser.args.percentile
+        duration = percentile(self.durations, percent)
         state = self.threshold.get_status(duration)
-        self.add_perfdata(label='resp_time', uom='s', value=duration, threshold=self.threshold)
-        out = "Response time of DcManager API %r: %0.2f sec, found %d clusters." % (
-            self.api.url, duration, nr_clusters)
+        if self.errors and state == nagios.state.ok:
+            state = nagios.state.warning
+
+        self.add_perfdata(
+            label='resp_time', uom='s', value=round(duration, 4), threshold=self.threshold)
+        for (label, pct) in (('min', 0), ('p50', 50), ('p95', 95), ('max', 100)):
+            self.add_perfdata(
+                label='resp_time_' + label, uom='s', min_data=0,
+                value=round(percentile(self.durations, pct), 4))
+
+        out = (
+            "Response times of DcManager API %r (%d requests on %s): "
+            "min %0.2f, p50 %0.2f, p95 %0.2f, max %0.2f sec.") % (
+            self.api.url, nr_requests, ', '.join(endpoints),
+            self.durations[0], percentile(self.durations, 50),
+            percentile(self.durations, 95), self.durations[-1])
+        if self.errors:
+            out += " %d requests failed, first error: %s" % (len(self.errors), self.errors[0])
 
         self.exit(state, out)
 
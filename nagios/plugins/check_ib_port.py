@@ -12,6 +12,7 @@ import os
 import re
 import logging
 import textwrap
+import signal
 
 # Third party modules
 
@@ -19,14 +20,29 @@ import textwrap
 
 import nagios
 
-from nagios.common import pp
+from nagios.plugin.logguard import LazyPP
 
+from nagios.plugin import NPReadTimeoutError
+from nagios.plugin.functions import STATUS_TEXT
+from nagios.plugin.range import NagiosRange
+from nagios.plugin.threshold import NagiosThreshold
 from nagios.plugin.extended import ExtNagiosPlugin
+from nagios.plugin.statestore import Sample
+from nagios.plugin.timing import monotonic
+
+from nagios.plugins.ib_counters import DEFAULT_STATE_FILE
+from nagios.plugins.ib_counters import IB_PORT_ERROR_COUNTERS
+from nagios.plugins.ib_counters import IB_PORT_COUNTERS
+from nagios.plugins.ib_counters import IB_PORT_EXT_COUNTERS
+from nagios.plugins.ib_counters import IB_PORT_TRAFFIC_RATES
+from nagios.plugins.ib_counters import IbCounterStateError
+from nagios.plugins.ib_counters import IbCounterState
+from nagios.plugins.ib_counters import port_rates
 
 # --------------------------------------------
 # Some module variables
 
-__version__ = '0.3.0'
+__version__ = '0.6.2'
 
 log = logging.getLogger(__name__)
 
@@ -55,6 +71,183 @@ re_state = re.compile(r'^(\d+):\s+(\S.*)')
 re_rate = re.compile(r'^(\d+)')
 
 
+# =============================================================================
+def list_subdirs(path):
+    """
+    Gives back the names of all subdirectories of the given directory in one
+    pass by os.scandir() (or os.listdir() on older Python versions).
+
+    @param path: the directory to scan
+    @type path: str
+
+    @return: the sorted names of the subdirectories, an empty list,
+             if the directory doesn't exists
+    @rtype: list of str
+
+    """
+
+    names = []
+    try:
+        if hasattr(os, 'scandir'):
+            for entry in os.scandir(path):
+                if entry.is_dir():
+                    names.append(entry.name)
+        else:
+            for name in os.listdir(path):
+                if os.path.isdir(os.path.join(path, name)):
+                    names.append(name)
+    except OSError:
+        return []
+
+    return sorted(names)
+
+
+# =============================================================================
+def read_sysfs_value(filename):
+    """
+    Reads the stripped content of a sysfs file without any checks before.
+
+    @param filename: the file to read
+    @type filename: str
+
+    @return: the content, None, if the file could not be read
+    @rtype: str or None
+
+    """
+
+    try:
+        with open(filename, 'r') as fh:
+            return fh.read().strip()
+    except (IOError, OSError):
+        return None
+
+
+# =============================================================================
+def read_ib_port(port_dir):
+    """
+    Reads the state, the physical state, the rate and the counters of
+    an Infiniband port out of sysfs.
+
+    @param port_dir: the sysfs directory of the port,
+                     e.g. '/sys/class/infiniband/mlx4_0/ports/1'
+    @type port_dir: str
+
+    @return: a dict with the keys 'state_num', 'state', 'phys_state_num',
+             'phys_state', 'rate', 'rate_str', 'counters' and 'errors',
+             the values of the states and the rate are None, if they could
+             not be evaluated, the reasons are in 'errors'
+    @rtype: dict
+
+    """
+
+    port = {
+        'state_num': None,
+        'state': None,
+        'phys_state_num': None,
+        'phys_state': None,
+        'rate': None,
+        'rate_str': None,
+        'counters': {},
+        'errors': [],
+    }
+
+    for key in ('state', 'phys_state'):
+        # e.g.: '4: ACTIVE', '1: DOWN' or '5: LinkUp', '2: Polling'
+        value = read_sysfs_value(os.path.join(port_dir, key))
+        if value is None:
+            port['errors'].append("Could not read %r." % (key))
+            continue
+        match = re_state.search(value)
+        if not match:
+            port['errors'].append("Could not evaluate %s %r." % (key, value))
+            continue
+        port[key + '_num'] = int(match.group(1))
+        port[key] = match.group(2)
+
+    # e.g. '40 Gb/sec (4X QDR)'
+    value = read_sysfs_value(os.path.join(port_dir, 'rate'))
+    if value is None:
+        port['errors'].append("Could not read 'rate'.")
+    else:
+        match = re_rate.search(value)
+        if match:
+            port['rate'] = int(match.group(1))
+            port['rate_str'] = value
+        else:
+            port['errors'].append("Could not evaluate rate %r." % (value))
+
+    port['counters'] = read_ib_counters(port_dir)
+
+    return port
+
+
+# =============================================================================
+def read_ib_counters(port_dir):
+    """
+    Reads the counters of an Infiniband port out of the directories
+    'counters' and 'counters_ext' (if existing) of the port in sysfs.
+
+    @param port_dir: the sysfs directory of the port
+    @type port_dir: str
+
+    @return: the values of all readable counters by their names
+    @rtype: dict
+
+    """
+
+    counters = {}
+
+    for (subdir, names) in (
+            ('counters', IB_PORT_COUNTERS), ('counters_ext', IB_PORT_EXT_COUNTERS)):
+        counters_dir = os.path.join(port_dir, subdir)
+        if subdir == 'counters_ext' and not os.path.isdir(counters_dir):
+            continue
+        for counter in names:
+            value = read_sysfs_value(os.path.join(counters_dir, counter))
+            if value is None:
+                continue
+            try:
+                counters[counter] = int(value)
+            except ValueError:
+                pass
+
+    return counters
+
+
+# =============================================================================
+def scan_ib_ports(base_dir=IB_BASE_DIR, hca_name=None):
+    """
+    Reads all ports of all Infiniband HCAs (or of the given HCA) out of sysfs.
+
+    @param base_dir: the sysfs base directory of the Infiniband HCAs
+    @type base_dir: str
+    @param hca_name: the name of a HCA to restrict the scan to
+    @type hca_name: str or None
+
+    @return: the found ports, see read_ib_port(), with additional keys
+             'hca' and 'port', sorted by the HCA name and the port number
+    @rtype: list of dict
+
+    """
+
+    ports = []
+
+    hca_names = list_subdirs(base_dir)
+    if hca_name is not None:
+        hca_names = [x for x in hca_names if x == hca_name]
+
+    for hca in hca_names:
+        ports_dir = os.path.join(base_dir, hca, 'ports')
+        port_nums = [int(x) for x in list_subdirs(ports_dir) if x.isdigit()]
+        for port_num in sorted(port_nums):
+            port = read_ib_port(os.path.join(ports_dir, str(port_num)))
+            port['hca'] = hca
+            port['port'] = port_num
+            ports.append(port)
+
+    return ports
+
+
 # =============================================================================
 class CheckIbStatusPlugin(ExtNagiosPlugin):
     """
@@ -72,11 +265,13 @@ class CheckIbStatusPlugin(ExtNagiosPlugin):
                 %(prog)s [-v] [-t <timeout>] -H <HCA_name> -P <HCA_port> [--rate <RATE>]
                 """
         usage = textwrap.dedent(usage).strip()
+        usage += '\n       %(prog)s [-v] [-t <timeout>] -A | -H <HCA_name> [--rate <RATE>]'
         usage += '\n       %(prog)s --usage'
         usage += '\n       %(prog)s --help'
 
         blurb = "Copyright (c) 2015 Frank Brehm, Berlin.\n\n"
-        blurb += "Checks the state of the given Infiniband HCA port."
+        blurb += "Checks the state of the given Infiniband HCA port "
+        blurb += "or of all ports of the given or of all HCAs."
 
         super(CheckIbStatusPlugin, self).__init__(
             shortname='IB_PORT',
@@ -102,6 +297,25 @@ class CheckIbStatusPlugin(ExtNagiosPlugin):
         @type: int
         """
 
+        self._all_ports = False
+        """
+        @ivar: check all ports of the given HCA or of all HCAs
+        @type: bool
+        """
+
+        self._state_file = None
+        """
+        @ivar: the file for the last sample of the port counters, None,
+               if no rates of the counters should be evaluated
+        @type: str or None
+        """
+
+        self._error_threshold = None
+        """
+        @ivar: the threshold of the rates of the error counters in errors per second
+        @type: NagiosThreshold or None
+        """
+
         self._add_args()
 
     # -----------------------------------------------------------
@@ -122,6 +336,24 @@ class CheckIbStatusPlugin(ExtNagiosPlugin):
         """The expected transfer rate of the HCA port in Gb/sec."""
         return self._rate
 
+    # -----------------------------------------------------------
+    @property
+    def all_ports(self):
+        """Check all ports of the given HCA or of all HCAs."""
+        return self._all_ports
+
+    # -----------------------------------------------------------
+    @property
+    def state_file(self):
+        """The file for the last sample of the port counters."""
+        return self._state_file
+
+    # -----------------------------------------------------------
+    @property
+    def error_threshold(self):
+        """The threshold of the rates of the error counters in errors per second."""
+        return self._error_threshold
+
     # -------------------------------------------------------------------------
     def as_dict(self):
         """
@@ -137,6 +369,11 @@ class CheckIbStatusPlugin(ExtNagiosPlugin):
         d['hca_name'] = self.hca_name
         d['hca_port'] = self.hca_port
         d['rate'] = self.rate
+        d['all_ports'] = self.all_ports
+        d['state_file'] = self.state_file
+        d['error_threshold'] = None
+        if self.error_threshold:
+            d['error_threshold'] = self.error_threshold.as_dict()
 
         return d
 
@@ -146,11 +383,17 @@ class CheckIbStatusPlugin(ExtNagiosPlugin):
         Adding all necessary arguments to the commandline argument parser.
         """
 
+        self.add_arg(
+            '-A', '--all',
+            action='store_true',
+            dest='all_ports',
+            help="Check all ports of all HCAs in %r." % (IB_BASE_DIR),
+        )
+
         self.add_arg(
             '-H', '--hca-name',
             metavar='HCA',
             dest='hca_name',
-            required=True,
             help="The name of the HCA to check (e.g. 'mlx4_0').",
         )
 
@@ -159,8 +402,8 @@ class CheckIbStatusPlugin(ExtNagiosPlugin):
             metavar='PORT',
             dest='hca_port',
             type=int,
-            required=True,
-            help="The port number of the HCA to check (e.g. 1).",
+            help=("The port number of the HCA to check (e.g. 1). If not given, "
+                  "all ports of the HCA are checked."),
         )
 
         self.add_arg(
@@ -174,6 +417,33 @@ class CheckIbStatusPlugin(ExtNagiosPlugin):
                 "in Gb/sec (Default: %(default)d)."),
         )
 
+        self.add_arg(
+            '--state-file',
+            metavar='FILE',
+            dest='state_file',
+            nargs='?',
+            const=DEFAULT_STATE_FILE,
+            help=("Keep the last sample of the port counters in the given file "
+                  "(Default: %r) for evaluating the per second rates of the data, "
+                  "packet and error counters.") % (DEFAULT_STATE_FILE),
+        )
+
+        self.add_arg(
+            '--error-warning',
+            metavar='ERRORS',
+            dest='error_warning',
+            type=float,
+            help="The rate of an error counter per second leading to a warning.",
+        )
+
+        self.add_arg(
+            '--error-critical',
+            metavar='ERRORS',
+            dest='error_critical',
+            type=float,
+            help="The rate of an error counter per second leading to a critical message.",
+        )
+
     # -------------------------------------------------------------------------
     def parse_args(self, args=None):
         """
@@ -191,6 +461,32 @@ class CheckIbStatusPlugin(ExtNagiosPlugin):
         self._hca_port = self.argparser.args.hca_port
         self._rate = self.argparser.args.rate
 
+        args = self.argparser.args
+        if args.state_file is None:
+            if args.error_warning is not None or args.error_critical is not None:
+                self.die("Thresholds of the error rates need a state file.")
+        else:
+            self._state_file = os.path.abspath(args.state_file)
+            warning = None
+            critical = None
+            if args.error_warning is not None:
+                warning = NagiosRange(start=None, end=args.error_warning)
+            if args.error_critical is not None:
+                critical = NagiosRange(start=None, end=args.error_critical)
+            self._error_threshold = NagiosThreshold(warning=warning, critical=critical)
+
+        if self.argparser.args.all_ports:
+            self._all_ports = True
+            self._hca_name = None
+            self._hca_port = None
+            return
+
+        if not self.hca_name:
+            self.die("No HCA to check given.")
+
+        if self.hca_port is None:
+            self._all_ports = True
+
     # -------------------------------------------------------------------------
     def __call__(self):
         """
@@ -200,13 +496,16 @@ class CheckIbStatusPlugin(ExtNagiosPlugin):
         self.parse_args()
         self.init_root_logger()
 
+        if self.verbose > 2:
+            log.debug("Current object:\n%s", LazyPP(self.as_dict()))
+
+        if self.all_ports:
+            return self.check_all_ports()
+
         state = nagios.state.ok
         out = "Infiniband port %s:%d seems to be okay." % (
             self.hca_name, self.hca_port)
 
-        if self.verbose > 2:
-            log.debug("Current object:\n%s", pp(self.as_dict()))
-
         # Checking directories in sysfs ...
         hca_dir = os.path.join(IB_BASE_DIR, self.hca_name)
         ports_dir = os.path.join(hca_dir, 'ports')
@@ -292,8 +591,245 @@ class CheckIbStatusPlugin(ExtNagiosPlugin):
         out = "Infiniband port %s:%d is %s (%s) - current rate %s." % (
             self.hca_name, self.hca_port, state_str, phys_state_str, cur_rate)
 
+        if self.state_file:
+            key = "%s:%d" % (self.hca_name, self.hca_port)
+            counters = self._read_sysfs(read_ib_counters, port_dir)
+            rates = self.eval_counter_rates({key: counters})
+            if key in rates:
+                (rates_state, rates_msg) = self._eval_rates(rates[key])
+                state = self.max_state_alt(state, rates_state)
+                if rates_msg:
+                    out += ' ' + rates_msg
+
         self.exit(state, out)
 
+    # -------------------------------------------------------------------------
+    def _read_sysfs(self, func, *args):
+        """
+        Calls the given function for reading out of sysfs under one alarm
+        with the timeout of the plugin, it dies on a timeout.
+
+        @param func: the function to call
+        @type func: callable
+
+        @return: the return value of the function
+
+        """
+
+        timeout = abs(int(self.timeout))
+
+        def read_alarm_caller(signum, sigframe):
+            '''
+            This nested function will be called in event of a timeout
+
+            @param signum:   the signal number (POSIX) which happend
+            @type signum:    int
+            @param sigframe: the frame of the signal
+            @type sigframe:  object
+            '''
+
+            raise NPReadTimeoutError(timeout, IB_BASE_DIR)
+
+        signal.signal(signal.SIGALRM, read_alarm_caller)
+        signal.alarm(timeout)
+        try:
+            return func(*args)
+        except NPReadTimeoutError as e:
+            self.die(str(e))
+        finally:
+            signal.alarm(0)
+
+    # -------------------------------------------------------------------------
+    def eval_counter_rates(self, samples):
+        """
+        Replaces the previous samples of the port counters in the state file
+        by the current ones and evaluates the per second rates between them.
+
+        @param samples: the current counters by the port ('<hca>:<port>')
+        @type samples: dict
+
+        @return: the rates by the port, see port_rates(), ports without
+                 a previous sample are omitted
+        @rtype: dict
+
+        """
+
+        now = monotonic()
+        current = {}
+        for key in samples:
+            current[key] = Sample(now, samples[key])
+
+        counter_state = IbCounterState(self.state_file)
+        try:
+            previous = counter_state.update(current)
+        except IbCounterStateError as e:
+            self.die(str(e))
+
+        rates = {}
+        for key in samples:
+            if key not in previous:
+                log.debug("No previous sample of the counters of port %s found.", key)
+                continue
+            (timestamp, counters) = previous[key]
+            rates[key] = port_rates(counters, samples[key], now - timestamp)
+            if self.verbose > 2:
+                log.debug("Rates of the counters of port %s: %r", key, rates[key])
+
+        return rates
+
+    # -------------------------------------------------------------------------
+    def _eval_rates(self, rates, label=''):
+        """
+        Evaluates the rates of the counters of a port against the error
+        threshold and adds them as perfdata.
+
+        @param rates: the rates of the counters of the port, see port_rates()
+        @type rates: dict
+        @param label: the prefix of the perfdata labels
+        @type label: str
+
+        @return: the state and a message about exceeded error rates
+        @rtype: tuple of (int, str)
+
+        """
+
+        state = nagios.state.ok
+        msgs = []
+
+        for (name, ext_counter, counter, factor) in IB_PORT_TRAFFIC_RATES:
+            if name in rates:
+                uom = None
+                if factor > 1:
+                    uom = 'B'
+                self.add_perfdata(
+                    label=(label + name + '_rate'), value=round(rates[name], 1), uom=uom)
+
+        for counter in IB_PORT_ERROR_COUNTERS:
+            if counter not in rates:
+                continue
+            rate = rates[counter]
+            self.add_perfdata(
+                label=(label + counter + '_rate'), value=round(rate, 3),
+                threshold=self.error_threshold)
+            if not self.error_threshold:
+                continue
+            counter_state = self.error_threshold.get_status(rate)
+            if counter_state != nagios.state.ok:
+                state = self.max_state_alt(state, counter_state)
+                msgs.append("%s: %.3f/s" % (counter, rate))
+
+        msg = ''
+        if msgs:
+            msg = "Error rates - %s." % (', '.join(msgs))
+
+        return (state, msg)
+
+    # -------------------------------------------------------------------------
+    def check_all_ports(self):
+        """
+        Checks all ports of the given HCA or of all HCAs, which are read
+        in one pass out of sysfs, and exits with the aggregated state.
+        """
+
+        ports = self._read_sysfs(scan_ib_ports, IB_BASE_DIR, self.hca_name)
+
+        if not ports:
+            if self.hca_name:
+                msg = "No ports of Infiniband HCA %r found." % (self.hca_name)
+            else:
+                msg = "No Infiniband ports found in %r." % (IB_BASE_DIR)
+            self.exit(nagios.state.critical, msg)
+
+        rates = {}
+        if self.state_file:
+            samples = {}
+            for port in ports:
+                samples["%s:%d" % (port['hca'], port['port'])] = port['counters']
+            rates = self.eval_counter_rates(samples)
+
+        state = nagios.state.ok
+        counts = {'ok': 0, 'warning': 0, 'critical': 0, 'unknown': 0}
+        port_msgs = []
+
+        for port in ports:
+
+            port_state = self._eval_port(port)
+
+            desc = "%s:%d" % (port['hca'], port['port'])
+            if port['errors']:
+                port_msgs.append("Port %s: %s" % (desc, ' '.join(port['errors'])))
+            elif port_state != nagios.state.ok:
+                port_msgs.append("Port %s is %s (%s) - current rate %s." % (
+                    desc, port['state'], port['phys_state'], port['rate_str']))
+
+            label = "%s_%d_" % (port['hca'], port['port'])
+            counters = port['counters']
+            if port['rate'] is not None:
+                self.add_perfdata(label=(label + 'rate'), value=port['rate'])
+            for counter in IB_PORT_ERROR_COUNTERS:
+                if counter in counters:
+                    self.add_perfdata(
+                        label=(label + counter), value=counters[counter], uom='c')
+            for (name, ext_counter, counter, factor) in IB_PORT_TRAFFIC_RATES:
+                value = counters.get(ext_counter, counters.get(counter))
+                if value is not None:
+                    self.add_perfdata(label=(label + name), value=(value * factor), uom='c')
+
+            if desc in rates:
+                (rates_state, rates_msg) = self._eval_rates(rates[desc], label)
+                if rates_state != nagios.state.ok:
+                    port_state = self.max_state_alt(port_state, rates_state)
+                    port_msgs.append("Port %s: %s" % (desc, rates_msg))
+
+            state = self.max_state_alt(state, port_state)
+            counts[STATUS_TEXT[port_state].lower()] += 1
+
+        out = "Infiniband ports: %d, %d ok" % (len(ports), counts['ok'])
+        for key in ('warning', 'critical', 'unknown'):
+            if counts[key]:
+                out += ", %d %s" % (counts[key], key)
+        out += '.'
+        if port_msgs:
+            out += ' ' + ' '.join(port_msgs)
+
+        self.exit(state, out)
+
+    # -------------------------------------------------------------------------
+    def _eval_port(self, port):
+        """
+        Evaluates the state of a port read by read_ib_port() the same way
+        like checking a single port.
+
+        @param port: the data of the port
+        @type port: dict
+
+        @return: the state of the port
+        @rtype: int
+
+        """
+
+        if port['errors']:
+            return nagios.state.critical
+
+        state = nagios.state.ok
+
+        if port['rate'] != self.rate:
+            state = nagios.state.warning
+
+        if port['state_num'] != IB_LINK_ACTIVE:
+            state = nagios.state.critical
+
+        if port['phys_state_num'] != IB_PORT_PHYS_STATE_LINKUP:
+            state = nagios.state.critical
+
+        if self.verbose > 1:
+            log.debug(
+                "Infiniband port %s:%d is %s (%s), rate %r => %s.", port['hca'],
+                port['port'], port['state'], port['phys_state'], port['rate_str'],
+                STATUS_TEXT[state])
+
+        return state
+
 # =============================================================================
 
 if __name__ == "__main__":
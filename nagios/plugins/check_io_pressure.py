@@ -0,0 +1,556 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+@author: Frank Brehm
+@contact: frank.brehm@profitbricks.com
+@copyright: © 2010 - 2016 by Frank Brehm, Berlin
+@summary: Module for CheckIoPressurePlugin class for checking the
+          I/O pressure of the system and of the cgroups
+"""
+
+# Standard modules
+import os
+import logging
+import textwrap
+
+# Third party modules
+
+# Own modules
+
+from nagios.plugin.logguard import LazyPP
+
+from nagios.plugin.range import NagiosRange
+from nagios.plugin.threshold import NagiosThreshold
+
+from nagios.plugin.extended import ExtNagiosPlugin
+from nagios.plugin.statestore import StateStoreError
+from nagios.plugin.statestore import StateStore
+from nagios.plugin.statestore import Sample
+from nagios.plugin.timing import monotonic
+
+from nagios.plugins.io_pressure import DEFAULT_STATE_FILE
+from nagios.plugins.io_pressure import PRESSURE_FILE
+from nagios.plugins.io_pressure import IO_STAT_COUNTERS
+from nagios.plugins.io_pressure import parse_pressure
+from nagios.plugins.io_pressure import find_cgroup_root
+from nagios.plugins.io_pressure import read_cgroups
+from nagios.plugins.io_pressure import sum_io_counters
+from nagios.plugins.io_pressure import device_name
+
+# --------------------------------------------
+# Some module variables
+
+__version__ = '0.2.3'
+__copyright__ = 'Copyright (c) 2016 Frank Brehm, Berlin.'
+
+DEFAULT_WARNING = 10.0
+DEFAULT_CRITICAL = 25.0
+DEFAULT_TOP = 5
+DEFAULT_DEPTH = 2
+
+log = logging.getLogger(__name__)
+
+
+# =============================================================================
+def counter_rate(old, new, interval):
+    """
+    Evaluates the per second rate of a counter between two samples.
+
+    @param old: the previous value of the counter
+    @type old: int
+    @param new: the current value of the counter
+    @type new: int
+    @param interval: the time between both samples in seconds
+    @type interval: float
+
+    @return: the rate or None, if the counter was reset or the interval is
+             not positive
+    @rtype: float or None
+
+    """
+
+    if old is None or new is None or interval <= 0 or new < old:
+        return None
+    return float(new - old) / interval
+
+
+# =============================================================================
+def stall_percent(old, new, interval):
+    """
+    Evaluates the share of the time in percent, in which tasks were stalled
+    on I/O, out of two samples of a 'total' PSI counter in microseconds.
+
+    @return: the percentage or None, if the counter was reset or the
+             interval is not positive
+    @rtype: float or None
+
+    """
+
+    rate = counter_rate(old, new, interval)
+    if rate is None:
+        return None
+    return min(rate / 10000.0, 100.0)
+
+
+# =============================================================================
+class CheckIoPressurePlugin(ExtNagiosPlugin):
+    """
+    A special NagiosPlugin class for checking the I/O pressure of the system
+    and of the cgroups by the pressure stall information (PSI) of the kernel.
+    """
+
+    # -------------------------------------------------------------------------
+    def __init__(self):
+        """
+        Constructor of the CheckIoPressurePlugin class.
+        """
+
+        usage = """\
+        %(prog)s [-v] [-w <warning_percent>] [-c <critical_percent>]
+                 [--cgroup-warning <percent>] [--cgroup-critical <percent>]
+                 [--top <num>] [--cgroup-root <dir>] [--depth <num>]
+                 [--state-file <file>]
+        %(prog)s --usage
+        %(prog)s --help
+        """
+        usage = textwrap.dedent(usage).strip()
+
+        blurb = __copyright__ + "\n\n"
+        blurb += textwrap.dedent("""\
+        Checks the share of the time, in which some tasks of the system were
+        stalled on I/O, by the pressure stall information of the kernel and
+        reports the cgroups with the highest I/O delay together with the
+        throughput of the block devices.
+        The rates are evaluated since the previous run of the plugin out of
+        the samples kept in the state file, before the first run the averages
+        of the last minute provided by the kernel are used.
+        The throughput of the block devices is given in the performance data
+        as dev_<device>_read_bps and dev_<device>_write_bps in bytes per
+        second, it is omitted before the first run.
+        """).strip()
+
+        super(CheckIoPressurePlugin, self).__init__(
+            shortname='IO_PRESSURE', usage=usage, blurb=blurb)
+
+        self.cgroup_threshold = None
+        """
+        @ivar: the thresholds of the I/O pressure of a single cgroup
+        @type: NagiosThreshold or None
+        """
+
+        self.top = DEFAULT_TOP
+        self.depth = DEFAULT_DEPTH
+        self.cgroup_root = None
+        self.state_file = None
+
+        self.interval = None
+        """
+        @ivar: the time since the previous sample in seconds, None, if the
+               averages of the kernel are used
+        @type: float or None
+        """
+
+        self.pressure = {}
+        """
+        @ivar: the I/O pressure of the system in percent by 'some' and 'full'
+        @type: dict
+        """
+
+        self.cgroups = []
+        """
+        @ivar: the leaf cgroups up to the maximum depth with their I/O
+               pressure in percent and their throughput in bytes per second,
+               sorted descending by the I/O pressure. Their parents are
+               omitted, they include the I/O of their children.
+        @type: list of dict
+        """
+
+        self.devices = []
+        """
+        @ivar: the block devices with their throughput in bytes per second
+        @type: list of dict
+        """
+
+        self._add_args()
+
+    # -------------------------------------------------------------------------
+    def as_dict(self):
+        """
+        Typecasting into a dictionary.
+
+        @return: structure as dict
+        @rtype:  dict
+
+        """
+
+        d = super(CheckIoPressurePlugin, self).as_dict()
+
+        d['cgroup_threshold'] = None
+        if self.cgroup_threshold:
+            d['cgroup_threshold'] = self.cgroup_threshold.as_dict()
+        d['top'] = self.top
+        d['depth'] = self.depth
+        d['cgroup_root'] = self.cgroup_root
+        d['state_file'] = self.state_file
+        d['interval'] = self.interval
+        d['pressure'] = self.pressure
+        d['cgroups'] = self.cgroups
+        d['devices'] = self.devices
+
+        return d
+
+    # -------------------------------------------------------------------------
+    def _add_args(self):
+        """
+        Adding all necessary arguments to the commandline argument parser.
+        """
+
+        msg_tpl = (
+            "Generate a %s state, if some tasks of the system were stalled on I/O "
+            "longer than the given percentage of the time (default: %%(default).1f).")
+
+        self.add_arg(
+            '-w', '--warning',
+            metavar='PERCENT',
+            dest='warning',
+            type=float,
+            default=DEFAULT_WARNING,
+            help=msg_tpl % ('warning'),
+        )
+
+        self.add_arg(
+            '-c', '--critical',
+            metavar='PERCENT',
+            dest='critical',
+            type=float,
+            default=DEFAULT_CRITICAL,
+            help=msg_tpl % ('critical'),
+        )
+
+        msg_tpl = (
+            "Generate a %s state, if some tasks of a cgroup were stalled on I/O "
+            "longer than the given percentage of the time.")
+
+        self.add_arg(
+            '--cgroup-warning',
+            metavar='PERCENT',
+            dest='cgroup_warning',
+            type=float,
+            help=msg_tpl % ('warning'),
+        )
+
+        self.add_arg(
+            '--cgroup-critical',
+            metavar='PERCENT',
+            dest='cgroup_critical',
+            type=float,
+            help=msg_tpl % ('critical'),
+        )
+
+        self.add_arg(
+            '--top',
+            metavar='NUM',
+            dest='top',
+            type=int,
+            default=DEFAULT_TOP,
+            help=("The number of cgroups with the highest I/O delay to report "
+                  "(default: %(default)d)."),
+        )
+
+        self.add_arg(
+            '--cgroup-root',
+            metavar='DIR',
+            dest='cgroup_root',
+            help=("The mount point of the unified cgroup hierarchy, if not given, it will "
+                  "be detected."),
+        )
+
+        self.add_arg(
+            '--depth',
+            metavar='NUM',
+            dest='depth',
+            type=int,
+            default=DEFAULT_DEPTH,
+            help="The maximum depth of the cgroups to check (default: %(default)d).",
+        )
+
+        self.add_arg(
+            '--state-file',
+            metavar='FILE',
+            dest='state_file',
+            default=DEFAULT_STATE_FILE,
+            help=("Keep the last sample of the I/O pressure and the I/O counters in the "
+                  "given file for evaluating the rates since the previous run "
+                  "(default: %(default)r)."),
+        )
+
+    # -------------------------------------------------------------------------
+    def parse_args(self, args=None):
+        """
+        Executes self.argparser.parse_args().
+
+        @param args: the argument strings to parse. If not given, they are
+                     taken from sys.argv.
+        @type args: list of str or None
+
+        """
+
+        super(CheckIoPressurePlugin, self).parse_args(args)
+
+        args = self.argparser.args
+
+        if args.top < 0:
+            self.die("The number of reported cgroups must not be negative.")
+        self.top = args.top
+
+        if args.depth < 0:
+            self.die("The depth of the cgroups must not be negative.")
+        self.depth = args.depth
+
+        self.set_thresholds(
+            warning=NagiosRange(start=None, end=args.warning),
+            critical=NagiosRange(start=None, end=args.critical),
+        )
+
+        if args.cgroup_warning is not None or args.cgroup_critical is not None:
+            warning = None
+            critical = None
+            if args.cgroup_warning is not None:
+                warning = NagiosRange(start=None, end=args.cgroup_warning)
+            if args.cgroup_critical is not None:
+                critical = NagiosRange(start=None, end=args.cgroup_critical)
+            self.cgroup_threshold = NagiosThreshold(warning=warning, critical=critical)
+
+        if args.cgroup_root:
+            self.cgroup_root = os.path.abspath(args.cgroup_root)
+        else:
+            self.cgroup_root = find_cgroup_root()
+
+        if args.state_file:
+            self.state_file = os.path.abspath(args.state_file)
+
+    # -------------------------------------------------------------------------
+    def __call__(self):
+        """
+        Method to call the plugin directly.
+        """
+
+        self.parse_args()
+        self.init_root_logger()
+
+        if not os.path.exists(PRESSURE_FILE):
+            self.die("The kernel doesn't provide I/O pressure stall information.")
+
+        (pressure, cgroups) = self.read_sample()
+        samples = self.get_samples(pressure, cgroups)
+        previous = self.replace_samples(samples)
+        self.eval_rates(pressure, cgroups, samples, previous)
+
+        if self.verbose > 1:
+            log.debug("Got the following results:\n%s", LazyPP(self.as_dict()))
+
+        state = self.threshold.get_status(self.pressure['some'])
+
+        self.add_perfdata(
+            label='io_some', value=round(self.pressure['some'], 2), uom='%',
+            threshold=self.threshold, min_data=0, max_data=100)
+        self.add_perfdata(
+            label='io_full', value=round(self.pressure['full'], 2), uom='%',
+            min_data=0, max_data=100)
+
+        top_cgroups = []
+        for cgroup in self.cgroups[:self.top]:
+            if self.cgroup_threshold:
+                cg_state = self.cgroup_threshold.get_status(cgroup['some'])
+                state = self.max_state_alt(state, cg_state)
+            self.add_perfdata(
+                label='cgroup_%s_some' % (cgroup['name']), value=round(cgroup['some'], 2),
+                uom='%', threshold=self.cgroup_threshold, min_data=0, max_data=100)
+            top_cgroups.append("%s %.2f%%" % (cgroup['name'], cgroup['some']))
+
+        self.add_device_perfdata()
+
+        if self.interval is None:
+            out = "I/O pressure of the last minute"
+        else:
+            out = "I/O pressure of the last %d seconds" % (self.interval)
+        out += ": some %.2f%%, full %.2f%%" % (self.pressure['some'], self.pressure['full'])
+        if top_cgroups:
+            out += ", top cgroups: " + ', '.join(top_cgroups)
+        out += '.'
+
+        self.exit(state, out)
+
+    # -------------------------------------------------------------------------
+    def add_device_perfdata(self):
+        """
+        Adds the throughput of the block devices in bytes per second
+        to the performance data.
+        """
+
+        for device in self.devices:
+            for (name, label) in (('rbytes', 'read_bps'), ('wbytes', 'write_bps')):
+                if device[name] is None:
+                    continue
+                self.add_perfdata(
+                    label='dev_%s_%s' % (device['name'], label),
+                    value=int(round(device[name])), min_data=0)
+
+    # -------------------------------------------------------------------------
+    def read_sample(self):
+        """
+        Reads the I/O pressure of the system and the I/O pressure and counters
+        of all cgroups.
+
+        @return: the I/O pressure of the system (see parse_pressure()) and
+                 the cgroups (see read_cgroups())
+        @rtype: tuple
+
+        """
+
+        try:
+            with open(PRESSURE_FILE, 'r') as fh:
+                pressure = parse_pressure(fh.read())
+        except (IOError, OSError) as e:
+            self.die("Could not read %r: %s" % (PRESSURE_FILE, e))
+
+        cgroups = {}
+        if self.cgroup_root:
+            if self.verbose > 1:
+                log.debug("Reading cgroups below %r ...", self.cgroup_root)
+            try:
+                cgroups = read_cgroups(self.cgroup_root, self.depth)
+            except (IOError, OSError) as e:
+                self.die("Could not read the cgroups below %r: %s" % (self.cgroup_root, e))
+        elif self.verbose:
+            log.info("No unified cgroup hierarchy found.")
+
+        return (pressure, cgroups)
+
+    # -------------------------------------------------------------------------
+    def get_samples(self, pressure, cgroups):
+        """
+        Gives back the counters of the current sample by the key in the
+        state file, the device counters are summed up over the top level
+        cgroups.
+        """
+
+        now = monotonic()
+
+        samples = {}
+        samples['system'] = Sample(now, {
+            'some': pressure.get('some', {}).get('total', 0),
+            'full': pressure.get('full', {}).get('total', 0),
+        })
+
+        devices = {}
+        for (path, cgroup) in cgroups.items():
+            counters = {}
+            if cgroup['pressure']:
+                for name in ('some', 'full'):
+                    if 'total' in cgroup['pressure'].get(name, {}):
+                        counters[name] = cgroup['pressure'][name]['total']
+            if cgroup['io'] is not None:
+                counters.update(sum_io_counters(cgroup['io']))
+                if cgroup['depth'] == 1:
+                    for (device, io) in cgroup['io'].items():
+                        dev_counters = devices.setdefault(device, {})
+                        for name in IO_STAT_COUNTERS:
+                            dev_counters[name] = dev_counters.get(name, 0) + io.get(name, 0)
+            samples['cgroup:' + path] = Sample(now, counters)
+
+        for (device, counters) in devices.items():
+            samples['device:' + device] = Sample(now, counters)
+
+        return samples
+
+    # -------------------------------------------------------------------------
+    def replace_samples(self, samples):
+        """
+        Replaces the previous samples in the state file by the current ones.
+
+        @return: the previous samples, an empty dict, if there is no state
+                 file or it could not be used
+        @rtype: dict
+
+        """
+
+        if not self.state_file:
+            return {}
+
+        state = StateStore('io_pressure', filename=self.state_file)
+        try:
+            return state.update(samples, replace=True)
+        except StateStoreError as e:
+            log.warning("%s Using the averages of the kernel.", e)
+            return {}
+
+    # -------------------------------------------------------------------------
+    def eval_rates(self, pressure, cgroups, samples, previous):
+        """
+        Evaluates the I/O pressure of the system and of the cgroups and the
+        throughput of the devices since the previous sample, if there is a
+        valid one, else the averages of the last minute of the kernel are used.
+        """
+
+        interval = None
+        if 'system' in previous:
+            interval = samples['system'][0] - previous['system'][0]
+
+        self.pressure = {}
+        for name in ('some', 'full'):
+            value = None
+            if interval is not None:
+                value = stall_percent(
+                    previous['system'][1].get(name), samples['system'][1][name], interval)
+            if value is None:
+                value = pressure.get(name, {}).get('avg60', 0.0)
+                interval = None
+            self.pressure[name] = value
+        self.interval = interval
+
+        parents = set(os.path.dirname(path) for path in cgroups)
+
+        self.cgroups = []
+        for path in sorted(cgroups.keys()):
+            if path == '/' or path in parents:
+                continue
+            key = 'cgroup:' + path
+            counters = samples[key][1]
+            old_counters = {}
+            if interval is not None and key in previous:
+                old_counters = previous[key][1]
+            cgroup = {'name': path.lstrip('/')}
+            some = stall_percent(old_counters.get('some'), counters.get('some'), interval or 0)
+            if some is None:
+                some = ((cgroups[path]['pressure'] or {}).get('some') or {}).get('avg60', 0.0)
+            cgroup['some'] = some
+            for name in IO_STAT_COUNTERS:
+                cgroup[name] = counter_rate(
+                    old_counters.get(name), counters.get(name), interval or 0)
+            self.cgroups.append(cgroup)
+        self.cgroups.sort(key=lambda x: x['some'], reverse=True)
+
+        self.devices = []
+        for key in sorted(samples.keys()):
+            if not key.startswith('device:'):
+                continue
+            counters = samples[key][1]
+            old_counters = {}
+            if interval is not None and key in previous:
+                old_counters = previous[key][1]
+            device = {'name': device_name(key[7:])}
+            for name in IO_STAT_COUNTERS:
+                device[name] = counter_rate(
+                    old_counters.get(name), counters.get(name), interval or 0)
+            self.devices.append(device)
+
+# =============================================================================
+
+if __name__ == "__main__":
+
+    pass
+
+# =============================================================================
+
+# vim: fileencoding=utf-8 filetype=python ts=4 et sw=4
@@ -16,76 +16,33 @@ import textwrap
 import time
 
 # Third party modules
-from iotop.data import TaskStatsNetlink, ProcessList
 
 # Own modules
 
 import nagios
 
-from nagios.common import pp
+from nagios.plugin.logguard import LazyPP
 
 from nagios.plugin.threshold import NagiosThreshold
 
 from nagios.plugin.extended import ExtNagiosPlugin
+from nagios.plugin.statestore import StateStoreError
+from nagios.plugin.statestore import StateStore
+
+from nagios.plugins.taskstats import TaskStatsError
+from nagios.plugins.taskstats import BlkioDelaySampler
 
 # --------------------------------------------
 # Some module variables
 
-__version__ = '0.3.1'
+__version__ = '0.5.1'
 __copyright__ = 'Copyright (c) 2015 Frank Brehm, Berlin.'
 
 DEFAULT_TIMEOUT = 60
 
-log = logging.getLogger(__name__)
-
-
-# #############################################################################
-class IotopOptions(object):
-
-    def __init__(
-        self, only=False, batch=None, iterations=None, delay_seconds=1, pids=None,
-            users=None, processes=False, accumulated=False, kilobytes=False,
-            time=None, quiet=0, profile=False):
-
-        self.only = bool(only)
-
-        self.batch = None
-        if batch is not None:
-            self.batch = bool(batch)
-        if time or quiet:
-            self.batch = True
-
-        self.iterations = None
-        if iterations is not None:
-            self.iterations = int(iterations)
-
-        self.delay_seconds = int(delay_seconds)
-
-        self.pids = []
-        if pids:
-            for pid in pids:
-                self.pids.append(int(pid))
-
-        self.users = []
-        if users:
-            for user in users:
-                self.users.append(user)
-
-        self.uids = []
-
-        self.processes = bool(processes)
-
-        self.accumulated = bool(accumulated)
+DEFAULT_STATE_FILE = '/var/lib/nagios/iotop_blkio_delays.state'
 
-        self.kilobytes = bool(kilobytes)
-
-        self.time = None
-        if time is not None:
-            self.time = bool(time)
-
-        self.quiet = int(quiet)
-
-        self.profile = bool(profile)
+log = logging.getLogger(__name__)
 
 
 # =============================================================================
@@ -103,7 +60,7 @@ class CheckIotopPlugin(ExtNagiosPlugin):
 
         usage = """\
         %(prog)s [-v] [-c <critical_thresholds>] [-w <warning_thresholds>]
-                 [-d DURATION] [-i ITERATIONS]
+                 [-d DURATION] [-i ITERATIONS] [--state-file [FILE]]
         %(prog)s --usage
         %(prog)s --help
         """
@@ -115,7 +72,8 @@ class CheckIotopPlugin(ExtNagiosPlugin):
         Checks the I/O utilization of all processes and generates WARNING or
         CRITICAL states if the block I/O delay breaks given thresholds.
         The I/O utilization will caught in ITERATIONS loops of
-        an interval of DURATION seconds.
+        an interval of DURATION seconds, or with a state file since
+        the previous run of the plugin.
         This plugin must be executed as root.
         """
         blurb = textwrap.dedent(blurb).strip()
@@ -126,11 +84,9 @@ class CheckIotopPlugin(ExtNagiosPlugin):
         self.critical = (1, 5, 10)
         self.delay = 1.0
         self.iterations = 5
+        self.state_file = None
 
-        self.iotop_opts = None
-        self.connection = None
-        self.process_list = None
-        self.processes = []
+        self.sampler = None
         self.process_count = {
             '90': 0,
             '50': 0,
@@ -194,6 +150,19 @@ class CheckIotopPlugin(ExtNagiosPlugin):
                 "the reult of this check (default: %(default)s)."),
         )
 
+        self.add_arg(
+            '--state-file',
+            metavar='FILE',
+            dest='state_file',
+            nargs='?',
+            const=DEFAULT_STATE_FILE,
+            help=(
+                "Keep the block I/O delays of all processes in the given file "
+                "(Default: %r) and evaluate the I/O utilization since the previous "
+                "run instead of sampling it in ITERATIONS loops, the loops are only "
+                "done, if there is no previous sample.") % (DEFAULT_STATE_FILE),
+        )
+
     # -------------------------------------------------------------------------
     def __call__(self):
         """
@@ -213,6 +182,9 @@ class CheckIotopPlugin(ExtNagiosPlugin):
             self.die(msg)
         self.iterations = self.argparser.args.iterations
 
+        if self.argparser.args.state_file:
+            self.state_file = os.path.abspath(self.argparser.args.state_file)
+
         msg_tpl = (
             "The %s thresholds must be given in the form "
             "'IO_DELAY_90,IO_DELAY_50,IO_DELAY_10', where the "
@@ -306,51 +278,64 @@ class CheckIotopPlugin(ExtNagiosPlugin):
     def get_proc_stats(self):
 
         if self.verbose > 2:
-            log.debug("Init of iotop objects  ...")
-
-        self.iotop_opts = IotopOptions(
-            only=True, batch=True, processes=True,
-            iterations=self.iterations, accumulated=True)
-
-        self.connection = TaskStatsNetlink(self.iotop_opts)
-        self.process_list = ProcessList(self.connection, self.iotop_opts)
-
-        for j in range(self.iterations):
-            time.sleep(self.delay)
-            if self.verbose > 1:
-                log.debug("Refreshing processlist %d ...", j)
-            total, actual = self.process_list.refresh_processes()
+            log.debug("Init of the taskstats sampler ...")
+
+        store = None
+        previous = {}
+        if self.state_file:
+            store = StateStore('iotop', filename=self.state_file)
+
+        try:
+            self.sampler = BlkioDelaySampler()
+            if store:
+                store.lock()
+                previous = store.load()
+                self.sampler.restore(dict(
+                    (int(key), sample) for (key, sample) in previous.items()))
+            self.sampler.sample()
+            if not previous:
+                for j in range(self.iterations):
+                    time.sleep(self.delay)
+                    if self.verbose > 1:
+                        log.debug("Sampling block I/O delays %d ...", j)
+                    self.sampler.sample()
+            elif self.verbose > 1:
+                log.debug("Evaluating block I/O delays since the previous run.")
+            if store:
+                store.save(dict(
+                    (str(pid), sample) for (pid, sample) in self.sampler.snapshot().items()))
+        except (TaskStatsError, StateStoreError) as e:
+            self.die(str(e))
+        finally:
+            if store:
+                store.unlock()
+            if self.sampler:
+                self.sampler.close()
 
     # -------------------------------------------------------------------------
     def evaluate_proc_stats(self):
 
-        for proc in self.process_list.processes.values():
-            self.processes.append(proc)
-
-        i = 0
-        duration = self.process_list.duration
-        for proc in self.processes:
-            i += 1
-            blkio_delay = 0
-            proc_duration = duration
-            blkio_delay = proc.stats_accum.blkio_delay_total
-            proc_duration = time.time() - proc.stats_accum_timestamp
-            blkio_delay_percent = float(blkio_delay) / (proc_duration * 10000000.0)
-
-            self.process_count['total'] += 1
+        total = 0
+        count_90 = 0
+        count_50 = 0
+        count_10 = 0
+        for blkio_delay_percent in self.sampler.delay_percents():
+            total += 1
             if blkio_delay_percent >= 90:
-                self.process_count['90'] += 1
+                count_90 += 1
             elif blkio_delay_percent >= 50:
-                self.process_count['50'] += 1
+                count_50 += 1
             elif blkio_delay_percent >= 10:
-                self.process_count['10'] += 1
+                count_10 += 1
 
-        self.process_count['0'] = (
-            self.process_count['total'] - self.process_count['90'] -
-            self.process_count['50'] - self.process_count['10'])
+        self.process_count['total'] = total
+        self.process_count['90'] = count_90
+        self.process_count['50'] = count_50
+        self.process_count['10'] = count_10
+        self.process_count['0'] = total - count_90 - count_50 - count_10
 
         if self.verbose > 1:
-            log.debug("Got the following results:\n%s", pp(self.process_count))
+            log.debug("Got the following results:\n%s", LazyPP(self.process_count))
 
 # =============================================================================
 
@@ -0,0 +1,738 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+@author: Frank Brehm
+@contact: frank.brehm@profitbricks.com
+@copyright: © 2010 - 2016 by Frank Brehm, Berlin
+@summary: Module for CheckIPoIBPlugin class for checking the IPoIB
+          connectivity to all pservers and gateways of the same cluster
+"""
+
+# Standard modules
+import os
+import re
+import json
+import socket
+import logging
+import tempfile
+import textwrap
+import time
+
+# Third party modules
+
+# Own modules
+
+import nagios
+
+from nagios.plugin.extended import ExtNagiosPluginError
+
+from nagios.plugins.base_dcm_client_check import BaseDcmClientPlugin
+
+from nagios.plugins.ping_sweep import PingSweep
+
+# --------------------------------------------
+# Some module variables
+
+__version__ = '1.4.2'
+__copyright__ = 'Copyright (c) 2016 Frank Brehm, Berlin.'
+
+DEFAULT_TIMEOUT = 20
+
+DEFAULT_CACHE_FILE = '/var/lib/nagios/ipoib_topology.json'
+DEFAULT_CACHE_TTL = 900
+
+# The Infiniband fabrics of the pservers, the gateways are pinged
+# on their BGP neighbor address
+PSERVER_FABRICS = ('ib0', 'ib1')
+GATEWAY_FABRIC = 'gw'
+
+# Options of former versions of check_IPoIB with their current names
+LEGACY_OPTIONS = {
+    '--url': '--api-url',
+    '--auth-token': '--extra-config-file',
+}
+
+re_hostname = re.compile(r'^(pserver|gw|ps)(\d+[a-z]-)?\d+$')
+re_bgp_protocol = re.compile(r'^bgp\d+$')
+re_bgp_host = re.compile(r'\(([A-Za-z0-9.-]+)\)$')
+
+log = logging.getLogger(__name__)
+
+
+# =============================================================================
+class TopologyCacheError(ExtNagiosPluginError):
+    """
+    Special error class for errors on accessing the topology cache.
+    """
+
+    pass
+
+
+# =============================================================================
+def read_topology_cache(filename, hostname):
+    """
+    Reads the cached topology of the cluster of the given host.
+
+    @param filename: the JSON file of the topology cache
+    @type filename: str
+    @param hostname: the name of the current host
+    @type hostname: str
+
+    @return: the cached topology, None, if there is no cached
+             topology of this host
+    @rtype: dict or None
+
+    """
+
+    if not os.path.exists(filename):
+        return None
+
+    try:
+        with open(filename, 'r') as fh:
+            topology = json.load(fh)
+    except (IOError, OSError, ValueError) as e:
+        log.debug("Could not read topology cache %r: %s", filename, e)
+        return None
+
+    if not isinstance(topology, dict) or topology.get('hostname') != hostname:
+        return None
+    for key in ('timestamp', 'cluster', 'state', 'pservers', 'gateways'):
+        if key not in topology:
+            return None
+
+    return topology
+
+
+# =============================================================================
+def write_topology_cache(filename, topology):
+    """
+    Writes atomically the given topology into the topology cache.
+
+    @raise TopologyCacheError: on errors writing the cache
+
+    @param filename: the JSON file of the topology cache
+    @type filename: str
+    @param topology: the topology to cache
+    @type topology: dict
+
+    """
+
+    dirname = os.path.dirname(os.path.abspath(filename))
+    tmp_file = None
+    try:
+        (fd, tmp_file) = tempfile.mkstemp(
+            prefix='.' + os.path.basename(filename), dir=dirname)
+        with os.fdopen(fd, 'w') as fh:
+            json.dump(topology, fh)
+        os.rename(tmp_file, filename)
+    except (IOError, OSError, TypeError, ValueError) as e:
+        if tmp_file and os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise TopologyCacheError(
+            "Could not write topology cache %r: %s" % (filename, e))
+
+
+# =============================================================================
+def map_legacy_options(args):
+    """
+    Replaces the options of former versions of check_IPoIB in the given
+    command line arguments by their current names, also in the form
+    '--option=value'.
+
+    @param args: the command line arguments
+    @type args: list of str
+
+    @return: the arguments with the current option names
+    @rtype: list of str
+
+    """
+
+    result = []
+    for arg in args:
+        (opt, sep, value) = arg.partition('=')
+        if opt in LEGACY_OPTIONS:
+            arg = LEGACY_OPTIONS[opt] + sep + value
+        result.append(arg)
+
+    return result
+
+
+# =============================================================================
+def parse_bird_protocols_all(output):
+    """
+    Evaluates the output of 'birdc6 show protocols all', where every
+    protocol starts with a not indented line followed by its indented
+    details, e.g.::
+
+        BIRD 1.4.5 ready.
+        name     proto    table    state  since       info
+        device1  Device   master   up     2016-01-12
+          Preference:     240
+
+        bgp1     BGP      master   up     2016-01-12  Established
+          Description:    gateway-fc57:1:0:1:0:11:2:1 (gw1701)
+          Preference:     100
+          BGP state:          Established
+            Neighbor address: fc57:1:0:1:0:11:2:1
+            Neighbor AS:      64512
+            Neighbor ID:      10.1.171.249
+
+    @param output: the output of birdc6
+    @type output: str
+
+    @return: the details of all BGP protocols (see
+             parse_bird_protocol_details()) by the name of the protocol
+    @rtype: dict
+
+    """
+
+    protocols = {}
+    name = None
+    lines = []
+
+    def finish():
+        if name is not None:
+            protocols[name] = parse_bird_protocol_details('\n'.join(lines))
+
+    for line in output.splitlines():
+        if not line.strip():
+            continue
+        if not line[0].isspace():
+            finish()
+            name = None
+            lines = []
+            fields = line.split()
+            if len(fields) > 1 and fields[1] == 'BGP' and re_bgp_protocol.match(fields[0]):
+                name = fields[0]
+            continue
+        if name is not None:
+            lines.append(line)
+    finish()
+
+    return protocols
+
+
+# =============================================================================
+def parse_bird_protocol_details(output):
+    """
+    Evaluates the output of 'birdc6 show protocols all <protocol>', e.g.::
+
+          Description:    gateway-fc57:1:0:1:0:11:2:1 (gw1701)
+          BGP state:          Established
+            Neighbor address: fc57:1:0:1:0:11:2:1
+            Neighbor ID:      10.1.171.249
+
+    @param output: the output of birdc6
+    @type output: str
+
+    @return: the values of the fields 'Description', 'BGP state',
+             'Neighbor address' and 'Neighbor ID', if found
+    @rtype: dict
+
+    """
+
+    details = {}
+    for line in output.splitlines():
+        if ':' not in line:
+            continue
+        (field, value) = line.split(':', 1)
+        field = field.strip()
+        if field in ('Description', 'BGP state', 'Neighbor address', 'Neighbor ID'):
+            details[field] = value.strip()
+
+    return details
+
+
+# =============================================================================
+class CheckIPoIBPlugin(BaseDcmClientPlugin):
+    """
+    A special Nagios/Icinga plugin to check the IPoIB connectivity to all
+    pservers (on both Infiniband fabrics) and gateways (on their BGP neighbor
+    address) in the same cluster as the current host.
+    """
+
+    # -------------------------------------------------------------------------
+    def __init__(self):
+        """
+        Constructor of the CheckIPoIBPlugin class.
+        """
+
+        usage = """\
+                %(prog)s [options] [--api-url <api_url>] [-C <concurrency>]
+                """
+        usage = textwrap.dedent(usage).strip()
+        usage += '\n       %(prog)s --usage'
+        usage += '\n       %(prog)s --help'
+
+        blurb = __copyright__ + "\n\n"
+        blurb += (
+            "Pings all pservers and gateways in the same cluster on both "
+            "Infiniband fabrics to identify broken IPoIB connectivity.")
+
+        self._concurrency = None
+        """
+        @ivar: the maximum number of hosts pinged at the same time, None
+               for the default of the ping engine
+        @type: int or None
+        """
+
+        self._cache_file = DEFAULT_CACHE_FILE
+        """
+        @ivar: the JSON file for caching the host topology
+        @type: str
+        """
+
+        self._cache_ttl = DEFAULT_CACHE_TTL
+        """
+        @ivar: the time to live of the cached host topology in seconds,
+               0 means no caching
+        @type: int
+        """
+
+        self._ignore_host_states = False
+        """
+        @ivar: continue despite of the hosts being marked down in the DcManager
+        @type: bool
+        """
+
+        super(CheckIPoIBPlugin, self).__init__(
+            shortname='IPOIB',
+            usage=usage, blurb=blurb,
+            version=__version__,
+            timeout=DEFAULT_TIMEOUT,
+        )
+
+    # -----------------------------------------------------------
+    @property
+    def concurrency(self):
+        """The maximum number of hosts pinged at the same time."""
+        return self._concurrency
+
+    # -----------------------------------------------------------
+    @property
+    def cache_file(self):
+        """The JSON file for caching the host topology."""
+        return self._cache_file
+
+    # -----------------------------------------------------------
+    @property
+    def cache_ttl(self):
+        """The time to live of the cached host topology in seconds."""
+        return self._cache_ttl
+
+    # -----------------------------------------------------------
+    @property
+    def ignore_host_states(self):
+        """Continue despite of the hosts being marked down in the DcManager."""
+        return self._ignore_host_states
+
+    # -------------------------------------------------------------------------
+    def as_dict(self):
+        """
+        Typecasting into a dictionary.
+
+        @return: structure as dict
+        @rtype:  dict
+
+        """
+
+        d = super(CheckIPoIBPlugin, self).as_dict()
+        d['concurrency'] = self.concurrency
+        d['cache_file'] = self.cache_file
+        d['cache_ttl'] = self.cache_ttl
+        d['ignore_host_states'] = self.ignore_host_states
+
+        return d
+
+    # -------------------------------------------------------------------------
+    def add_args(self):
+        """
+        Adding all necessary arguments to the commandline argument parser.
+        """
+
+        self.add_arg(
+            '-C', '--concurrency',
+            metavar='HOSTS',
+            dest='concurrency',
+            type=int,
+            help="The maximum number of hosts pinged at the same time.",
+        )
+
+        self.add_arg(
+            '--cache-file',
+            metavar='FILE',
+            dest='cache_file',
+            default=DEFAULT_CACHE_FILE,
+            help=("The file for caching the pservers and gateways of the cluster "
+                  "(Default: %(default)r)."),
+        )
+
+        self.add_arg(
+            '--cache-ttl',
+            metavar='SECONDS',
+            dest='cache_ttl',
+            type=int,
+            default=DEFAULT_CACHE_TTL,
+            help=("The time to live of the cached pservers and gateways, 0 means "
+                  "no caching (Default: %(default)d seconds)."),
+        )
+
+        self.add_arg(
+            '--ignore-dcmanager-host-states',
+            dest='ignore_host_states',
+            action='store_true',
+            help=("Continue despite of the pserver/gateway being marked down "
+                  "in the DcManager."),
+        )
+
+        super(CheckIPoIBPlugin, self).add_args()
+
+    # -------------------------------------------------------------------------
+    def parse_args_second(self):
+        """
+        Method to evaluate command line parameters after evaluating
+        the configuration.
+        """
+
+        args = self.argparser.args
+
+        if args.concurrency is not None:
+            if args.concurrency < 1:
+                self.die("The concurrency must be at least 1.")
+            self._concurrency = args.concurrency
+
+        if args.cache_ttl < 0:
+            self.die("The time to live of the cache may not be negative.")
+        self._cache_ttl = args.cache_ttl
+        self._cache_file = os.path.abspath(args.cache_file)
+        self._ignore_host_states = args.ignore_host_states
+
+    # -------------------------------------------------------------------------
+    def get_topology(self, hostname):
+        """
+        Gives back the cluster, the DcManager state of the current host and
+        the pservers and gateways of the cluster, either out of the topology
+        cache or out of the DcManager. If the DcManager could not be queried,
+        an outdated cached topology is used.
+
+        @param hostname: the name of the current host
+        @type hostname: str
+
+        @return: the topology with the keys 'hostname', 'timestamp', 'cluster',
+                 'state', 'pservers' and 'gateways'
+        @rtype: dict
+
+        """
+
+        cached = None
+        if self.cache_ttl:
+            cached = read_topology_cache(self.cache_file, hostname)
+            if cached and time.time() - cached['timestamp'] < self.cache_ttl:
+                log.debug("Using cached topology from %r.", self.cache_file)
+                return cached
+
+        try:
+            topology = self._query_topology(hostname)
+        except Exception as e:
+            if not cached:
+                self.exit(nagios.state.unknown, str(e))
+            log.debug("Using outdated cached topology: %s", e)
+            return cached
+
+        if self.cache_ttl:
+            try:
+                write_topology_cache(self.cache_file, topology)
+            except TopologyCacheError as e:
+                log.debug(str(e))
+
+        return topology
+
+    # -------------------------------------------------------------------------
+    def _query_topology(self, hostname):
+
+        # fetch the cluster name of current hostname
+        try:
+            response = self.api.pservers(name=hostname)
+        except Exception as e:
+            raise ExtNagiosPluginError(
+                "failed to fetch cluster name from dcmanager api for host %s: %s" % (
+                    hostname, e))
+
+        if len(response) != 1 or 'cluster' not in response[0]:
+            raise ExtNagiosPluginError(
+                "dcmanager api response for host %s does not contain "
+                "any 'cluster' attribute" % (hostname))
+        if 'state' not in response[0]:
+            raise ExtNagiosPluginError(
+                "dcmanager api response for host %s does not contain "
+                "any 'state' attribute" % (hostname))
+        cluster = response[0]['cluster']
+
+        # fetch all pservers in this cluster
+        try:
+            pservers = self.api.pservers(cluster=cluster)
+        except Exception as e:
+            raise ExtNagiosPluginError(
+                "failed to fetch pservers from cluster %s from dcmanager api: %s" % (
+                    cluster, e))
+
+        # fetch all gateways in this cluster
+        try:
+            gateways = self.api.pgateways(cluster=cluster)
+        except Exception as e:
+            raise ExtNagiosPluginError(
+                "failed to fetch gateways from cluster %s from dcmanager api: %s" % (
+                    cluster, e))
+
+        return {
+            'hostname': hostname,
+            'timestamp': time.time(),
+            'cluster': cluster,
+            'state': response[0]['state'],
+            'pservers': [
+                {'name': x['name'], 'state': x['state'], 'ip': x['ip']} for x in pservers],
+            'gateways': [
+                {'name': x['name'], 'state': x['state'], 'ip_addr': x['ip_addr']}
+                for x in gateways],
+        }
+
+    # -------------------------------------------------------------------------
+    def get_bgp_neighbors(self, domain):
+        """
+        Evaluates the BGP neighbors out of the state of all protocols
+        of bird6, which are retrieved by one call of birdc6.
+
+        @param domain: the DNS domain of the current host
+        @type domain: str
+
+        @return: the details of the BGP neighbors (see
+                 parse_bird_protocol_details()) by their hostname
+        @rtype: dict
+
+        """
+
+        birdc6 = self.get_command('birdc6')
+        if not birdc6:
+            self.exit(nagios.state.unknown, "Command 'birdc6' not found.")
+        cmd = [birdc6]
+        if os.geteuid():
+            sudo = self.get_command('sudo')
+            if sudo:
+                cmd = [sudo, birdc6]
+
+        cmd += ['show', 'protocols', 'all']
+        (ret, stdoutdata, stderrdata) = self.exec_cmd(cmd)
+        if ret:
+            self.exit(nagios.state.unknown, "Command %r failed: %s" % (
+                ' '.join(cmd), (stderrdata or stdoutdata).strip()))
+
+        bgp_neighbors = {}
+        domain_pattern = re.compile(r'\.%s$' % (re.escape(domain)))
+        protocols = parse_bird_protocols_all(stdoutdata)
+
+        for protocol in sorted(protocols.keys()):
+
+            details = protocols[protocol]
+            hostname = None
+            if 'Description' in details:
+                match = re_bgp_host.search(details['Description'])
+                if match:
+                    hostname = match.group(1)
+            if hostname is None and 'Neighbor ID' in details:
+                try:
+                    hostname = socket.gethostbyaddr(details['Neighbor ID'])[0]
+                    hostname = domain_pattern.sub('', hostname)
+                except socket.herror:
+                    hostname = details['Neighbor ID']
+            if hostname is None and 'Neighbor address' in details:
+                hostname = details['Neighbor address']
+            if hostname is None:
+                self.exit(
+                    nagios.state.unknown, (
+                        "Failed to extract hostname, ipv4 and ipv6 address of "
+                        "protocol %r from command: %r") % (protocol, ' '.join(cmd)))
+
+            details.pop('Description', None)
+            bgp_neighbors[hostname] = details
+
+        if self.verbose > 2:
+            log.debug("Found BGP neighbors: %r", bgp_neighbors)
+
+        return bgp_neighbors
+
+    # -------------------------------------------------------------------------
+    def run(self):
+        """Main execution method."""
+
+        fqdn = socket.getfqdn(socket.gethostname())
+        (hostname, domain) = (fqdn.split('.', 1) + [''])[:2]
+
+        if not re_hostname.match(hostname):
+            self.exit(nagios.state.unknown, "only pservers and gateways are supported")
+
+        topology = self.get_topology(hostname)
+        cluster = topology['cluster']
+
+        if not self.ignore_host_states and topology['state'] != 'UP':
+            self.exit(nagios.state.ok, "host %s is not marked as 'UP' in dcmanager" % (
+                hostname))
+
+        bgp_neighbors = self.get_bgp_neighbors(domain)
+
+        dcmanager_offline = []
+        ping_hosts = []
+
+        # pservers in this cluster on both fabrics
+        for ps in topology['pservers']:
+            if not self.ignore_host_states and ps['state'] != 'UP':
+                dcmanager_offline.append(ps['name'])
+                continue
+            for i in range(len(PSERVER_FABRICS)):
+                host_fqdn = '%s-ib%i.%s' % (ps['name'], i, domain)
+                ping_hosts.append({
+                    'ping_address': host_fqdn,
+                    'hostalias': host_fqdn,
+                    'ipv4_address': ps['ip'],
+                    'fabric': PSERVER_FABRICS[i],
+                })
+
+        bgp_no_neighbor = []
+        bgp_no_link = []
+        bgp_ipv4_mismatch = []
+        bgp_no_ipv6_address = []
+        bgp_no_ipv4_address = []
+        bgp_gateways = []
+
+        # gateways in this cluster on their BGP neighbor address
+        for gw in topology['gateways']:
+            if not self.ignore_host_states and gw['state'] != 'UP':
+                dcmanager_offline.append(gw['name'])
+                continue
+            ping_hostname = gw['name']
+            if ping_hostname not in bgp_neighbors:
+                if gw['ip_addr'] in bgp_neighbors:
+                    ping_hostname = gw['ip_addr']
+                else:
+                    bgp_no_neighbor.append(gw['name'])
+                    continue
+
+            if 'Neighbor address' not in bgp_neighbors[ping_hostname]:
+                bgp_no_ipv6_address.append(ping_hostname)
+                continue
+
+            ping_hosts.append({
+                'ping_address': bgp_neighbors[ping_hostname]['Neighbor address'],
+                'hostalias': ping_hostname,
+                'ipv4_address': gw['ip_addr'],
+                'fabric': GATEWAY_FABRIC,
+            })
+            bgp_gateways.append((ping_hostname, gw['ip_addr']))
+
+        sweep = PingSweep(concurrency=self.concurrency)
+        results = sweep.run(ping_hosts)
+
+        # the BGP state is only relevant for gateways, which are not offline
+        for (ping_hostname, ip_addr) in bgp_gateways:
+            if ping_hostname in results['offline']:
+                continue
+            neighbor = bgp_neighbors[ping_hostname]
+            if neighbor.get('BGP state') != 'Established':
+                bgp_no_link.append(ping_hostname)
+            if 'Neighbor ID' not in neighbor:
+                bgp_no_ipv4_address.append(ping_hostname)
+            elif neighbor['Neighbor ID'] != ip_addr:
+                bgp_ipv4_mismatch.append(ping_hostname)
+
+        self._add_ping_perfdata(ping_hosts, results, sweep.duration)
+
+        pattern = re.compile(r'\.%s' % (re.escape(domain)))
+
+        def host_list(hosts):
+            return pattern.sub('', ', '.join(sorted(hosts)))
+
+        n = len(ping_hosts) + len(dcmanager_offline)
+        nr_neighbors = len(bgp_neighbors)
+        msg = []
+        if results['notreached']:
+            msg.append("%d/%d hosts are not reachable (%s)" % (
+                len(results['notreached']), n, host_list(results['notreached'])))
+        if results['failed']:
+            msg.append("failed check for %d/%d hosts (%s)" % (
+                len(results['failed']), n, host_list(results['failed'])))
+        if bgp_no_link:
+            msg.append("%d/%d hosts in bird setup have no established BGP state (%s)" % (
+                len(bgp_no_link), nr_neighbors, host_list(bgp_no_link)))
+        if bgp_no_ipv4_address:
+            msg.append("%d/%d hosts have no IPv4 address in bird setup (%s)" % (
+                len(bgp_no_ipv4_address), nr_neighbors, host_list(bgp_no_ipv4_address)))
+        if bgp_ipv4_mismatch:
+            msg.append(
+                "IPv4 address differs for %d/%d hosts between bird setup and dcmanager (%s)" % (
+                    len(bgp_ipv4_mismatch), nr_neighbors, host_list(bgp_ipv4_mismatch)))
+        if bgp_no_ipv6_address:
+            msg.append("%d/%d hosts in bird setup have no IPv6 address (%s)" % (
+                len(bgp_no_ipv6_address), nr_neighbors, host_list(bgp_no_ipv6_address)))
+
+        state = nagios.state.ok
+        if msg:
+            state = nagios.state.critical
+        elif results['reached']:
+            msg.append("%d/%d hosts in cluster %s are reachable (%s)" % (
+                len(results['reached']), n, cluster, host_list(results['reached'])))
+
+        info = []
+        if dcmanager_offline:
+            info.append("%d/%d hosts are down in dcmanager (%s)" % (
+                len(dcmanager_offline), n, host_list(dcmanager_offline)))
+        if results['offline']:
+            info.append("%d/%d hosts are offline (%s)" % (
+                len(results['offline']), n, host_list(results['offline'])))
+        # TODO: move into msg as soon as the gateways in cluster 1-4 are reinstalled
+        #       and are visible by all pservers
+        if bgp_no_neighbor:
+            info.append("%d hosts not found in bird setup (%s)" % (
+                len(bgp_no_neighbor), host_list(bgp_no_neighbor)))
+
+        out = ', '.join(msg)
+        if info:
+            out += ", INFO: " + ', '.join(info)
+
+        self.exit(state, out)
+
+    # -------------------------------------------------------------------------
+    def _add_ping_perfdata(self, ping_hosts, results, duration):
+        """
+        Adds the ratio of the reached hosts, the duration of the sweep and
+        the number of not reached and failed hosts per fabric as perfdata.
+        """
+
+        total = len(ping_hosts)
+        ratio = 100.0
+        if total:
+            ratio = 100.0 * len(results['reached']) / total
+        self.add_perfdata(
+            label='reached', value=round(ratio, 1), uom='%', min_data=0, max_data=100)
+        self.add_perfdata(label='hosts', value=total, min_data=0)
+        self.add_perfdata(label='sweep_time', value=round(duration, 3), uom='s', min_data=0)
+
+        failures = {}
+        for fabric in PSERVER_FABRICS + (GATEWAY_FABRIC, ):
+            failures[fabric] = 0
+        for host in ping_hosts:
+            alias = host['hostalias']
+            if alias in results['notreached'] or alias in results['failed']:
+                failures[host['fabric']] += 1
+        for fabric in PSERVER_FABRICS + (GATEWAY_FABRIC, ):
+            self.add_perfdata(
+                label=('failures_' + fabric), value=failures[fabric], min_data=0)
+
+
+# =============================================================================
+
+if __name__ == "__main__":
+
+    pass
+
+# =============================================================================
+
+# vim: fileencoding=utf-8 filetype=python ts=4 et sw=4
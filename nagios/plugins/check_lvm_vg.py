@@ -24,6 +24,8 @@ import nagios
 
 from nagios.common import pp
 
+from nagios.plugin.logguard import LazyPP
+
 from nagios.plugin.threshold import NagiosThreshold
 
 from nagios.plugin.extended import ExtNagiosPluginError
@@ -33,7 +35,7 @@ from nagios.plugin.extended import ExtNagiosPlugin
 # --------------------------------------------
 # Some module variables
 
-__version__ = '0.2.1'
+__version__ = '0.2.2'
 
 log = logging.getLogger(__name__)
 
@@ -492,7 +494,7 @@ class LvmVgState(object):
 
         fields = stdoutdata.strip().split(';')
         if self.verbose > 2:
-            log.debug("Got fields:\n%s", pp(fields))
+            log.debug("Got fields:\n%s", LazyPP(fields))
 
         self._format = fields[0]
         self._ext_size = int(float(fields[3]))
@@ -667,7 +669,7 @@ class CheckLvmVgPlugin(ExtNagiosPlugin):
         self._vg = self.argparser.args.vg
 
         if self.verbose > 2:
-            log.debug("Current object:\n%s", pp(self.as_dict()))
+            log.debug("Current object:\n%s", LazyPP(self.as_dict()))
 
         # ----------------------------------------------------------
         # Parameters for check_free
@@ -813,10 +815,10 @@ class CheckLvmVgPlugin(ExtNagiosPlugin):
                     self.vg, vg_state.free_mb, vg_state.percent_free))
 
         if self.verbose > 2:
-            log.debug("Thresholds free MBytes:\n%s", pp(th_free_abs.as_dict()))
-            log.debug("Thresholds free percent:\n%s", pp(th_free_pc.as_dict()))
-            log.debug("Thresholds used MBytes:\n%s", pp(th_used_abs.as_dict()))
-            log.debug("Thresholds used percent:\n%s", pp(th_used_pc.as_dict()))
+            log.debug("Thresholds free MBytes:\n%s", LazyPP(th_free_abs.as_dict()))
+            log.debug("Thresholds free percent:\n%s", LazyPP(th_free_pc.as_dict()))
+            log.debug("Thresholds used MBytes:\n%s", LazyPP(th_used_abs.as_dict()))
+            log.debug("Thresholds used percent:\n%s", LazyPP(th_used_pc.as_dict()))
 
         self.add_perfdata(
             label='total_size', value=vg_state.size_mb, uom='MB')
@@ -12,21 +12,25 @@
 import os
 import re
 import logging
+import json
+
+from collections import OrderedDict
 
 # Third party modules
 
 # Own modules
 
-from nagios.common import pp
+from nagios.plugin.logguard import LazyPP
 
 from nagios.plugin.argparser import default_timeout
 
+from nagios.plugin.extended import ExtNagiosPluginError
 from nagios.plugin.extended import ExtNagiosPlugin
 
 # --------------------------------------------
 # Some module variables
 
-__version__ = '0.4.1'
+__version__ = '0.5.2'
 
 log = logging.getLogger(__name__)
 
@@ -34,6 +38,222 @@ re_exit_code = re.compile(r'^\s*Exit\s*Code\s*:\s+0x([0-9a-f]+)', re.IGNORECASE)
 re_no_adapter = re.compile(
     r'^\s*User\s+specified\s+controller\s+is\s+not\s+present', re.IGNORECASE)
 
+MEGACLI_EXE_NAMES = ('MegaCli64', 'MegaCli', 'megacli')
+STORCLI_EXE_NAMES = ('storcli64', 'storcli', 'perccli64', 'perccli')
+
+VALID_BACKENDS = ('auto', 'storcli', 'megacli')
+
+# Mapping of the abbreviated physical drive states of storcli
+# to the firmware states displayed by MegaCli
+STORCLI_PD_STATES = {
+    'onln': 'Online',
+    'offln': 'Offline',
+    'ghs': 'Hotspare',
+    'dhs': 'Hotspare',
+    'ugood': 'Unconfigured(good)',
+    'ubad': 'Unconfigured(bad)',
+    'ugunsp': 'Unconfigured(good)',
+    'rbld': 'Rebuild',
+    'cpybck': 'Copyback',
+    'failed': 'Failed',
+    'msng': 'Missing',
+    'jbod': 'JBOD',
+    'sntze': 'Sanitize',
+}
+
+# Drive states, where MegaCli displays the spin state of the drive
+STORCLI_PD_SPIN_STATES = ('onln', 'ghs', 'dhs', 'ugood')
+
+# Mapping of the abbreviated virtual drive states of storcli
+# to the states displayed by MegaCli
+STORCLI_VD_STATES = {
+    'optl': 'Optimal',
+    'ofln': 'Offline',
+    'pdgd': 'Partially Degraded',
+    'dgrd': 'Degraded',
+    'rec': 'Recovery',
+    'cac': 'CacheCade',
+}
+
+
+# =============================================================================
+class StorCliError(ExtNagiosPluginError):
+    """
+    Special exception class for errors on evaluating the JSON output
+    of storcli or perccli.
+    """
+
+    pass
+
+
+# =============================================================================
+def storcli_response(output, adapter_nr=0):
+    """
+    Evaluates the JSON output of a storcli call (called with the trailing
+    'J' argument) and returns the response data of the given controller.
+
+    @raise StorCliError: if the output could not be decoded, the controller
+                         was not found or the command has failed.
+
+    @param output: the output of storcli on STDOUT
+    @type output: str
+    @param adapter_nr: the number of the MegaRaid adapter
+    @type adapter_nr: int
+
+    @return: the response data of the controller
+    @rtype: dict
+
+    """
+
+    try:
+        data = json.loads(output, object_pairs_hook=OrderedDict)
+    except ValueError as e:
+        raise StorCliError("Could not decode output of storcli: %s" % (e))
+
+    controllers = data.get('Controllers', [])
+    for ctrl in controllers:
+        status = ctrl.get('Command Status', {})
+        ctrl_nr = status.get('Controller')
+        if ctrl_nr is not None and str(ctrl_nr) != str(adapter_nr):
+            continue
+        if status.get('Status', '').lower() != 'success':
+            msg = "Controller %d: %s" % (adapter_nr, status.get('Description', 'unknown error'))
+            detailed = status.get('Detailed Status', [])
+            if detailed and 'ErrMsg' in detailed[0]:
+                msg += " - %s" % (detailed[0]['ErrMsg'])
+            raise StorCliError(msg)
+        return ctrl.get('Response Data', {})
+
+    raise StorCliError("The specified controller %d is not present." % (adapter_nr))
+
+
+# =============================================================================
+def storcli_properties(rows):
+    """
+    Converts a list of property/value pairs of the storcli JSON output
+    (e.g. 'BBU_Firmware_Status') into a dictionary with lowercase keys.
+
+    @param rows: the list of property dicts
+    @type rows: list of dict
+
+    @return: the properties with lowercase names as keys
+    @rtype: OrderedDict
+
+    """
+
+    props = OrderedDict()
+    if not rows:
+        return props
+    for row in rows:
+        if 'Property' not in row:
+            continue
+        props[row['Property'].strip().lower()] = str(row.get('Value', '')).strip()
+    return props
+
+
+# =============================================================================
+def storcli_pd_id(eid_slot):
+    """
+    Converts the 'EID:Slt' value of the storcli output into a tuple of
+    the enclosure ID and the slot number. The enclosure ID is None for
+    drives not located in an enclosure.
+
+    @param eid_slot: the value of the 'EID:Slt' field, e.g. '252:3'
+    @type eid_slot: str
+
+    @return: enclosure ID and slot number
+    @rtype: tuple
+
+    """
+
+    (eid, slot) = str(eid_slot).split(':', 1)
+    eid = eid.strip()
+    enclosure = None
+    if eid and eid != '-':
+        enclosure = int(eid)
+    return (enclosure, int(slot))
+
+
+# =============================================================================
+def storcli_fw_state(pd):
+    """
+    Builds from a row of a storcli PD list the firmware state string
+    as displayed by MegaCli, e.g. 'Online, Spun Up'.
+
+    @param pd: a row of a PD list of the storcli output
+    @type pd: dict
+
+    @return: the firmware state
+    @rtype: str
+
+    """
+
+    st = str(pd.get('State', '')).strip()
+    fw_state = STORCLI_PD_STATES.get(st.lower(), st)
+    if st.lower() in STORCLI_PD_SPIN_STATES:
+        spin = str(pd.get('Sp', '')).strip().upper()
+        if spin == 'U':
+            fw_state += ', Spun Up'
+        elif spin == 'D':
+            fw_state += ', Spun Down'
+    return fw_state
+
+
+# =============================================================================
+def storcli_drives(response):
+    """
+    Evaluates the response data of 'storcli /cX/eall/sall show all J' and
+    returns the drive information in the same structure as collected from the
+    output of 'MegaCli -PdList'.
+
+    @param response: the response data of the storcli call
+    @type response: dict
+
+    @return: the drive informations with the pd ID ('[enc:slot]') as key
+    @rtype: OrderedDict
+
+    """
+
+    drives = OrderedDict()
+
+    for key in response:
+        if not key.startswith('Drive ') or key.endswith('Information'):
+            continue
+        rows = response[key]
+        if not isinstance(rows, list) or not rows:
+            continue
+        pd = rows[0]
+        if 'EID:Slt' not in pd:
+            continue
+
+        (enclosure, slot) = storcli_pd_id(pd['EID:Slt'])
+        dev = {
+            'enclosure': enclosure,
+            'slot': slot,
+            'dev_id': pd.get('DID'),
+            'media_errors': 0,
+            'other_errors': 0,
+            'predictive_failures': 0,
+            'fw_state': storcli_fw_state(pd),
+            'foreign_state': 'None',
+        }
+        if str(pd.get('DG', '')).strip().upper() == 'F':
+            dev['foreign_state'] = 'Foreign'
+
+        details = response.get(key + ' - Detailed Information', {})
+        dstate = details.get(key + ' State', {})
+        dev['media_errors'] = int(dstate.get('Media Error Count', 0))
+        dev['other_errors'] = int(dstate.get('Other Error Count', 0))
+        dev['predictive_failures'] = int(dstate.get('Predictive Failure Count', 0))
+
+        if enclosure is None:
+            pd_id = '[%d]' % (slot)
+        else:
+            pd_id = '[%d:%d]' % (enclosure, slot)
+        drives[pd_id] = dev
+
+    return drives
+
 
 # =============================================================================
 class CheckMegaRaidPlugin(ExtNagiosPlugin):
@@ -85,6 +305,19 @@ class CheckMegaRaidPlugin(ExtNagiosPlugin):
         @type: str
         """
 
+        self._storcli_cmd = None
+        """
+        @ivar: the path to the executable storcli or perccli command
+        @type: str
+        """
+
+        self._backend = 'auto'
+        """
+        @ivar: the backend used to query the adapter, 'storcli' or 'megacli'
+               after evaluating the command line, 'auto' before
+        @type: str
+        """
+
         self._timeout = default_timeout
         """
         @ivar: the timeout on execution of MegaCli in seconds
@@ -105,6 +338,18 @@ class CheckMegaRaidPlugin(ExtNagiosPlugin):
         """The path to the executable MegaCli command."""
         return self._megacli_cmd
 
+    # -----------------------------------------------------------
+    @property
+    def storcli_cmd(self):
+        """The path to the executable storcli or perccli command."""
+        return self._storcli_cmd
+
+    # -----------------------------------------------------------
+    @property
+    def backend(self):
+        """The backend used to query the adapter ('storcli' or 'megacli')."""
+        return self._backend
+
     # -----------------------------------------------------------
     @property
     def timeout(self):
@@ -125,6 +370,8 @@ class CheckMegaRaidPlugin(ExtNagiosPlugin):
 
         d['adapter_nr'] = self.adapter_nr
         d['megacli_cmd'] = self.megacli_cmd
+        d['storcli_cmd'] = self.storcli_cmd
+        d['backend'] = self.backend
         d['timeout'] = self.timeout
 
         return d
@@ -155,14 +402,34 @@ class CheckMegaRaidPlugin(ExtNagiosPlugin):
                 "The path to the executable MegaCli command (Default: %(default)r)."),
         )
 
+        self.add_arg(
+            '--storcli',
+            metavar='CMD',
+            dest='storcli_cmd',
+            default=self.storcli_cmd,
+            help=(
+                "The path to the executable storcli or perccli command "
+                "(Default: %(default)r)."),
+        )
+
+        self.add_arg(
+            '--backend',
+            dest='backend',
+            choices=VALID_BACKENDS,
+            default='auto',
+            help=(
+                "The backend to query the adapter. With 'auto' storcli (JSON output) "
+                "is used, if found, else MegaCli (Default: %(default)r)."),
+        )
+
     # -------------------------------------------------------------------------
     def _init_megacli_cmd(self):
         """
-        Initializes self.megacli_cmd.
+        Initializes self.megacli_cmd and self.storcli_cmd.
         """
 
-        # self._megacli_cmd = self._get_megacli_cmd()
-        self._megacli_cmd = '/usr/bin/storcli'
+        self._megacli_cmd = self._get_megacli_cmd()
+        self._storcli_cmd = self._get_storcli_cmd()
 
     # -------------------------------------------------------------------------
     def _get_megacli_cmd(self, given_path=None):
@@ -178,10 +445,43 @@ class CheckMegaRaidPlugin(ExtNagiosPlugin):
 
         """
 
+        return self._search_exe(MEGACLI_EXE_NAMES, given_path)
+
+    # -------------------------------------------------------------------------
+    def _get_storcli_cmd(self, given_path=None):
+        """
+        Finding the executable 'storcli64', 'storcli', 'perccli64' or 'perccli'
+        under the search path or the given path.
+
+        @param given_path: a possibly given path to storcli
+        @type given_path: str
+
+        @return: the found path to the storcli executable.
+        @rtype: str or None
+
+        """
+
+        return self._search_exe(STORCLI_EXE_NAMES, given_path)
+
+    # -------------------------------------------------------------------------
+    def _search_exe(self, exe_names, given_path=None):
+        """
+        Finding the first of the given executables under the search path
+        or the given path.
+
+        @param exe_names: the names of the executables to search
+        @type exe_names: tuple of str
+        @param given_path: a possibly given path to the executable
+        @type given_path: str
+
+        @return: the found path to the executable.
+        @rtype: str or None
+
+        """
+
         def is_exe(fpath):
             return os.path.isfile(fpath) and os.access(fpath, os.X_OK)
 
-        exe_names = ('MegaCli64', 'MegaCli', 'megacli')
         if given_path:
             # Normalize the given path, if it exists.
             if os.path.isabs(given_path):
@@ -203,7 +503,7 @@ class CheckMegaRaidPlugin(ExtNagiosPlugin):
                 search_paths.append(sbin)
 
         for exe_name in exe_names:
-            for path in os.environ["PATH"].split(os.pathsep):
+            for path in search_paths:
                 path = path.strip('"')
                 exe_file = os.path.join(path, exe_name)
                 if is_exe(exe_file):
@@ -240,6 +540,22 @@ class CheckMegaRaidPlugin(ExtNagiosPlugin):
                         self.argparser.args.megacli_cmd))
             self._megacli_cmd = megacli_cmd
 
+        if self.argparser.args.storcli_cmd:
+
+            storcli_cmd = self._get_storcli_cmd(self.argparser.args.storcli_cmd)
+            if not storcli_cmd:
+                self.die(
+                    "Could not find storcli command %r." % (
+                        self.argparser.args.storcli_cmd))
+            self._storcli_cmd = storcli_cmd
+
+        backend = self.argparser.args.backend
+        if backend == 'auto':
+            backend = 'megacli'
+            if self.storcli_cmd:
+                backend = 'storcli'
+        self._backend = backend
+
     # -------------------------------------------------------------------------
     def pre_call(self):
         """
@@ -249,7 +565,10 @@ class CheckMegaRaidPlugin(ExtNagiosPlugin):
         self.parse_args()
         self.init_root_logger()
 
-        if not self.megacli_cmd:
+        if self.backend == 'storcli':
+            if not self.storcli_cmd:
+                self.die("Could not find 'storcli64', 'storcli' or 'perccli' in OS PATH.")
+        elif not self.megacli_cmd:
             self.die("Could not find 'MegaCli64' or 'MegaCli' in OS PATH.")
 
     # -------------------------------------------------------------------------
@@ -258,7 +577,7 @@ class CheckMegaRaidPlugin(ExtNagiosPlugin):
         self.pre_call()
 
         if self.verbose > 2:
-            log.debug("Current object:\n%s", pp(self.as_dict()))
+            log.debug("Current object:\n%s", LazyPP(self.as_dict()))
 
         self.call()
 
@@ -331,6 +650,47 @@ class CheckMegaRaidPlugin(ExtNagiosPlugin):
 
         return (stdoutdata, stderrdata, ret, exit_code)
 
+    # -------------------------------------------------------------------------
+    def storcli(self, path=None, args=('show', 'all'), ignore_errors=False):
+        """
+        Method to call storcli with JSON output for the current adapter.
+
+        The controller object '/c<adapter_nr>' is prepended to the given
+        object path, the argument 'J' is appended to the command line.
+
+        @param path: the object path below the controller, e.g. '/eall/sall'
+        @type path: str or None
+        @param args: the arguments following the object path
+        @type args: list of str or tuple of str
+        @param ignore_errors: don't die on a failed command, return None instead
+        @type ignore_errors: bool
+
+        @return: the response data of the controller
+        @rtype: dict or None
+
+        """
+
+        obj = '/c%d' % (self.adapter_nr)
+        if path:
+            obj += path
+
+        cmd_list = [self.storcli_cmd, obj]
+        for arg in args:
+            cmd_list.append(arg)
+        cmd_list.append('J')
+
+        (ret, stdoutdata, stderrdata) = self.exec_cmd(cmd_list)
+        if self.verbose > 3:
+            log.debug("Output on StdOut:\n%s", stdoutdata)
+
+        try:
+            return storcli_response(stdoutdata, self.adapter_nr)
+        except StorCliError as e:
+            if ignore_errors:
+                log.debug(str(e))
+                return None
+            self.die(str(e))
+
 
 # =============================================================================
 
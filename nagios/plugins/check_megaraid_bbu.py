@@ -23,11 +23,12 @@ from nagios.plugin.functions import max_state
 
 import nagios.plugins.check_megaraid
 from nagios.plugins.check_megaraid import CheckMegaRaidPlugin
+from nagios.plugins.check_megaraid import storcli_properties
 
 # --------------------------------------------
 # Some module variables
 
-__version__ = '0.2.2'
+__version__ = '0.3.1'
 
 log = logging.getLogger(__name__)
 
@@ -71,6 +72,93 @@ Exit Code: 0x00
 '''
 
 
+# Mapping of the properties of the storcli firmware status
+# to the keys of the BBU state
+STORCLI_BBU_FW_PROPERTIES = {
+    'voltage': 'voltage',
+    'temperature': 'temperature',
+    'learn cycle requested': 'lc_req',
+    'learn cycle active': 'lc_act',
+    'learn cycle status': 'lc_state',
+    'learn cycle timeout': 'lc_timeout',
+    'i2c errors detected': 'i2c_err',
+    'battery pack missing': 'bbu_miss',
+    'replacement required': 'bbu_replace',
+    'battery replacement required': 'bbu_replace',
+    'remaining capacity low': 'capac_low',
+    'periodic learn required': 'per_learn',
+    'transparent learn': 'trans_learn',
+    'no space to cache offload': 'no_space',
+    'pack is about to fail & should be replaced': 'pack_fail',
+    'module microcode update required': 'micro_upd',
+}
+
+
+# =============================================================================
+def empty_bbu_state():
+    """
+    Returns the structure with the state of a BBU filled by the
+    get_bbu_state_*() methods of CheckMegaRaidBBUPlugin.
+
+    @rtype: dict
+    """
+
+    return {
+        'exit_code': 0,
+        'batt_type': 'unknown',
+        'batt_state': None,     # optimal
+        'voltage': None,        # ok
+        'temperature': None,    # ok
+        'lc_req': None,         # no
+        'lc_act': None,         # no
+        'lc_state': None,       # ok
+        'lc_timeout': None,     # no
+        'i2c_err': None,        # no
+        'bbu_miss': None,       # no
+        'bbu_replace': None,    # no
+        'capac_low': None,      # no
+        'per_learn': None,      # no
+        'trans_learn': None,    # no
+        'no_space': None,       # no
+        'pack_fail': None,      # no
+        'micro_upd': None,      # no
+    }
+
+
+# =============================================================================
+def storcli_bbu_state(response):
+    """
+    Evaluates the response data of 'storcli /cX/bbu show all J'
+    or 'storcli /cX/cv show all J'.
+
+    @param response: the response data of the storcli call
+    @type response: dict
+
+    @return: the state of the BBU or CacheVault
+    @rtype: dict
+
+    """
+
+    bbu = empty_bbu_state()
+
+    info = storcli_properties(response.get('BBU_Info', response.get('Cachevault_Info')))
+    fw_status = storcli_properties(
+        response.get('BBU_Firmware_Status', response.get('Firmware_Status')))
+
+    if info.get('type'):
+        bbu['batt_type'] = info['type']
+    for key in ('battery state', 'state'):
+        if info.get(key):
+            bbu['batt_state'] = info[key]
+            break
+
+    for prop in fw_status:
+        if prop in STORCLI_BBU_FW_PROPERTIES:
+            bbu[STORCLI_BBU_FW_PROPERTIES[prop]] = fw_status[prop].lower()
+
+    return bbu
+
+
 # =============================================================================
 class CheckMegaRaidBBUPlugin(CheckMegaRaidPlugin):
     """
@@ -118,13 +206,15 @@ class CheckMegaRaidBBUPlugin(CheckMegaRaidPlugin):
         return d
 
     # -------------------------------------------------------------------------
-    def call(self):
-        """
-        Method to call the plugin directly.
+    def get_bbu_state_megacli(self):
         """
+        Retrieves the state of the BBU from the output of
+        'MegaCli -AdpBbuCmd -GetBbuStatus'.
 
-        state = nagios.state.ok
-        out = "BBU of MegaRaid adapter %d seems to be okay." % (self.adapter_nr)
+        @return: the state of the BBU
+        @rtype: dict
+
+        """
 
         re_batt_type = re.compile(r'^\s*BatteryType\s*:\s*(\S+.*)', re.IGNORECASE)
         re_batt_state = re.compile(r'^\s*Battery\s*State\s*:\s*(\S+.*)', re.IGNORECASE)
@@ -156,23 +246,8 @@ class CheckMegaRaidBBUPlugin(CheckMegaRaidPlugin):
         if self.verbose > 2:
             log.debug("Output on StdOut:\n%s", stdoutdata)
 
-        batt_type = 'unknown'
-        batt_state = None       # optimal
-        voltage = None          # ok
-        temperature = None      # ok
-        lc_req = None           # no
-        lc_act = None           # no
-        lc_state = None         # ok
-        lc_timeout = None       # no
-        i2c_err = None          # no
-        bbu_miss = None         # no
-        bbu_replace = None      # no
-        capac_low = None        # no
-        per_learn = None        # no
-        trans_learn = None      # no
-        no_space = None         # no
-        pack_fail = None        # no
-        micro_upd = None        # no
+        bbu = empty_bbu_state()
+        bbu['exit_code'] = exit_code
 
         for line in stdoutdata.splitlines():
 
@@ -180,89 +255,142 @@ class CheckMegaRaidBBUPlugin(CheckMegaRaidPlugin):
 
             match = re_batt_type.search(line)
             if match:
-                batt_type = match.group(1)
+                bbu['batt_type'] = match.group(1)
                 continue
 
             match = re_batt_state.search(line)
             if match:
-                batt_state = match.group(1)
+                bbu['batt_state'] = match.group(1)
                 continue
 
             match = re_voltage.search(line)
             if match:
-                voltage = match.group(1).lower()
+                bbu['voltage'] = match.group(1).lower()
                 continue
 
             match = re_temp.search(line)
             if match:
-                temperature = match.group(1).lower()
+                bbu['temperature'] = match.group(1).lower()
                 continue
 
             match = re_lc_req.search(line)
             if match:
-                lc_req = match.group(1).lower()
+                bbu['lc_req'] = match.group(1).lower()
                 continue
 
             match = re_lc_act.search(line)
             if match:
-                lc_act = match.group(1).lower()
+                bbu['lc_act'] = match.group(1).lower()
                 continue
 
             match = re_lc_state.search(line)
             if match:
-                lc_state = match.group(1).lower()
+                bbu['lc_state'] = match.group(1).lower()
                 continue
 
             match = re_lc_tout.search(line)
             if match:
-                lc_timeout = match.group(1).lower()
+                bbu['lc_timeout'] = match.group(1).lower()
                 continue
 
             match = re_i2c_err.search(line)
             if match:
-                i2c_err = match.group(1).lower()
+                bbu['i2c_err'] = match.group(1).lower()
                 continue
 
             match = re_bbu_miss.search(line)
             if match:
-                bbu_miss = match.group(1).lower()
+                bbu['bbu_miss'] = match.group(1).lower()
                 continue
 
             match = re_bbu_replace.search(line)
             if match:
-                bbu_replace = match.group(1).lower()
+                bbu['bbu_replace'] = match.group(1).lower()
                 continue
 
             match = re_capac_low.search(line)
             if match:
-                capac_low = match.group(1).lower()
+                bbu['capac_low'] = match.group(1).lower()
                 continue
 
             match = re_per_learn.search(line)
             if match:
-                per_learn = match.group(1).lower()
+                bbu['per_learn'] = match.group(1).lower()
                 continue
 
             match = re_trans_learn.search(line)
             if match:
-                trans_learn = match.group(1).lower()
+                bbu['trans_learn'] = match.group(1).lower()
                 continue
 
             match = re_no_space.search(line)
             if match:
-                no_space = match.group(1).lower()
+                bbu['no_space'] = match.group(1).lower()
                 continue
 
             match = re_pack_fail.search(line)
             if match:
-                pack_fail = match.group(1).lower()
+                bbu['pack_fail'] = match.group(1).lower()
                 continue
 
             match = re_micro_upd.search(line)
             if match:
-                micro_upd = match.group(1).lower()
+                bbu['micro_upd'] = match.group(1).lower()
                 continue
 
+        return bbu
+
+    # -------------------------------------------------------------------------
+    def get_bbu_state_storcli(self):
+        """
+        Retrieves the state of the BBU from the JSON output of
+        'storcli /cX/bbu show all J', or of 'storcli /cX/cv show all J',
+        if the adapter has a CacheVault module instead of a battery.
+
+        @return: the state of the BBU
+        @rtype: dict
+
+        """
+
+        response = self.storcli('/bbu', ignore_errors=True)
+        if response is None:
+            response = self.storcli('/cv')
+
+        return storcli_bbu_state(response)
+
+    # -------------------------------------------------------------------------
+    def call(self):
+        """
+        Method to call the plugin directly.
+        """
+
+        state = nagios.state.ok
+        out = "BBU of MegaRaid adapter %d seems to be okay." % (self.adapter_nr)
+
+        if self.backend == 'storcli':
+            bbu = self.get_bbu_state_storcli()
+        else:
+            bbu = self.get_bbu_state_megacli()
+
+        exit_code = bbu['exit_code']
+        batt_type = bbu['batt_type']
+        batt_state = bbu['batt_state']
+        voltage = bbu['voltage']
+        temperature = bbu['temperature']
+        lc_req = bbu['lc_req']
+        lc_act = bbu['lc_act']
+        lc_state = bbu['lc_state']
+        lc_timeout = bbu['lc_timeout']
+        i2c_err = bbu['i2c_err']
+        bbu_miss = bbu['bbu_miss']
+        bbu_replace = bbu['bbu_replace']
+        capac_low = bbu['capac_low']
+        per_learn = bbu['per_learn']
+        trans_learn = bbu['trans_learn']
+        no_space = bbu['no_space']
+        pack_fail = bbu['pack_fail']
+        micro_upd = bbu['micro_upd']
+
         add_infos = []
         if exit_code:
             state = nagios.state.critical
@@ -27,10 +27,36 @@ from nagios.plugins.check_megaraid import CheckMegaRaidPlugin
 # --------------------------------------------
 # Some module variables
 
-__version__ = '0.3.1'
+__version__ = '0.4.1'
 
 log = logging.getLogger(__name__)
 
+STORCLI_HOTSPARE_STATES = ('ghs', 'dhs')
+
+
+# =============================================================================
+def storcli_hotspares(response):
+    """
+    Counts the drives and the hotspare drives (global and dedicated)
+    in the 'PD LIST' of the response data of 'storcli /cX show all J'.
+
+    @param response: the response data of the storcli call
+    @type response: dict
+
+    @return: the total number of drives and the number of hotspares
+    @rtype: tuple of int
+
+    """
+
+    drives_total = 0
+    found_hotspares = 0
+    for pd in response.get('PD LIST', []):
+        drives_total += 1
+        if str(pd.get('State', '')).strip().lower() in STORCLI_HOTSPARE_STATES:
+            found_hotspares += 1
+
+    return (drives_total, found_hotspares)
+
 
 # =============================================================================
 class CheckMegaRaidHotsparePlugin(CheckMegaRaidPlugin):
@@ -181,14 +207,15 @@ class CheckMegaRaidHotsparePlugin(CheckMegaRaidPlugin):
         )
 
     # -------------------------------------------------------------------------
-    def call(self):
-        """
-        Method to call the plugin directly.
+    def count_hotspares_megacli(self):
         """
+        Counts the drives and the hotspare drives in the output
+        of 'MegaCli -PdList'.
 
-        state = nagios.state.ok
-        out = "Number of existing hotspares of MegaRaid adapter %d seems to be okay." % (
-            self.adapter_nr)
+        @return: the total number of drives and the number of hotspares
+        @rtype: tuple of int
+
+        """
 
         # Slot Number: 23
         re_slot = re.compile(r'^\s*Slot\s+Number\s*:\s*\d+', re.IGNORECASE)
@@ -215,6 +242,23 @@ class CheckMegaRaidHotsparePlugin(CheckMegaRaidPlugin):
             if match and match.group(1).lower() == 'hotspare':
                 found_hotspares += 1
 
+        return (drives_total, found_hotspares)
+
+    # -------------------------------------------------------------------------
+    def call(self):
+        """
+        Method to call the plugin directly.
+        """
+
+        state = nagios.state.ok
+        out = "Number of existing hotspares of MegaRaid adapter %d seems to be okay." % (
+            self.adapter_nr)
+
+        if self.backend == 'storcli':
+            (drives_total, found_hotspares) = storcli_hotspares(self.storcli())
+        else:
+            (drives_total, found_hotspares) = self.count_hotspares_megacli()
+
         log.debug("Found %d drives, %d hotspares.", drives_total, found_hotspares)
 
         state = self.threshold.get_status(found_hotspares)
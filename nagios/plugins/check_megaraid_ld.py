@@ -24,14 +24,23 @@ from nagios.plugin.functions import max_state
 
 import nagios.plugins.check_megaraid
 from nagios.plugins.check_megaraid import CheckMegaRaidPlugin
+from nagios.plugins.check_megaraid import STORCLI_VD_STATES
 
 # --------------------------------------------
 # Some module variables
 
-__version__ = '0.2.2'
+__version__ = '0.3.1'
 
 log = logging.getLogger(__name__)
 
+# TYPE: RAID1, RAID10, RAID50
+re_storcli_raid = re.compile(r'^\s*RAID(\d+)', re.IGNORECASE)
+# Size: 2.728 TB
+re_storcli_size = re.compile(r'^\s*(\d+(?:\.\d*)?)\s*(\S+)?')
+# Active Operations: Consistency Check 95% ...
+re_storcli_consist = re.compile(
+    r'(?:Check\s+Consistency|Consistency\s+Check|\bCC\b)\D*(\d+)\s*%', re.IGNORECASE)
+
 # Example output
 """
 0 storage208:~ # megacli -LdInfo -L 0 -a0
@@ -94,6 +103,91 @@ Exit Code: 0x00
 """
 
 
+# =============================================================================
+def empty_ld_info():
+    """
+    Returns the structure with the information about a logical drive
+    filled by the get_ld_info_*() methods of CheckMegaRaidLdPlugin.
+
+    @rtype: dict
+    """
+
+    return {
+        'exit_code': 0,
+        'raid_level': None,
+        'size_val': None,
+        'size_unit': None,
+        'ld_state': None,
+        'pd_number': None,
+        'span_depth': None,
+        'ld_cached': None,
+        'consist_percent': None,
+        'consist_min': None,
+    }
+
+
+# =============================================================================
+def storcli_ld_info(response, ld_number):
+    """
+    Evaluates the response data of 'storcli /cX/vY show all J'.
+
+    @param response: the response data of the storcli call
+    @type response: dict
+    @param ld_number: the number of the logical drive
+    @type ld_number: int
+
+    @return: the information about the logical drive or None, if the
+             logical drive was not found in the response data
+    @rtype: dict or None
+
+    """
+
+    vd = None
+    for key in response:
+        if not key.startswith('/c') or not key.endswith('/v%d' % (ld_number)):
+            continue
+        if response[key]:
+            vd = response[key][0]
+        break
+    if vd is None:
+        return None
+
+    props = response.get('VD%d Properties' % (ld_number), {})
+    info = empty_ld_info()
+
+    span_depth = int(props.get('Span Depth', 1))
+    info['span_depth'] = span_depth
+    if 'Number of Drives Per Span' in props:
+        info['pd_number'] = int(props['Number of Drives Per Span'])
+
+    match = re_storcli_raid.search(str(vd.get('TYPE', '')))
+    if match:
+        level = match.group(1)
+        if span_depth > 1 and len(level) > 1:
+            # RAID10, RAID50 and RAID60 in MegaCli notation: primary level and span depth
+            level = level[:-1]
+        info['raid_level'] = int(level)
+
+    match = re_storcli_size.search(str(vd.get('Size', '')))
+    if match:
+        info['size_val'] = float(match.group(1))
+        info['size_unit'] = match.group(2)
+
+    vd_state = str(vd.get('State', '')).strip()
+    if vd_state:
+        info['ld_state'] = STORCLI_VD_STATES.get(vd_state.lower(), vd_state)
+
+    cached = props.get('Is VD Cached')
+    if cached is not None:
+        info['ld_cached'] = str(cached)
+
+    match = re_storcli_consist.search(str(props.get('Active Operations', '')))
+    if match:
+        info['consist_percent'] = int(match.group(1))
+
+    return info
+
+
 # =============================================================================
 class CheckMegaRaidLdPlugin(CheckMegaRaidPlugin):
     """
@@ -239,14 +333,15 @@ class CheckMegaRaidLdPlugin(CheckMegaRaidPlugin):
             self._warn_on_consistency_check = True
 
     # -------------------------------------------------------------------------
-    def call(self):
-        """
-        Method to call the plugin directly.
+    def get_ld_info_megacli(self):
         """
+        Retrieves the information about the logical drive from the output
+        of 'MegaCli -LdInfo'.
 
-        state = nagios.state.ok
-        out = "LD %d of MegaRaid adapter %d seems to be okay." % (
-            self.ld_number, self.adapter_nr)
+        @return: the information about the logical drive
+        @rtype: dict
+
+        """
 
         # Adapter 0: Virtual Drive 55 Does not Exist.
         re_not_exists = re.compile(
@@ -273,20 +368,13 @@ class CheckMegaRaidLdPlugin(CheckMegaRaidPlugin):
             r'Check\s+Consistency\s*:\s+Completed\s+(\d+)%,\s+Taken\s+(\d+)\s*min',
             re.IGNORECASE)
 
-        raid_level = None
-        size_val = None
-        size_unit = None
-        ld_state = None
-        pd_number = None
-        span_depth = None
-        ld_cached = None
-        consist_percent = None
-        consist_min = None
+        info = empty_ld_info()
 
         args = ('-LdInfo', '-L', ("%d" % (self.ld_number)))
         (stdoutdata, stderrdata, ret, exit_code) = self.megacli(args)
         if self.verbose > 2:
             log.debug("Output on StdOut:\n%s", stdoutdata)
+        info['exit_code'] = exit_code
 
         for line in stdoutdata.splitlines():
 
@@ -298,38 +386,84 @@ class CheckMegaRaidLdPlugin(CheckMegaRaidPlugin):
 
             match = re_raid_level.search(line)
             if match:
-                raid_level = int(match.group(1))
+                info['raid_level'] = int(match.group(1))
                 continue
 
             match = re_size.search(line)
             if match:
-                size_val = float(match.group(1))
-                size_unit = match.group(2)
+                info['size_val'] = float(match.group(1))
+                info['size_unit'] = match.group(2)
                 continue
 
             match = re_state.search(line)
             if match:
-                ld_state = match.group(1)
+                info['ld_state'] = match.group(1)
                 continue
 
             match = re_number.search(line)
             if match:
-                pd_number = int(match.group(1))
+                info['pd_number'] = int(match.group(1))
                 continue
 
             match = re_span.search(line)
             if match:
-                span_depth = int(match.group(1))
+                info['span_depth'] = int(match.group(1))
                 continue
 
             match = re_cached.search(line)
             if match:
-                ld_cached = match.group(1)
+                info['ld_cached'] = match.group(1)
 
             match = re_consist.search(line)
             if match:
-                consist_percent = int(match.group(1))
-                consist_min = int(match.group(2))
+                info['consist_percent'] = int(match.group(1))
+                info['consist_min'] = int(match.group(2))
+
+        return info
+
+    # -------------------------------------------------------------------------
+    def get_ld_info_storcli(self):
+        """
+        Retrieves the information about the logical drive from the JSON output
+        of 'storcli /cX/vY show all J'.
+
+        @return: the information about the logical drive
+        @rtype: dict
+
+        """
+
+        response = self.storcli('/v%d' % (self.ld_number))
+        info = storcli_ld_info(response, self.ld_number)
+        if info is None:
+            self.die("Adapter %d: Virtual Drive %d Does not Exist." % (
+                self.adapter_nr, self.ld_number))
+        return info
+
+    # -------------------------------------------------------------------------
+    def call(self):
+        """
+        Method to call the plugin directly.
+        """
+
+        state = nagios.state.ok
+        out = "LD %d of MegaRaid adapter %d seems to be okay." % (
+            self.ld_number, self.adapter_nr)
+
+        if self.backend == 'storcli':
+            info = self.get_ld_info_storcli()
+        else:
+            info = self.get_ld_info_megacli()
+
+        exit_code = info['exit_code']
+        raid_level = info['raid_level']
+        size_val = info['size_val']
+        size_unit = info['size_unit']
+        ld_state = info['ld_state']
+        pd_number = info['pd_number']
+        span_depth = info['span_depth']
+        ld_cached = info['ld_cached']
+        consist_percent = info['consist_percent']
+        consist_min = info['consist_min']
 
         if exit_code:
             state = nagios.state.critical
@@ -343,8 +477,10 @@ class CheckMegaRaidLdPlugin(CheckMegaRaidPlugin):
         if consist_percent is not None:
             if self.warn_on_consistency_check:
                 state = max_state(state, nagios.state.warning)
-            consistency_out = ", consistency check completed: %d%%, taken %d min." % (
-                consist_percent, consist_min)
+            consistency_out = ", consistency check completed: %d%%" % (consist_percent)
+            if consist_min is not None:
+                consistency_out += ", taken %d min" % (consist_min)
+            consistency_out += "."
 
         cached_out = ', cached: No'
         if ld_cached:
@@ -26,11 +26,12 @@ from nagios.plugin.functions import max_state
 
 import nagios.plugins.check_megaraid
 from nagios.plugins.check_megaraid import CheckMegaRaidPlugin
+from nagios.plugins.check_megaraid import storcli_drives
 
 # --------------------------------------------
 # Some module variables
 
-__version__ = '0.2.3'
+__version__ = '0.3.1'
 
 log = logging.getLogger(__name__)
 
@@ -107,14 +108,15 @@ class CheckMegaRaidPdPlugin(CheckMegaRaidPlugin):
         super(CheckMegaRaidPdPlugin, self).parse_args(args)
 
     # -------------------------------------------------------------------------
-    def call(self):
-        """
-        Method to call the plugin directly.
+    def collect_drives_megacli(self):
         """
+        Collects the state of all physical drives from the output
+        of 'MegaCli -PdList' into self.drive_list and self.drive.
 
-        state = nagios.state.ok
-        out = "State of physical drives of MegaRaid adapter %d seems to be okay." % (
-            self.adapter_nr)
+        @return: the total number of found drives
+        @rtype: int
+
+        """
 
         # Enclosure Device ID: 0
         re_enc = re.compile(r'^\s*Enclosure\s+Device\s+ID\s*:\s*(\d+)', re.IGNORECASE)
@@ -137,22 +139,6 @@ class CheckMegaRaidPdPlugin(CheckMegaRaidPlugin):
         re_foreign_state = re.compile(
             r'^\s*Foreign\s+state\s*:\s*(\S+.*)', re.IGNORECASE)
 
-        good_fw_states = (
-            r'Online,\s+Spun\s+Up',
-            r'Hotspare,\s+Spun\s+Up',
-            r'Hotspare,\s+Spun\s+Down',
-            r'Unconfigured\(good\),\s+Spun\s+Up',
-            r'Unconfigured\(good\),\s+Spun\s+Down',
-        )
-        warn_fw_states = (
-            r'Rebuild',
-            r'Copyback',
-        )
-        good_fw_pattern = r'^\s*(?:' + r'|'.join(good_fw_states) + r')\s*$'
-        warn_fw_pattern = r'^\s*(?:' + r'|'.join(warn_fw_states) + r')\s*$'
-        re_good_fw_state = re.compile(good_fw_pattern, re.IGNORECASE)
-        re_warn_fw_state = re.compile(warn_fw_pattern, re.IGNORECASE)
-
         drives_total = 0
         args = ('-PdList',)
         (stdoutdata, stderrdata, ret, exit_code) = self.megacli(args)
@@ -233,6 +219,59 @@ class CheckMegaRaidPdPlugin(CheckMegaRaidPlugin):
                 self.drive_list.append(pd_id)
                 self.drive[pd_id] = cur_dev
 
+        return drives_total
+
+    # -------------------------------------------------------------------------
+    def collect_drives_storcli(self):
+        """
+        Collects the state of all physical drives from the JSON output
+        of 'storcli /cX/eall/sall show all J' into self.drive_list
+        and self.drive.
+
+        @return: the total number of found drives
+        @rtype: int
+
+        """
+
+        response = self.storcli('/eall/sall')
+        drives = storcli_drives(response)
+        for pd_id in drives:
+            self.drive_list.append(pd_id)
+            self.drive[pd_id] = drives[pd_id]
+
+        return len(self.drive_list)
+
+    # -------------------------------------------------------------------------
+    def call(self):
+        """
+        Method to call the plugin directly.
+        """
+
+        state = nagios.state.ok
+        out = "State of physical drives of MegaRaid adapter %d seems to be okay." % (
+            self.adapter_nr)
+
+        good_fw_states = (
+            r'Online,\s+Spun\s+Up',
+            r'Hotspare,\s+Spun\s+Up',
+            r'Hotspare,\s+Spun\s+Down',
+            r'Unconfigured\(good\),\s+Spun\s+Up',
+            r'Unconfigured\(good\),\s+Spun\s+Down',
+        )
+        warn_fw_states = (
+            r'Rebuild',
+            r'Copyback',
+        )
+        good_fw_pattern = r'^\s*(?:' + r'|'.join(good_fw_states) + r')\s*$'
+        warn_fw_pattern = r'^\s*(?:' + r'|'.join(warn_fw_states) + r')\s*$'
+        re_good_fw_state = re.compile(good_fw_pattern, re.IGNORECASE)
+        re_warn_fw_state = re.compile(warn_fw_pattern, re.IGNORECASE)
+
+        if self.backend == 'storcli':
+            drives_total = self.collect_drives_storcli()
+        else:
+            drives_total = self.collect_drives_megacli()
+
         media_errors = 0
         other_errors = 0
         predictive_failures = 0
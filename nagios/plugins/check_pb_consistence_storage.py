@@ -19,6 +19,8 @@ import uuid
 import math
 import datetime
 
+from collections import namedtuple
+
 try:
     import configparser as cfgparser
 except ImportError:
@@ -30,7 +32,7 @@ except ImportError:
 
 import nagios
 
-from nagios.common import pp
+from nagios.plugin.logguard import LogGuard, LazyPP
 
 from nagios.plugin.range import NagiosRange
 
@@ -41,12 +43,10 @@ from nagios.plugins.base_dcm_client_check import DEFAULT_TIMEOUT, DEFAULT_PB_VG
 from nagios.plugins.base_dcm_client_check import STORAGE_CONFIG_DIR, DUMMY_LV, BACKUP_LV
 from nagios.plugins.base_dcm_client_check import BaseDcmClientPlugin
 
-from dcmanagerclient.client import RestApiError
-
 # --------------------------------------------
 # Some module variables
 
-__version__ = '0.9.3'
+__version__ = '0.10.3'
 __copyright__ = 'Copyright (c) 2015 Frank Brehm, Berlin.'
 
 DEFAULT_WARN_VOL_ERRORS = 0
@@ -58,6 +58,14 @@ LVM_PATH = os.sep + os.path.join('usr', 'sbin')
 LVM_BIN_PATH = os.path.join(LVM_PATH, 'lvm')
 
 log = logging.getLogger(__name__)
+log_guard = LogGuard(log)
+
+# Compact records of the volumes from the REST API with only the fields
+# needed by the check
+ApiVolume = namedtuple('ApiVolume', ['guid', 'replicated', 'size', 'state'])
+ApiImage = namedtuple('ApiImage', ['guid', 'replicated', 'size', 'img_type', 'state'])
+ApiSnapshot = namedtuple('ApiSnapshot', ['guid', 'size', 'state'])
+TargetVolume = namedtuple('TargetVolume', ['size', 'type', 'state'])
 
 
 # =============================================================================
@@ -345,45 +353,21 @@ class CheckPbConsistenceStoragePlugin(BaseDcmClientPlugin):
 
         self.all_api_volumes = {}
 
-        self.get_api_storage_volumes()
-        for vol in self.api_volumes:
-            guid = str(vol['guid'])
-            size = vol['size']
-            self.all_api_volumes[guid] = {
-                'size': size,
-                'type': 'vol',
-                'state': vol['state'],
-            }
-        self.api_volumes = None
-
-        self.get_api_image_volumes()
-        for vol in self.api_images:
-            guid = str(vol['guid'])
-            size = vol['size']
-            self.all_api_volumes[guid] = {
-                'size': size,
-                'type': 'img',
-                'state': vol['state'],
-            }
-        self.api_images = None
-
-        self.get_api_snapshot_volumes()
-        for vol in self.api_snapshots:
-            guid = str(vol['guid'])
-            size = vol['size']
-            self.all_api_volumes[guid] = {
-                'size': size,
-                'type': 'snap',
-                'state': vol['state'],
-            }
-        self.api_snapshots = None
+        for vol in self.iter_api_storage_volumes():
+            self.all_api_volumes[str(vol.guid)] = TargetVolume(vol.size, 'vol', vol.state)
+
+        for vol in self.iter_api_image_volumes():
+            self.all_api_volumes[str(vol.guid)] = TargetVolume(vol.size, 'img', vol.state)
+
+        for vol in self.iter_api_snapshot_volumes():
+            self.all_api_volumes[str(vol.guid)] = TargetVolume(vol.size, 'snap', vol.state)
 
         if self.verbose > 2:
-            log.debug("All Volumes from API:\n%s", pp(self.all_api_volumes))
+            log.debug("All Volumes from API:\n%s", LazyPP(self.all_api_volumes))
 
         self.get_lvm_lvs()
         if self.verbose > 3:
-            log.debug("All Logical Volumes from LVM:\n%s", pp(self.lvm_lvs))
+            log.debug("All Logical Volumes from LVM:\n%s", LazyPP(self.lvm_lvs))
 
         self.count = {
             'total': 0,
@@ -414,7 +398,7 @@ class CheckPbConsistenceStoragePlugin(BaseDcmClientPlugin):
             self.add_perfdata(label=key, value=self.count[key])
 
         if self.verbose > 1:
-            log.debug("Got following counts:\n%s", pp(self.count))
+            log.debug("Got following counts:\n%s", LazyPP(self.count))
 
         self.exit(state, out)
 
@@ -501,7 +485,7 @@ class CheckPbConsistenceStoragePlugin(BaseDcmClientPlugin):
                 continue
 
             if lv['remove_timestamp']:
-                prov_state = self.all_api_volumes[guid]['state']
+                prov_state = self.all_api_volumes[guid].state
                 if prov_state and 'delete' in prov_state:
                     # Volume is on deletion
                     if self.verbose > 2:
@@ -521,7 +505,7 @@ class CheckPbConsistenceStoragePlugin(BaseDcmClientPlugin):
                 continue
 
             cur_size = lv['total']
-            target_size = self.all_api_volumes[guid]['size']
+            target_size = self.all_api_volumes[guid].size
             if cur_size != target_size:
                 # different sizes between database and current state
                 self.count['error'] += 1
@@ -540,12 +524,12 @@ class CheckPbConsistenceStoragePlugin(BaseDcmClientPlugin):
         if len(self.all_api_volumes.keys()):
             for guid in self.all_api_volumes:
                 voltype = 'Volume'
-                if self.all_api_volumes[guid]['type'] == 'img':
+                if self.all_api_volumes[guid].type == 'img':
                     voltype = 'Image'
-                elif self.all_api_volumes[guid]['type'] == 'snap':
+                elif self.all_api_volumes[guid].type == 'snap':
                     voltype = 'Snapshot'
 
-                prov_state = self.all_api_volumes[guid]['state']
+                prov_state = self.all_api_volumes[guid].state
 
                 if prov_state and 'delete' in prov_state:
                     # Volume is on deletion
@@ -566,13 +550,24 @@ class CheckPbConsistenceStoragePlugin(BaseDcmClientPlugin):
                 # These volumes should be there
                 log.info(
                     "%s %s with a size of %d MiB doesn't exists.", voltype,
-                    guid, self.all_api_volumes[guid]['size'])
+                    guid, self.all_api_volumes[guid].size)
                 self.count['missing'] += 1
 
     # -------------------------------------------------------------------------
     def get_api_storage_volumes(self):
 
-        self.api_volumes = []
+        self.api_volumes = list(self.iter_api_storage_volumes())
+
+    # -------------------------------------------------------------------------
+    def iter_api_storage_volumes(self):
+        """
+        Gives back the storage volumes of the current storage server from
+        the REST API one by one, while they are received.
+
+        @return: the storage volumes
+        @rtype: iterator of ApiVolume
+
+        """
 
         key_replicated = 'replicated'
         key_size = 'size'
@@ -588,14 +583,9 @@ class CheckPbConsistenceStoragePlugin(BaseDcmClientPlugin):
             key_guid = key_guid.decode('utf-8')
             key_virtual_state = key_virtual_state.decode('utf-8')
 
-        storages = None
-        try:
-            storages = self.api.vstorages(pstorage=self.hostname, contract_infos=False)
-        except RestApiError as e:
-            self.die(str(e))
-        except Exception as e:
-            self.die("%s: %s" % (e.__class__.__name__, e))
+        storages = self.iter_api_records('vstorages', pstorage=self.hostname, contract_infos=False)
 
+        count = 0
         first_volume = True
         for stor in storages:
 
@@ -604,7 +594,7 @@ class CheckPbConsistenceStoragePlugin(BaseDcmClientPlugin):
                 vl = 2
 
             if self.verbose > vl:
-                log.debug("Got Storage volume from API:\n%s", pp(stor))
+                log.debug("Got Storage volume from API:\n%s", LazyPP(stor))
             first_volume = False
 
             replicated = True
@@ -633,32 +623,38 @@ class CheckPbConsistenceStoragePlugin(BaseDcmClientPlugin):
                     break
 
             if not guid:
-                log.debug("No valid GUID found for storage volume:\n%s", pp(stor))
+                log.debug("No valid GUID found for storage volume:\n%s", LazyPP(stor))
                 continue
 
             if state:
                 state = state.lower()
 
-            vol = {
-                'guid': guid,
-                'replicated': replicated,
-                'size': size,
-                'state': state,
-            }
-            self.api_volumes.append(vol)
+            vol = ApiVolume(guid, replicated, size, state)
+            count += 1
 
             if self.verbose > vl:
-                log.debug("Transferred data of storage volume:\n%s", pp(vol))
+                log.debug("Transferred data of storage volume: %r", vol)
+
+            yield vol
 
         if self.verbose > 1:
-            log.debug("Got %d Storage volumes from API.", len(self.api_volumes))
-        if self.verbose > 3:
-            log.debug("Got Storage volumes from API:\n%s", pp(self.api_volumes))
+            log.debug("Got %d Storage volumes from API.", count)
 
     # -------------------------------------------------------------------------
     def get_api_image_volumes(self):
 
-        self.api_images = []
+        self.api_images = list(self.iter_api_image_volumes())
+
+    # -------------------------------------------------------------------------
+    def iter_api_image_volumes(self):
+        """
+        Gives back the image volumes of the current storage server from
+        the REST API one by one, while they are received.
+
+        @return: the image volumes
+        @rtype: iterator of ApiImage
+
+        """
 
         key_replicated = 'replicate'
         key_size = 'size'
@@ -676,14 +672,9 @@ class CheckPbConsistenceStoragePlugin(BaseDcmClientPlugin):
             key_image_type = key_image_type.decode('utf-8')
             key_virtual_state = key_virtual_state.decode('utf-8')
 
-        images = None
-        try:
-            images = self.api.vimages(pstorage=self.hostname)
-        except RestApiError as e:
-            self.die(str(e))
-        except Exception as e:
-            self.die("%s: %s" % (e.__class__.__name__, e))
+        images = self.iter_api_records('vimages', pstorage=self.hostname)
 
+        count = 0
         first_volume = True
         for stor in images:
 
@@ -692,7 +683,7 @@ class CheckPbConsistenceStoragePlugin(BaseDcmClientPlugin):
                 vl = 2
 
             if self.verbose > vl:
-                log.debug("Got Image volume from API:\n%s", pp(stor))
+                log.debug("Got Image volume from API:\n%s", LazyPP(stor))
             first_volume = False
 
             state = None
@@ -729,58 +720,50 @@ class CheckPbConsistenceStoragePlugin(BaseDcmClientPlugin):
                     break
 
             if not guid:
-                log.debug("No valid GUID found for image:\n%s", pp(stor))
+                log.debug("No valid GUID found for image:\n%s", LazyPP(stor))
                 continue
 
             if state:
                 state = state.lower()
 
-            vol = {
-                'guid': guid,
-                'replicated': replicated,
-                'size': size,
-                'img_type': img_type,
-                'state': state,
-            }
-            self.api_images.append(vol)
+            vol = ApiImage(guid, replicated, size, img_type, state)
+            count += 1
 
             if self.verbose > vl:
-                log.debug("Transferred data of image volume:\n%s", pp(vol))
+                log.debug("Transferred data of image volume: %r", vol)
+
+            yield vol
 
         if self.verbose > 1:
-            log.debug("Got %d Image volumes from API.", len(self.api_images))
-        if self.verbose > 3:
-            log.debug("Got Image volumes from API:\n%s", pp(self.api_images))
+            log.debug("Got %d Image volumes from API.", count)
 
     # -------------------------------------------------------------------------
     def get_api_snapshot_volumes(self):
 
-        self.api_snapshots = []
+        self.api_snapshots = list(self.iter_api_snapshot_volumes())
+
+    # -------------------------------------------------------------------------
+    def iter_api_snapshot_volumes(self):
+        """
+        Gives back the snapshot volumes of the current storage server from
+        the REST API one by one, while they are received.
+
+        @return: the snapshot volumes
+        @rtype: iterator of ApiSnapshot
+
+        """
 
-        key_replicated = 'replicate'
         key_size = 'size'
-        key_replicas = 'replicas'
-        key_storage_server = 'storage_server'
         key_guid = 'guid'
-        key_image_type = 'image_type'
         key_virtual_state = 'virtual_state'
         if sys.version_info[0] <= 2:
-            key_replicated = key_replicated.decode('utf-8')
             key_size = key_size.decode('utf-8')
-            key_replicas = key_replicas.decode('utf-8')
-            key_storage_server = key_storage_server.decode('utf-8')
             key_guid = key_guid.decode('utf-8')
-            key_image_type = key_image_type.decode('utf-8')
             key_virtual_state = key_virtual_state.decode('utf-8')
 
-        snapshots = None
-        try:
-            snapshots = self.api.vsnapshots(pstorage=self.hostname)
-        except RestApiError as e:
-            self.die(str(e))
-        except Exception as e:
-            self.die("%s: %s" % (e.__class__.__name__, e))
+        snapshots = self.iter_api_records('vsnapshots', pstorage=self.hostname)
 
+        count = 0
         first_volume = True
         for stor in snapshots:
 
@@ -789,7 +772,7 @@ class CheckPbConsistenceStoragePlugin(BaseDcmClientPlugin):
                 vl = 2
 
             if self.verbose > vl:
-                log.debug("Got Snapshot volume from API:\n%s", pp(stor))
+                log.debug("Got Snapshot volume from API:\n%s", LazyPP(stor))
             first_volume = False
 
             size = stor[key_size]
@@ -803,20 +786,16 @@ class CheckPbConsistenceStoragePlugin(BaseDcmClientPlugin):
             if state:
                 state = state.lower()
 
-            vol = {
-                'guid': guid,
-                'size': size,
-                'state': state,
-            }
-            self.api_snapshots.append(vol)
+            vol = ApiSnapshot(guid, size, state)
+            count += 1
 
             if self.verbose > vl:
-                log.debug("Transferred data of storage volume:\n%s", pp(vol))
+                log.debug("Transferred data of snapshot volume: %r", vol)
+
+            yield vol
 
         if self.verbose > 1:
-            log.debug("Got %d Snapshot volumes from API.", len(self.api_snapshots))
-        if self.verbose > 3:
-            log.debug("Got Snapshot volumes from API:\n%s", pp(self.api_snapshots))
+            log.debug("Got %d Snapshot volumes from API.", count)
 
     # -------------------------------------------------------------------------
     def get_lvm_lvs(self):
@@ -855,11 +834,15 @@ class CheckPbConsistenceStoragePlugin(BaseDcmClientPlugin):
 
         got_lvs = []
 
+        # the debug levels are evaluated once for all logical volumes
+        debug = log_guard.verbose_debug(self.verbose, 3)
+        trace = log_guard.verbose_debug(self.verbose, 4)
+
         for line in lines:
             line = line.strip()
             if line == '':
                 continue
-            if self.verbose > 4:
+            if trace:
                 log.debug("Checking line %r", line)
 
             words = line.split(";")
@@ -882,7 +865,7 @@ class CheckPbConsistenceStoragePlugin(BaseDcmClientPlugin):
             lv['extent_size'] = int(words[8])
             lv['total'] = int(words[9]) / 1024 / 1024
 
-            if self.verbose > 3:
+            if debug:
                 log.debug(
                     "Got LV %s/%s, size %d MiB ...", lv['vgname'], lv['lvname'], lv['total'])
 
@@ -921,7 +904,8 @@ class CheckPbConsistenceStoragePlugin(BaseDcmClientPlugin):
                             lv['cfg_file'])
                         lv['cfg_file_valid'] = True
                     except CfgFileNotValidError as e:
-                        log.debug("Error reading %r: %s", lv['cfg_file'], e)
+                        if log_guard.debug:
+                            log.debug("Error reading %r: %s", lv['cfg_file'], e)
 
             self.lvm_lvs.append(lv)
 
@@ -19,11 +19,13 @@ import textwrap
 import uuid
 import glob
 
+from collections import namedtuple
+
 # Own modules
 from pb_base.crc import crc64_digest
 
 import nagios
-from nagios.common import pp
+from nagios.plugin.logguard import LogGuard, LazyPP
 
 from nagios.plugin.range import NagiosRange
 from nagios.plugin.extended import CommandNotFoundError
@@ -31,11 +33,10 @@ from nagios.plugin.extended import CommandNotFoundError
 from nagios.plugins.base_dcm_client_check import DEFAULT_TIMEOUT
 from nagios.plugins.base_dcm_client_check import DUMMY_LV, DUMMY_CRC
 from nagios.plugins.base_dcm_client_check import BaseDcmClientPlugin
-
-from dcmanagerclient.client import RestApiError
+from nagios.plugins.base_dcm_client_check import dcm_client
 
 # Some module variables
-__version__ = '0.3.1'
+__version__ = '0.4.3'
 __copyright__ = 'Copyright (c) 2015 Frank Brehm, Berlin.'
 
 DEFAULT_WARN_ERRORS = 0
@@ -50,6 +51,11 @@ SCST_INI_GROUP_DIR = os.path.join(SCST_SRP_TARGET0_DIR, 'ini_groups')
 DEFAULT_STORAGE_VG = 'storage'
 
 log = logging.getLogger(__name__)
+log_guard = LogGuard(log)
+
+# Compact record of a volume from the REST API with only the fields
+# needed to check its exports
+ExportVolume = namedtuple('ExportVolume', ['guid', 'replicated'])
 
 
 class CheckPbStorageExportsPlugin(BaseDcmClientPlugin):
@@ -303,7 +309,7 @@ class CheckPbStorageExportsPlugin(BaseDcmClientPlugin):
         self.check_exports()
         self.check_ini_groups()
 
-        log.debug("Results of check:\n%s", pp(self.count))
+        log.debug("Results of check:\n%s", LazyPP(self.count))
 
         total_errors = self.count['missing'] + self.count['error'] + self.count['needless']
         state = self.threshold.get_status(total_errors)
@@ -325,12 +331,12 @@ class CheckPbStorageExportsPlugin(BaseDcmClientPlugin):
 
         try:
             storages = self.api.pstorages(name=self.hostname)
-        except RestApiError as e:
+        except dcm_client().RestApiError as e:
             self.die(str(e))
         except Exception as e:
             self.die("%s: %s" % (e.__class__.__name__, e))
 
-        log.debug("Info about current storage server from API:\n%s", pp(storages))
+        log.debug("Info about current storage server from API:\n%s", LazyPP(storages))
 
         if not len(storages):
             self.die("Could not find information about current storage server %r." %
@@ -355,14 +361,14 @@ class CheckPbStorageExportsPlugin(BaseDcmClientPlugin):
 
         try:
             pservers = self.api.pservers(cluster=self.current_cluster)
-        except RestApiError as e:
+        except dcm_client().RestApiError as e:
             self.die(str(e))
         except Exception as e:
             self.die("%s: %s" % (e.__class__.__name__, e))
 
         if self.verbose > 3:
             log.debug("Info about pservers in current cluster %r from API:\n%s",
-                      self.current_cluster, pp(pservers))
+                      self.current_cluster, LazyPP(pservers))
 
         key_name = 'name'
         key_zone = 'zone'
@@ -407,7 +413,7 @@ class CheckPbStorageExportsPlugin(BaseDcmClientPlugin):
 
         if self.verbose > 2:
             log.debug("Found Pservers in current cluster %r from API:\n%s",
-                      self.current_cluster, pp(self.valid_pservers))
+                      self.current_cluster, LazyPP(self.valid_pservers))
 
     def check_exports(self):
 
@@ -506,13 +512,7 @@ class CheckPbStorageExportsPlugin(BaseDcmClientPlugin):
             key_pserver_name = key_pserver_name.decode('utf-8')
 
         log.debug("Retrieving storage volumes from API ...")
-        storages = None
-        try:
-            storages = self.api.vstorages(pstorage=self.hostname, contract_infos=False)
-        except RestApiError as e:
-            self.die(str(e))
-        except Exception as e:
-            self.die("%s: %s" % (e.__class__.__name__, e))
+        storages = self.iter_api_records('vstorages', pstorage=self.hostname, contract_infos=False)
 
         first = True
         for stor in storages:
@@ -543,7 +543,7 @@ class CheckPbStorageExportsPlugin(BaseDcmClientPlugin):
                 vl = 2
 
             if self.verbose > vl:
-                log.debug("Got Storage volume from API:\n%s", pp(stor))
+                log.debug("Got Storage volume from API:\n%s", LazyPP(stor))
 
             replicated = True
             if key_replicated in stor:
@@ -560,29 +560,20 @@ class CheckPbStorageExportsPlugin(BaseDcmClientPlugin):
                     break
 
             if not guid:
-                log.debug("No valid GUID found for storage volume:\n%s", pp(stor))
+                log.debug("No valid GUID found for storage volume:\n%s", LazyPP(stor))
                 continue
 
-            vol = {
-                'guid': guid,
-                'replicated': replicated,
-            }
+            vol = ExportVolume(guid, replicated)
             api_volumes[vol_uuid] = vol
 
             if self.verbose > vl:
-                log.debug("Transformed Storage volume %r:\n%s", vol_uuid, pp(vol))
+                log.debug("Transformed Storage volume %r: %r", vol_uuid, vol)
 
             if first:
                 first = False
 
         log.debug("Retrieving storage mappings from API ...")
-        maps = None
-        try:
-            maps = self.api.vstorage_maps(pstorage=self.hostname)
-        except RestApiError as e:
-            self.die(str(e))
-        except Exception as e:
-            self.die("%s: %s" % (e.__class__.__name__, e))
+        maps = self.iter_api_records('vstorage_maps', pstorage=self.hostname)
 
         first = True
 
@@ -625,7 +616,7 @@ class CheckPbStorageExportsPlugin(BaseDcmClientPlugin):
                 vl = 2
 
             if self.verbose > vl:
-                log.debug("Got Storage mapping from API:\n%s", pp(mapping))
+                log.debug("Got Storage mapping from API:\n%s", LazyPP(mapping))
 
             vol_uuid = uuid.UUID(mapping[key_vstorage_uuid])
 
@@ -633,7 +624,7 @@ class CheckPbStorageExportsPlugin(BaseDcmClientPlugin):
                 log.error("No volume for mapping of %r found.", vol_uuid)
                 continue
 
-            guid = api_volumes[vol_uuid]['guid']
+            guid = api_volumes[vol_uuid].guid
             scst_devname = crc64_digest(str(guid))
             if sys.version_info[0] <= 2:
                 pserver = pserver.encode('utf-8')
@@ -642,14 +633,14 @@ class CheckPbStorageExportsPlugin(BaseDcmClientPlugin):
                 'uuid': vol_uuid,
                 'guid': guid,
                 'scst_devname': scst_devname,
-                'replicated': api_volumes[vol_uuid]['replicated'],
+                'replicated': api_volumes[vol_uuid].replicated,
                 'pserver': pserver,
                 'checked': False,
             }
             self.storage_exports.append(m)
 
             if self.verbose > vl:
-                log.debug("Transformed storage mapping:\n%s", pp(m))
+                log.debug("Transformed storage mapping:\n%s", LazyPP(m))
 
             if first:
                 first = False
@@ -683,13 +674,7 @@ class CheckPbStorageExportsPlugin(BaseDcmClientPlugin):
             key_pserver_name = key_pserver_name.decode('utf-8')
 
         log.debug("Retrieving image volumes from API ...")
-        images = None
-        try:
-            images = self.api.vimages(pstorage=self.hostname)
-        except RestApiError as e:
-            self.die(str(e))
-        except Exception as e:
-            self.die("%s: %s" % (e.__class__.__name__, e))
+        images = self.iter_api_records('vimages', pstorage=self.hostname)
 
         first = True
         for img in images:
@@ -717,7 +702,7 @@ class CheckPbStorageExportsPlugin(BaseDcmClientPlugin):
                 vl = 2
 
             if self.verbose > vl:
-                log.debug("Got Image volume from API:\n%s", pp(img))
+                log.debug("Got Image volume from API:\n%s", LazyPP(img))
 
             replicated = bool(img[key_replicated])
             vol_uuid = uuid.UUID(img[key_uuid])
@@ -732,29 +717,20 @@ class CheckPbStorageExportsPlugin(BaseDcmClientPlugin):
                     break
 
             if not guid:
-                log.debug("No valid GUID found for image volume:\n%s", pp(img))
+                log.debug("No valid GUID found for image volume:\n%s", LazyPP(img))
                 continue
 
-            vol = {
-                'guid': guid,
-                'replicated': replicated,
-            }
+            vol = ExportVolume(guid, replicated)
             api_volumes[vol_uuid] = vol
 
             if self.verbose > vl:
-                log.debug("Transformed Image volume %r:\n%s", vol_uuid, pp(vol))
+                log.debug("Transformed Image volume %r: %r", vol_uuid, vol)
 
             if first:
                 first = False
 
         log.debug("Retrieving image mappings from API ...")
-        maps = None
-        try:
-            maps = self.api.vimage_maps(pstorage=self.hostname)
-        except RestApiError as e:
-            self.die(str(e))
-        except Exception as e:
-            self.die("%s: %s" % (e.__class__.__name__, e))
+        maps = self.iter_api_records('vimage_maps', pstorage=self.hostname)
 
         first = True
 
@@ -801,7 +777,7 @@ class CheckPbStorageExportsPlugin(BaseDcmClientPlugin):
                 vl = 2
 
             if self.verbose > vl:
-                log.debug("Got Image mapping from API:\n%s", pp(mapping))
+                log.debug("Got Image mapping from API:\n%s", LazyPP(mapping))
 
             if first:
                 first = False
@@ -812,7 +788,7 @@ class CheckPbStorageExportsPlugin(BaseDcmClientPlugin):
                 log.error("No volume for mapping of %r found.", vol_uuid)
                 continue
 
-            guid = api_volumes[vol_uuid]['guid']
+            guid = api_volumes[vol_uuid].guid
             scst_devname = crc64_digest(str(guid))
             if sys.version_info[0] <= 2:
                 pserver = pserver.encode('utf-8')
@@ -821,14 +797,14 @@ class CheckPbStorageExportsPlugin(BaseDcmClientPlugin):
                 'uuid': vol_uuid,
                 'guid': guid,
                 'scst_devname': scst_devname,
-                'replicated': api_volumes[vol_uuid]['replicated'],
+                'replicated': api_volumes[vol_uuid].replicated,
                 'pserver': pserver,
                 'checked': False,
             }
             self.image_exports.append(m)
 
             if self.verbose > vl:
-                log.debug("Transformed storage mapping:\n%s", pp(m))
+                log.debug("Transformed storage mapping:\n%s", LazyPP(m))
 
         log.debug("Finished retrieving image mappings from API, found %d mappings.",
                   len(self.image_exports))
@@ -858,11 +834,18 @@ class CheckPbStorageExportsPlugin(BaseDcmClientPlugin):
         pattern = os.path.join(SCST_DEV_DIR, '*')
         log.debug("Searching for SCST devices in %r ...", pattern)
         dev_dirs = glob.glob(pattern)
+
+        # the debug levels are evaluated once for all devices, the first
+        # export is shown already with a lower verbosity
+        debug_first = log_guard.verbose_debug(self.verbose, 1)
+        debug = log_guard.verbose_debug(self.verbose, 2)
+        trace = log_guard.verbose_debug(self.verbose, 4)
+
         for dev_dir in dev_dirs:
 
-            vl = 4
+            show_export = trace
             if first:
-                vl = 2
+                show_export = debug
 
             filename_file = os.path.join(dev_dir, 'filename')
             handler_link = os.path.join(dev_dir, 'handler')
@@ -906,14 +889,14 @@ class CheckPbStorageExportsPlugin(BaseDcmClientPlugin):
 
             match = pb_lv.search(export_filename)
             if not match:
-                if self.verbose > 2:
+                if debug:
                     log.debug("Export %r for device %r is not a regular ProfitBricks volume.",
                               devname, export_filename)
                 self.count['alien'] += 1
                 continue
             short_guid = match.group(1)
             if short_guid == DUMMY_LV and devname == DUMMY_CRC:
-                if self.verbose > 1:
+                if debug_first:
                     log.debug("Found the exported notorious dummy device.")
                 self.count['dummy'] += 1
                 continue
@@ -951,11 +934,11 @@ class CheckPbStorageExportsPlugin(BaseDcmClientPlugin):
             if has_errors:
                 self.count['error'] += 1
 
-            if self.verbose > 2:
+            if debug:
                 log.debug("Found export %r.", devname)
 
-            if self.verbose > vl:
-                log.debug("Got existing export:\n%s", pp(export))
+            if show_export:
+                log.debug("Got existing export:\n%s", LazyPP(export))
 
             if first:
                 first = False
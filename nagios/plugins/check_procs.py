@@ -22,15 +22,18 @@ from numbers import Number
 
 from nagios.common import pp
 
+from nagios.plugin.logguard import LogGuard, LazyPP
+
 from nagios.plugin.range import NagiosRange
 
 from nagios.plugin.extended import ExtNagiosPlugin
 
 # Some module variables
 
-__version__ = '0.5.0'
+__version__ = '0.5.1'
 
 log = logging.getLogger(__name__)
+log_guard = LogGuard(log)
 
 PS_CMD = os.sep + os.path.join('bin', 'ps')
 
@@ -685,7 +688,7 @@ class CheckProcsPlugin(ExtNagiosPlugin):
         self.set_thresholds(warning=self.warning, critical=self.critical)
 
         if self.verbose > 2:
-            log.debug("Current object:\n%s", pp(self.as_dict()))
+            log.debug("Current object:\n%s", LazyPP(self.as_dict()))
 
         uom = self.get_uom()
         label = self.get_label()
@@ -832,22 +835,27 @@ class CheckProcsPlugin(ExtNagiosPlugin):
 
         found_processes = []
 
+        # the debug levels are evaluated once for all processes
+        debug = log_guard.verbose_debug(self.verbose, 2)
+        trace = log_guard.verbose_debug(self.verbose, 3)
+        my_pid = os.getpid()
+
         for line in lines[1:]:
 
-            pinfo = self._parse_process_line(line)
+            pinfo = self._parse_process_line(line, trace)
             if not pinfo:
                 log.warn("Could not parse output line of ps: %r", line)
                 continue
 
-            if pinfo.pid == os.getpid():
+            if pinfo.pid == my_pid:
                 # Ignore myself
-                if self.verbose > 2:
+                if debug:
                     log.debug("Ignoring myself.")
                 continue
 
-            if pinfo.ppid == os.getpid():
+            if pinfo.ppid == my_pid:
                 # Ignore the process of the ps-command initiated by myself
-                if self.verbose > 2:
+                if debug:
                     log.debug("Ignoring self initiated process.")
                 continue
 
@@ -866,16 +874,16 @@ class CheckProcsPlugin(ExtNagiosPlugin):
                         found = True
                         break
                 if found:
-                    if self.verbose > 2:
+                    if debug:
                         log.debug("State %r found in %r (%d).", state, pinfo.state, pinfo.pid)
                 else:
-                    if self.verbose > 3:
+                    if trace:
                         log.debug("State %r not found in %r (%d).", state, pinfo.state, pinfo.pid)
                     continue
 
             if self.user:
                 if pinfo.user != self.user:
-                    if self.verbose > 2:
+                    if debug:
                         log.debug("Ignoring process %d of user %r.", pinfo.pid, pinfo.user)
                     continue
 
@@ -906,20 +914,24 @@ class CheckProcsPlugin(ExtNagiosPlugin):
             found_processes.append(pinfo)
 
         # What did we found:
-        if self.verbose > 2:
+        if debug:
             if found_processes:
-                r = []
-                for pinfo in found_processes:
-                    r.append(repr(pinfo))
-                procs = ',\n'.join(r)
+                procs = ',\n'.join(repr(pinfo) for pinfo in found_processes)
                 log.debug("Processes to regard:\n%s", procs)
             else:
                 log.debug("No processes to regard.")
 
         return found_processes
 
-    def _parse_process_line(self, line):
-        """Parsing a line how given back from the ps command."""
+    def _parse_process_line(self, line, trace=False):
+        """Parsing a line how given back from the ps command.
+
+        @param line: the output line of ps
+        @type line: str
+        @param trace: log the parsed process info
+        @type trace: bool
+
+        """
 
         match = re_ps_line.search(line)
         if not match:
@@ -928,7 +940,7 @@ class CheckProcsPlugin(ExtNagiosPlugin):
         kwords = match.groupdict()
 
         pinfo = ProcessInfo(**kwords)
-        if self.verbose > 3:
+        if trace:
             log.debug("Got process info: %s", pinfo)
 
         return pinfo
@@ -9,10 +9,14 @@
 
 # Standard modules
 import os
+import sys
 import logging
 import textwrap
 import re
 import stat
+import glob
+import time
+import threading
 
 from numbers import Number
 
@@ -22,19 +26,677 @@ from numbers import Number
 
 import nagios
 
-from nagios.common import pp
+from nagios.plugin.logguard import LazyPP
+from nagios.plugin.functions import STATUS_TEXT
 from nagios.plugin.range import NagiosRange
+from nagios.plugin.threshold import NagiosThreshold
 from nagios.plugin.extended import ExtNagiosPluginError
 from nagios.plugin.extended import ExtNagiosPlugin
 
+from nagios.plugins.smart_history import DEFAULT_HISTORY_FILE
+from nagios.plugins.smart_history import SECONDS_PER_DAY
+from nagios.plugins.smart_history import SmartHistoryError
+from nagios.plugins.smart_history import SmartHistory
+from nagios.plugins.smart_history import defect_rate
+
 # Some module variables
-__version__ = '0.3.1'
+__version__ = '0.7.6'
 
 log = logging.getLogger(__name__)
 
 DEFAULT_MEGARAID_PATH = '/opt/MegaRAID/MegaCli'
 DEFAULT_WARN_SECTORS = 4
 DEFAULT_CRIT_SECTORS = 10
+DEFAULT_PARALLEL = 8
+DEFAULT_RATE_WINDOW = 7
+DEFAULT_FULL_INTERVAL = 24
+DEFAULT_WARN_USED = 80
+DEFAULT_CRIT_USED = 90
+
+SYS_NVME_DIR = os.sep + os.path.join('sys', 'class', 'nvme')
+
+# The bits of the critical warning in the SMART / health information log
+# of NVMe devices
+NVME_CRITICAL_WARNINGS = (
+    (0x01, "available spare below threshold"),
+    (0x02, "temperature out of range"),
+    (0x04, "reliability degraded"),
+    (0x08, "media in read only mode"),
+    (0x10, "volatile memory backup failed"),
+    (0x20, "persistent memory region read only"),
+)
+
+# The fields of the SMART / health information log of NVMe devices as keys
+# in the disk data by their names in the output of 'smartctl --json'
+# and of 'nvme smart-log -o json'
+NVME_HEALTH_LOG_FIELDS = {
+    'critical_warning': 'critical_warning',
+    'media_errors': 'media_errors',
+    'percentage_used': 'percentage_used',
+    'percent_used': 'percentage_used',
+    'available_spare': 'available_spare',
+    'avail_spare': 'available_spare',
+    'available_spare_threshold': 'available_spare_threshold',
+    'spare_thresh': 'available_spare_threshold',
+    'power_on_hours': 'hours_on',
+}
+
+re_nvme_ctrl = re.compile(r'^nvme\d+$')
+re_nvme_dev = re.compile(r'^nvme\d+(?:n\d+)?$')
+
+# The messages of smartctl have a fixed case, the patterns are searched
+# case sensitive to let them start with a literal prefix, which is
+# searched much faster through the whole output.
+re_is_sas = re.compile(r'Transport\s+protocol\s*:\s*SAS')
+
+no_smart_patterns = (
+    r'Device\s+does\s+not\s+support\s+SMART',
+    # SMART support is:     Unavailable - device lacks SMART capability.
+    r'SMART\s+support\s+is:\s+Unavailable\s+-\s+.*',
+)
+re_no_smart = re.compile(r'(' + r'|'.join(no_smart_patterns) + r')')
+
+re_no_mega_sas = re.compile(r'failed:\s+SATA\s+device\s+detected,', re.IGNORECASE)
+
+# SMART attributes of SATA disks to evaluate, by their name in the output
+# of 'smartctl -x' - the values are the keys in the disk data
+SATA_ATTRIBUTE_NAMES = {
+    'reallocated_sector_ct': 'realloc_sectors',
+    'reported_uncorrect': 'reported_uncorrect',
+    'current_pending_sector': 'current_pending_sector',
+    'offline_uncorrectable': 'offline_uncorretable',
+    'reallocated_event_count': 'realloc_event_count',
+    'erase_fail_count': 'erase_fail_count',
+    'temperature_celsius': 'temperature',
+    'power_on_hours': 'hours_on',
+}
+
+# SMART attributes of SATA disks to evaluate from the JSON output by their ID,
+# temperature and power on hours are taken from the normalized JSON values
+SATA_ATTRIBUTE_IDS = {
+    5: 'realloc_sectors',
+    187: 'reported_uncorrect',
+    196: 'realloc_event_count',
+    197: 'current_pending_sector',
+    198: 'offline_uncorretable',
+}
+
+# SMART attributes, which are summed up to the number of grown defects
+GROWN_DEFECT_ATTRIBUTES = (
+    'realloc_sectors', 'reported_uncorrect', 'current_pending_sector',
+    'offline_uncorretable', 'realloc_event_count', 'erase_fail_count')
+
+# All interesting lines of the output of 'smartctl -x' of a SATA
+# (or a NVMe) disk, evaluated in one pass, e.g.:
+# SMART overall-health self-assessment test result: PASSED
+# Device Model:     ST2000NM0033-9ZM175
+# Serial Number:    Z1X0ABCD
+#   5 Reallocated_Sector_Ct   -O--CK   100   100   000    -    0
+# 187 Reported_Uncorrect      -O--CK   100   100   000    -    0
+# 194 Temperature_Celsius     -O---K   100   100   000    -    25
+# The attributes are also taken out of the old table layout of 'smartctl -A':
+#   5 Reallocated_Sector_Ct   0x0033   100   100   010    Pre-fail  Always       -       3
+re_sata_line = re.compile(
+    r'^\s*(?:'
+    r'SMART\s+overall-health\s+self-assessment\s+test\s+result\s*:\s*(?P<health>\S.*?)\s*$'
+    r'|Device\s+Model\s*:\s*(?P<model>\S.*?)\s*$'
+    r'|Serial\s+Number\s*:\s*(?P<serial>\S.*?)\s*$'
+    r'|\d+\s+(?P<attr>' + r'|'.join(SATA_ATTRIBUTE_NAMES.keys()) + r')'
+    r'\s+(?P<flags>\S+)\s+\S+\s+\S+\s+\S+'
+    r'\s+(?:(?P<attr_type>Pre-fail|Old_age)\s+\S+\s+)?\S+\s+(?P<raw>\d+(?:\.\d*)?)'
+    r'|Model\s+Number\s*:\s*(?P<nvme_model>\S.*?)\s*$'
+    r'|Temperature\s*:\s*(?P<nvme_temp>\d+)\s+Celsius'
+    r'|Power\s+On\s+Hours\s*:\s*(?P<nvme_hours>\d[\d,]*)'
+    r'|Media\s+and\s+Data\s+Integrity\s+Errors\s*:\s*(?P<media_errors>\d[\d,]*)'
+    r'|Critical\s+Warning\s*:\s*(?P<crit_warning>0x[0-9a-f]+)'
+    r'|Percentage\s+Used\s*:\s*(?P<used>\d+)%'
+    r'|Available\s+Spare\s*:\s*(?P<spare>\d+)%'
+    r'|Available\s+Spare\s+Threshold\s*:\s*(?P<spare_thresh>\d+)%'
+    r')', (re.IGNORECASE | re.MULTILINE))
+
+# All interesting lines of the output of 'smartctl -x' of a SAS disk,
+# evaluated in one pass, e.g.:
+# SMART Health Status: OK
+# Elements in grown defect list: 0
+# Current Drive Temperature:     34 C
+#   number of hours powered up = 25230.17
+re_sas_line = re.compile(
+    r'^\s*(?:'
+    r'SMART\s+Health\s+Status\s*:\s*(?P<health>\S.*?)\s*$'
+    r'|Elements\s+in\s+grown\s+defect\s+list\s*:\s*(?P<gd_list>\d+)'
+    r'|Vendor\s*:\s*(?P<vendor>\S.*?)\s*$'
+    r'|Product\s*:\s*(?P<product>\S.*?)\s*$'
+    r'|Serial\s+number\s*:\s*(?P<serial>\S.*?)\s*$'
+    r'|Non-medium\s+error\s+count\s*:\s*(?P<non_medium>\d+)'
+    r'|Current\s+Drive\s+Temperature\s*:\s*(?P<temp>\d+)(?:\s*(?P<temp_unit>[CF]))?'
+    r'|number\s+of\s+hours\s+powered\s+up\s*=\s*(?P<hours>\d+(?:\.\d*)?)'
+    r')', (re.IGNORECASE | re.MULTILINE))
+
+# Patterns for evaluating the output of 'MegaCli -PdList'
+# Enclosure Device ID: 32
+re_pd_enc = re.compile(r'^\s*Enclosure\s+Device\s+ID\s*:\s*(\d+)', re.IGNORECASE)
+# Slot Number: 23
+re_pd_slot = re.compile(r'^\s*Slot\s+Number\s*:\s*(\d+)', re.IGNORECASE)
+# Device Id: 38
+re_pd_dev_id = re.compile(r'^\s*Device\s+Id\s*:\s*(\d+)', re.IGNORECASE)
+# PD Type: SATA
+re_pd_type = re.compile(r'^\s*PD\s+Type\s*:\s*(\S+)', re.IGNORECASE)
+# Firmware state: Unconfigured(good), Spun down
+re_pd_fw_state = re.compile(r'^\s*Firmware\s+state\s*:\s*(\S.*)', re.IGNORECASE)
+re_spin_state = re.compile(r'Spun\s+(Down|Up)', re.IGNORECASE)
+
+
+def new_disk_data():
+    """
+    Returns an empty structure for the evaluated SMART data of a disk.
+    """
+
+    return {
+        'model': None,
+        'serial': None,
+        'health_state': None,
+        'nr_grown_defects': 0,
+        'temperature': None,
+        'hours_on': None,
+        'protocol': None,
+    }
+
+
+def disk_type(is_sas, disk_data=None, device=None):
+    """
+    Gives back the type of a disk for output messages.
+
+    @param is_sas: is the disk a SAS disk
+    @type is_sas: bool
+    @param disk_data: the evaluated SMART data of the disk, if there are some
+    @type disk_data: dict or None
+    @param device: the device file of the disk
+    @type device: str or None
+
+    @return: 'SAS', 'SATA' or 'NVMe'
+    @rtype: str
+
+    """
+
+    if disk_data and disk_data.get('protocol') == 'NVMe':
+        return 'NVMe'
+    if device and re_nvme_dev.search(os.path.basename(device)):
+        return 'NVMe'
+    if is_sas:
+        return 'SAS'
+    return 'SATA'
+
+
+def nvme_critical_warnings(critical_warning):
+    """
+    Gives back the descriptions of the set bits of the critical warning
+    of a NVMe device.
+
+    @param critical_warning: the critical warning of the device
+    @type critical_warning: int
+
+    @return: the descriptions
+    @rtype: list of str
+
+    """
+
+    warnings = []
+    for (bit, desc) in NVME_CRITICAL_WARNINGS:
+        if critical_warning & bit:
+            warnings.append(desc)
+    if critical_warning & ~0x3f:
+        warnings.append("unknown warning")
+
+    return warnings
+
+
+def eval_nvme_health_log(health_log, disk_data, kelvin=False):
+    """
+    Evaluates the SMART / health information log of a NVMe device
+    out of the output of 'smartctl --json' or 'nvme smart-log -o json'
+    into the given disk data. The media and data integrity errors are
+    taken as grown defects.
+
+    @param health_log: the decoded health information log
+    @type health_log: dict
+    @param disk_data: the disk data to fill, see new_disk_data()
+    @type disk_data: dict
+    @param kelvin: the temperature is given in Kelvin (by nvme-cli)
+    @type kelvin: bool
+
+    """
+
+    disk_data['protocol'] = 'NVMe'
+
+    for (field, key) in NVME_HEALTH_LOG_FIELDS.items():
+        value = health_log.get(field)
+        if isinstance(value, dict):
+            value = value.get('value')
+        if value is not None:
+            disk_data[key] = int(value)
+
+    temperature = health_log.get('temperature')
+    if temperature is not None and disk_data['temperature'] is None:
+        if kelvin:
+            temperature -= 273
+        disk_data['temperature'] = int(temperature)
+
+    if 'media_errors' in disk_data:
+        disk_data['nr_grown_defects'] = disk_data['media_errors']
+
+
+def eval_nvme_smart_log(data):
+    """
+    Evaluates the decoded output of 'nvme smart-log -o json'.
+
+    @param data: the decoded JSON output
+    @type data: dict
+
+    @return: a tuple of three values, like eval_smartctl_json()
+    @rtype: tuple
+
+    """
+
+    disk_data = new_disk_data()
+    eval_nvme_health_log(data, disk_data, kelvin=True)
+
+    if 'critical_warning' in disk_data:
+        if disk_data['critical_warning']:
+            disk_data['health_state'] = 'FAILED'
+        else:
+            disk_data['health_state'] = 'PASSED'
+
+    return (False, disk_data, None)
+
+
+def get_nvme_controllers(sys_dir=SYS_NVME_DIR):
+    """
+    Gives back the names of all NVMe controllers of the system.
+
+    @param sys_dir: the sysfs directory of the NVMe controllers
+    @type sys_dir: str
+
+    @return: the sorted names of the controllers, e.g. ['nvme0', 'nvme1']
+    @rtype: list of str
+
+    """
+
+    if not os.path.isdir(sys_dir):
+        return []
+
+    ctrls = [x for x in os.listdir(sys_dir) if re_nvme_ctrl.search(x)]
+    return sorted(ctrls, key=lambda x: int(x[4:]))
+
+
+def read_nvme_sysfs(ctrl_dir):
+    """
+    Reads the state, the model, the serial number, the firmware revision
+    and the current temperature (out of hwmon) of a NVMe controller
+    from sysfs, without any ioctl on the device.
+
+    @param ctrl_dir: the sysfs directory of the controller,
+                     e.g. '/sys/class/nvme/nvme0'
+    @type ctrl_dir: str
+
+    @return: the found values with the keys 'state', 'model', 'serial',
+             'firmware_rev' and 'temperature', missing values are None
+    @rtype: dict
+
+    """
+
+    info = {
+        'state': None,
+        'model': None,
+        'serial': None,
+        'firmware_rev': None,
+        'temperature': None,
+    }
+
+    for key in ('state', 'model', 'serial', 'firmware_rev'):
+        try:
+            with open(os.path.join(ctrl_dir, key)) as fh:
+                info[key] = fh.read().strip()
+        except (IOError, OSError):
+            pass
+
+    hwmon_files = glob.glob(os.path.join(ctrl_dir, 'hwmon*', 'temp1_input'))
+    hwmon_files += glob.glob(os.path.join(ctrl_dir, 'device', 'hwmon', 'hwmon*', 'temp1_input'))
+    for hwmon_file in hwmon_files:
+        try:
+            with open(hwmon_file) as fh:
+                info['temperature'] = int(fh.read().strip()) // 1000
+            break
+        except (IOError, OSError, ValueError):
+            pass
+
+    return info
+
+
+def complete_nvme_data(disk_data, nvme_info):
+    """
+    Completes the disk data of a NVMe device by its information out of sysfs.
+
+    @param disk_data: the evaluated SMART data of the device
+    @type disk_data: dict
+    @param nvme_info: the information out of sysfs, see read_nvme_sysfs()
+    @type nvme_info: dict or None
+
+    """
+
+    if not nvme_info:
+        return
+
+    disk_data['protocol'] = 'NVMe'
+    for key in ('model', 'serial', 'temperature'):
+        if disk_data.get(key) is None and nvme_info.get(key) is not None:
+            disk_data[key] = nvme_info[key]
+
+
+def sum_grown_defects(disk_data, use_uncorrect=True):
+    """
+    Sums up the SMART attributes of a SATA disk indicating grown defects
+    into disk_data['nr_grown_defects'].
+
+    @param disk_data: the evaluated SMART data of a disk
+    @type disk_data: dict
+    @param use_uncorrect: take the Reported_Uncorrect attribute into account
+    @type use_uncorrect: bool
+
+    """
+
+    disk_data['nr_grown_defects'] = 0
+    for key in GROWN_DEFECT_ATTRIBUTES:
+        if key == 'reported_uncorrect' and not use_uncorrect:
+            continue
+        if key in disk_data:
+            disk_data['nr_grown_defects'] += disk_data[key]
+
+
+def eval_smartctl_json(data):
+    """
+    Evaluates the decoded JSON output of 'smartctl -x --json'
+    (smartctl 7.0 and newer).
+
+    @param data: the decoded JSON output
+    @type data: dict
+
+    @return: a tuple of three values:
+             * the disk is a SAS disk,
+             * the evaluated disk data, None, if the disk doesn't support SMART
+             * the reason, why SMART is not supported, or None
+    @rtype: tuple
+
+    """
+
+    protocol = data.get('device', {}).get('protocol', '')
+    is_sas = (protocol.upper() == 'SCSI')
+
+    smart_support = data.get('smart_support', {})
+    if 'available' in smart_support and not smart_support['available']:
+        return (is_sas, None, "SMART support is: Unavailable - device lacks SMART capability.")
+
+    disk_data = new_disk_data()
+    disk_data['serial'] = data.get('serial_number')
+    disk_data['protocol'] = protocol or None
+
+    smart_status = data.get('smart_status', {})
+    if 'passed' in smart_status:
+        if is_sas:
+            disk_data['health_state'] = 'OK' if smart_status['passed'] else 'FAILED'
+        else:
+            disk_data['health_state'] = 'PASSED' if smart_status['passed'] else 'FAILED'
+
+    temperature = data.get('temperature', {})
+    if 'current' in temperature:
+        disk_data['temperature'] = int(temperature['current'])
+
+    power_on_time = data.get('power_on_time', {})
+    if 'hours' in power_on_time:
+        hours = power_on_time['hours']
+        if power_on_time.get('minutes', 0) >= 30:
+            hours += 1
+        disk_data['hours_on'] = hours
+
+    if is_sas:
+        vendor = data.get('scsi_vendor')
+        product = data.get('scsi_product', data.get('model_name'))
+        if vendor:
+            disk_data['vendor'] = vendor
+        if product:
+            disk_data['product'] = product
+        disk_data['model'] = ' '.join([x for x in (vendor, product) if x]) or None
+        if 'scsi_grown_defect_list' in data:
+            disk_data['nr_grown_defects'] = int(data['scsi_grown_defect_list'])
+        non_medium = data.get('scsi_error_counter_log', {}).get('non_medium_error_count')
+        if non_medium is None:
+            non_medium = data.get('scsi_non_medium_error_count')
+        if non_medium is not None:
+            disk_data['non_medium_errors'] = int(non_medium)
+        return (is_sas, disk_data, None)
+
+    disk_data['model'] = data.get('model_name')
+
+    if protocol.upper() == 'NVME':
+        eval_nvme_health_log(data.get('nvme_smart_health_information_log', {}), disk_data)
+        return (is_sas, disk_data, None)
+
+    use_uncorrect = True
+    for attr in data.get('ata_smart_attributes', {}).get('table', []):
+        key = SATA_ATTRIBUTE_IDS.get(attr.get('id'))
+        if key is None:
+            key = SATA_ATTRIBUTE_NAMES.get(attr.get('name', '').lower())
+            if key in ('temperature', 'hours_on'):
+                key = None
+        if key is None:
+            continue
+        if key == 'reported_uncorrect' and attr.get('flags', {}).get('prefailure'):
+            use_uncorrect = False
+        disk_data[key] = int(attr.get('raw', {}).get('value', 0))
+
+    sum_grown_defects(disk_data, use_uncorrect)
+
+    return (is_sas, disk_data, None)
+
+
+def eval_sata_output(smart_output, disk_data):
+    """
+    Evaluates the text output of 'smartctl -x' (or 'smartctl -H -A')
+    of a SATA (or a NVMe) disk into the given disk data.
+
+    @param smart_output: the output of smartctl
+    @type smart_output: str
+    @param disk_data: the disk data to fill, see new_disk_data()
+    @type disk_data: dict
+
+    """
+
+    use_uncorrect = True
+    disk_data['protocol'] = 'ATA'
+
+    for match in re_sata_line.finditer(smart_output):
+
+        attr = match.group('attr')
+        if attr is not None:
+            key = SATA_ATTRIBUTE_NAMES[attr.lower()]
+            if key == 'hours_on':
+                disk_data['hours_on'] = int(float(match.group('raw')) + 0.5)
+                continue
+            prefail = (match.group('attr_type') or match.group('flags')).lower()[0] == 'p'
+            if key == 'reported_uncorrect' and prefail:
+                use_uncorrect = False
+            disk_data[key] = int(float(match.group('raw')))
+            continue
+
+        if match.group('health') is not None:
+            disk_data['health_state'] = match.group('health')
+        elif match.group('model') is not None:
+            disk_data['model'] = match.group('model')
+        elif match.group('serial') is not None:
+            disk_data['serial'] = match.group('serial')
+        elif match.group('nvme_model') is not None:
+            disk_data['model'] = match.group('nvme_model')
+        elif match.group('nvme_temp') is not None:
+            disk_data['temperature'] = int(match.group('nvme_temp'))
+        elif match.group('nvme_hours') is not None:
+            disk_data['hours_on'] = int(match.group('nvme_hours').replace(',', ''))
+        elif match.group('media_errors') is not None:
+            disk_data['media_errors'] = int(match.group('media_errors').replace(',', ''))
+        elif match.group('crit_warning') is not None:
+            disk_data['critical_warning'] = int(match.group('crit_warning'), 16)
+            disk_data['protocol'] = 'NVMe'
+        elif match.group('used') is not None:
+            disk_data['percentage_used'] = int(match.group('used'))
+        elif match.group('spare') is not None:
+            disk_data['available_spare'] = int(match.group('spare'))
+        elif match.group('spare_thresh') is not None:
+            disk_data['available_spare_threshold'] = int(match.group('spare_thresh'))
+
+    sum_grown_defects(disk_data, use_uncorrect)
+    if 'media_errors' in disk_data:
+        disk_data['nr_grown_defects'] += disk_data['media_errors']
+
+
+def eval_sas_output(smart_output, disk_data):
+    """
+    Evaluates the text output of 'smartctl -x' of a SAS disk
+    into the given disk data.
+
+    @param smart_output: the output of smartctl
+    @type smart_output: str
+    @param disk_data: the disk data to fill, see new_disk_data()
+    @type disk_data: dict
+
+    """
+
+    disk_data['protocol'] = 'SCSI'
+
+    for match in re_sas_line.finditer(smart_output):
+
+        if match.group('health') is not None:
+            disk_data['health_state'] = match.group('health')
+        elif match.group('gd_list') is not None:
+            disk_data['nr_grown_defects'] = int(match.group('gd_list'))
+        elif match.group('vendor') is not None:
+            disk_data['vendor'] = match.group('vendor')
+        elif match.group('product') is not None:
+            disk_data['product'] = match.group('product')
+        elif match.group('serial') is not None:
+            disk_data['serial'] = match.group('serial')
+        elif match.group('non_medium') is not None:
+            disk_data['non_medium_errors'] = int(match.group('non_medium'))
+        elif match.group('temp') is not None:
+            temp = float(match.group('temp'))
+            unit = match.group('temp_unit')
+            if unit and unit.upper() == 'F':
+                temp = ((temp - 32.0) * 5.0 / 9.0) + 0.5
+            disk_data['temperature'] = int(temp)
+        elif match.group('hours') is not None:
+            disk_data['hours_on'] = int(float(match.group('hours')) + 0.5)
+
+    if 'vendor' in disk_data:
+        if 'product' in disk_data:
+            disk_data['model'] = (disk_data['vendor'] + ' ' + disk_data['product'])
+        else:
+            disk_data['model'] = disk_data['vendor']
+    elif 'product' in disk_data:
+        disk_data['model'] = disk_data['product']
+
+
+def eval_smartctl_output(smart_output):
+    """
+    Evaluates the text output of 'smartctl -x'.
+
+    @param smart_output: the output of smartctl
+    @type smart_output: str
+
+    @return: a tuple of three values, like eval_smartctl_json()
+    @rtype: tuple
+
+    """
+
+    is_sas = False
+    if re_is_sas.search(smart_output):
+        is_sas = True
+
+    match = re_no_smart.search(smart_output)
+    if match:
+        reason = re.sub(r'\s+', ' ', match.group(1).strip())
+        return (is_sas, None, reason)
+
+    disk_data = new_disk_data()
+    if is_sas:
+        eval_sas_output(smart_output, disk_data)
+    else:
+        eval_sata_output(smart_output, disk_data)
+
+    return (is_sas, disk_data, None)
+
+
+def parse_megacli_pd_list(output):
+    """
+    Evaluates the output of 'MegaCli -PdList' into a list of physical drives.
+
+    @param output: the output of MegaCli on STDOUT
+    @type output: str
+
+    @return: a list of dicts with the keys 'enclosure', 'slot', 'device_id',
+             'pd_type' and 'spin_state' ('up', 'down' or None)
+    @rtype: list of dict
+
+    """
+
+    drives = []
+    cur_dev = None
+
+    for line in output.splitlines():
+
+        match = re_pd_enc.search(line)
+        if match:
+            cur_dev = {
+                'enclosure': int(match.group(1)),
+                'slot': None,
+                'device_id': None,
+                'pd_type': None,
+                'spin_state': None,
+            }
+            drives.append(cur_dev)
+            continue
+
+        if cur_dev is None:
+            continue
+
+        match = re_pd_slot.search(line)
+        if match:
+            cur_dev['slot'] = int(match.group(1))
+            continue
+
+        match = re_pd_dev_id.search(line)
+        if match:
+            cur_dev['device_id'] = int(match.group(1))
+            continue
+
+        match = re_pd_type.search(line)
+        if match:
+            cur_dev['pd_type'] = match.group(1).upper()
+            continue
+
+        match = re_pd_fw_state.search(line)
+        if match:
+            m_spin = re_spin_state.search(match.group(1))
+            if m_spin:
+                cur_dev['spin_state'] = m_spin.group(1).lower()
+            continue
+
+    return [x for x in drives if x['slot'] is not None and x['device_id'] is not None]
+
+
+class SmartctlError(ExtNagiosPluginError):
+    """
+    Special error class indicating, that smartctl could not deliver
+    usable output for a disk.
+    """
+
+    pass
 
 
 class MegaCliExecTimeoutError(ExtNagiosPluginError, IOError):
@@ -85,23 +747,33 @@ class CheckSmartStatePlugin(ExtNagiosPlugin):
         %(prog)s [-v] [-m] -c <critical grown sectors> -w <warn grown sectors> <HD device>
         """
         usage = textwrap.dedent(usage).strip()
+        usage += '\n       %(prog)s [-v] [-P <workers>] -c <critical grown sectors> '
+        usage += '-w <warn grown sectors> -A | -N | -G <device glob> | -m all <HD device>'
         usage += '\n       %(prog)s --usage'
         usage += '\n       %(prog)s --help'
 
         blurb = "Copyright (c) 2015 Frank Brehm, Berlin.\n\n"
-        blurb += "Checks the SMART state of a physical hard drive."
+        blurb += "Checks the SMART state of a physical hard drive or a NVMe device."
 
         super(CheckSmartStatePlugin, self).__init__(
             usage=usage, blurb=blurb,
             append_searchpath=[DEFAULT_MEGARAID_PATH],
         )
 
-        self._smartctl_cmd = self.get_command('smartctl')
+        self._smartctl_cmd = self.get_command('smartctl', quiet=True)
         """
         @ivar: the underlaying 'smartctl' command
         @type: str
         """
-        if not self.smartctl_cmd:
+
+        self._nvme_cmd = self.get_command('nvme', quiet=True)
+        """
+        @ivar: the 'nvme' command of nvme-cli, used for NVMe devices,
+               if there is no smartctl
+        @type: str
+        """
+
+        if not self.smartctl_cmd and not self.nvme_cmd:
             msg = "Command %r not found." % ('smartctl')
             self.die(msg)
 
@@ -153,6 +825,87 @@ class CheckSmartStatePlugin(ExtNagiosPlugin):
         @type: str
         """
 
+        self._multi = False
+        """
+        @ivar: Checking multiple disks in one run
+        @type: bool
+        """
+
+        self._devices = []
+        """
+        @ivar: the devices to check in case of checking multiple disks
+        @type: list of str
+        """
+
+        self._parallel = DEFAULT_PARALLEL
+        """
+        @ivar: the maximum number of concurrently running smartctl processes
+        @type: int
+        """
+
+        self._use_json = True
+        """
+        @ivar: try to use the JSON output of smartctl, it is switched off,
+               if smartctl doesn't support it
+        @type: bool
+        """
+
+        self._history_file = None
+        """
+        @ivar: the SQLite file of the SMART history, None, if no history is used
+        @type: str or None
+        """
+
+        self._rate_threshold = None
+        """
+        @ivar: the thresholds of the growth rate of grown defects per day
+        @type: NagiosThreshold or None
+        """
+
+        self._rate_window = DEFAULT_RATE_WINDOW
+        """
+        @ivar: the time window in days for computing the growth rate of grown defects
+        @type: int
+        """
+
+        self._full_interval = DEFAULT_FULL_INTERVAL
+        """
+        @ivar: the maximum age in hours of the last full query of the SMART data
+               of a disk, before a full query is done again, 0 means always
+        @type: int
+        """
+
+        self._used_threshold = NagiosThreshold(
+            warning=NagiosRange(start=None, end=DEFAULT_WARN_USED),
+            critical=NagiosRange(start=None, end=DEFAULT_CRIT_USED))
+        """
+        @ivar: the thresholds of the used percentage of the rated lifetime
+               of NVMe devices
+        @type: NagiosThreshold
+        """
+
+        self._nvme_info = {}
+        """
+        @ivar: the information about NVMe controllers out of sysfs
+               by their device files
+        @type: dict
+        """
+
+        self._running_cmds = set()
+        """
+        @ivar: the smartctl processes currently executed by the worker threads
+        @type: set of subprocess.Popen
+        """
+
+        self._cmds_killed = False
+        """
+        @ivar: the running smartctl processes were killed after a timeout,
+               no further processes may be started
+        @type: bool
+        """
+
+        self._cmds_lock = threading.Lock()
+
         self._init_megacli_cmd()
 
         self._add_args()
@@ -162,6 +915,11 @@ class CheckSmartStatePlugin(ExtNagiosPlugin):
         """The absolute path to the OS command 'smartctl'."""
         return self._smartctl_cmd
 
+    @property
+    def nvme_cmd(self):
+        """The absolute path to the OS command 'nvme'."""
+        return self._nvme_cmd
+
     @property
     def megacli_cmd(self):
         """The absolute path to the OS command 'MegaCli'."""
@@ -206,6 +964,51 @@ class CheckSmartStatePlugin(ExtNagiosPlugin):
         """The number of the MegaRaid adapter (e.g. 0)."""
         return self._adapter_nr
 
+    @property
+    def multi(self):
+        """Checking multiple disks in one run."""
+        return self._multi
+
+    @property
+    def devices(self):
+        """The devices to check in case of checking multiple disks."""
+        return self._devices[:]
+
+    @property
+    def parallel(self):
+        """The maximum number of concurrently running smartctl processes."""
+        return self._parallel
+
+    @property
+    def use_json(self):
+        """Try to use the JSON output of smartctl."""
+        return self._use_json
+
+    @property
+    def history_file(self):
+        """The SQLite file of the SMART history, None, if no history is used."""
+        return self._history_file
+
+    @property
+    def rate_threshold(self):
+        """The thresholds of the growth rate of grown defects per day."""
+        return self._rate_threshold
+
+    @property
+    def rate_window(self):
+        """The time window in days for computing the growth rate of grown defects."""
+        return self._rate_window
+
+    @property
+    def full_interval(self):
+        """The maximum age in hours of the last full query of the SMART data."""
+        return self._full_interval
+
+    @property
+    def used_threshold(self):
+        """The thresholds of the used percentage of the rated lifetime of NVMe devices."""
+        return self._used_threshold
+
     def as_dict(self):
         """
         Typecasting into a dictionary.
@@ -219,6 +1022,7 @@ class CheckSmartStatePlugin(ExtNagiosPlugin):
 
         d['adapter_nr'] = self.adapter_nr
         d['smartctl_cmd'] = self.smartctl_cmd
+        d['nvme_cmd'] = self.nvme_cmd
         d['megacli_cmd'] = self.megacli_cmd
         d['megaraid'] = self.megaraid
         d['warn_sectors'] = self.warn_sectors
@@ -226,6 +1030,18 @@ class CheckSmartStatePlugin(ExtNagiosPlugin):
         d['device'] = self.device
         d['device_id'] = self.device_id
         d['megaraid_slot'] = self.megaraid_slot
+        d['multi'] = self.multi
+        d['devices'] = self.devices
+        d['parallel'] = self.parallel
+        d['use_json'] = self.use_json
+        d['history_file'] = self.history_file
+        d['rate_threshold'] = None
+        if self.rate_threshold:
+            d['rate_threshold'] = self.rate_threshold.as_dict()
+        d['rate_window'] = self.rate_window
+        d['full_interval'] = self.full_interval
+        d['used_threshold'] = self.used_threshold.as_dict()
+        d['nvme_info'] = self._nvme_info
 
         return d
 
@@ -306,14 +1122,126 @@ class CheckSmartStatePlugin(ExtNagiosPlugin):
             help=('If given, check the device DEVICE_ID on a MegaRAID '
                   'controller. The DEVICE_ID might be given as a single '
                   'Device Id (integer) or as an <enclosure-id:slot-id> '
-                  'pair of the MegaRaid adapter.'),
+                  'pair of the MegaRaid adapter. With \'all\' all physical '
+                  'drives of the MegaRaid adapter are checked.'),
+        )
+
+        self.add_arg(
+            '-A', '--all',
+            action='store_true',
+            dest='all_disks',
+            help="Check all SCSI/SATA disks of the system (/sys/block/sd*).",
+        )
+
+        self.add_arg(
+            '-N', '--nvme',
+            action='store_true',
+            dest='nvme',
+            help="Check all NVMe controllers of the system (%s/nvme*)." % (SYS_NVME_DIR),
+        )
+
+        self.add_arg(
+            '--used-warning',
+            metavar='PERCENT',
+            dest='used_warning',
+            type=int,
+            default=DEFAULT_WARN_USED,
+            help=("The used percentage of the rated lifetime of a NVMe device "
+                  "leading to a warning (Default: %(default)d)."),
+        )
+
+        self.add_arg(
+            '--used-critical',
+            metavar='PERCENT',
+            dest='used_critical',
+            type=int,
+            default=DEFAULT_CRIT_USED,
+            help=("The used percentage of the rated lifetime of a NVMe device "
+                  "leading to a critical message (Default: %(default)d)."),
+        )
+
+        self.add_arg(
+            '-G', '--glob',
+            metavar='PATTERN',
+            dest='glob',
+            help=("Check all disks matching the given shell pattern, "
+                  "e.g. '/dev/sd[b-z]' or 'sd*'."),
+        )
+
+        self.add_arg(
+            '-P', '--parallel',
+            metavar='WORKERS',
+            dest='parallel',
+            type=int,
+            default=DEFAULT_PARALLEL,
+            help=("The maximum number of concurrently running smartctl processes "
+                  "on checking multiple disks (Default: %(default)d)."),
+        )
+
+        self.add_arg(
+            '--no-json',
+            action='store_true',
+            dest='no_json',
+            help=("Don't try to use the JSON output of smartctl (available "
+                  "since smartctl 7.0), evaluate the text output instead."),
+        )
+
+        self.add_arg(
+            '--history',
+            metavar='FILE',
+            dest='history',
+            nargs='?',
+            const=DEFAULT_HISTORY_FILE,
+            help=("Record the SMART counters of the checked disks in the given SQLite "
+                  "file (Default: %r) for evaluating growth rates of grown defects "
+                  "and for omitting full queries of unchanged disks.") % (
+                DEFAULT_HISTORY_FILE),
+        )
+
+        self.add_arg(
+            '--rate-warning',
+            metavar='DEFECTS',
+            dest='rate_warning',
+            type=float,
+            help="The growth rate of grown defects per day leading to a warning.",
+        )
+
+        self.add_arg(
+            '--rate-critical',
+            metavar='DEFECTS',
+            dest='rate_critical',
+            type=float,
+            help="The growth rate of grown defects per day leading to a critical message.",
+        )
+
+        self.add_arg(
+            '--rate-window',
+            metavar='DAYS',
+            dest='rate_window',
+            type=int,
+            default=DEFAULT_RATE_WINDOW,
+            help=("The time window in days for computing the growth rate of "
+                  "grown defects (Default: %(default)d)."),
+        )
+
+        self.add_arg(
+            '--full-interval',
+            metavar='HOURS',
+            dest='full_interval',
+            type=int,
+            default=DEFAULT_FULL_INTERVAL,
+            help=("With a history, the full SMART data of a disk are only queried, "
+                  "if the last full query is older than this, or if a query of the "
+                  "health state and the attributes shows a change. 0 means "
+                  "always a full query (Default: %(default)d)."),
         )
 
         self.add_arg(
             'device',
             dest='device',
             nargs='?',
-            help="The device to check (given as 'sdX' or '/dev/sdX', must exists).",
+            help=("The device to check (given as 'sdX', '/dev/sdX', 'nvmeX' "
+                  "or '/dev/nvmeX', must exists)."),
         )
 
     def parse_args(self, args=None):
@@ -335,13 +1263,110 @@ class CheckSmartStatePlugin(ExtNagiosPlugin):
 
         self.set_thresholds(warning=self.warn_sectors, critical=self.crit_sectors)
 
+        if self.argparser.args.parallel < 1:
+            self.die("The number of parallel workers must be at least 1.")
+        self._parallel = self.argparser.args.parallel
+
+        if self.argparser.args.no_json:
+            self._use_json = False
+
+        self._init_history_args()
+
+        self._used_threshold = NagiosThreshold(
+            warning=NagiosRange(start=None, end=self.argparser.args.used_warning),
+            critical=NagiosRange(start=None, end=self.argparser.args.used_critical))
+
+        if self.argparser.args.nvme:
+            self._multi = True
+            self._devices = self._get_nvme_devices()
+            if not self._devices and not (
+                    self.argparser.args.all_disks or self.argparser.args.glob):
+                self.die("No NVMe controllers found in %r." % (SYS_NVME_DIR))
+
+        if self.argparser.args.all_disks or self.argparser.args.glob:
+            self._multi = True
+            pattern = self.argparser.args.glob
+            if not pattern:
+                pattern = os.sep + os.path.join('dev', 'sd*')
+            devices = self._get_devices_by_glob(pattern)
+            if not devices and not self._devices:
+                self.die("No disks found matching %r." % (pattern))
+            self._devices += [x for x in devices if x not in self._devices]
+
+        if self.multi:
+            self._check_commands(self.devices)
+            return
+
         if not self.argparser.args.device:
             self.die("No device to check given.")
 
-        dev = os.path.basename(self.argparser.args.device)
+        self._device = self._check_device(self.argparser.args.device)
+        self._check_commands([self.device])
+
+        if self.argparser.args.megaraid:
+            if self.argparser.args.megaraid.strip().lower() == 'all':
+                self._megaraid = True
+                self._multi = True
+            else:
+                self._init_megacli_dev(self.argparser.args.megaraid)
+
+    def _init_history_args(self):
+        """
+        Evaluates the command line arguments for the SMART history.
+        """
+
+        args = self.argparser.args
+
+        if args.history is None:
+            if args.rate_warning is not None or args.rate_critical is not None:
+                self.die("Thresholds of the growth rate of grown defects need a history.")
+            return
+
+        self._history_file = os.path.abspath(args.history)
+
+        if args.rate_window < 1:
+            self.die("The time window of the growth rate must be at least one day.")
+        self._rate_window = args.rate_window
+
+        if args.full_interval < 0:
+            self.die("The interval of full queries may not be negative.")
+        self._full_interval = args.full_interval
+
+        warning = None
+        critical = None
+        if args.rate_warning is not None:
+            warning = NagiosRange(start=None, end=args.rate_warning)
+        if args.rate_critical is not None:
+            critical = NagiosRange(start=None, end=args.rate_critical)
+        self._rate_threshold = NagiosThreshold(warning=warning, critical=critical)
+
+    def _check_device(self, device):
+        """
+        Checks, whether the given device is an existing whole block device.
+
+        It dies, if not.
+
+        @param device: the device to check, given as 'sdX' or '/dev/sdX'
+        @type device: str
+
+        @return: the device file of the device
+        @rtype: str
+
+        """
+
+        dev = os.path.basename(device)
         dev_dev = os.sep + os.path.join('dev', dev)
         sys_dev = os.sep + os.path.join('sys', 'block', dev)
 
+        if re_nvme_ctrl.search(dev):
+            ctrl_dir = os.path.join(SYS_NVME_DIR, dev)
+            if not os.path.isdir(ctrl_dir):
+                self.die("Device %r is not a NVMe controller." % (dev))
+            if not os.path.exists(dev_dev) or not stat.S_ISCHR(os.stat(dev_dev).st_mode):
+                self.die("%r is not a character device." % (dev_dev))
+            self._nvme_info[dev_dev] = read_nvme_sysfs(ctrl_dir)
+            return dev_dev
+
         if not os.path.isdir(sys_dev):
             self.die("Device %r is not a block device." % (dev))
 
@@ -353,10 +1378,75 @@ class CheckSmartStatePlugin(ExtNagiosPlugin):
         if not stat.S_ISBLK(dev_mode):
             self.die("%r is not a block device." % (dev_dev))
 
-        self._device = dev_dev
+        return dev_dev
 
-        if self.argparser.args.megaraid:
-            self._init_megacli_dev(self.argparser.args.megaraid)
+    def _check_commands(self, devices):
+        """
+        Checks, whether the commands are available to query the given devices.
+        Without smartctl only NVMe devices can be checked by nvme-cli.
+
+        It dies, if not.
+
+        @param devices: the device files of the devices to check
+        @type devices: list of str
+
+        """
+
+        if self.smartctl_cmd:
+            return
+
+        for device in devices:
+            if not re_nvme_dev.search(os.path.basename(device)):
+                self.die("Command %r not found." % ('smartctl'))
+
+    def _get_nvme_devices(self):
+        """
+        Gives back the device files of all NVMe controllers of the system
+        and reads their information out of sysfs into self._nvme_info.
+
+        @return: the device files of the found controllers
+        @rtype: list of str
+
+        """
+
+        devices = []
+        for ctrl in get_nvme_controllers():
+            dev_dev = os.sep + os.path.join('dev', ctrl)
+            self._nvme_info[dev_dev] = read_nvme_sysfs(os.path.join(SYS_NVME_DIR, ctrl))
+            devices.append(dev_dev)
+
+        log.debug("Found NVMe controllers: %r", devices)
+        return devices
+
+    def _get_devices_by_glob(self, pattern):
+        """
+        Gives back all whole disks (no partitions) matching the given pattern.
+
+        @param pattern: a shell pattern, either relative to /dev or absolute
+        @type pattern: str
+
+        @return: the sorted device files of the found disks
+        @rtype: list of str
+
+        """
+
+        if not os.path.isabs(pattern):
+            pattern = os.sep + os.path.join('dev', pattern)
+
+        devices = []
+        for dev_dev in sorted(glob.glob(pattern)):
+            dev = os.path.basename(dev_dev)
+            sys_dev_dir = os.sep + os.path.join('sys', 'block', dev, 'device')
+            if not os.path.isdir(sys_dev_dir):
+                if self.verbose > 2:
+                    log.debug("%r is not a whole disk, skipping.", dev_dev)
+                continue
+            if not stat.S_ISBLK(os.stat(dev_dev).st_mode):
+                continue
+            devices.append(dev_dev)
+
+        log.debug("Found disks matching %r: %r", pattern, devices)
+        return devices
 
     def _init_megacli_dev(self, dev):
         """
@@ -525,6 +1615,39 @@ class CheckSmartStatePlugin(ExtNagiosPlugin):
 
         return match.group(1).lower()
 
+    def get_megaraid_pd_list(self):
+        """
+        Retrieves all physical drives of the MegaRaid adapter with one call
+        of 'MegaCli -PdList'.
+
+        It dies, if the list could not retrieved.
+
+        @return: the physical drives, see parse_megacli_pd_list()
+        @rtype: list of dict
+
+        """
+
+        if not self.megacli_cmd:
+            self.die("Didn't found to MegaCli command to retrieve the " +
+                     "list of the Magaraid Physical Devices.")
+
+        cmd_list = [
+            self.megacli_cmd,
+            '-PdList',
+            '-a', ('%d' % (self.adapter_nr)),
+            '-NoLog',
+        ]
+
+        (ret, stdoutdata, stderrdata) = self.exec_cmd(cmd_list)
+        if not stdoutdata:
+            self.die("No ouput from %s -PdList." % (self.megacli_cmd))
+
+        drives = parse_megacli_pd_list(stdoutdata)
+        if not drives:
+            self.die("No physical drives found on MegaRaid adapter %d." % (self.adapter_nr))
+
+        return drives
+
     def __call__(self):
         """
         Method to call the plugin directly.
@@ -533,44 +1656,43 @@ class CheckSmartStatePlugin(ExtNagiosPlugin):
         self.parse_args()
 
         if self.verbose > 2:
-            log.debug("Current object:\n%s", pp(self.as_dict()))
+            log.debug("Current object:\n%s", LazyPP(self.as_dict()))
+
+        if self.multi:
+            return self.check_multiple_disks()
 
         state = nagios.state.ok
         out = "All seems to be ok."
 
-        re_is_sas = re.compile(r'^\s*Transport\s+protocol\s*:\s*SAS.*$',
-                               (re.IGNORECASE | re.MULTILINE))
-
-        no_smart_patterns = (
-            r'Device\s+does\s+not\s+support\s+SMART',
-            # SMART support is:     Unavailable - device lacks SMART capability.
-            r'SMART\s+support\s+is:\s+Unavailable\s+-\s+.*',
-        )
-        pattern = r'(' + r'|'.join(no_smart_patterns) + r')'
-        re_no_smart = re.compile(pattern, (re.IGNORECASE | re.MULTILINE))
         if self.verbose > 2:
             log.debug("No SMART pattern: %r", re_no_smart.pattern)
 
-        smart_output = self._exec_smartctl()
+        nvme_info = self._nvme_info.get(self.device)
+        if nvme_info:
+            ctrl_result = self._eval_nvme_ctrl_state(nvme_info)
+            if ctrl_result:
+                self.exit(ctrl_result[0], "NVMe Drive %s: %s" % (self.device, ctrl_result[1]))
 
-        is_sas = False
-        if re_is_sas.search(smart_output):
-            is_sas = True
+        history = self.open_history()
+        device_id = None
+        if self.megaraid:
+            device_id = self.device_id
+        key = self._history_key(self.device, device_id)
+        (last_full, references) = self.get_history_records(history)
+        last_full = last_full.get(key)
 
-        match = re_no_smart.search(smart_output)
-        if match:
+        try:
+            (is_sas, disk_data, reason, full) = self.query_smart_data(last_full=last_full)
+        except SmartctlError as e:
+            self.die(str(e))
 
-            msg = ''
-            if is_sas:
-                msg = "SAS "
-            else:
-                msg = "SATA "
+        if disk_data is None:
+
+            msg = disk_type(is_sas, device=self.device) + ' '
             dev = self.device
             if self.megaraid:
                 dev = "[%d:%d]" % self.megaraid_slot
 
-            reason = match.group(1).strip()
-            reason = re.sub(r'\s+', ' ', reason)
             log.debug("No SMART of Drive %s: %s", dev, reason)
 
             if self.megaraid:
@@ -585,54 +1707,28 @@ class CheckSmartStatePlugin(ExtNagiosPlugin):
             msg += "Drive %s: %s" % (dev, reason)
             self.die(msg)
 
-        self.disk_data = {
-            'model': None,
-            'serial': None,
-            'health_state': None,
-            'nr_grown_defects': 0,
-            'temperature': None,
-            'hours_on': None,
-        }
-
-        if is_sas:
-            log.debug("Disk is a SAS disk.")
-            self._eval_sas_disk(smart_output)
-        else:
-            log.debug("Disk is a SATA disk.")
-            self._eval_sata_disk(smart_output)
+        self.disk_data = disk_data
+        complete_nvme_data(self.disk_data, nvme_info)
 
-        log.debug("Evaluated disk data:\n%s", pp(self.disk_data))
+        log.debug("Disk is a %s disk.", disk_type(is_sas, self.disk_data))
 
-        err_msgs = []
+        log.debug("Evaluated disk data:\n%s", LazyPP(self.disk_data))
 
         if self.disk_data['health_state'] is None:
             msg = "Could not detect SMART Health Status of "
-            if is_sas:
-                msg += "SAS "
-            else:
-                msg += "SATA "
+            msg += disk_type(is_sas, self.disk_data) + ' '
             dev = self.device
             if self.megaraid:
                 dev = "[%d:%d]" % self.megaraid_slot
             msg += "Drive %s." % (dev)
             self.die(msg)
 
-        if is_sas:
-            if self.disk_data['health_state'].lower() != 'ok':
-                state = self.max_state(state, nagios.state.critical)
-                err_msgs.append("SMART Health Status is %r." % (self.disk_data['health_state']))
-        else:
-            if self.disk_data['health_state'].lower() != 'passed':
-                state = self.max_state(state, nagios.state.critical)
-                err_msgs.append("SMART overall-health self-assessment test result is %r." %
-                                (self.disk_data['health_state']))
+        (rate, replaced) = self._eval_history(
+            self.disk_data, full, last_full, references.get(key))
+        (state, err_msgs) = self._eval_disk_state(self.disk_data, is_sas, rate)
 
         gd_count = self.disk_data['nr_grown_defects']
         if self.threshold:
-            gd_state = self.threshold.get_status(gd_count)
-            if gd_state != nagios.state.ok:
-                state = self.max_state(state, gd_state)
-                err_msgs.append("%d elements in list of grown defects." % (gd_count))
             self.add_perfdata(label='gd_list', value=gd_count, threshold=self.threshold)
         else:
             self.add_perfdata(label='gd_list', value=gd_count)
@@ -644,11 +1740,12 @@ class CheckSmartStatePlugin(ExtNagiosPlugin):
                 uom="C",
             )
 
-        out = ""
-        if is_sas:
-            out = "SAS "
-        else:
-            out = "SATA "
+        if rate is not None:
+            self.add_perfdata(label='gd_rate', value=round(rate, 3), threshold=self.rate_threshold)
+
+        self._add_nvme_perfdata(self.disk_data)
+
+        out = disk_type(is_sas, self.disk_data) + ' '
         dev = self.device
         if self.megaraid:
             dev = "[%d:%d]" % self.megaraid_slot
@@ -665,236 +1762,749 @@ class CheckSmartStatePlugin(ExtNagiosPlugin):
             hours = self.disk_data['hours_on'] % 24
             out += " Power on: %d days, %d hours." % (days, hours)
 
+        if history:
+            self._record_history(history, key, is_sas, self.disk_data, full, replaced)
+            self._close_history(history)
+
         self.exit(state, out)
 
-    def _eval_sata_disk(self, smart_output):
-
-        re_health_state = re.compile(
-            r'^SMART\s+overall-health\s+self-assessment\s+test\s+result\s*:\s*(\S.*)',
-            re.IGNORECASE)
-        re_model = re.compile(r'^Device\s+Model\s*:\s*(\S.*)', re.IGNORECASE)
-        #   5 Reallocated_Sector_Ct   -O--CK   100   100   000    -    0
-        re_realloc = re.compile(
-            r'^\d+\s+Reallocated_Sector_Ct\s+\S+\s+\S+\s+\S+\s+\S+\s+\S+\s+(\d+)',
-            re.IGNORECASE)
-        # 187 Reported_Uncorrect      -O--CK   100   100   000    -    0
-        re_rep_uncorr = re.compile(
-            r'^\d+\s+Reported_Uncorrect\s+(\S+)\s+\S+\s+\S+\s+\S+\s+\S+\s+(\d+)',
-            re.IGNORECASE)
-        # 197 Current_Pending_Sector  -O--CK   100   100   000    -    0
-        re_cur_pend_sect = re.compile(
-            r'^\d+\s+Current_Pending_Sector\s+\S+\s+\S+\s+\S+\s+\S+\s+\S+\s+(\d+)',
-            re.IGNORECASE)
-        # yxz Offline_Uncorrectable   -O--CK   100   100   000    -    0
-        re_offl_uncor = re.compile(
-            r'^\d+\s+Offline_Uncorrectable\s+\S+\s+\S+\s+\S+\s+\S+\s+\S+\s+(\d+)',
-            re.IGNORECASE)
-        # xyz Reallocated_Event_Count -O--CK   100   100   000    -    0
-        re_realloc_evt = re.compile(
-            r'^\d+\s+Reallocated_Event_Count\s+\S+\s+\S+\s+\S+\s+\S+\s+\S+\s+(\d+)',
-            re.IGNORECASE)
-        # zyx Erase_Fail_Count        -O--CK   100   100   000    -    0
-        re_erase_fail_count = re.compile(
-            r'^\d+\s+Erase_Fail_Count\s+\S+\s+\S+\s+\S+\s+\S+\s+\S+\s+(\d+)',
-            re.IGNORECASE)
-        # 194 Temperature_Celsius     -O---K   100   100   000    -    25
-        re_temp = re.compile(r'^\d+\s+Temperature_Celsius\s+\S+\s+\S+\s+\S+\s+\S+\s+\S+\s+(\d+)',
-                             re.IGNORECASE)
-        #   9 Power_On_Hours          -O--CK   100   100   000    -    2139
-        re_hours = re.compile(
-            r'^\d+\s+Power_On_Hours\s+\S+\s+\S+\s+\S+\s+\S+\s+\S+\s+(\d+(?:\.\d*)?)',
-            re.IGNORECASE)
-
-        use_uncorrect = True
-
-        for line in smart_output.splitlines():
-            line = line.strip()
-            if line == '':
-                continue
+    def _eval_disk_state(self, disk_data, is_sas, rate=None):
+        """
+        Evaluates the SMART health status, the number of grown defects
+        and their growth rate of the given disk data.
 
-            match = re_health_state.search(line)
-            if match:
-                self.disk_data['health_state'] = match.group(1)
-                continue
+        @param disk_data: the evaluated SMART data of a disk
+        @type disk_data: dict
+        @param is_sas: is the disk a SAS disk
+        @type is_sas: bool
+        @param rate: the growth rate of grown defects per day, if known
+        @type rate: float or None
 
-            match = re_model.search(line)
-            if match:
-                self.disk_data['model'] = match.group(1)
-                continue
+        @return: the state of the disk and a list of error messages
+        @rtype: tuple
 
-            match = re_realloc.search(line)
-            if match:
-                self.disk_data['realloc_sectors'] = int(match.group(1))
-                continue
+        """
 
-            match = re_rep_uncorr.search(line)
-            if match:
-                uncorrect_tags = match.group(1).lower()
-                if uncorrect_tags[0] == 'p':
-                    use_uncorrect = False
-                self.disk_data['reported_uncorrect'] = int(match.group(2))
-                continue
+        state = nagios.state.ok
+        err_msgs = []
 
-            match = re_cur_pend_sect.search(line)
-            if match:
-                self.disk_data['current_pending_sector'] = int(match.group(1))
-                continue
+        if is_sas:
+            if disk_data['health_state'].lower() != 'ok':
+                state = self.max_state(state, nagios.state.critical)
+                err_msgs.append("SMART Health Status is %r." % (disk_data['health_state']))
+        else:
+            if disk_data['health_state'].lower() != 'passed':
+                state = self.max_state(state, nagios.state.critical)
+                err_msgs.append("SMART overall-health self-assessment test result is %r." %
+                                (disk_data['health_state']))
 
-            match = re_offl_uncor.search(line)
-            if match:
-                self.disk_data['offline_uncorretable'] = int(match.group(1))
-                continue
+        critical_warning = disk_data.get('critical_warning')
+        if critical_warning:
+            state = self.max_state(state, nagios.state.critical)
+            err_msgs.append("Critical warning 0x%02x: %s." % (
+                critical_warning, ', '.join(nvme_critical_warnings(critical_warning))))
 
-            match = re_realloc_evt.search(line)
-            if match:
-                self.disk_data['realloc_event_count'] = int(match.group(1))
-                continue
+        gd_count = disk_data['nr_grown_defects']
+        if self.threshold:
+            gd_state = self.threshold.get_status(gd_count)
+            if gd_state != nagios.state.ok:
+                state = self.max_state(state, gd_state)
+                if disk_data.get('protocol') == 'NVMe':
+                    err_msgs.append("%d media and data integrity errors." % (gd_count))
+                else:
+                    err_msgs.append("%d elements in list of grown defects." % (gd_count))
+
+        used = disk_data.get('percentage_used')
+        if used is not None:
+            used_state = self.used_threshold.get_status(used)
+            if used_state != nagios.state.ok:
+                state = self.max_state(state, used_state)
+                err_msgs.append("%d%% of the rated lifetime used." % (used))
+
+        if rate is not None and self.rate_threshold:
+            rate_state = self.rate_threshold.get_status(rate)
+            if rate_state != nagios.state.ok:
+                state = self.max_state(state, rate_state)
+                err_msgs.append("Grown defects increasing by %0.2f per day." % (rate))
+
+        return (state, err_msgs)
+
+    def _eval_nvme_ctrl_state(self, nvme_info):
+        """
+        Evaluates the state of a NVMe controller out of sysfs.
 
-            match = re_erase_fail_count.search(line)
-            if match:
-                self.disk_data['erase_fail_count'] = int(match.group(1))
-                continue
+        @param nvme_info: the information out of sysfs, see read_nvme_sysfs()
+        @type nvme_info: dict
 
-            match = re_temp.search(line)
-            if match:
-                self.disk_data['temperature'] = int(match.group(1))
-                continue
+        @return: None, if the controller is usable, else a tuple of
+                 the Nagios state and a message
+        @rtype: tuple or None
 
-            match = re_hours.search(line)
-            if match:
-                hours = int(float(match.group(1)) + 0.5)
-                self.disk_data['hours_on'] = hours
-
-        self.disk_data['nr_grown_defects'] = 0
-        if 'realloc_sectors' in self.disk_data:
-            self.disk_data['nr_grown_defects'] += self.disk_data['realloc_sectors']
-        if 'reported_uncorrect' in self.disk_data and use_uncorrect:
-            self.disk_data['nr_grown_defects'] += self.disk_data['reported_uncorrect']
-        if 'current_pending_sector' in self.disk_data:
-            self.disk_data['nr_grown_defects'] += self.disk_data['current_pending_sector']
-        if 'offline_uncorretable' in self.disk_data:
-            self.disk_data['nr_grown_defects'] += self.disk_data['offline_uncorretable']
-        if 'realloc_event_count' in self.disk_data:
-            self.disk_data['nr_grown_defects'] += self.disk_data['realloc_event_count']
-        if 'erase_fail_count' in self.disk_data:
-            self.disk_data['nr_grown_defects'] += self.disk_data['erase_fail_count']
-
-    def _eval_sas_disk(self, smart_output):
-
-        re_health_state = re.compile(r'^SMART\s+Health\s+Status\s*:\s*(\S.*)', re.IGNORECASE)
-        re_el_gd_list = re.compile(r'^Elements\s+in\s+grown\s+defect\s+list\s*:\s*(\d+)',
-                                   re.IGNORECASE)
-        re_vendor = re.compile(r'^Vendor\s*:\s*(\S.*)', re.IGNORECASE)
-        re_product = re.compile(r'^Product\s*:\s*(\S.*)', re.IGNORECASE)
-        re_serial = re.compile(r'^Serial\s+number\s*:\s*(\S.*)', re.IGNORECASE)
-        re_non_medium_errs = re.compile(r'^Non-medium\s+error\s+count\s*:\s*(\d+)',
-                                        re.IGNORECASE)
-        # Current Drive Temperature:     34 C
-        re_temp = re.compile(r'^Current\s+Drive\s+Temperature\s*:\s*(\d+)(?:\s*([CF]))?',
-                             re.IGNORECASE)
-        re_hours = re.compile(r'^number\s+of\s+hours\s+powered\s+up\s*=\s*(\d+(?:\.\d*)?)',
-                              re.IGNORECASE)
-
-        for line in smart_output.splitlines():
-            line = line.strip()
-            if line == '':
-                continue
+        """
 
-            match = re_health_state.search(line)
-            if match:
-                self.disk_data['health_state'] = match.group(1)
-                continue
+        ctrl_state = nvme_info.get('state')
+        if ctrl_state is None or ctrl_state == 'live':
+            return None
 
-            match = re_el_gd_list.search(line)
-            if match:
-                self.disk_data['nr_grown_defects'] = int(match.group(1))
-                continue
+        msg = "Controller state is %r." % (ctrl_state)
+        if ctrl_state in ('resetting', 'connecting', 'new'):
+            return (nagios.state.warning, msg)
+        return (nagios.state.critical, msg)
 
-            match = re_vendor.search(line)
-            if match:
-                self.disk_data['vendor'] = match.group(1)
-                continue
+    def _add_nvme_perfdata(self, disk_data, label=None):
+        """
+        Adds the performance data of the used percentage of the rated lifetime
+        and of the available spare of a NVMe device, if known.
 
-            match = re_product.search(line)
-            if match:
-                self.disk_data['product'] = match.group(1)
-                continue
+        @param disk_data: the evaluated SMART data of the device
+        @type disk_data: dict
+        @param label: the label of the device in case of multiple disks
+        @type label: str or None
 
-            match = re_serial.search(line)
-            if match:
-                self.disk_data['serial'] = match.group(1)
-                continue
+        """
 
-            match = re_non_medium_errs.search(line)
-            if match:
-                self.disk_data['non_medium_errors'] = int(match.group(1))
+        prefix = ''
+        if label:
+            prefix = label + '_'
+
+        if disk_data.get('percentage_used') is not None:
+            self.add_perfdata(
+                label=(prefix + 'used'), value=disk_data['percentage_used'], uom='%',
+                threshold=self.used_threshold)
+        if disk_data.get('available_spare') is not None:
+            critical = None
+            if disk_data.get('available_spare_threshold') is not None:
+                critical = "%d:" % (disk_data['available_spare_threshold'])
+            self.add_perfdata(
+                label=(prefix + 'spare'), value=disk_data['available_spare'], uom='%',
+                critical=critical)
+
+    def open_history(self):
+        """
+        Opens the SMART history, if one should be used.
+
+        It dies, if the history could not be opened.
+
+        @return: the opened history, None, if no history is used
+        @rtype: SmartHistory or None
+
+        """
+
+        if not self.history_file:
+            return None
+
+        history = SmartHistory(self.history_file)
+        try:
+            history.open()
+        except SmartHistoryError as e:
+            self.die(str(e))
+
+        return history
+
+    def get_history_records(self, history):
+        """
+        Reads the records out of the SMART history needed for the current check.
+
+        It dies, if the history could not be read.
+
+        @param history: the opened history or None
+        @type history: SmartHistory or None
+
+        @return: a tuple of two dicts by the disk key: the last records of
+                 a full query and the reference records for the growth rates
+        @rtype: tuple
+
+        """
+
+        if history is None:
+            return ({}, {})
+
+        since = time.time() - (self.rate_window * SECONDS_PER_DAY)
+        try:
+            return (history.last_full_records(), history.reference_records(since))
+        except SmartHistoryError as e:
+            self.die(str(e))
+
+    def _history_key(self, device, device_id=None):
+
+        if device_id is None:
+            return device
+        return "%s:megaraid,%d" % (device, device_id)
+
+    def _eval_history(self, disk_data, full, last_full, reference):
+        """
+        Evaluates the disk data against the records of the SMART history.
+
+        @param disk_data: the evaluated SMART data of a disk
+        @type disk_data: dict
+        @param full: the disk data are the result of a full query
+        @type full: bool
+        @param last_full: the last record of a full query of the disk
+        @type last_full: dict or None
+        @param reference: the reference record for the growth rate
+        @type reference: dict or None
+
+        @return: the growth rate of grown defects per day (or None) and
+                 whether the disk was replaced since the last full query
+        @rtype: tuple
+
+        """
+
+        if full and last_full and last_full['serial'] and disk_data.get('serial'):
+            if last_full['serial'] != disk_data['serial']:
+                log.debug("Disk %r was replaced, serial number %r => %r.", last_full['disk'],
+                          last_full['serial'], disk_data['serial'])
+                return (None, True)
+
+        return (defect_rate(reference, disk_data['nr_grown_defects']), False)
+
+    def _record_history(self, history, key, is_sas, disk_data, full, replaced):
+
+        try:
+            if replaced:
+                history.forget(key)
+            history.add(key, is_sas, disk_data, full)
+        except SmartHistoryError as e:
+            self.die(str(e))
+
+    def _close_history(self, history):
+
+        try:
+            history.close()
+        except SmartHistoryError as e:
+            self.die(str(e))
+
+    def _get_targets(self):
+        """
+        Builds the list of disks to check in case of checking multiple disks.
+
+        @return: a list of dicts with the keys 'device', 'device_id',
+                 'pd_type', 'spin_state', 'desc', 'label', 'key' and 'nvme_info'
+        @rtype: list of dict
+
+        """
+
+        targets = []
+
+        if not self.megaraid:
+            for dev_dev in self.devices:
+                dev = os.path.basename(dev_dev)
+                targets.append({
+                    'device': dev_dev,
+                    'device_id': None,
+                    'pd_type': None,
+                    'spin_state': None,
+                    'desc': dev_dev,
+                    'label': dev,
+                    'key': self._history_key(dev_dev),
+                    'nvme_info': self._nvme_info.get(dev_dev),
+                })
+            return targets
+
+        for pd in self.get_megaraid_pd_list():
+            targets.append({
+                'device': self.device,
+                'device_id': pd['device_id'],
+                'pd_type': pd['pd_type'],
+                'spin_state': pd['spin_state'],
+                'desc': "[%d:%d]" % (pd['enclosure'], pd['slot']),
+                'label': "e%ds%d" % (pd['enclosure'], pd['slot']),
+                'key': self._history_key(self.device, pd['device_id']),
+                'nvme_info': None,
+            })
+
+        return targets
+
+    def check_multiple_disks(self):
+        """
+        Checks the SMART state of multiple disks, executing smartctl for them
+        concurrently with at most self.parallel workers, and exits with
+        the aggregated state.
+        """
+
+        from multiprocessing import TimeoutError as PoolTimeoutError
+        from multiprocessing.pool import ThreadPool
+
+        targets = self._get_targets()
+        log.debug("Checking %d disks with %d workers.", len(targets), self.parallel)
+
+        history = self.open_history()
+        (last_full, references) = self.get_history_records(history)
+        for target in targets:
+            target['last_full'] = last_full.get(target['key'])
+            target['reference'] = references.get(target['key'])
+
+        workers = min(self.parallel, len(targets))
+        pool = ThreadPool(processes=workers)
+        try:
+            async_result = pool.map_async(self._check_disk, targets)
+            results = async_result.get(self.timeout)
+        except PoolTimeoutError:
+            # the workers are blocked in waiting for their processes,
+            # so these must be killed to finish them
+            self._kill_running_cmds()
+            self.die("Timeout after %d secs on checking %d disks." % (
+                self.timeout, len(targets)))
+        finally:
+            pool.terminate()
+
+        state = nagios.state.ok
+        counts = {'ok': 0, 'warning': 0, 'critical': 0, 'unknown': 0}
+        err_msgs = []
+
+        for result in results:
+
+            target = result['target']
+            disk_state = result['state']
+            state = self.max_state_alt(state, disk_state)
+            counts[STATUS_TEXT[disk_state].lower()] += 1
+
+            if result['err_msgs']:
+                err_msgs.append("Drive %s: %s" % (target['desc'], ' '.join(result['err_msgs'])))
+
+            disk_data = result['disk_data']
+            if disk_data is None:
                 continue
 
-            match = re_temp.search(line)
-            if match:
-                unit = 'C'
-                if match.group(2) and match.group(2).upper() == 'F':
-                    unit = 'F'
-                temp = float(match.group(1))
-                if unit == 'F':
-                    temp = ((temp - 32.0) * 5.0 / 9.0) + 0.5
-                self.disk_data['temperature'] = int(temp)
-
-            match = re_hours.search(line)
-            if match:
-                hours = int(float(match.group(1)) + 0.5)
-                self.disk_data['hours_on'] = hours
+            label = target['label']
+            self.add_perfdata(
+                label=(label + '_gd_list'), value=disk_data['nr_grown_defects'],
+                threshold=self.threshold)
+            if disk_data['temperature'] is not None:
+                self.add_perfdata(
+                    label=(label + '_temperature'), value=disk_data['temperature'], uom='C')
+            if disk_data.get('realloc_sectors') is not None:
+                self.add_perfdata(
+                    label=(label + '_realloc'), value=disk_data['realloc_sectors'])
+            if result['rate'] is not None:
+                self.add_perfdata(
+                    label=(label + '_gd_rate'), value=round(result['rate'], 3),
+                    threshold=self.rate_threshold)
+            self._add_nvme_perfdata(disk_data, label)
+
+            if history:
+                self._record_history(
+                    history, target['key'], result['is_sas'], disk_data,
+                    result['full'], result['replaced'])
+
+        self.add_perfdata(label='drives_total', value=len(results))
+        self.add_perfdata(
+            label='drives_failed',
+            value=(counts['warning'] + counts['critical'] + counts['unknown']))
+
+        out = "SMART state of %d drives: %d ok" % (len(results), counts['ok'])
+        for key in ('warning', 'critical', 'unknown'):
+            if counts[key]:
+                out += ", %d %s" % (counts[key], key)
+        out += '.'
+        if err_msgs:
+            out += ' ' + ' '.join(err_msgs)
+
+        if history:
+            self._close_history(history)
+
+        self.exit(state, out)
+
+    def _check_disk(self, target):
+        """
+        Checks the SMART state of a single disk in case of checking multiple
+        disks. It is executed in a worker thread, so it may not exit.
+        Any error on checking the disk results in an UNKNOWN state of this
+        disk only, the other disks are checked nevertheless.
+
+        @param target: the disk to check, see _get_targets()
+        @type target: dict
+
+        @return: a dict with the keys 'target', 'state', 'is_sas',
+                 'disk_data', 'full', 'rate', 'replaced' and 'err_msgs'
+        @rtype: dict
+
+        """
+
+        result = {
+            'target': target,
+            'state': nagios.state.unknown,
+            'is_sas': False,
+            'disk_data': None,
+            'full': True,
+            'rate': None,
+            'replaced': False,
+            'err_msgs': [],
+        }
+
+        try:
+            self._check_disk_state(target, result)
+        except (SmartctlError, OSError) as e:
+            result['state'] = nagios.state.unknown
+            result['disk_data'] = None
+            result['err_msgs'] = [str(e)]
+        except Exception as e:
+            log.debug("Error on checking drive %s:", target['desc'], exc_info=True)
+            result['state'] = nagios.state.unknown
+            result['disk_data'] = None
+            result['err_msgs'] = ["%s: %s" % (e.__class__.__name__, e)]
+
+        return result
+
+    def _check_disk_state(self, target, result):
+        """
+        Retrieves and evaluates the SMART data of a single disk for
+        _check_disk() and fills in the given result dict.
+
+        @raise SmartctlError: if smartctl gave no output
 
-        if 'vendor' in self.disk_data:
-            if 'product' in self.disk_data:
-                self.disk_data['model'] = (self.disk_data['vendor'] + ' ' +
-                                           self.disk_data['product'])
+        @param target: the disk to check, see _get_targets()
+        @type target: dict
+        @param result: the result of the check to fill in, see _check_disk()
+        @type result: dict
+
+        """
+
+        nvme_info = target.get('nvme_info')
+        if nvme_info:
+            ctrl_result = self._eval_nvme_ctrl_state(nvme_info)
+            if ctrl_result:
+                result['state'] = ctrl_result[0]
+                result['err_msgs'].append(ctrl_result[1])
+                return
+
+        (is_sas, disk_data, reason, result['full']) = self.query_smart_data(
+            device=target['device'], device_id=target['device_id'],
+            pd_type=target['pd_type'], threaded=True,
+            last_full=target.get('last_full'))
+        result['is_sas'] = is_sas
+
+        if disk_data is None:
+            if target['spin_state'] == 'down':
+                log.debug("Drive %s is spun down.", target['desc'])
+                result['state'] = nagios.state.ok
+                return
+            result['err_msgs'].append(reason)
+            return
+
+        complete_nvme_data(disk_data, nvme_info)
+        if self.verbose > 2:
+            log.debug("Evaluated disk data of %s:\n%s", target['desc'], LazyPP(disk_data))
+
+        if disk_data['health_state'] is None:
+            result['err_msgs'].append("Could not detect SMART Health Status.")
+            return
+
+        (result['rate'], result['replaced']) = self._eval_history(
+            disk_data, result['full'], target.get('last_full'), target.get('reference'))
+        (result['state'], result['err_msgs']) = self._eval_disk_state(
+            disk_data, is_sas, result['rate'])
+        result['disk_data'] = disk_data
+
+    def query_smart_data(
+            self, device=None, device_id=None, pd_type=None, threaded=False, last_full=None):
+        """
+        Retrieves and evaluates the SMART data of a disk. If there is a recent
+        record of a full query in the SMART history, only the health state
+        and the attributes are queried. If they didn't change, the remaining
+        data are taken from the history, else a full query is done.
+
+        @raise SmartctlError: if smartctl gave no output
+
+        @param device: the device to check, see _exec_smartctl()
+        @type device: str or None
+        @param device_id: the MegaRaid Device Id of the PD to check
+        @type device_id: int or None
+        @param pd_type: the type of the MegaRaid PD ('SAS' or 'SATA'), if known
+        @type pd_type: str or None
+        @param threaded: executed in a worker thread
+        @type threaded: bool
+        @param last_full: the last record of a full query of the disk
+        @type last_full: dict or None
+
+        @return: a tuple of four values, the values of get_disk_smart_data()
+                 and whether a full query was done
+        @rtype: tuple
+
+        """
+
+        if last_full and self.full_interval and self.smartctl_cmd:
+            age = time.time() - last_full['timestamp']
+            if age < self.full_interval * 3600:
+                light_data = self._get_light_smart_data(
+                    device, device_id, pd_type, threaded, last_full)
+                if light_data is not None:
+                    return (light_data[0], light_data[1], None, False)
+
+        (is_sas, disk_data, reason) = self.get_disk_smart_data(
+            device=device, device_id=device_id, pd_type=pd_type, threaded=threaded)
+        return (is_sas, disk_data, reason, True)
+
+    def _get_light_smart_data(self, device, device_id, pd_type, threaded, last_full):
+        """
+        Queries only the health state and the attributes of a disk and
+        completes them by the last record of a full query.
+
+        @return: a tuple of the SAS flag and the disk data, None, if a full
+                 query is necessary, because something has changed
+        @rtype: tuple or None
+
+        """
+
+        data = None
+        if self.use_json:
+            smart_output = self._exec_smartctl(
+                device=device, device_id=device_id, pd_type=pd_type,
+                threaded=threaded, use_json=True, light=True)
+            if smart_output.startswith('{'):
+                import json
+                try:
+                    data = json.loads(smart_output)
+                except ValueError as e:
+                    log.debug("Could not decode JSON output of smartctl: %s", e)
+            if data is None:
+                log.debug("smartctl doesn't support JSON output, using text output.")
+                self._use_json = False
+
+        if data is not None:
+            (is_sas, disk_data, reason) = eval_smartctl_json(data)
+        else:
+            smart_output = self._exec_smartctl(
+                device=device, device_id=device_id, pd_type=pd_type,
+                threaded=threaded, light=True)
+            if re_no_smart.search(smart_output):
+                return None
+            is_sas = last_full['is_sas']
+            disk_data = new_disk_data()
+            if is_sas:
+                eval_sas_output(smart_output, disk_data)
             else:
-                self.disk_data['model'] = self.disk_data['vendor']
-        elif 'product' in self.disk_data:
-            self.disk_data['model'] = self.disk_data['product']
+                eval_sata_output(smart_output, disk_data)
+
+        if disk_data is None or is_sas != last_full['is_sas']:
+            return None
+        if disk_data['health_state'] != last_full['health_state']:
+            return None
+        if disk_data['nr_grown_defects'] != last_full['grown_defects']:
+            return None
+
+        for key in ('model', 'serial'):
+            if disk_data.get(key) is None:
+                disk_data[key] = last_full[key]
+        if disk_data['hours_on'] is None and last_full['hours_on'] is not None:
+            disk_data['hours_on'] = last_full['hours_on'] + int(
+                (time.time() - last_full['timestamp']) / 3600)
+
+        log.debug("SMART data of %r unchanged since the last full query.", last_full['disk'])
+        return (is_sas, disk_data)
+
+    def get_disk_smart_data(self, device=None, device_id=None, pd_type=None, threaded=False):
+        """
+        Retrieves and evaluates the SMART data of a disk. The JSON output
+        of smartctl is used, if supported, else the text output.
+
+        @raise SmartctlError: if smartctl gave no output
+
+        @param device: the device to check, see _exec_smartctl()
+        @type device: str or None
+        @param device_id: the MegaRaid Device Id of the PD to check
+        @type device_id: int or None
+        @param pd_type: the type of the MegaRaid PD ('SAS' or 'SATA'), if known
+        @type pd_type: str or None
+        @param threaded: executed in a worker thread
+        @type threaded: bool
+
+        @return: a tuple of three values:
+                 * the disk is a SAS disk,
+                 * the evaluated disk data, None, if the disk doesn't support SMART
+                 * the reason, why SMART is not supported, or None
+        @rtype: tuple
+
+        """
+
+        if not self.smartctl_cmd:
+            return self.get_nvme_smart_log(device, threaded)
+
+        if self.use_json:
+            smart_output = self._exec_smartctl(
+                device=device, device_id=device_id, pd_type=pd_type,
+                threaded=threaded, use_json=True)
+            data = None
+            if smart_output.startswith('{'):
+                import json
+                try:
+                    data = json.loads(smart_output)
+                except ValueError as e:
+                    log.debug("Could not decode JSON output of smartctl: %s", e)
+            if data is not None:
+                return eval_smartctl_json(data)
+            log.debug("smartctl doesn't support JSON output, using text output.")
+            self._use_json = False
+
+        smart_output = self._exec_smartctl(
+            device=device, device_id=device_id, pd_type=pd_type, threaded=threaded)
+
+        return eval_smartctl_output(smart_output)
+
+    def get_nvme_smart_log(self, device=None, threaded=False):
+        """
+        Retrieves and evaluates the SMART / health information log of a NVMe
+        device by 'nvme smart-log', if there is no smartctl.
+
+        @raise SmartctlError: if nvme gave no usable output
+
+        @param device: the device to check, if not given, self.device is used
+        @type device: str or None
+        @param threaded: executed in a worker thread
+        @type threaded: bool
 
-    def _exec_smartctl(self):
+        @return: a tuple of three values, like get_disk_smart_data()
+        @rtype: tuple
+
+        """
+
+        if device is None:
+            device = self.device
+
+        cmd_list = [self.nvme_cmd, 'smart-log', device, '-o', 'json']
+        stdoutdata = self._smartctl_output(cmd_list, threaded)
+        if not stdoutdata:
+            raise SmartctlError("Got no output from nvme smart-log %s." % (device))
+
+        import json
+        try:
+            data = json.loads(stdoutdata)
+        except ValueError as e:
+            raise SmartctlError(
+                "Could not decode output of nvme smart-log %s: %s" % (device, e))
+
+        return eval_nvme_smart_log(data)
+
+    def _exec_smartctl(
+            self, device=None, device_id=None, pd_type=None, threaded=False, use_json=False,
+            light=False):
         """
         Execute smartctl with all necessary parameters.
 
+        @raise SmartctlError: if smartctl gave no output
+
+        @param device: the device to check, if not given, self.device
+                       (and self.device_id on a MegaRaid adapter) is used
+        @type device: str or None
+        @param device_id: the MegaRaid Device Id of the PD to check
+        @type device_id: int or None
+        @param pd_type: the type of the MegaRaid PD ('SAS' or 'SATA'), if known
+        @type pd_type: str or None
+        @param threaded: executed in a worker thread, so no signal
+                         based timeout handling may be used
+        @type threaded: bool
+        @param use_json: call smartctl with the option '--json'
+        @type use_json: bool
+        @param light: query only the health state and the attributes ('-H -A')
+                      instead of all SMART data ('-x')
+        @type light: bool
+
         @return: the output on STDOUT
         @rtype: str
 
         """
 
-        re_no_mega_sas = re.compile(r'failed:\s+SATA\s+device\s+detected,', re.IGNORECASE)
+        if device is None:
+            device = self.device
+            if self.megaraid:
+                device_id = self.device_id
 
-        cmd_list = [self.smartctl_cmd, '-x']
-        dev_desc = self.device
-        if self.megaraid:
-            cmd_list.append('-d')
-            cmd_list.append('megaraid,%d' % (self.device_id))
-            dev_desc = "%s => megaraid %d" % (self.device, self.device_id)
-        cmd_list.append(self.device)
+        query_args = ['-x']
+        if light:
+            query_args = ['-H', '-A']
 
-        (ret, stdoutdata, stderrdata) = self.exec_cmd(cmd_list)
+        cmd_list = [self.smartctl_cmd] + query_args
+        if use_json:
+            cmd_list.append('--json')
+        dev_desc = device
+        if device_id is not None:
+            cmd_list.append('-d')
+            if pd_type == 'SATA':
+                cmd_list.append('sat+megaraid,%d' % (device_id))
+            else:
+                cmd_list.append('megaraid,%d' % (device_id))
+            dev_desc = "%s => megaraid %d" % (device, device_id)
+        cmd_list.append(device)
 
-        if stdoutdata is None:
-            stdoutdata = ''
-        stdoutdata = stdoutdata.strip()
+        stdoutdata = self._smartctl_output(cmd_list, threaded)
         if not stdoutdata:
-            self.die("Got no output from smartctl %s." % (dev_desc))
+            raise SmartctlError("Got no output from smartctl %s." % (dev_desc))
 
-        if self.megaraid:
+        if device_id is not None and pd_type != 'SATA':
             if re_no_mega_sas.search(stdoutdata):
-                cmd_list = [self.smartctl_cmd, '-x']
+                cmd_list = [self.smartctl_cmd] + query_args
+                if use_json:
+                    cmd_list.append('--json')
                 cmd_list.append('-d')
-                cmd_list.append('sat+megaraid,%d' % (self.device_id))
-                cmd_list.append(self.device)
-                (ret, stdoutdata, stderrdata) = self.exec_cmd(cmd_list)
-                if stdoutdata is None:
-                    stdoutdata = ''
-                stdoutdata = stdoutdata.strip()
+                cmd_list.append('sat+megaraid,%d' % (device_id))
+                cmd_list.append(device)
+                stdoutdata = self._smartctl_output(cmd_list, threaded)
                 if not stdoutdata:
-                    self.die("Got no output from smartctl %s is SATA attempt.")
+                    raise SmartctlError(
+                        "Got no output from smartctl %s in SATA attempt." % (dev_desc))
 
         if self.verbose > 2:
             log.debug("Got output from smartctl %s:\n%s", dev_desc, stdoutdata)
 
         return stdoutdata
+
+    def _kill_running_cmds(self):
+        """
+        Kills all smartctl processes executed by the worker threads and
+        prevents the start of further processes.
+        """
+
+        with self._cmds_lock:
+            self._cmds_killed = True
+            cmd_objs = list(self._running_cmds)
+
+        for cmd_obj in cmd_objs:
+            log.debug("Killing process %d ...", cmd_obj.pid)
+            try:
+                cmd_obj.kill()
+            except OSError as e:
+                log.debug("Could not kill process %d: %s", cmd_obj.pid, e)
+
+    def _smartctl_output(self, cmd_list, threaded=False):
+        """
+        Executes the given smartctl command line and gives back the stripped
+        output on STDOUT.
+
+        Inside a worker thread the command is executed without the signal
+        based timeout handling of exec_cmd(), the timeout is handled by
+        the caller of the worker threads, which kills the running processes.
+
+        @param cmd_list: the command line to execute
+        @type cmd_list: list of str
+        @param threaded: executed in a worker thread
+        @type threaded: bool
+
+        @return: the output on STDOUT
+        @rtype: str
+
+        """
+
+        if not threaded:
+            (ret, stdoutdata, stderrdata) = self.exec_cmd(cmd_list)
+        else:
+            if self.verbose > 1:
+                log.debug("Executing: %s", ' '.join(cmd_list))
+            import subprocess
+            with self._cmds_lock:
+                if self._cmds_killed:
+                    raise SmartctlError("Not executed after the timeout: %s" % (
+                        ' '.join(cmd_list)))
+                cmd_obj = subprocess.Popen(
+                    cmd_list, stdout=subprocess.PIPE, stderr=subprocess.PIPE, close_fds=True)
+                self._running_cmds.add(cmd_obj)
+            try:
+                (stdoutdata, stderrdata) = cmd_obj.communicate()
+            finally:
+                with self._cmds_lock:
+                    self._running_cmds.discard(cmd_obj)
+            if sys.version_info[0] > 2 and isinstance(stdoutdata, bytes):
+                stdoutdata = stdoutdata.decode('utf-8')
+
+        if stdoutdata is None:
+            stdoutdata = ''
+        return stdoutdata.strip()
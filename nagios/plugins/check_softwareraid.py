@@ -22,7 +22,7 @@ import errno
 
 import nagios
 
-from nagios.common import pp
+from nagios.plugin.logguard import LazyPP
 
 from nagios.plugin import NPReadTimeoutError
 
@@ -33,7 +33,7 @@ from nagios.plugin.extended import ExtNagiosPlugin
 # --------------------------------------------
 # Some module variables
 
-__version__ = '0.3.6'
+__version__ = '0.3.7'
 
 log = logging.getLogger(__name__)
 
@@ -267,7 +267,7 @@ class CheckSoftwareRaidPlugin(ExtNagiosPlugin):
         self.init_root_logger()
 
         ini_opts = self.argparser._load_config_section('softwareraid')
-        log.debug("Got options from ini-Parser: %s", pp(ini_opts))
+        log.debug("Got options from ini-Parser: %s", LazyPP(ini_opts))
         if ini_opts and 'spare_ok' in ini_opts:
             self.spare_ok = to_bool(ini_opts['spare_ok'])
 
@@ -476,7 +476,7 @@ class CheckSoftwareRaidPlugin(ExtNagiosPlugin):
                 state.raid_devices[slave_slot] = slave
 
         if self.verbose > 2:
-            log.debug("Status results for %r:\n%s", dev, pp(state.as_dict()))
+            log.debug("Status results for %r:\n%s", dev, LazyPP(state.as_dict()))
 
         # And evaluate the results ....
         state_id = nagios.state.ok
@@ -558,7 +558,7 @@ class CheckSoftwareRaidPlugin(ExtNagiosPlugin):
                 self.exit(nagios.state.ok, "No MD devices to check found.")
 
         if self.verbose > 2:
-            log.debug("Current object:\n%s", pp(self.as_dict()))
+            log.debug("Current object:\n%s", LazyPP(self.as_dict()))
         log.debug("MD devices to check: %r", self.devices)
 
         state = nagios.state.ok
@@ -597,9 +597,9 @@ class CheckSoftwareRaidPlugin(ExtNagiosPlugin):
             self.exit(nagios.state.ok, "No MD devices to check found.")
 
         if self.verbose > 2:
-            log.debug("Ugly states: %s", pp(self.ugly_ones))
-            log.debug("Bad states: %s", pp(self.bad_ones))
-            log.debug("Good states: %s", pp(self.good_ones))
+            log.debug("Ugly states: %s", LazyPP(self.ugly_ones))
+            log.debug("Bad states: %s", LazyPP(self.bad_ones))
+            log.debug("Good states: %s", LazyPP(self.good_ones))
 
         msgs = []
         if self.bad_ones or self.ugly_ones:
@@ -12,18 +12,16 @@ import os
 import logging
 import textwrap
 
-# Third party modules
-import debian.debian_support
-
 # Own modules
 import nagios
 
-from nagios.common import pp
+from nagios.plugin.logguard import LazyPP
+from nagios.common import debian_version
 
 from nagios.plugin.extended import ExtNagiosPlugin
 
 # Some module variables
-__version__ = '0.1.0'
+__version__ = '0.1.2'
 
 log = logging.getLogger(__name__)
 
@@ -202,7 +200,7 @@ class CheckUnamePlugin(ExtNagiosPlugin):
         self.init_root_logger()
 
         if self.verbose > 2:
-            log.debug("Current object:\n%s", pp(self.as_dict()))
+            log.debug("Current object:\n%s", LazyPP(self.as_dict()))
 
         un = os.uname()
 
@@ -222,11 +220,11 @@ class CheckUnamePlugin(ExtNagiosPlugin):
         if self.min_version is not None:
             cur_version = un[2]
 
-            parsed_version_expected = debian.debian_support.Version(self.min_version)
+            parsed_version_expected = debian_version(self.min_version)
             if self.verbose > 1:
                 log.debug("Expecting parsed version %r.", parsed_version_expected)
 
-            parsed_version_got = debian.debian_support.Version(cur_version)
+            parsed_version_got = debian_version(cur_version)
             if self.verbose > 1:
                 log.debug("Got parsed version %r.", parsed_version_got)
 
@@ -0,0 +1,122 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+@author: Frank Brehm
+@contact: frank.brehm@profitbricks.com
+@copyright: © 2010 - 2016 by Frank Brehm, Berlin
+@summary: Module for the IbCounterState class, a local store of the last
+          sample of the counters of the Infiniband ports, used by
+          CheckIbStatusPlugin for evaluating the rates of the counters.
+"""
+
+# Standard modules
+import logging
+
+# Third party modules
+
+# Own modules
+
+from nagios.plugin.statestore import StateStoreError
+from nagios.plugin.statestore import StateStore
+from nagios.plugin.statestore import counter_delta
+
+# Some module variables
+__version__ = '0.2.0'
+
+log = logging.getLogger(__name__)
+
+DEFAULT_STATE_FILE = '/var/lib/nagios/ib_port_counters.state'
+
+# The width of the data and packet counters in <port_dir>/counters/, they
+# are wrapping around, the counters in <port_dir>/counters_ext/ have 64 bits
+COUNTER_WIDTH = 32
+
+# The error counters out of <port_dir>/counters/, they are saturating
+# instead of wrapping around, so a decrease means a reset
+IB_PORT_ERROR_COUNTERS = (
+    'symbol_error', 'link_error_recovery', 'link_downed', 'port_rcv_errors',
+    'port_xmit_discards')
+
+# The data counters are given in units of 4 octets
+IB_PORT_DATA_COUNTERS = ('port_xmit_data', 'port_rcv_data')
+IB_PORT_PACKET_COUNTERS = ('port_xmit_packets', 'port_rcv_packets')
+IB_PORT_COUNTERS = IB_PORT_ERROR_COUNTERS + IB_PORT_DATA_COUNTERS + IB_PORT_PACKET_COUNTERS
+
+IB_PORT_EXT_COUNTERS = (
+    'port_xmit_data_64', 'port_rcv_data_64', 'port_xmit_packets_64',
+    'port_rcv_packets_64')
+
+# The rates evaluated out of the data and packet counters:
+# (name of the rate, counter in counters_ext, counter in counters, factor)
+IB_PORT_TRAFFIC_RATES = (
+    ('xmit_bytes', 'port_xmit_data_64', 'port_xmit_data', 4),
+    ('rcv_bytes', 'port_rcv_data_64', 'port_rcv_data', 4),
+    ('xmit_packets', 'port_xmit_packets_64', 'port_xmit_packets', 1),
+    ('rcv_packets', 'port_rcv_packets_64', 'port_rcv_packets', 1),
+)
+
+# the former special error class of the counter state file
+IbCounterStateError = StateStoreError
+
+
+def port_rates(old, new, interval):
+    """
+    Computes the per second rates of the traffic and the error counters
+    of a port between two samples.
+
+    @param old: the previous sample of the counters by their names
+    @type old: dict
+    @param new: the current sample of the counters by their names
+    @type new: dict
+    @param interval: the time between both samples in seconds
+    @type interval: float
+
+    @return: the rates by the names out of IB_PORT_TRAFFIC_RATES and
+             IB_PORT_ERROR_COUNTERS, rates of reset counters are omitted
+    @rtype: dict
+
+    """
+
+    rates = {}
+    if interval <= 0:
+        return rates
+
+    for (name, ext_counter, counter, factor) in IB_PORT_TRAFFIC_RATES:
+        if ext_counter in old and ext_counter in new:
+            delta = counter_delta(old[ext_counter], new[ext_counter])
+        elif counter in old and counter in new:
+            delta = counter_delta(old[counter], new[counter], COUNTER_WIDTH)
+        else:
+            continue
+        if delta is not None:
+            rates[name] = float(delta * factor) / interval
+
+    for counter in IB_PORT_ERROR_COUNTERS:
+        if counter in old and counter in new:
+            delta = counter_delta(old[counter], new[counter])
+            if delta is not None:
+                rates[counter] = float(delta) / interval
+
+    return rates
+
+
+class IbCounterState(StateStore):
+    """
+    A store of the last sample of the counters of the Infiniband ports
+    by the port ('<hca>:<port>'), concurrent checks of different ports
+    share the same state file.
+    """
+
+    def __init__(self, filename=DEFAULT_STATE_FILE):
+        """
+        Constructor.
+
+        @param filename: the filename of the state file
+        @type filename: str
+
+        """
+
+        super(IbCounterState, self).__init__('ib_port_counters', filename=filename)
+
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,436 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+@author: Frank Brehm
+@contact: frank.brehm@profitbricks.com
+@copyright: © 2010 - 2016 by Frank Brehm, Berlin
+@summary: Module for the InstanceProber class, which sends a request to
+          the instances of a daemon (PPD, VCB) on many hosts at the same
+          time and collects their replies in one single threaded loop.
+"""
+
+# Standard modules
+import errno
+import socket
+import select
+import logging
+import time
+
+from multiprocessing.pool import ThreadPool
+
+# Third party modules
+
+# Own modules
+
+from nagios.plugins.socket_transport import SocketTransportError
+from nagios.plugins.socket_transport import SocketConnectTimeoutError
+from nagios.plugins.socket_transport import NoListeningError
+from nagios.plugins.socket_transport import ReplyReader
+from nagios.plugins.socket_transport import sort_addresses
+from nagios.plugin.timing import monotonic
+from nagios.plugins.socket_transport import DEFAULT_BUFFER_SIZE, DEFAULT_IDLE_INTERVAL
+
+# Some module variables
+__version__ = '0.3.1'
+
+log = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = 64
+
+RESOLVE_THREADS = 32
+
+DEFAULT_COMMAND_FILE = '/var/lib/nagios3/rw/nagios.cmd'
+
+PROBE_CONNECTING = 'connecting'
+PROBE_SENDING = 'sending'
+PROBE_RECEIVING = 'receiving'
+PROBE_DONE = 'done'
+
+
+def passive_check_result(host, service, state, output, timestamp=None):
+    """
+    Gives back an external command for submitting a passive service
+    check result to Nagios/Icinga.
+
+    @param host: the name of the host of the service
+    @type host: str
+    @param service: the description of the service
+    @type service: str
+    @param state: the state of the service
+    @type state: int
+    @param output: the output of the check
+    @type output: str
+    @param timestamp: the timestamp of the check, if not given,
+                      the current time
+    @type timestamp: int or None
+
+    @return: the external command
+    @rtype: str
+
+    """
+
+    if timestamp is None:
+        timestamp = time.time()
+    output = ' '.join(str(output).splitlines())
+    return "[%d] PROCESS_SERVICE_CHECK_RESULT;%s;%s;%d;%s" % (
+        int(timestamp), host, service, state, output)
+
+
+class InstanceProbe(object):
+    """
+    The request to the daemon on one host and the reply of it.
+    """
+
+    def __init__(self, host, port):
+
+        self.host = host
+        self.port = port
+
+        self.result = None
+        """
+        @ivar: the decoded reply of the daemon
+        @type: str or None
+        """
+
+        self.error = None
+        """
+        @ivar: the error of the request, if it was not successful
+        @type: SocketTransportError or None
+        """
+
+        self.state = PROBE_CONNECTING
+        self.addresses = []
+        self.sock = None
+        self.sockaddr = None
+        self.outbuf = b''
+        self.reader = None
+        self.deadline = None
+        self.last_data = None
+
+    def as_dict(self):
+        """
+        Typecasting into a dictionary.
+
+        @return: structure as dict
+        @rtype:  dict
+
+        """
+
+        d = {
+            '__class__': self.__class__.__name__,
+            'host': self.host,
+            'port': self.port,
+            'state': self.state,
+            'sockaddr': self.sockaddr,
+            'result': self.result,
+            'error': None,
+        }
+        if self.error:
+            d['error'] = str(self.error)
+
+        return d
+
+
+class InstanceProber(object):
+    """
+    Sends a request to the daemons on many hosts concurrently over
+    non blocking sockets in one select() loop.
+
+    The reply of a daemon is complete, if the given is_complete() callback
+    is true for the received data, if the daemon closes the connection or
+    if no further data are coming for the idle interval after receiving
+    some data. Every request has its own deadline.
+    """
+
+    def __init__(
+            self, timeout, concurrency=DEFAULT_CONCURRENCY, buffer_size=DEFAULT_BUFFER_SIZE,
+            idle_interval=DEFAULT_IDLE_INTERVAL, is_complete=None, should_stop=None,
+            name='Daemon'):
+        """
+        Constructor.
+
+        @param timeout: the deadline of every request in seconds
+        @type timeout: float
+        @param concurrency: the maximum number of requests at the same time
+        @type concurrency: int
+        @param buffer_size: the size of the receive buffer
+        @type buffer_size: int
+        @param idle_interval: the time without new data after receiving some
+                              data, after which the reply is taken as complete
+        @type idle_interval: float
+        @param is_complete: a callback with the decoded data received so far,
+                            which gives back, whether the reply is complete
+        @type is_complete: callable or None
+        @param should_stop: a callback, which gives back, whether the probing
+                            should be canceled
+        @type should_stop: callable or None
+        @param name: the name of the daemon for error messages
+        @type name: str
+
+        """
+
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.buffer_size = buffer_size
+        self.idle_interval = idle_interval
+        self.is_complete = is_complete
+        self.should_stop = should_stop
+        self.name = name
+
+    def as_dict(self):
+        """
+        Typecasting into a dictionary.
+
+        @return: structure as dict
+        @rtype:  dict
+
+        """
+
+        d = {
+            '__class__': self.__class__.__name__,
+            'timeout': self.timeout,
+            'concurrency': self.concurrency,
+            'buffer_size': self.buffer_size,
+            'idle_interval': self.idle_interval,
+            'name': self.name,
+        }
+
+        return d
+
+    def run(self, endpoints, message):
+        """
+        Sends the message to all given endpoints and collects the replies.
+
+        @param endpoints: the endpoints as tuples of the host and the port
+        @type endpoints: list of tuple
+        @param message: the message to send
+        @type message: str
+
+        @return: the probes of all endpoints in the given order
+        @rtype: list of InstanceProbe
+
+        """
+
+        if not isinstance(message, bytes):
+            message = message.encode('utf-8')
+
+        probes = [InstanceProbe(host, port) for (host, port) in endpoints]
+        self._resolve(probes)
+
+        pending = [x for x in probes if x.state != PROBE_DONE]
+        pending.reverse()
+        active = []
+
+        try:
+            while pending or active:
+
+                if self.should_stop and self.should_stop():
+                    for probe in active + pending:
+                        self._fail(probe, SocketTransportError("Canceled."))
+                    break
+
+                now = monotonic()
+                while pending and len(active) < self.concurrency:
+                    probe = pending.pop()
+                    probe.deadline = now + self.timeout
+                    probe.outbuf = message
+                    probe.reader = ReplyReader(self.buffer_size, self.is_complete)
+                    self._connect(probe)
+                    if probe.state != PROBE_DONE:
+                        active.append(probe)
+
+                self._poll(active)
+
+                now = monotonic()
+                still_active = []
+                for probe in active:
+                    if probe.state != PROBE_DONE:
+                        self._check_times(probe, now)
+                    if probe.state != PROBE_DONE:
+                        still_active.append(probe)
+                active = still_active
+
+        finally:
+            for probe in probes:
+                self._close(probe)
+
+        return probes
+
+    def _resolve(self, probes):
+
+        def resolve(probe):
+            try:
+                return socket.getaddrinfo(
+                    probe.host, probe.port, socket.AF_UNSPEC, socket.SOCK_STREAM)
+            except (socket.error, UnicodeError) as e:
+                return e
+
+        if len(probes) > 1:
+            pool = ThreadPool(min(RESOLVE_THREADS, len(probes)))
+            try:
+                results = pool.map(resolve, probes)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [resolve(x) for x in probes]
+
+        for (probe, result) in zip(probes, results):
+            if isinstance(result, Exception):
+                self._fail(probe, NoListeningError("Could not resolve %r: %s" % (
+                    probe.host, result)))
+            else:
+                probe.addresses = sort_addresses(result)
+
+    def _connect(self, probe):
+        """
+        Starts a non blocking connect to the next address of the probe.
+        """
+
+        while probe.addresses:
+            (af, socktype, proto, canonname, sa) = probe.addresses.pop(0)
+            try:
+                sock = socket.socket(af, socktype, proto)
+            except socket.error as e:
+                log.debug("Could not create socket for %r: %s", sa, e)
+                continue
+            sock.setblocking(False)
+            err = sock.connect_ex(sa)
+            if err in (0, errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY):
+                probe.sock = sock
+                probe.sockaddr = sa
+                probe.state = PROBE_CONNECTING
+                return
+            log.debug("Could not connect to %r: %s", sa, errno.errorcode.get(err, err))
+            sock.close()
+
+        self._fail(probe, NoListeningError("%s seems not to listen on %r, port %d." % (
+            self.name, probe.host, probe.port)))
+
+    def _poll(self, active):
+
+        if not active:
+            return
+
+        rlist = []
+        wlist = []
+        by_fd = {}
+        now = monotonic()
+        timeout = self.idle_interval
+        for probe in active:
+            fd = probe.sock.fileno()
+            by_fd[fd] = probe
+            if probe.state in (PROBE_CONNECTING, PROBE_SENDING):
+                wlist.append(fd)
+            else:
+                rlist.append(fd)
+            timeout = min(timeout, max(0, probe.deadline - now))
+
+        try:
+            (readable, writable, exceptional) = select.select(rlist, wlist, [], timeout)
+        except select.error as e:
+            if e.args[0] == errno.EINTR:
+                return
+            raise
+
+        for fd in writable:
+            probe = by_fd[fd]
+            if probe.state == PROBE_CONNECTING:
+                self._connected(probe)
+            if probe.state == PROBE_SENDING:
+                self._send(probe)
+
+        for fd in readable:
+            self._receive(by_fd[fd])
+
+    def _connected(self, probe):
+
+        err = probe.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if err:
+            log.debug(
+                "Could not connect to %r: %s", probe.sockaddr,
+                errno.errorcode.get(err, err))
+            self._close(probe)
+            self._connect(probe)
+            return
+
+        log.debug("Connected to %r.", probe.sockaddr)
+        probe.state = PROBE_SENDING
+
+    def _send(self, probe):
+
+        try:
+            sent = probe.sock.send(probe.outbuf)
+        except socket.error as e:
+            if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return
+            self._fail(probe, SocketTransportError(
+                "Error sending to %r port %d: %s" % (probe.host, probe.port, e)))
+            return
+
+        probe.outbuf = probe.outbuf[sent:]
+        if not probe.outbuf:
+            probe.state = PROBE_RECEIVING
+
+    def _receive(self, probe):
+
+        reader = probe.reader
+        try:
+            count = reader.receive(probe.sock)
+        except socket.error as e:
+            if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return
+            self._fail(probe, SocketTransportError(
+                "Error receiving from %r port %d: %s" % (probe.host, probe.port, e)))
+            return
+
+        if not count:
+            log.debug("Socket to %r closed from remote.", probe.host)
+            if reader.received:
+                self._done(probe)
+            else:
+                self._fail(probe, SocketTransportError(
+                    "Connection closed by %r port %d without a reply." % (
+                        probe.host, probe.port)))
+            return
+
+        probe.last_data = monotonic()
+        if reader.complete:
+            self._done(probe)
+
+    def _check_times(self, probe, now):
+
+        if probe.state == PROBE_RECEIVING and probe.last_data is not None:
+            if now - probe.last_data >= self.idle_interval:
+                self._done(probe)
+                return
+
+        if now >= probe.deadline:
+            if probe.state == PROBE_CONNECTING:
+                error = SocketConnectTimeoutError("Timeout connecting to %r port %d." % (
+                    probe.host, probe.port))
+            else:
+                error = SocketTransportError("Timeout after %0.2f seconds." % (self.timeout))
+            self._fail(probe, error)
+
+    def _done(self, probe):
+
+        probe.result = probe.reader.text
+        probe.state = PROBE_DONE
+        self._close(probe)
+
+    def _fail(self, probe, error):
+
+        log.debug("Request to %r failed: %s", probe.host, error)
+        probe.error = error
+        probe.state = PROBE_DONE
+        self._close(probe)
+
+    def _close(self, probe):
+
+        if probe.sock is not None:
+            probe.sock.close()
+            probe.sock = None
+
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,218 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+@author: Frank Brehm
+@contact: frank.brehm@profitbricks.com
+@copyright: © 2010 - 2016 by Frank Brehm, Berlin
+@summary: Module for reading the I/O pressure stall information (PSI) and
+          the I/O counters of the cgroups (v2), used by CheckIoPressurePlugin.
+"""
+
+# Standard modules
+import os
+import errno
+import logging
+
+# Third party modules
+
+# Own modules
+
+# Some module variables
+__version__ = '0.2.0'
+
+log = logging.getLogger(__name__)
+
+DEFAULT_STATE_FILE = '/var/lib/nagios/io_pressure.state'
+
+PRESSURE_FILE = os.sep + os.path.join('proc', 'pressure', 'io')
+
+CGROUP_ROOTS = (
+    os.sep + os.path.join('sys', 'fs', 'cgroup'),
+    os.sep + os.path.join('sys', 'fs', 'cgroup', 'unified'),
+)
+
+SYS_DEV_BLOCK_DIR = os.sep + os.path.join('sys', 'dev', 'block')
+
+# the counters out of io.stat summed up over all devices of a cgroup
+IO_STAT_COUNTERS = ('rbytes', 'wbytes', 'rios', 'wios')
+
+
+def parse_pressure(content):
+    """
+    Parses the content of a PSI file (/proc/pressure/io or io.pressure
+    of a cgroup).
+
+    @param content: the content of the file
+    @type content: str
+
+    @return: the values by the line ('some' or 'full') and their names
+             ('avg10', 'avg60', 'avg300' as percentages, 'total' in
+             microseconds)
+    @rtype: dict
+
+    """
+
+    result = {}
+    for line in content.splitlines():
+        fields = line.split()
+        if not fields:
+            continue
+        values = {}
+        for field in fields[1:]:
+            (name, sep, value) = field.partition('=')
+            if not sep:
+                continue
+            try:
+                if name == 'total':
+                    values[name] = int(value)
+                else:
+                    values[name] = float(value)
+            except ValueError:
+                continue
+        result[fields[0]] = values
+
+    return result
+
+
+def parse_io_stat(content):
+    """
+    Parses the content of the io.stat file of a cgroup.
+
+    @param content: the content of the file
+    @type content: str
+
+    @return: the counters by the device ('<major>:<minor>') and their names
+    @rtype: dict
+
+    """
+
+    result = {}
+    for line in content.splitlines():
+        fields = line.split()
+        if not fields:
+            continue
+        counters = {}
+        for field in fields[1:]:
+            (name, sep, value) = field.partition('=')
+            if sep and value.isdigit():
+                counters[name] = int(value)
+        result[fields[0]] = counters
+
+    return result
+
+
+def find_cgroup_root():
+    """
+    Gives back the mount point of the unified cgroup (v2) hierarchy.
+
+    @return: the directory or None, if there is no unified hierarchy
+    @rtype: str or None
+
+    """
+
+    for root in CGROUP_ROOTS:
+        if os.path.exists(os.path.join(root, 'cgroup.controllers')):
+            return root
+    return None
+
+
+def _read(filename):
+
+    try:
+        with open(filename, 'r') as fh:
+            return fh.read()
+    except (IOError, OSError) as e:
+        if e.errno in (errno.ENOENT, errno.ENODEV, errno.EOPNOTSUPP):
+            return None
+        raise
+
+
+def read_cgroups(root, max_depth=2):
+    """
+    Reads the I/O pressure and the I/O counters of all cgroups up to the
+    given depth in one pass over the cgroup hierarchy.
+
+    @param root: the mount point of the unified cgroup hierarchy
+    @type root: str
+    @param max_depth: the maximum depth of the cgroups below the root
+    @type max_depth: int
+
+    @return: the cgroups by their path relative to the root ('/' for the root
+             cgroup) as dicts with the keys 'depth', 'pressure' (see
+             parse_pressure()) and 'io' (see parse_io_stat())
+    @rtype: dict
+
+    """
+
+    cgroups = {}
+    root = root.rstrip(os.sep) or os.sep
+
+    for (dirpath, dirnames, filenames) in os.walk(root):
+        rel = dirpath[len(root):]
+        depth = rel.count(os.sep)
+        if depth >= max_depth:
+            del dirnames[:]
+        dirnames.sort()
+
+        pressure = None
+        if 'io.pressure' in filenames:
+            content = _read(os.path.join(dirpath, 'io.pressure'))
+            if content is not None:
+                pressure = parse_pressure(content)
+
+        io = None
+        if 'io.stat' in filenames:
+            content = _read(os.path.join(dirpath, 'io.stat'))
+            if content is not None:
+                io = parse_io_stat(content)
+
+        if pressure is None and io is None:
+            continue
+
+        cgroups[rel or '/'] = {
+            'depth': depth,
+            'pressure': pressure,
+            'io': io,
+        }
+
+    return cgroups
+
+
+def device_name(device, sys_dev_block_dir=SYS_DEV_BLOCK_DIR):
+    """
+    Gives back the kernel name of the block device with the given number.
+
+    @param device: the number of the device ('<major>:<minor>')
+    @type device: str
+
+    @return: the name of the device, the number, if it is unknown
+    @rtype: str
+
+    """
+
+    try:
+        return os.path.basename(os.readlink(os.path.join(sys_dev_block_dir, device)))
+    except (IOError, OSError):
+        return device
+
+
+def sum_io_counters(io):
+    """
+    Sums up the I/O counters of a cgroup over all devices.
+
+    @param io: the I/O counters by the device, see parse_io_stat()
+    @type io: dict
+
+    @return: the sums of the counters out of IO_STAT_COUNTERS
+    @rtype: dict
+
+    """
+
+    sums = dict((name, 0) for name in IO_STAT_COUNTERS)
+    for counters in io.values():
+        for name in IO_STAT_COUNTERS:
+            sums[name] += counters.get(name, 0)
+    return sums
+
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
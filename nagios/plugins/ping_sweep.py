@@ -0,0 +1,590 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+@author: Frank Brehm
+@contact: frank.brehm@profitbricks.com
+@copyright: © 2010 - 2016 by Frank Brehm, Berlin
+@summary: Module for the PingSweep class, which pings a great number of
+          hosts via IPv6 and as a fallback via IPv4 in one single threaded
+          event loop, either by ICMP sockets or by ping commands.
+"""
+
+# Standard modules
+import os
+import errno
+import socket
+import select
+import struct
+import logging
+import subprocess
+import time
+
+from collections import deque
+from multiprocessing.pool import ThreadPool
+
+# Third party modules
+
+# Own modules
+
+from nagios.plugin.timing import monotonic
+
+# Some module variables
+__version__ = '0.1.1'
+
+log = logging.getLogger(__name__)
+
+ICMP_ECHO_REPLY = 0
+ICMP_ECHO_REQUEST = 8
+ICMPV6_ECHO_REQUEST = 128
+ICMPV6_ECHO_REPLY = 129
+
+IPPROTO_ICMPV6 = getattr(socket, 'IPPROTO_ICMPV6', 58)
+
+# Number of echo requests per host and the deadline of the pings
+# of a host in seconds, like 'ping -c 2 -w 4'
+DEFAULT_COUNT = 2
+DEFAULT_DEADLINE = 4
+
+# The interval between the echo requests to the same host
+DEFAULT_INTERVAL = 0.2
+
+# The maximum number of hosts pinged at the same time by ICMP sockets
+# and by ping commands
+DEFAULT_CONCURRENCY = 256
+DEFAULT_CMD_CONCURRENCY = 30
+
+# The interval of polling running ping commands
+POLL_INTERVAL = 0.05
+
+RESOLVE_THREADS = 32
+
+# The receive buffer of the ICMP sockets, great enough for the replies
+# of all concurrently pinged hosts
+ICMP_RCVBUF = 1024 * 1024
+
+# The results of pinging a host
+PING_REACHED = 'reached'
+PING_NOT_REACHED = 'notreached'
+PING_OFFLINE = 'offline'
+PING_FAILED = 'failed'
+PING_RESULTS = (PING_REACHED, PING_NOT_REACHED, PING_OFFLINE, PING_FAILED)
+
+
+def icmp_checksum(data):
+    """
+    Computes the internet checksum (RFC 1071) of the given data.
+
+    @param data: the data to checksum
+    @type data: bytes
+
+    @return: the checksum
+    @rtype: int
+
+    """
+
+    if len(data) % 2:
+        data += b'\0'
+    total = sum(struct.unpack('!%dH' % (len(data) // 2), data))
+    total = (total >> 16) + (total & 0xffff)
+    total += total >> 16
+    return ~total & 0xffff
+
+
+def echo_request(family, ident, seq, payload=b''):
+    """
+    Builds an ICMP or ICMPv6 echo request. The checksum of ICMPv6 packets
+    is always computed by the kernel.
+
+    @param family: the address family, socket.AF_INET or socket.AF_INET6
+    @type family: int
+    @param ident: the identifier of the echo request
+    @type ident: int
+    @param seq: the sequence number of the echo request
+    @type seq: int
+    @param payload: the payload of the echo request
+    @type payload: bytes
+
+    @return: the packet
+    @rtype: bytes
+
+    """
+
+    icmp_type = ICMP_ECHO_REQUEST
+    if family == socket.AF_INET6:
+        icmp_type = ICMPV6_ECHO_REQUEST
+
+    header = struct.pack('!BBHHH', icmp_type, 0, 0, ident, seq)
+    if family == socket.AF_INET:
+        checksum = icmp_checksum(header + payload)
+        header = struct.pack('!BBHHH', icmp_type, 0, checksum, ident, seq)
+
+    return header + payload
+
+
+def parse_echo_reply(family, data, raw=True):
+    """
+    Evaluates a received ICMP or ICMPv6 packet.
+
+    @param family: the address family, socket.AF_INET or socket.AF_INET6
+    @type family: int
+    @param data: the received packet
+    @type data: bytes
+    @param raw: the packet was received by a raw socket, so an ICMP packet
+                starts with the IP header
+    @type raw: bool
+
+    @return: the identifier and the sequence number of an echo reply,
+             None for all other packets
+    @rtype: tuple of (int, int) or None
+
+    """
+
+    reply_type = ICMP_ECHO_REPLY
+    if family == socket.AF_INET6:
+        reply_type = ICMPV6_ECHO_REPLY
+    elif raw:
+        if len(data) < 20:
+            return None
+        ihl = (struct.unpack('!B', data[:1])[0] & 0x0f) * 4
+        data = data[ihl:]
+
+    if len(data) < 8:
+        return None
+    (icmp_type, code, checksum, ident, seq) = struct.unpack('!BBHHH', data[:8])
+    if icmp_type != reply_type:
+        return None
+
+    return (ident, seq)
+
+
+def normalize_address(family, address):
+    """
+    Gives back the canonical form of an IP address without a scope id.
+
+    @param family: the address family, socket.AF_INET or socket.AF_INET6
+    @type family: int
+    @param address: the IP address
+    @type address: str
+
+    @return: the normalized address
+    @rtype: str
+
+    """
+
+    address = address.split('%', 1)[0]
+    return socket.inet_ntop(family, socket.inet_pton(family, address))
+
+
+def open_icmp_socket(family):
+    """
+    Opens a non blocking raw ICMP socket, or, if not permitted, a datagram
+    ICMP socket (allowed by net.ipv4.ping_group_range).
+
+    @param family: the address family, socket.AF_INET or socket.AF_INET6
+    @type family: int
+
+    @return: the socket and the flag, whether it is a raw socket,
+             (None, None), if no ICMP socket could be opened
+    @rtype: tuple
+
+    """
+
+    proto = socket.IPPROTO_ICMP
+    if family == socket.AF_INET6:
+        proto = IPPROTO_ICMPV6
+
+    for (sock_type, raw) in ((socket.SOCK_RAW, True), (socket.SOCK_DGRAM, False)):
+        try:
+            sock = socket.socket(family, sock_type, proto)
+        except (socket.error, OSError) as e:
+            log.debug("Could not open ICMP socket (family %d, raw %r): %s", family, raw, e)
+            continue
+        sock.setblocking(False)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, ICMP_RCVBUF)
+        except (socket.error, OSError):
+            pass
+        return (sock, raw)
+
+    return (None, None)
+
+
+class PingProbe(object):
+    """
+    The pings of one address of a host.
+    """
+
+    __slots__ = (
+        'host', 'family', 'address', 'sent', 'received', 'next_send',
+        'deadline', 'proc')
+
+    def __init__(self, host, family, address):
+
+        self.host = host
+        self.family = family
+        self.address = address
+        self.sent = 0
+        self.received = 0
+        self.next_send = None
+        self.deadline = None
+        self.proc = None
+
+
+class PingSweep(object):
+    """
+    Pings a list of hosts, each given as a dict with the keys 'hostalias',
+    'ping_address' (an IPv6 address or a hostname) and 'ipv4_address'.
+
+    Every host is first pinged on its IPv6 address. If it doesn't answer,
+    its IPv4 address is pinged to distinguish between a host, which is not
+    reachable via IPv6 ('notreached'), and a host, which is offline at all.
+
+    The pings are done in one single threaded loop, either by ICMP sockets,
+    if they could be opened, or else by ping6 and ping commands, which are
+    polled until they are finished or their deadline is reached. The number
+    of hosts pinged at the same time is limited by the concurrency.
+    """
+
+    def __init__(
+            self, count=DEFAULT_COUNT, deadline=DEFAULT_DEADLINE, interval=DEFAULT_INTERVAL,
+            concurrency=None, use_sockets=True, ping6_cmd='ping6', ping_cmd='ping'):
+        """
+        Constructor.
+
+        @param count: the number of echo replies needed from a host
+        @type count: int
+        @param deadline: the deadline for the pings of an address in seconds
+        @type deadline: float
+        @param interval: the interval between the echo requests to an address
+        @type interval: float
+        @param concurrency: the maximum number of addresses pinged at the same
+                            time, if not given, DEFAULT_CONCURRENCY for ICMP
+                            sockets or DEFAULT_CMD_CONCURRENCY for ping commands
+        @type concurrency: int or None
+        @param use_sockets: try to use ICMP sockets instead of ping commands
+        @type use_sockets: bool
+        @param ping6_cmd: the command for pinging IPv6 addresses
+        @type ping6_cmd: str
+        @param ping_cmd: the command for pinging IPv4 addresses
+        @type ping_cmd: str
+
+        """
+
+        self.count = count
+        self.deadline = deadline
+        self.interval = interval
+        self.concurrency = concurrency
+        self.use_sockets = use_sockets
+        self.ping6_cmd = ping6_cmd
+        self.ping_cmd = ping_cmd
+
+        self.results = None
+        """
+        @ivar: the aliases of the pinged hosts by the result of the pings,
+               see PING_RESULTS
+        @type: dict of set
+        """
+
+        self.duration = None
+        """
+        @ivar: the duration of the last sweep in seconds
+        @type: float
+        """
+
+        self._sockets = {}
+        self._ident = os.getpid() & 0xffff
+        self._seq = 0
+        self._pending = None
+        self._active = None
+        self._by_seq = None
+
+    def as_dict(self):
+        """
+        Typecasting into a dictionary.
+
+        @return: structure as dict
+        @rtype:  dict
+
+        """
+
+        d = {
+            '__class__': self.__class__.__name__,
+            'count': self.count,
+            'deadline': self.deadline,
+            'interval': self.interval,
+            'concurrency': self.concurrency,
+            'use_sockets': self.use_sockets,
+            'ping6_cmd': self.ping6_cmd,
+            'ping_cmd': self.ping_cmd,
+            'duration': self.duration,
+        }
+
+        return d
+
+    def run(self, hosts):
+        """
+        Pings all given hosts.
+
+        @param hosts: the hosts to ping
+        @type hosts: list of dict
+
+        @return: the aliases of the pinged hosts by the result of the pings,
+                 see PING_RESULTS
+        @rtype: dict of set
+
+        """
+
+        start = monotonic()
+        self.results = {}
+        for result in PING_RESULTS:
+            self.results[result] = set()
+        self._pending = deque()
+        self._active = []
+        self._by_seq = {}
+
+        try:
+            if self.use_sockets and self._open_sockets():
+                self._sweep_sockets(hosts)
+            else:
+                self._sweep_commands(hosts)
+        finally:
+            self._close_sockets()
+
+        self.duration = monotonic() - start
+        log.debug(
+            "Pinged %d hosts in %.2f seconds: %s", len(hosts), self.duration,
+            ', '.join(["%d %s" % (len(self.results[x]), x) for x in PING_RESULTS]))
+
+        return self.results
+
+    def _open_sockets(self):
+
+        for family in (socket.AF_INET6, socket.AF_INET):
+            (sock, raw) = open_icmp_socket(family)
+            if sock is None:
+                log.debug("No ICMP sockets available, using ping commands.")
+                self._close_sockets()
+                return False
+            self._sockets[family] = (sock, raw)
+
+        return True
+
+    def _close_sockets(self):
+
+        for family in list(self._sockets.keys()):
+            self._sockets[family][0].close()
+        self._sockets = {}
+
+    def _finished(self, probe, success):
+        """
+        Evaluates the end of the pings of an address of a host, it gives
+        back the probe of the IPv4 address, if the host didn't answer on
+        its IPv6 address.
+        """
+
+        host = probe.host
+        if probe.family == socket.AF_INET6:
+            if success:
+                self.results[PING_REACHED].add(host['hostalias'])
+                return None
+            return PingProbe(host, socket.AF_INET, host['ipv4_address'])
+
+        if success:
+            self.results[PING_NOT_REACHED].add(host['hostalias'])
+        else:
+            self.results[PING_OFFLINE].add(host['hostalias'])
+        return None
+
+    def _failed(self, probe, error):
+
+        log.debug("Pinging %r failed: %s", probe.address, error)
+        self.results[PING_FAILED].add(probe.host['hostalias'])
+
+    # -------------------------------------------------------------------------
+    # Pinging by ICMP sockets
+
+    def _resolve(self, hosts):
+        """
+        Resolves the IPv6 addresses of all hosts in parallel.
+        """
+
+        def resolve(name):
+            try:
+                return normalize_address(socket.AF_INET6, name)
+            except (socket.error, ValueError):
+                pass
+            try:
+                info = socket.getaddrinfo(name, None, socket.AF_INET6, socket.SOCK_RAW)
+            except (socket.error, UnicodeError) as e:
+                log.debug("Could not resolve %r: %s", name, e)
+                return None
+            return normalize_address(socket.AF_INET6, info[0][4][0])
+
+        names = [x['ping_address'] for x in hosts]
+        if len(names) < 2:
+            return [resolve(x) for x in names]
+
+        pool = ThreadPool(min(RESOLVE_THREADS, len(names)))
+        try:
+            return pool.map(resolve, names)
+        finally:
+            pool.close()
+            pool.join()
+
+    def _sweep_sockets(self, hosts):
+
+        concurrency = self.concurrency or DEFAULT_CONCURRENCY
+        addresses = self._resolve(hosts)
+        for (host, address) in zip(hosts, addresses):
+            if address is None:
+                self._pending.append(PingProbe(host, socket.AF_INET, host['ipv4_address']))
+            else:
+                self._pending.append(PingProbe(host, socket.AF_INET6, address))
+
+        sockets = dict((x[0].fileno(), (family, x[0], x[1])) for (family, x) in (
+            self._sockets.items()))
+
+        while self._pending or self._active:
+
+            now = monotonic()
+            while self._pending and len(self._active) < concurrency:
+                probe = self._pending.popleft()
+                try:
+                    if probe.family == socket.AF_INET:
+                        probe.address = normalize_address(probe.family, probe.address)
+                except (socket.error, ValueError, TypeError, AttributeError) as e:
+                    self._failed(probe, "invalid address %r: %s" % (probe.address, e))
+                    continue
+                probe.next_send = now
+                probe.deadline = now + self.deadline
+                self._active.append(probe)
+
+            next_event = now + POLL_INTERVAL
+            for probe in self._active:
+                if probe.sent < self.count and probe.next_send <= now:
+                    self._send(probe, now)
+                if probe.sent < self.count:
+                    next_event = min(next_event, probe.next_send)
+                next_event = min(next_event, probe.deadline)
+
+            timeout = max(0, next_event - monotonic())
+            try:
+                (readable, writable, exceptional) = select.select(
+                    list(sockets.keys()), [], [], timeout)
+            except select.error as e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+            for fd in readable:
+                (family, sock, raw) = sockets[fd]
+                self._receive(family, sock, raw)
+
+            now = monotonic()
+            active = []
+            for probe in self._active:
+                if probe.received >= self.count:
+                    next_probe = self._finished(probe, True)
+                elif now >= probe.deadline:
+                    next_probe = self._finished(probe, False)
+                else:
+                    active.append(probe)
+                    continue
+                if next_probe is not None:
+                    self._pending.append(next_probe)
+            self._active = active
+
+    def _send(self, probe, now):
+
+        (sock, raw) = self._sockets[probe.family]
+        self._seq = (self._seq + 1) & 0xffff
+        packet = echo_request(probe.family, self._ident, self._seq)
+        try:
+            sock.sendto(packet, (probe.address, 0))
+        except (socket.error, OSError) as e:
+            # e.g. network unreachable - the same like no answer
+            log.debug("Could not send echo request to %r: %s", probe.address, e)
+            probe.sent = self.count
+            probe.deadline = now
+            return
+
+        self._by_seq[(probe.family, probe.address, self._seq)] = probe
+        probe.sent += 1
+        probe.next_send = now + self.interval
+
+    def _receive(self, family, sock, raw):
+
+        while True:
+            try:
+                (data, addr) = sock.recvfrom(2048)
+            except (socket.error, OSError) as e:
+                if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                    return
+                raise
+            reply = parse_echo_reply(family, data, raw)
+            if reply is None:
+                continue
+            (ident, seq) = reply
+            # Datagram ICMP sockets are replacing the identifier
+            if raw and ident != self._ident:
+                continue
+            key = (family, normalize_address(family, addr[0]), seq)
+            probe = self._by_seq.pop(key, None)
+            if probe is not None:
+                probe.received += 1
+
+    # -------------------------------------------------------------------------
+    # Pinging by ping commands
+
+    def _sweep_commands(self, hosts):
+
+        concurrency = self.concurrency or DEFAULT_CMD_CONCURRENCY
+        for host in hosts:
+            self._pending.append(PingProbe(host, socket.AF_INET6, host['ping_address']))
+
+        devnull = open(os.devnull, 'w')
+        try:
+            while self._pending or self._active:
+
+                now = monotonic()
+                while self._pending and len(self._active) < concurrency:
+                    probe = self._pending.popleft()
+                    cmd = self.ping_cmd
+                    if probe.family == socket.AF_INET6:
+                        cmd = self.ping6_cmd
+                    cmd = [cmd, '-c%d' % (self.count), '-s', '0', '-w', str(int(self.deadline)),
+                           probe.address]
+                    try:
+                        probe.proc = subprocess.Popen(
+                            cmd, stdout=devnull, stderr=devnull, close_fds=True)
+                    except (OSError, ValueError, TypeError) as e:
+                        self._failed(probe, e)
+                        continue
+                    # the ping command should stop itself on its deadline
+                    probe.deadline = now + self.deadline + 1
+                    self._active.append(probe)
+
+                active = []
+                for probe in self._active:
+                    retcode = probe.proc.poll()
+                    if retcode is None:
+                        if now < probe.deadline:
+                            active.append(probe)
+                            continue
+                        probe.proc.kill()
+                        probe.proc.wait()
+                    next_probe = self._finished(probe, retcode == 0)
+                    if next_probe is not None:
+                        self._pending.append(next_probe)
+                self._active = active
+
+                if self._active:
+                    time.sleep(POLL_INTERVAL)
+        finally:
+            for probe in self._active:
+                if probe.proc.poll() is None:
+                    probe.proc.kill()
+                    probe.proc.wait()
+            devnull.close()
+
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
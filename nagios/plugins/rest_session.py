@@ -0,0 +1,810 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+@author: Frank Brehm
+@contact: frank.brehm@profitbricks.com
+@copyright: © 2010 - 2016 by Frank Brehm, Berlin
+@summary: Module for the RestSession class, a HTTP client for REST APIs
+          with a process wide pool of keep-alive connections, for an
+          incremental decoder of JSON arrays and for the TimedApiClient
+          class, which measures the calls of an API client.
+"""
+
+# Standard modules
+import sys
+import json
+import errno
+import zlib
+import codecs
+import socket
+import logging
+import threading
+import time
+
+from collections import deque
+
+try:
+    import http.client as http_client
+    from urllib.parse import urlsplit, urlencode
+except ImportError:
+    import httplib as http_client
+    from urlparse import urlsplit
+    from urllib import urlencode
+
+# Third party modules
+
+# Own modules
+
+from nagios.plugin import NagiosPluginError
+
+from nagios.plugin.timing import monotonic
+
+# Some module variables
+__version__ = '0.3.2'
+
+log = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 60
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF = 0.2
+
+# The maximum number of idle connections kept per server
+MAX_IDLE_CONNECTIONS = 4
+
+# The size of the blocks of a streamed response body
+DEFAULT_CHUNK_SIZE = 65536
+
+# The number of requests kept in the history of a session
+HISTORY_SIZE = 100
+
+# Methods, which may be repeated without side effects
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Status codes of temporary failures, after which a request is repeated
+RETRY_STATUS_CODES = (502, 503, 504)
+
+# Methods of the REST API client of the DcManager, which only read lists
+# and may be repeated by a TimedApiClient after a connection error
+IDEMPOTENT_API_METHODS = frozenset((
+    'clusters', 'pgateways', 'pservers', 'pstorages', 'vimages', 'vimage_maps',
+    'vsnapshots', 'vstorages', 'vstorage_maps'))
+
+# Error numbers of socket errors, which are failed connections
+CONNECTION_ERRNOS = (
+    errno.ECONNRESET, errno.ECONNREFUSED, errno.ECONNABORTED, errno.EPIPE,
+    errno.ETIMEDOUT, errno.EHOSTUNREACH, errno.ENETUNREACH)
+
+if sys.version_info[0] > 2:
+    CONNECTION_ERRORS = (ConnectionError, socket.timeout)
+else:
+    CONNECTION_ERRORS = (socket.timeout, )
+
+if sys.version_info[0] > 2:
+    NUMBER_TYPES = (int, float)
+else:
+    NUMBER_TYPES = (int, long, float)                                   # noqa
+
+_pool_lock = threading.Lock()
+_idle_connections = {}
+
+
+class RestSessionError(NagiosPluginError):
+    """
+    Base error class for errors on requests of a RestSession.
+    """
+
+    pass
+
+
+class RestConnectionError(RestSessionError):
+    """
+    Error class for network errors on requests.
+    """
+
+    pass
+
+
+class RestHttpError(RestSessionError):
+    """
+    Error class for replies with a HTTP status code of an error.
+    """
+
+    def __init__(self, status, reason, url):
+
+        self.status = status
+        self.reason = reason
+        self.url = url
+
+    def __str__(self):
+
+        return "Got HTTP status %d (%s) from %r." % (self.status, self.reason, self.url)
+
+
+def _get_connection(key, timeout):
+    """
+    Gives back an idle connection of the pool to the given server or
+    a new one.
+
+    @return: the connection and whether it was taken out of the pool
+    @rtype: tuple of HTTPConnection and bool
+
+    """
+
+    with _pool_lock:
+        connections = _idle_connections.get(key)
+        if connections:
+            conn = connections.pop()
+            conn.timeout = timeout
+            if conn.sock is not None:
+                conn.sock.settimeout(timeout)
+            return (conn, True)
+
+    return (_new_connection(key, timeout), False)
+
+
+def _new_connection(key, timeout):
+
+    (scheme, host, port) = key
+    if scheme == 'https':
+        return http_client.HTTPSConnection(host, port, timeout=timeout)
+    return http_client.HTTPConnection(host, port, timeout=timeout)
+
+
+def _release_connection(key, conn):
+    """
+    Gives back a connection after a complete response into the pool.
+    """
+
+    with _pool_lock:
+        connections = _idle_connections.setdefault(key, [])
+        if len(connections) < MAX_IDLE_CONNECTIONS:
+            connections.append(conn)
+            return
+    conn.close()
+
+
+def clear_connection_pool():
+    """
+    Closes all idle connections of the pool.
+    """
+
+    with _pool_lock:
+        for connections in _idle_connections.values():
+            for conn in connections:
+                conn.close()
+        _idle_connections.clear()
+
+
+class JsonArrayDecoder(object):
+    """
+    An incremental decoder of a JSON array, which gives back its elements
+    one by one as soon as they are complete, so the whole array never
+    has to be held in memory.
+    """
+
+    def __init__(self):
+
+        self._decoder = json.JSONDecoder()
+        self._text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self._buffer = u''
+        self._state = 'start'
+        self.count = 0
+
+    def feed(self, data):
+        """
+        Decodes the next part of the JSON text.
+
+        @raise RestSessionError: if the text is not a valid JSON array
+
+        @param data: the next part of the UTF-8 encoded JSON text
+        @type data: bytes
+
+        @return: all elements of the array completed by this part
+        @rtype: list
+
+        """
+
+        self._buffer += self._text_decoder.decode(data)
+        return self._decode(False)
+
+    def close(self):
+        """
+        Decodes the rest of the JSON text after the end of the data.
+
+        @raise RestSessionError: if the JSON array is incomplete
+
+        @return: the last elements of the array
+        @rtype: list
+
+        """
+
+        self._buffer += self._text_decoder.decode(b'', True)
+        items = self._decode(True)
+        if self._state != 'end':
+            raise RestSessionError("Incomplete JSON array after %d elements." % (self.count))
+        return items
+
+    def _decode(self, final):
+
+        items = []
+        buf = self._buffer
+        length = len(buf)
+        pos = 0
+
+        while True:
+            while pos < length and buf[pos] in u' \t\r\n':
+                pos += 1
+            if pos >= length:
+                break
+            char = buf[pos]
+
+            if self._state == 'start':
+                if char != u'[':
+                    raise RestSessionError("The JSON text is not an array.")
+                pos += 1
+                self._state = 'first'
+            elif self._state in ('first', 'item'):
+                if char == u']' and self._state == 'first':
+                    pos += 1
+                    self._state = 'end'
+                    continue
+                try:
+                    (item, end) = self._decoder.raw_decode(buf, pos)
+                except ValueError as e:
+                    if final:
+                        raise RestSessionError("Invalid element of JSON array: %s" % (e))
+                    # the element is still incomplete
+                    break
+                if not final and isinstance(item, NUMBER_TYPES) and (
+                        end >= length or buf[end] in u'0123456789.eE+-'):
+                    # the number could be continued by the next part
+                    break
+                items.append(item)
+                self.count += 1
+                pos = end
+                self._state = 'separator'
+            elif self._state == 'separator':
+                if char == u',':
+                    self._state = 'item'
+                elif char == u']':
+                    self._state = 'end'
+                else:
+                    raise RestSessionError(
+                        "Unexpected character %r after element %d of JSON array." % (
+                            char, self.count))
+                pos += 1
+            else:
+                raise RestSessionError("Unexpected data after the end of the JSON array.")
+
+        self._buffer = buf[pos:]
+        return items
+
+
+class RestResponse(object):
+    """
+    A response of a REST API, either with the complete body or with
+    a body to stream by iter_content().
+    """
+
+    def __init__(self, url, status, reason, headers, body, timings, attempts=1):
+
+        self.url = url
+        self.status = status
+        self.reason = reason
+
+        self.headers = headers
+        """
+        @ivar: the headers of the response with lower case names
+        @type: dict
+        """
+
+        self.body = body
+        """
+        @ivar: the body of the response, already decompressed
+        @type: bytes
+        """
+
+        self.timings = timings
+        """
+        @ivar: the durations of the phases of the request in seconds since its
+               begin: 'connect' (if a new connection was needed), 'firstbyte'
+               and 'total'
+        @type: dict
+        """
+
+        self.attempts = attempts
+        self._stream = None
+
+    def as_dict(self):
+        """
+        Typecasting into a dictionary.
+
+        @return: structure as dict
+        @rtype:  dict
+
+        """
+
+        d = {
+            '__class__': self.__class__.__name__,
+            'url': self.url,
+            'status': self.status,
+            'reason': self.reason,
+            'headers': self.headers,
+            'length': None if self.body is None else len(self.body),
+            'timings': self.timings,
+            'attempts': self.attempts,
+        }
+
+        return d
+
+    @property
+    def text(self):
+        """The body of the response as a decoded string."""
+        return self.body.decode('utf-8', 'replace')
+
+    def json(self):
+        """
+        Decodes the body of the response as JSON.
+
+        @raise RestSessionError: if the body is not valid JSON
+
+        """
+
+        try:
+            return json.loads(self.text)
+        except ValueError as e:
+            raise RestSessionError("Invalid JSON in response from %r: %s" % (self.url, e))
+
+    def raise_for_status(self):
+        """
+        @raise RestHttpError: if the status code is an error
+        """
+
+        if self.status >= 400:
+            raise RestHttpError(self.status, self.reason, self.url)
+
+    def iter_content(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Reads the body of a streamed response block by block. The connection
+        is given back into the pool after reading the complete body, it is
+        closed, if the iteration was aborted.
+
+        @raise RestConnectionError: on network errors
+
+        @param chunk_size: the size of the blocks to read from the connection
+        @type chunk_size: int
+
+        @return: the decompressed blocks of the body
+        @rtype: iterator of bytes
+
+        """
+
+        if self._stream is None:
+            if self.body:
+                yield self.body
+            return
+
+        (conn, resp, key, begin) = self._stream
+        self._stream = None
+
+        decompressor = None
+        if self.headers.get('content-encoding', '').lower() == 'gzip':
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+        finished = False
+        try:
+            while True:
+                try:
+                    data = resp.read(chunk_size)
+                except (socket.error, http_client.HTTPException) as e:
+                    raise RestConnectionError(
+                        "Error reading response from %r: %s" % (self.url, e))
+                if not data:
+                    break
+                if decompressor:
+                    try:
+                        data = decompressor.decompress(data)
+                    except zlib.error as e:
+                        raise RestSessionError(
+                            "Could not decompress response from %r: %s" % (self.url, e))
+                if data:
+                    yield data
+            if decompressor:
+                data = decompressor.flush()
+                if data:
+                    yield data
+            finished = True
+        finally:
+            self.timings['total'] = monotonic() - begin
+            if finished and not resp.will_close:
+                _release_connection(key, conn)
+            else:
+                conn.close()
+
+    def iter_json_array(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Decodes the body of the response, which has to be a JSON array,
+        incrementally and gives back its elements one by one.
+
+        @raise RestSessionError: on network errors or if the body is not
+                                 a valid JSON array
+
+        @return: the elements of the array
+        @rtype: iterator
+
+        """
+
+        decoder = JsonArrayDecoder()
+        for data in self.iter_content(chunk_size):
+            for item in decoder.feed(data):
+                yield item
+        for item in decoder.close():
+            yield item
+
+
+class RestSession(object):
+    """
+    A HTTP client for a REST API. The connections are kept alive in a
+    process wide pool and shared by all sessions to the same server, so
+    subsequent requests in a run of a plugin (or in further runs inside
+    the same process) don't need a new TCP and TLS handshake.
+
+    Responses compressed by gzip are decompressed, idempotent requests are
+    repeated with an exponential backoff after network errors and
+    temporary failures of the server.
+    """
+
+    def __init__(
+            self, base_url, timeout=DEFAULT_TIMEOUT, headers=None,
+            retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF):
+        """
+        Constructor.
+
+        @param base_url: the URL of the API, the paths of the requests
+                         are relative to it
+        @type base_url: str
+        @param timeout: the timeout of the socket operations in seconds
+        @type timeout: float
+        @param headers: additional headers for all requests
+        @type headers: dict or None
+        @param retries: how often an idempotent request is repeated
+        @type retries: int
+        @param backoff: the delay before the first repetition in seconds,
+                        it is doubled for every further repetition
+        @type backoff: float
+
+        """
+
+        parts = urlsplit(base_url)
+        if parts.scheme not in ('http', 'https'):
+            raise RestSessionError("Unsupported URL %r." % (base_url))
+
+        self.base_url = base_url
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        if self.port is None:
+            self.port = 443 if self.scheme == 'https' else 80
+        self.base_path = parts.path.rstrip('/')
+
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+
+        self.headers = {
+            'Accept': 'application/json',
+            'Accept-Encoding': 'gzip',
+        }
+        if headers:
+            self.headers.update(headers)
+
+        self.history = deque(maxlen=HISTORY_SIZE)
+        """
+        @ivar: the last requests of the session as tuples of the method,
+               the path, the status and the timings
+        @type: deque
+        """
+
+    @property
+    def pool_key(self):
+        """The key of the connections to the server in the pool."""
+        return (self.scheme, self.host, self.port)
+
+    def as_dict(self):
+        """
+        Typecasting into a dictionary.
+
+        @return: structure as dict
+        @rtype:  dict
+
+        """
+
+        d = {
+            '__class__': self.__class__.__name__,
+            'base_url': self.base_url,
+            'timeout': self.timeout,
+            'retries': self.retries,
+            'backoff': self.backoff,
+            'headers': self.headers,
+            'history': list(self.history),
+        }
+
+        return d
+
+    def url(self, path, params=None):
+        """
+        Gives back the URL on the server of the given path relative to
+        the base URL.
+        """
+
+        url = self.base_path + '/' + path.lstrip('/')
+        if params:
+            url += '?' + urlencode(params)
+        return url
+
+    def get(self, path, params=None, headers=None):
+        """
+        Executes a GET request.
+
+        @raise RestSessionError: on network errors or temporary failures
+                                 of the server after all repetitions
+
+        @param path: the path relative to the base URL
+        @type path: str
+        @param params: the parameters of the query string
+        @type params: dict or list of tuple or None
+        @param headers: additional headers of the request
+        @type headers: dict or None
+
+        @return: the response
+        @rtype: RestResponse
+
+        """
+
+        return self.request('GET', path, params=params, headers=headers)
+
+    def get_json(self, path, params=None):
+        """
+        Executes a GET request and decodes the JSON body of the response.
+
+        @raise RestHttpError: if the status code of the response is an error
+        @raise RestSessionError: on network errors or invalid JSON
+
+        """
+
+        response = self.get(path, params=params)
+        response.raise_for_status()
+        return response.json()
+
+    def iter_json(self, path, params=None):
+        """
+        Executes a GET request, which returns a JSON array, and decodes its
+        elements incrementally while the response is received.
+
+        @raise RestHttpError: if the status code of the response is an error
+        @raise RestSessionError: on network errors or if the response
+                                 is not a valid JSON array
+
+        @return: the elements of the array
+        @rtype: iterator
+
+        """
+
+        response = self.request('GET', path, params=params, stream=True)
+        response.raise_for_status()
+        return response.iter_json_array()
+
+    def request(self, method, path, params=None, body=None, headers=None, stream=False):
+        """
+        Executes a request, idempotent requests are repeated after network
+        errors and temporary failures of the server.
+
+        The body of a successful response is not read, if stream is set,
+        it has to be read by iter_content() or iter_json_array() of the
+        response.
+
+        @raise RestConnectionError: on network errors
+
+        @return: the response
+        @rtype: RestResponse
+
+        """
+
+        method = method.upper()
+        url = self.url(path, params)
+        all_headers = dict(self.headers)
+        if headers:
+            all_headers.update(headers)
+
+        attempts = 1
+        if method in IDEMPOTENT_METHODS:
+            attempts += self.retries
+
+        response = None
+        for attempt in range(attempts):
+            if attempt:
+                delay = self.backoff * (2 ** (attempt - 1))
+                log.debug("Repeating %s %r in %0.2f seconds.", method, url, delay)
+                time.sleep(delay)
+            try:
+                response = self._request(method, url, body, all_headers, stream)
+            except (socket.error, http_client.HTTPException) as e:
+                msg = "Error on %s %s://%s:%d%s: %s" % (
+                    method, self.scheme, self.host, self.port, url, e)
+                log.debug(msg)
+                if attempt + 1 >= attempts:
+                    raise RestConnectionError(msg)
+                continue
+            response.attempts = attempt + 1
+            self.history.append((method, url, response.status, response.timings))
+            if response.status not in RETRY_STATUS_CODES:
+                break
+            log.debug("Got status %d on %s %r.", response.status, method, url)
+
+        return response
+
+    def _request(self, method, url, body, headers, stream=False):
+
+        begin = monotonic()
+        timings = {}
+        key = self.pool_key
+
+        (conn, reused) = _get_connection(key, self.timeout)
+        try:
+            if not reused:
+                conn.connect()
+                timings['connect'] = monotonic() - begin
+            try:
+                conn.request(method, url, body, headers)
+                resp = conn.getresponse()
+            except (socket.error, http_client.BadStatusLine) as e:
+                if not reused or method not in IDEMPOTENT_METHODS:
+                    raise
+                # the server closed the kept connection in the meantime
+                log.debug("Kept connection to %s:%d failed: %s", self.host, self.port, e)
+                conn.close()
+                conn = _new_connection(key, self.timeout)
+                conn.connect()
+                timings['connect'] = monotonic() - begin
+                conn.request(method, url, body, headers)
+                resp = conn.getresponse()
+            timings['firstbyte'] = monotonic() - begin
+            resp_headers = dict((k.lower(), v) for (k, v) in resp.getheaders())
+            if stream and resp.status == 200:
+                response = RestResponse(
+                    url, resp.status, resp.reason, resp_headers, None, timings)
+                response._stream = (conn, resp, key, begin)
+                return response
+            data = resp.read()
+        except Exception:
+            conn.close()
+            raise
+        timings['total'] = monotonic() - begin
+
+        if resp.will_close:
+            conn.close()
+        else:
+            _release_connection(key, conn)
+
+        if resp_headers.get('content-encoding', '').lower() == 'gzip':
+            try:
+                data = zlib.decompress(data, 16 + zlib.MAX_WBITS)
+            except zlib.error as e:
+                raise RestSessionError(
+                    "Could not decompress response from %r: %s" % (url, e))
+
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug(
+                "%s %r: status %d, %d bytes in %0.3f seconds.",
+                method, url, resp.status, len(data), timings['total'])
+
+        return RestResponse(url, resp.status, resp.reason, resp_headers, data, timings)
+
+
+def is_connection_error(e):
+    """
+    Checks, whether the given error of an API client is a failed connection
+    to the server, after which a reading request may be repeated. Errors of
+    the requests module are only checked, if it was already imported.
+
+    @param e: the error raised by a call of an API client
+    @type e: Exception
+
+    @return: whether the error is a failed connection
+    @rtype: bool
+
+    """
+
+    requests = sys.modules.get('requests')
+    if requests is not None and isinstance(e, requests.RequestException):
+        return isinstance(e, (requests.ConnectionError, requests.Timeout))
+    if isinstance(e, CONNECTION_ERRORS):
+        return True
+    return isinstance(e, socket.error) and e.errno in CONNECTION_ERRNOS
+
+
+class TimedApiClient(object):
+    """
+    A wrapper around an API client object (e.g. a RestApi of the
+    DcManager client), which measures the duration of all calls of
+    its methods and repeats calls of methods reading lists after
+    connection errors.
+    """
+
+    def __init__(
+            self, client, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF, timings=None,
+            idempotent=IDEMPOTENT_API_METHODS):
+        """
+        Constructor.
+
+        @param client: the wrapped API client object
+        @type client: object
+        @param retries: how often a call of an idempotent method is repeated
+                        after a connection error
+        @type retries: int
+        @param backoff: the delay before the first repetition in seconds,
+                        it is doubled for every further repetition
+        @type backoff: float
+        @param timings: the timings of a plugin, all calls are added to
+                        as spans named 'api:<method name>'
+        @type timings: nagios.plugin.timing.Timings or None
+        @param idempotent: the names of the methods, which may be repeated
+                           without side effects
+        @type idempotent: set of str
+
+        """
+
+        self._client = client
+        self._retries = retries
+        self._backoff = backoff
+        self._timings = timings
+        self._idempotent = idempotent
+
+        self.calls = []
+        """
+        @ivar: all calls as tuples of the method name and the duration
+               in seconds
+        @type: list of tuple
+        """
+
+    @property
+    def client(self):
+        """The wrapped API client object."""
+        return self._client
+
+    def __getattr__(self, name):
+
+        attr = getattr(self._client, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        retries = self._retries
+        if name not in self._idempotent:
+            retries = 0
+
+        def timed_call(*args, **kwargs):
+            begin = monotonic()
+            attempt = 0
+            try:
+                while True:
+                    try:
+                        return attr(*args, **kwargs)
+                    except Exception as e:
+                        if attempt >= retries or not is_connection_error(e):
+                            raise
+                        delay = self._backoff * (2 ** attempt)
+                        attempt += 1
+                        log.debug("Repeating %s() in %0.2f seconds after: %s", name, delay, e)
+                        time.sleep(delay)
+            finally:
+                duration = monotonic() - begin
+                self.calls.append((name, duration))
+                if self._timings is not None:
+                    self._timings.add('api:' + name, duration, begin)
+                if log.isEnabledFor(logging.DEBUG):
+                    log.debug("API call %s() took %0.3f seconds.", name, duration)
+
+        return timed_call
+
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,330 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+@author: Frank Brehm
+@contact: frank.brehm@profitbricks.com
+@copyright: © 2010 - 2016 by Frank Brehm, Berlin
+@summary: Module for the SmartHistory class, a local store of the SMART
+          counters of the disks of a host, used by CheckSmartStatePlugin
+          for trend based alerts.
+"""
+
+# Standard modules
+import os
+import logging
+import time
+
+# Third party modules
+
+# Own modules
+
+from nagios.plugin.extended import ExtNagiosPluginError
+
+# Some module variables
+__version__ = '0.1.1'
+
+log = logging.getLogger(__name__)
+
+DEFAULT_HISTORY_FILE = '/var/lib/nagios/smart_history.db'
+DEFAULT_RETENTION_DAYS = 90
+DEFAULT_LOCK_TIMEOUT = 5
+
+# The minimum time span between two records in seconds to compute
+# a growth rate from them
+MIN_RATE_INTERVAL = 3600
+
+SECONDS_PER_DAY = 86400.0
+
+HISTORY_COLUMNS = (
+    'disk', 'timestamp', 'full', 'is_sas', 'health_state', 'grown_defects',
+    'temperature', 'hours_on', 'model', 'serial')
+
+SQL_CREATE_TABLE = """\
+CREATE TABLE IF NOT EXISTS smart_history (
+    disk TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    full INTEGER NOT NULL,
+    is_sas INTEGER NOT NULL,
+    health_state TEXT,
+    grown_defects INTEGER,
+    temperature INTEGER,
+    hours_on INTEGER,
+    model TEXT,
+    serial TEXT)"""
+
+SQL_CREATE_INDEX = """\
+CREATE INDEX IF NOT EXISTS smart_history_disk_ts ON smart_history (disk, timestamp)"""
+
+# The newest record of every disk, where a full query of the SMART data was done
+SQL_LAST_FULL = """\
+SELECT %s FROM smart_history h
+ WHERE full = 1 AND timestamp = (
+    SELECT MAX(timestamp) FROM smart_history WHERE disk = h.disk AND full = 1)""" % (
+    ', '.join(HISTORY_COLUMNS))
+
+# The oldest record of every disk since a given timestamp
+SQL_REFERENCE = """\
+SELECT %s FROM smart_history h
+ WHERE timestamp = (
+    SELECT MIN(timestamp) FROM smart_history WHERE disk = h.disk AND timestamp >= ?)""" % (
+    ', '.join(HISTORY_COLUMNS))
+
+SQL_INSERT = "INSERT INTO smart_history (%s) VALUES (%s)" % (
+    ', '.join(HISTORY_COLUMNS), ', '.join(['?'] * len(HISTORY_COLUMNS)))
+
+# The module sqlite3, imported on first use
+_sqlite3_module = None
+
+
+def _sqlite3():
+    """
+    Gives back the module sqlite3. It is imported on the first call, so it
+    is not loaded, if the SMART history is not used.
+    """
+
+    global _sqlite3_module
+
+    if _sqlite3_module is None:
+        import sqlite3
+        _sqlite3_module = sqlite3
+
+    return _sqlite3_module
+
+
+class SmartHistoryError(ExtNagiosPluginError):
+    """
+    Special error class for errors on accessing the SMART history file.
+    """
+
+    pass
+
+
+def defect_rate(reference, grown_defects, timestamp=None):
+    """
+    Computes the growth rate of the grown defects of a disk in defects per day.
+
+    @param reference: the reference record of the disk out of the history
+    @type reference: dict or None
+    @param grown_defects: the current number of grown defects
+    @type grown_defects: int
+    @param timestamp: the timestamp of the current value, if not given,
+                      the current time
+    @type timestamp: float or None
+
+    @return: the growth rate, None, if there is no usable reference record
+    @rtype: float or None
+
+    """
+
+    if reference is None or reference['grown_defects'] is None:
+        return None
+    if timestamp is None:
+        timestamp = time.time()
+
+    interval = timestamp - reference['timestamp']
+    if interval < MIN_RATE_INTERVAL:
+        return None
+
+    return (grown_defects - reference['grown_defects']) * SECONDS_PER_DAY / interval
+
+
+class SmartHistory(object):
+    """
+    An append only store of the SMART counters of the disks of a host
+    in a SQLite database. The records are keyed by the disk, they are
+    given back as dicts with the keys of HISTORY_COLUMNS.
+
+    It is not thread safe, it should only be used by the main thread.
+    """
+
+    def __init__(self, filename=DEFAULT_HISTORY_FILE, retention_days=DEFAULT_RETENTION_DAYS):
+        """
+        Constructor.
+
+        @param filename: the filename of the SQLite database
+        @type filename: str
+        @param retention_days: records older than this are removed on closing
+        @type retention_days: int
+
+        """
+
+        self.filename = filename
+        """
+        @ivar: the filename of the SQLite database
+        @type: str
+        """
+
+        self.retention_days = retention_days
+        """
+        @ivar: records older than this number of days are removed on closing
+        @type: int
+        """
+
+        self._conn = None
+
+    def __del__(self):
+
+        if self._conn is not None:
+            self._conn.close()
+
+    def as_dict(self):
+        """
+        Typecasting into a dictionary.
+
+        @return: structure as dict
+        @rtype:  dict
+
+        """
+
+        d = {
+            '__class__': self.__class__.__name__,
+            'filename': self.filename,
+            'retention_days': self.retention_days,
+            'opened': self._conn is not None,
+        }
+
+        return d
+
+    def open(self):
+        """
+        Opens the database and creates the table, if necessary.
+
+        @raise SmartHistoryError: on errors opening the database
+
+        """
+
+        dirname = os.path.dirname(self.filename)
+        if dirname and not os.path.isdir(dirname):
+            raise SmartHistoryError(
+                "Directory %r for the SMART history doesn't exists." % (dirname))
+
+        log.debug("Opening SMART history %r ...", self.filename)
+        try:
+            self._conn = _sqlite3().connect(self.filename, timeout=DEFAULT_LOCK_TIMEOUT)
+            self._conn.execute(SQL_CREATE_TABLE)
+            self._conn.execute(SQL_CREATE_INDEX)
+        except _sqlite3().Error as e:
+            self._conn = None
+            raise SmartHistoryError(
+                "Could not open SMART history %r: %s" % (self.filename, e))
+
+    def close(self):
+        """
+        Removes outdated records, commits all changes and closes the database.
+
+        @raise SmartHistoryError: on errors writing the database
+
+        """
+
+        if self._conn is None:
+            return
+
+        try:
+            if self.retention_days:
+                before = time.time() - (self.retention_days * SECONDS_PER_DAY)
+                self._conn.execute("DELETE FROM smart_history WHERE timestamp < ?", (before,))
+            self._conn.commit()
+        except _sqlite3().Error as e:
+            raise SmartHistoryError(
+                "Could not write SMART history %r: %s" % (self.filename, e))
+        finally:
+            self._conn.close()
+            self._conn = None
+
+    def _records_by_disk(self, sql, params=()):
+
+        try:
+            rows = self._conn.execute(sql, params).fetchall()
+        except _sqlite3().Error as e:
+            raise SmartHistoryError(
+                "Could not read SMART history %r: %s" % (self.filename, e))
+
+        records = {}
+        for row in rows:
+            record = dict(zip(HISTORY_COLUMNS, row))
+            record['full'] = bool(record['full'])
+            record['is_sas'] = bool(record['is_sas'])
+            records[record['disk']] = record
+
+        return records
+
+    def last_full_records(self):
+        """
+        Gives back the newest record of every disk, where a full query
+        of the SMART data was done.
+
+        @raise SmartHistoryError: on errors reading the database
+
+        @return: the records by the disk
+        @rtype: dict
+
+        """
+
+        return self._records_by_disk(SQL_LAST_FULL)
+
+    def reference_records(self, since):
+        """
+        Gives back the oldest record of every disk since the given timestamp,
+        e.g. as the reference for computing growth rates.
+
+        @raise SmartHistoryError: on errors reading the database
+
+        @param since: the timestamp of the begin of the time window
+        @type since: float
+
+        @return: the records by the disk
+        @rtype: dict
+
+        """
+
+        return self._records_by_disk(SQL_REFERENCE, (since,))
+
+    def add(self, disk, is_sas, disk_data, full=True, timestamp=None):
+        """
+        Appends a record of the SMART data of a disk.
+
+        @param disk: the key of the disk
+        @type disk: str
+        @param is_sas: is the disk a SAS disk
+        @type is_sas: bool
+        @param disk_data: the evaluated SMART data of the disk
+        @type disk_data: dict
+        @param full: the disk data are the result of a full query
+        @type full: bool
+        @param timestamp: the timestamp of the disk data, if not given,
+                          the current time
+        @type timestamp: float or None
+
+        """
+
+        if timestamp is None:
+            timestamp = time.time()
+
+        try:
+            self._conn.execute(SQL_INSERT, (
+                disk, timestamp, int(bool(full)), int(bool(is_sas)),
+                disk_data.get('health_state'), disk_data.get('nr_grown_defects'),
+                disk_data.get('temperature'), disk_data.get('hours_on'),
+                disk_data.get('model'), disk_data.get('serial')))
+        except _sqlite3().Error as e:
+            raise SmartHistoryError(
+                "Could not write SMART history %r: %s" % (self.filename, e))
+
+    def forget(self, disk):
+        """
+        Removes all records of the given disk, e.g. after it was replaced.
+
+        @param disk: the key of the disk
+        @type disk: str
+
+        """
+
+        log.debug("Removing all SMART history records of disk %r.", disk)
+        try:
+            self._conn.execute("DELETE FROM smart_history WHERE disk = ?", (disk,))
+        except _sqlite3().Error as e:
+            raise SmartHistoryError(
+                "Could not write SMART history %r: %s" % (self.filename, e))
+
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
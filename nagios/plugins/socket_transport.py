@@ -0,0 +1,719 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+@author: Frank Brehm
+@contact: frank.brehm@profitbricks.com
+@copyright: © 2010 - 2016 by Frank Brehm, Berlin
+@summary: Module for the SocketTransport class and the status replies of
+          the provisioning daemons (PPD, VCB) speaking PJD over TCP sockets.
+"""
+
+# Standard modules
+import sys
+import re
+import codecs
+import errno
+import socket
+import select
+import signal
+import logging
+
+# Third party modules
+
+# Own modules
+
+from nagios.plugin import NagiosPluginError
+
+from nagios.plugin.timing import monotonic
+
+# Some module variables
+__version__ = '0.2.1'
+
+log = logging.getLogger(__name__)
+
+DEFAULT_BUFFER_SIZE = 8192
+DEFAULT_IDLE_INTERVAL = 0.5
+
+# The delay before starting the next connection attempt while the
+# previous one is still pending, see RFC 8305
+CONNECTION_ATTEMPT_DELAY = 0.25
+
+SIGNAL_NAMES = {
+    signal.SIGHUP:  'HUP',
+    signal.SIGINT:  'INT',
+    signal.SIGABRT: 'ABRT',
+    signal.SIGTERM: 'TERM',
+    signal.SIGKILL: 'KILL',
+    signal.SIGUSR1: 'USR1',
+    signal.SIGUSR2: 'USR2',
+}
+
+STATUS = {
+    'unknown':          0,
+    'progress':         3,
+    'failed':           4,
+    'succeeded':        5,
+    'in_progress_cont': 6,
+    'continuing':       10,
+}
+
+re_parse_result = re.compile(r'^([^,]+),(\d+),(\d+),(.*)$')
+
+# The begin of a status record and the end of a line for skipping
+# status records line by line
+re_status_record = re.compile(r'\s*([^,]+),(\d+),(\d+),')
+re_line_end = re.compile(r'\r\n?|\n')
+
+
+class SocketTransportError(NagiosPluginError):
+    pass
+
+
+class SocketConnectTimeoutError(SocketTransportError):
+    pass
+
+
+class NoListeningError(SocketTransportError):
+    pass
+
+
+class RequestStatusError(NagiosPluginError):
+    pass
+
+
+class RequestStatus(object):
+    """
+    A class for handling status replies from provisioning daemon.
+    """
+
+    def __init__(self, job_id=None, state=None, error_code=None, message=None):
+        """
+        Constructor.
+
+        @param job_id: the job ID of this reply
+        @type job_id: int
+        @param state: the reply state (see VCB)
+        @type state: int
+        @param error_code: the VDC error code
+        @type error_code: int
+        @param message: the textual reply message
+        @type message: str
+
+        @return: None
+
+        """
+
+        self._job_id = job_id
+
+        self._state = state
+
+        self._error_code = error_code
+
+        self._message = message
+
+    @property
+    def job_id(self):
+        """The job ID of this reply."""
+        return self._job_id
+
+    @property
+    def state(self):
+        """The reply state (see VCB)."""
+        return self._state
+
+    @property
+    def error_code(self):
+        """The VDC error code (old unused trash from somewhere)."""
+        return self._error_code
+
+    @property
+    def message(self):
+        """The textual reply message."""
+        return self._message
+
+    def __str__(self):
+        """
+        Typecasting function for translating object structure into a string.
+
+        @return: string as used as a reply from the provisioning daemon
+        @rtype:  str
+        """
+
+        jid = self.job_id
+        if jid is None:
+            jid = '0'
+
+        st = self.state
+        if st is None:
+            st = 0
+
+        ec = self.error_code
+        if ec is None:
+            ec = 0
+
+        msg = self.message
+        if msg is None:
+            msg = '<No message>'
+
+        s = "%s,%d,%d,%s" % (jid, st, ec, msg)
+        return s
+
+    def as_dict(self):
+        """
+        Typecasting into a dictionary.
+
+        @return: structure as dict
+        @rtype:  dict
+
+        """
+
+        res = {
+            '__class_name__': self.__class__.__name__,
+            'error_code': self.error_code,
+            'job_id': self.job_id,
+            'message': self.message,
+            'state': self.state,
+        }
+
+        return res
+
+    @classmethod
+    def from_message(cls, message, regex=re_parse_result):
+        """
+        Parses the given string to get an instance of a RequestStatus object.
+
+        @raise RequestStatusError: if not successful.
+
+        @param message: the message to parse into a RequestStatus object.
+        @type message: str
+        @param regex: the regular expression for parsing the message
+        @type regex: re.RegexObject
+
+        @return: the parsed status reply
+        @rtype: RequestStatus
+
+        """
+
+        if message is None:
+            raise RequestStatusError("Cannot parse a None object.")
+
+        message = str(message).strip()
+
+        match = regex.search(message)
+        if not match:
+            msg = (("Parsing error. Message %r doesn't match " +
+                    "a status reply message.") % (message))
+            raise RequestStatusError(msg)
+
+        return cls(
+            job_id=str(match.group(1)).strip(),
+            state=int(match.group(2)),
+            error_code=int(match.group(3)),
+            message=match.group(4),
+        )
+
+
+def skip_status_records(message, states=(STATUS['progress'], )):
+    """
+    Skips the leading single line status records of the given states, e.g.
+    the progress records before the final status of a VCB reply, in one
+    pass over the message.
+
+    @param message: the reply of the daemon
+    @type message: str
+    @param states: the states of the status records to skip
+    @type states: tuple of int
+
+    @return: the offset of the first status record of another state
+             in the message
+    @rtype: int
+
+    """
+
+    pos = 0
+    while True:
+        match = re_status_record.match(message, pos)
+        if not match or int(match.group(2)) not in states:
+            return pos
+        end = re_line_end.search(message, pos)
+        if log.isEnabledFor(logging.DEBUG):
+            line_end = len(message)
+            if end:
+                line_end = end.start()
+            log.debug("Skipping status record %r.", message[pos:line_end])
+        if not end:
+            return len(message)
+        pos = end.end()
+
+
+def sort_addresses(addresses):
+    """
+    Sorts the results of socket.getaddrinfo() for connection attempts in
+    the order of RFC 8305, alternating between the address families and
+    starting with the family of the first address.
+
+    @param addresses: the results of socket.getaddrinfo()
+    @type addresses: list of tuple
+
+    @return: the sorted addresses
+    @rtype: list of tuple
+
+    """
+
+    families = []
+    by_family = {}
+    for addr in addresses:
+        family = addr[0]
+        if family not in by_family:
+            families.append(family)
+            by_family[family] = []
+        by_family[family].append(addr)
+
+    result = []
+    while len(result) < len(addresses):
+        for family in families:
+            if by_family[family]:
+                result.append(by_family[family].pop(0))
+
+    return result
+
+
+class ReplyReader(object):
+    """
+    Reads the reply of a daemon from a socket chunk by chunk into a reused
+    buffer and decodes it incrementally, so multibyte characters split
+    between two chunks are decoded correctly. The reply is complete, if the
+    given is_complete() callback is true for the data received so far.
+    """
+
+    def __init__(self, buffer_size=DEFAULT_BUFFER_SIZE, is_complete=None):
+        """
+        Constructor.
+
+        @param buffer_size: the size of the receive buffer
+        @type buffer_size: int
+        @param is_complete: a callback with the decoded data received so far,
+                            which gives back, whether the reply is complete
+        @type is_complete: callable or None
+
+        """
+
+        self.buffer = bytearray(buffer_size)
+        self.is_complete = is_complete
+
+        self.received = 0
+        """
+        @ivar: the number of bytes received so far
+        @type: int
+        """
+
+        self.complete = False
+        """
+        @ivar: the end of the reply was detected by is_complete()
+        @type: bool
+        """
+
+        self.eof = False
+        """
+        @ivar: the connection was closed by the remote side
+        @type: bool
+        """
+
+        self._parts = []
+        self._text = ''
+        self._decoder = None
+        if sys.version_info[0] > 2:
+            self._decoder = codecs.getincrementaldecoder('utf-8')('replace')
+
+    @property
+    def text(self):
+        """The decoded data received so far."""
+        if self._parts:
+            self._text += ''.join(self._parts)
+            self._parts = []
+        return self._text
+
+    def receive(self, sock):
+        """
+        Receives the next chunk of data from the given socket.
+
+        @raise socket.error: on errors receiving from the socket
+
+        @param sock: the socket to read from
+        @type sock: socket.socket
+
+        @return: the number of received bytes, 0 if the connection was closed
+        @rtype: int
+
+        """
+
+        count = sock.recv_into(self.buffer)
+        if not count:
+            self.eof = True
+            if self._decoder:
+                self._parts.append(self._decoder.decode(b'', True))
+            return 0
+
+        self.received += count
+        chunk = self.buffer[:count]
+        if self._decoder:
+            self._parts.append(self._decoder.decode(chunk))
+        else:
+            self._parts.append(bytes(chunk))
+
+        if self.is_complete is not None and self.is_complete(self.text):
+            self.complete = True
+
+        return count
+
+
+class SocketTransport(object):
+    """
+    Sends requests to a daemon over a TCP socket and receives its replies.
+
+    The addresses of the daemon are tried in parallel in the manner of
+    "Happy Eyeballs" (RFC 8305). If the daemon doesn't close the connection
+    after a complete reply, the connection is used for the next request.
+    The durations of the phases of the last request are kept in timings.
+    """
+
+    def __init__(
+            self, host, port, timeout, buffer_size=DEFAULT_BUFFER_SIZE,
+            idle_interval=DEFAULT_IDLE_INTERVAL, is_complete=None, should_stop=None,
+            keep_alive=True, name='Daemon'):
+        """
+        Constructor.
+
+        @param host: the DNS name or IP address of the host of the daemon
+        @type host: str
+        @param port: the TCP port of the daemon
+        @type port: int
+        @param timeout: the deadline of a request in seconds
+        @type timeout: float
+        @param buffer_size: the size of the receive buffer
+        @type buffer_size: int
+        @param idle_interval: the time without new data after receiving some
+                              data, after which the reply is taken as complete
+        @type idle_interval: float
+        @param is_complete: a callback with the decoded data received so far,
+                            which gives back, whether the reply is complete
+        @type is_complete: callable or None
+        @param should_stop: a callback, which gives back, whether the request
+                            should be canceled
+        @type should_stop: callable or None
+        @param keep_alive: keep the connection for further requests, if the
+                           daemon doesn't close it
+        @type keep_alive: bool
+        @param name: the name of the daemon for error messages
+        @type name: str
+
+        """
+
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.buffer_size = buffer_size
+        self.idle_interval = idle_interval
+        self.is_complete = is_complete
+        self.should_stop = should_stop
+        self.keep_alive = keep_alive
+        self.name = name
+
+        self.sock = None
+        self.sockaddr = None
+
+        self.timings = {}
+        """
+        @ivar: the durations of the phases of the last request in seconds
+               since its begin: 'dns', 'connect', 'firstbyte' and 'total'
+        @type: dict
+        """
+
+        self.reused = False
+        """
+        @ivar: the last request used an already established connection
+        @type: bool
+        """
+
+    def as_dict(self):
+        """
+        Typecasting into a dictionary.
+
+        @return: structure as dict
+        @rtype:  dict
+
+        """
+
+        d = {
+            '__class__': self.__class__.__name__,
+            'host': self.host,
+            'port': self.port,
+            'timeout': self.timeout,
+            'buffer_size': self.buffer_size,
+            'idle_interval': self.idle_interval,
+            'keep_alive': self.keep_alive,
+            'name': self.name,
+            'sockaddr': self.sockaddr,
+            'connected': self.sock is not None,
+            'reused': self.reused,
+            'timings': self.timings,
+        }
+
+        return d
+
+    def close(self):
+        """
+        Closes the connection to the daemon.
+        """
+
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def _stopped(self):
+
+        return bool(self.should_stop and self.should_stop())
+
+    def _connection_usable(self):
+        """
+        An idle kept connection must not be readable, otherwise it was
+        closed by the daemon or there are stale data.
+        """
+
+        try:
+            rlist, _, _ = select.select([self.sock], [], [], 0)
+        except (select.error, socket.error, ValueError):
+            return False
+        return not rlist
+
+    def connect(self, begin, deadline):
+        """
+        Connects to the daemon, starting a new connection attempt to the next
+        address every CONNECTION_ATTEMPT_DELAY seconds, while the previous
+        attempts are still pending. The first established connection wins.
+
+        @raise NoListeningError: if the daemon isn't listening on any address
+        @raise SocketConnectTimeoutError: if no connection was established
+                                          until the deadline
+        @raise SocketTransportError: if the request was canceled
+
+        @param begin: the monotonic time of the begin of the request
+        @type begin: float
+        @param deadline: the monotonic time of the deadline of the request
+        @type deadline: float
+
+        """
+
+        try:
+            addresses = socket.getaddrinfo(
+                self.host, self.port, socket.AF_UNSPEC, socket.SOCK_STREAM)
+        except (socket.error, UnicodeError) as e:
+            raise NoListeningError("Could not resolve %r: %s" % (self.host, e))
+        self.timings['dns'] = monotonic() - begin
+
+        pending = sort_addresses(addresses)
+        attempts = {}
+        next_attempt = monotonic()
+        winner = None
+
+        try:
+            while winner is None:
+
+                if self._stopped():
+                    raise SocketTransportError("Canceled.")
+
+                now = monotonic()
+                if now >= deadline:
+                    raise SocketConnectTimeoutError(
+                        "Timeout connecting to %r port %d." % (self.host, self.port))
+
+                if pending and (now >= next_attempt or not attempts):
+                    (af, socktype, proto, canonname, sa) = pending.pop(0)
+                    if log.isEnabledFor(logging.DEBUG):
+                        log.debug("Connecting to %r ...", sa)
+                    try:
+                        sock = socket.socket(af, socktype, proto)
+                    except socket.error as e:
+                        log.debug("Could not create socket for %r: %s", sa, e)
+                        continue
+                    sock.setblocking(False)
+                    err = sock.connect_ex(sa)
+                    if err == 0:
+                        winner = (sock, sa)
+                        break
+                    if err not in (errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY):
+                        log.debug("Could not connect to %r: %s", sa, errno.errorcode.get(err, err))
+                        sock.close()
+                        continue
+                    attempts[sock] = sa
+                    next_attempt = now + CONNECTION_ATTEMPT_DELAY
+                    continue
+
+                if not attempts:
+                    raise NoListeningError("%s seems not to listen on %r, port %d." % (
+                        self.name, self.host, self.port))
+
+                wait = deadline - now
+                if pending:
+                    wait = min(wait, next_attempt - now)
+                try:
+                    _, writable, _ = select.select([], list(attempts.keys()), [], max(wait, 0))
+                except select.error as e:
+                    if e.args[0] == errno.EINTR:
+                        continue
+                    raise
+
+                for sock in writable:
+                    sa = attempts.pop(sock)
+                    err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                    if err:
+                        log.debug("Could not connect to %r: %s", sa, errno.errorcode.get(err, err))
+                        sock.close()
+                        # start the next attempt at once
+                        next_attempt = now
+                        continue
+                    winner = (sock, sa)
+                    break
+
+        finally:
+            for sock in attempts:
+                sock.close()
+
+        (self.sock, self.sockaddr) = winner
+        self.timings['connect'] = monotonic() - begin
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Connected to %r.", self.sockaddr)
+
+        if self.keep_alive:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
+    def send(self, message):
+        """
+        Sends the message to the daemon and waits for its reply.
+
+        The reply is complete, if the is_complete() callback is true for it,
+        if the daemon closes the connection or if no further data are coming
+        for the idle interval after receiving some data.
+
+        @raise NoListeningError: if the daemon isn't listening on the port
+        @raise SocketTransportError: on some communication errors or timeouts
+
+        @param message: the message to send over the network
+        @type message: str
+
+        @return: the reply of the daemon
+        @rtype: str
+
+        """
+
+        begin = monotonic()
+        deadline = begin + self.timeout
+        self.timings = {}
+
+        if self.sock is not None and not self._connection_usable():
+            log.debug("Kept connection to %r is not usable anymore.", self.sockaddr)
+            self.close()
+
+        self.reused = self.sock is not None
+        if not self.reused:
+            self.connect(begin, deadline)
+
+        if sys.version_info[0] > 2:
+            if isinstance(message, str):
+                message = message.encode('utf-8')
+
+        reader = ReplyReader(self.buffer_size, self.is_complete)
+        try:
+            self._send_all(message, deadline)
+            self._receive(reader, begin, deadline)
+        except socket.error as e:
+            self.close()
+            raise SocketTransportError("Error communicating with %r port %d: %s" % (
+                self.host, self.port, e))
+        except Exception:
+            self.close()
+            raise
+
+        self.timings['total'] = monotonic() - begin
+
+        if reader.eof or not reader.complete or not self.keep_alive:
+            self.close()
+
+        if reader.eof and not reader.received:
+            raise SocketTransportError("Connection closed by %r port %d without a reply." % (
+                self.host, self.port))
+
+        return reader.text
+
+    def _send_all(self, message, deadline):
+
+        view = memoryview(message)
+        while view:
+            now = monotonic()
+            if now >= deadline:
+                raise SocketTransportError('Timeout after %0.2f seconds.' % (self.timeout))
+            try:
+                _, writable, _ = select.select([], [self.sock], [], deadline - now)
+            except select.error as e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+            if not writable:
+                continue
+            try:
+                sent = self.sock.send(view)
+            except socket.error as e:
+                if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                    continue
+                raise
+            view = view[sent:]
+
+    def _receive(self, reader, begin, deadline):
+
+        last_data = None
+        while True:
+
+            if self._stopped():
+                raise SocketTransportError("Canceled.")
+
+            cur_time = monotonic()
+            if cur_time >= deadline:
+                raise SocketTransportError(
+                    'Timeout after %0.2f seconds.' % (cur_time - begin))
+
+            # Without an end mark the reply is complete, if no further
+            # data are coming for the idle interval
+            wait = deadline - cur_time
+            if last_data is not None:
+                idle = last_data + self.idle_interval - cur_time
+                if idle <= 0:
+                    return
+                wait = min(wait, idle)
+
+            try:
+                rlist, _, _ = select.select([self.sock], [], [], wait)
+            except select.error as e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+            if not rlist:
+                continue
+
+            try:
+                count = reader.receive(self.sock)
+            except socket.error as e:
+                if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                    continue
+                raise
+            if not count:
+                log.debug("Socket closed from remote.")
+                return
+
+            last_data = monotonic()
+            if 'firstbyte' not in self.timings:
+                self.timings['firstbyte'] = last_data - begin
+            if reader.complete:
+                return
+
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,453 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+@author: Frank Brehm
+@contact: frank.brehm@profitbricks.com
+@copyright: © 2010 - 2016 by Frank Brehm, Berlin
+@summary: Module for a lean sampler of the block I/O delays of processes
+          by the taskstats generic netlink family of the Linux kernel
+"""
+
+# Standard modules
+import os
+import errno
+import socket
+import struct
+import logging
+
+from array import array
+
+# Third party modules
+
+# Own modules
+
+from nagios.plugin import NagiosPluginError
+from nagios.plugin.statestore import Sample
+from nagios.plugin.timing import monotonic
+
+# Some module variables
+__version__ = '0.2.1'
+
+log = logging.getLogger(__name__)
+
+DEFAULT_BUFFER_SIZE = 16384
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_TIMEOUT = 10
+
+NETLINK_GENERIC = 16
+
+NLM_F_REQUEST = 1
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+
+GENL_ID_CTRL = 0x10
+CTRL_CMD_GETFAMILY = 3
+CTRL_ATTR_FAMILY_ID = 1
+CTRL_ATTR_FAMILY_NAME = 2
+
+TASKSTATS_GENL_NAME = b'TASKSTATS'
+TASKSTATS_GENL_VERSION = 1
+TASKSTATS_CMD_GET = 1
+TASKSTATS_CMD_ATTR_TGID = 2
+TASKSTATS_TYPE_STATS = 3
+TASKSTATS_TYPE_AGGR_PID = 4
+TASKSTATS_TYPE_AGGR_TGID = 5
+
+# offset of blkio_delay_total in struct taskstats
+BLKIO_DELAY_TOTAL_OFFSET = 40
+
+NLMSG_HEADER = struct.Struct('=IHHII')
+GENL_HEADER = struct.Struct('=BBH')
+NLA_HEADER = struct.Struct('=HH')
+ERROR_CODE = struct.Struct('=i')
+U16 = struct.Struct('=H')
+U64 = struct.Struct('=Q')
+
+# a complete TASKSTATS_CMD_GET request for the stats of a thread group:
+# netlink header, generic netlink header and the TGID attribute
+TGID_REQUEST = struct.Struct('=IHHIIBBHHHI')
+
+
+# =============================================================================
+class TaskStatsError(NagiosPluginError):
+    """
+    Base error class for errors on taskstats requests.
+    """
+
+    pass
+
+
+# =============================================================================
+def list_pids(proc_dir='/proc'):
+    """
+    Gives back the IDs of all processes by one scan of /proc.
+
+    @return: the process IDs
+    @rtype: array of int
+
+    """
+
+    return array('i', [int(x) for x in os.listdir(proc_dir) if x.isdigit()])
+
+
+# =============================================================================
+def iter_attributes(buf, offset, end):
+    """
+    Gives back the netlink attributes in the given range of the buffer.
+
+    @return: the type of the attribute, the offset and the end of its payload
+    @rtype: iterator of tuple
+
+    """
+
+    while offset + NLA_HEADER.size <= end:
+        (length, attr_type) = NLA_HEADER.unpack_from(buf, offset)
+        if length < NLA_HEADER.size:
+            break
+        yield (attr_type & 0x3fff, offset + NLA_HEADER.size, offset + length)
+        offset += (length + 3) & ~3
+
+
+# =============================================================================
+def parse_replies(buf, length, family_id, results):
+    """
+    Evaluates the taskstats replies in the given buffer.
+
+    @raise TaskStatsError: on other errors than vanished processes
+
+    @param buf: the buffer with the received netlink messages
+    @type buf: bytearray
+    @param length: the number of received bytes in the buffer
+    @type length: int
+    @param family_id: the ID of the taskstats generic netlink family
+    @type family_id: int
+    @param results: the block I/O delays in nanoseconds by the sequence
+                    numbers of the requests, a vanished process gets -1
+    @type results: dict
+
+    """
+
+    offset = 0
+    while offset + NLMSG_HEADER.size <= length:
+        (msg_len, msg_type, flags, seq, port) = NLMSG_HEADER.unpack_from(buf, offset)
+        if msg_len < NLMSG_HEADER.size:
+            break
+        end = min(offset + msg_len, length)
+        payload = offset + NLMSG_HEADER.size
+
+        if msg_type == NLMSG_ERROR:
+            error = -ERROR_CODE.unpack_from(buf, payload)[0]
+            if error in (errno.ESRCH, errno.ENOENT):
+                results[seq] = -1
+            elif error:
+                raise TaskStatsError(
+                    "Error on taskstats request: %s" % (os.strerror(error)))
+        elif msg_type == family_id:
+            delay = -1
+            attrs_offset = payload + GENL_HEADER.size
+            for (attr_type, start, stop) in iter_attributes(buf, attrs_offset, end):
+                if attr_type not in (TASKSTATS_TYPE_AGGR_TGID, TASKSTATS_TYPE_AGGR_PID):
+                    continue
+                for (sub_type, sub_start, sub_stop) in iter_attributes(buf, start, stop):
+                    if sub_type == TASKSTATS_TYPE_STATS:
+                        delay = U64.unpack_from(buf, sub_start + BLKIO_DELAY_TOTAL_OFFSET)[0]
+            results[seq] = delay
+
+        offset += (msg_len + 3) & ~3
+
+
+# =============================================================================
+class TaskStatsConnection(object):
+    """
+    A connection to the taskstats generic netlink family. A single netlink
+    socket and a preallocated receive buffer are used for all requests,
+    the requests for many processes are sent together in one datagram.
+    """
+
+    # -------------------------------------------------------------------------
+    def __init__(
+            self, buffer_size=DEFAULT_BUFFER_SIZE, batch_size=DEFAULT_BATCH_SIZE,
+            timeout=DEFAULT_TIMEOUT):
+        """
+        Constructor.
+
+        @raise TaskStatsError: if the taskstats family could not be resolved
+
+        @param buffer_size: the size of the receive buffer
+        @type buffer_size: int
+        @param batch_size: the number of processes requested at once
+        @type batch_size: int
+        @param timeout: the timeout for receiving a reply in seconds
+        @type timeout: float
+
+        """
+
+        self.batch_size = batch_size
+        self.buffer = bytearray(buffer_size)
+        self.seq = 0
+
+        try:
+            self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_GENERIC)
+            self.sock.bind((0, 0))
+            self.sock.settimeout(timeout)
+        except (socket.error, AttributeError) as e:
+            raise TaskStatsError("Could not open generic netlink socket: %s" % (e))
+
+        self.family_id = self._resolve_family(TASKSTATS_GENL_NAME)
+        log.debug("Got ID %d of the taskstats netlink family.", self.family_id)
+
+    # -------------------------------------------------------------------------
+    def close(self):
+        """Closes the netlink socket."""
+
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    # -------------------------------------------------------------------------
+    def _next_seq(self):
+
+        self.seq = (self.seq + 1) & 0xffffffff
+        return self.seq
+
+    # -------------------------------------------------------------------------
+    def _resolve_family(self, name):
+
+        name += b'\0'
+        attr_len = NLA_HEADER.size + len(name)
+        attr = NLA_HEADER.pack(attr_len, CTRL_ATTR_FAMILY_NAME) + name
+        attr += b'\0' * (((attr_len + 3) & ~3) - attr_len)
+        body = GENL_HEADER.pack(CTRL_CMD_GETFAMILY, 1, 0) + attr
+        seq = self._next_seq()
+        msg = NLMSG_HEADER.pack(
+            NLMSG_HEADER.size + len(body), GENL_ID_CTRL, NLM_F_REQUEST, seq, 0) + body
+
+        try:
+            self.sock.send(msg)
+            length = self.sock.recv_into(self.buffer)
+        except socket.error as e:
+            raise TaskStatsError("Could not resolve the taskstats netlink family: %s" % (e))
+
+        buf = self.buffer
+        (msg_len, msg_type, flags, rseq, port) = NLMSG_HEADER.unpack_from(buf, 0)
+        if msg_type == NLMSG_ERROR:
+            error = -ERROR_CODE.unpack_from(buf, NLMSG_HEADER.size)[0]
+            raise TaskStatsError(
+                "Could not resolve the taskstats netlink family: %s" % (os.strerror(error)))
+
+        start = NLMSG_HEADER.size + GENL_HEADER.size
+        for (attr_type, offset, end) in iter_attributes(buf, start, min(msg_len, length)):
+            if attr_type == CTRL_ATTR_FAMILY_ID:
+                return U16.unpack_from(buf, offset)[0]
+
+        raise TaskStatsError("Got no ID of the taskstats netlink family.")
+
+    # -------------------------------------------------------------------------
+    def blkio_delays(self, pids):
+        """
+        Requests the accumulated block I/O delays of the given processes
+        (of all their threads).
+
+        @raise TaskStatsError: on errors of the requests
+
+        @param pids: the IDs of the processes
+        @type pids: sequence of int
+
+        @return: the block I/O delays in nanoseconds in the order of the
+                 given processes, -1 for vanished processes
+        @rtype: array of float
+
+        """
+
+        delays = array('d', [-1.0]) * len(pids)
+        family_id = self.family_id
+        pack = TGID_REQUEST.pack
+
+        for first in range(0, len(pids), self.batch_size):
+            batch = pids[first:first + self.batch_size]
+            seqs = {}
+            requests = []
+            for (i, pid) in enumerate(batch):
+                seq = self._next_seq()
+                seqs[seq] = first + i
+                requests.append(pack(
+                    TGID_REQUEST.size, family_id, NLM_F_REQUEST, seq, 0,
+                    TASKSTATS_CMD_GET, TASKSTATS_GENL_VERSION, 0,
+                    8, TASKSTATS_CMD_ATTR_TGID, pid))
+
+            results = {}
+            try:
+                self.sock.send(b''.join(requests))
+                while len(results) < len(batch):
+                    length = self.sock.recv_into(self.buffer)
+                    parse_replies(self.buffer, length, family_id, results)
+            except socket.timeout:
+                raise TaskStatsError("Timeout on receiving taskstats replies.")
+            except socket.error as e:
+                raise TaskStatsError("Error on taskstats requests: %s" % (e))
+
+            for (seq, delay) in results.items():
+                index = seqs.get(seq)
+                if index is not None:
+                    delays[index] = delay
+
+        return delays
+
+
+# =============================================================================
+class BlkioDelaySampler(object):
+    """
+    Samples the block I/O delays of all processes repeatedly and keeps
+    the accumulated delays since the first sample of every process
+    in arrays.
+    """
+
+    # -------------------------------------------------------------------------
+    def __init__(self, connection=None, proc_dir='/proc'):
+        """
+        Constructor.
+
+        @param connection: the connection to the taskstats family, a new one
+                           is opened, if not given
+        @type connection: TaskStatsConnection or None
+        @param proc_dir: the directory of the process information
+        @type proc_dir: str
+
+        """
+
+        if connection is None:
+            connection = TaskStatsConnection()
+        self.connection = connection
+        self.proc_dir = proc_dir
+
+        self.slots = {}
+        """
+        @ivar: the index in the arrays by the process ID
+        @type: dict
+        """
+
+        self.pids = array('i')
+        self.first_delay = array('d')
+        self.first_time = array('d')
+        self.last_delay = array('d')
+        self.alive = array('b')
+        self.last_time = None
+        self.samples = 0
+
+    # -------------------------------------------------------------------------
+    def close(self):
+        """Closes the connection to the taskstats family."""
+
+        self.connection.close()
+
+    # -------------------------------------------------------------------------
+    def restore(self, samples):
+        """
+        Takes the samples of a previous run as the first samples of
+        the processes.
+
+        @param samples: the samples by the process ID, see snapshot()
+        @type samples: dict of Sample
+
+        """
+
+        for (pid, (timestamp, counters)) in samples.items():
+            delay = counters.get('blkio_delay')
+            if delay is None or pid in self.slots:
+                continue
+            self.slots[pid] = len(self.pids)
+            self.pids.append(pid)
+            self.first_delay.append(float(delay))
+            self.first_time.append(timestamp)
+            self.last_delay.append(float(delay))
+            self.alive.append(0)
+
+    # -------------------------------------------------------------------------
+    def snapshot(self):
+        """
+        Gives back the last sample of the processes existing in it for
+        restoring them in the next run.
+
+        @return: samples with the counter 'blkio_delay' in nanoseconds by
+                 the process ID
+        @rtype: dict of Sample
+
+        """
+
+        samples = {}
+        now = self.last_time
+        for (index, alive) in enumerate(self.alive):
+            if alive:
+                samples[self.pids[index]] = Sample(
+                    now, {'blkio_delay': int(self.last_delay[index])})
+        return samples
+
+    # -------------------------------------------------------------------------
+    def sample(self):
+        """
+        Takes a sample of the block I/O delays of all current processes.
+        Processes not existing any more are excluded from the evaluation.
+        """
+
+        pids = list_pids(self.proc_dir)
+        now = monotonic()
+        delays = self.connection.blkio_delays(pids)
+
+        alive = array('b', [0]) * len(self.pids)
+        slots = self.slots
+        for (pid, delay) in zip(pids, delays):
+            if delay < 0:
+                continue
+            index = slots.get(pid)
+            if index is None or delay < self.first_delay[index]:
+                # a new process, or a process ID used again
+                if index is None:
+                    index = len(self.pids)
+                    slots[pid] = index
+                    self.pids.append(pid)
+                    self.first_delay.append(delay)
+                    self.first_time.append(now)
+                    self.last_delay.append(delay)
+                    alive.append(1)
+                    continue
+                self.first_delay[index] = delay
+                self.first_time[index] = now
+            self.last_delay[index] = delay
+            alive[index] = 1
+
+        self.alive = alive
+        self.last_time = now
+        self.samples += 1
+
+    # -------------------------------------------------------------------------
+    def delay_percents(self):
+        """
+        Gives back the block I/O delay of every process existing in the last
+        sample as a percentage of the time since its first sample.
+
+        @rtype: iterator of float
+
+        """
+
+        now = self.last_time
+        first_delay = self.first_delay
+        first_time = self.first_time
+        last_delay = self.last_delay
+        for (index, alive) in enumerate(self.alive):
+            if not alive:
+                continue
+            duration = now - first_time[index]
+            if duration <= 0:
+                yield 0.0
+                continue
+            yield (last_delay[index] - first_delay[index]) / (duration * 10000000.0)
+
+# =============================================================================
+
+if __name__ == "__main__":
+
+    pass
+
+# =============================================================================
+
+# vim: fileencoding=utf-8 filetype=python ts=4 et sw=4
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+@author: Frank Brehm
+@contact: frank.brehm@profitbricks.com
+@organization: Profitbricks GmbH
+@copyright: © 2010 - 2016 by Profitbricks GmbH
+@license: GPL3
+@summary: benchmark of creating a plugin object and parsing its command
+          line arguments for every plugin class in nagios.plugins
+'''
+
+import os
+import sys
+import glob
+import timeit
+import logging
+import argparse
+import importlib
+
+libdir = os.path.abspath(os.path.join(os.path.dirname(sys.argv[0]), '..'))
+sys.path.insert(0, libdir)
+
+import general
+from general import ColoredFormatter, init_root_logger
+
+import nagios
+
+from nagios.plugin import NagiosPlugin
+from nagios.plugin.argparser import clear_parser_cache
+
+log = logging.getLogger(__name__)
+
+__version__ = '0.1.0'
+
+
+#==============================================================================
+def iter_plugin_classes(verbose=0):
+    """Yields all plugin classes defined in the modules nagios.plugins.check_*."""
+
+    plugin_dir = os.path.join(libdir, 'nagios', 'plugins')
+    for filename in sorted(glob.glob(os.path.join(plugin_dir, 'check_*.py'))):
+        modname = 'nagios.plugins.' + os.path.basename(filename)[:-3]
+        try:
+            module = importlib.import_module(modname)
+        except ImportError as e:
+            if verbose:
+                log.info("Skipping %s: %s", modname, e)
+            continue
+        for name in sorted(dir(module)):
+            cls = getattr(module, name)
+            if (isinstance(cls, type) and issubclass(cls, NagiosPlugin) and
+                    cls.__module__ == modname):
+                yield cls
+
+
+#==============================================================================
+def parse(cls, args, cached=True):
+    """Creates a plugin object and parses the given arguments."""
+
+    if not cached:
+        clear_parser_cache()
+    plugin = cls()
+    try:
+        plugin.argparser.parse_args(args)
+    except SystemExit:
+        pass
+
+#==============================================================================
+
+if __name__ == '__main__':
+
+    arg_parser = argparse.ArgumentParser(
+        description="Benchmark of parsing the command line arguments of all plugins.")
+    arg_parser.add_argument(
+        '-n', '--number', type=int, default=200,
+        help="Number of parsings per plugin and mode (Default: %(default)d).")
+    arg_parser.add_argument(
+        '-v', '--verbose', action='count', default=0, help="Increase the verbosity level.")
+    args = arg_parser.parse_args()
+
+    init_root_logger(args.verbose)
+
+    # missing required arguments are leading to a message on stdout
+    stdout = sys.stdout
+    devnull = open(os.devnull, 'w')
+
+    plugin_args = ['-t', '10']
+    for cls in iter_plugin_classes(args.verbose):
+        sys.stdout = devnull
+        try:
+            try:
+                if cls().argparser is None:
+                    continue
+            except (SystemExit, Exception) as e:
+                log.info("Skipping %s, it can't be created here: %s", cls.__name__, e)
+                continue
+            t_uncached = timeit.timeit(
+                lambda: parse(cls, plugin_args, cached=False), number=args.number)
+            t_cached = timeit.timeit(
+                lambda: parse(cls, plugin_args), number=args.number)
+        finally:
+            sys.stdout = stdout
+
+        print("%-32s uncached: %8.1f µs/call, cached: %8.1f µs/call" % (
+            cls.__name__, (t_uncached * 1000000.0 / args.number),
+            (t_cached * 1000000.0 / args.number)))
+
+    devnull.close()
+
+#==============================================================================
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
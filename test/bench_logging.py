@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+@author: Frank Brehm
+@contact: frank.brehm@profitbricks.com
+@organization: Profitbricks GmbH
+@copyright: © 2010 - 2016 by Profitbricks GmbH
+@license: GPL3
+@summary: benchmark of the overhead of disabled debug log records
+          and of parsing ranges and performance data
+'''
+
+import os
+import sys
+import timeit
+import logging
+import argparse
+
+libdir = os.path.abspath(os.path.join(os.path.dirname(sys.argv[0]), '..'))
+sys.path.insert(0, libdir)
+
+import general
+from general import ColoredFormatter, init_root_logger
+
+import nagios
+
+from nagios.common import pp
+
+from nagios.plugin.logguard import LogGuard, LazyPP
+
+from nagios.plugin.range import NagiosRange
+from nagios.plugin.performance import NagiosPerformance
+
+from nagios.plugin.extended import ExtNagiosPlugin
+
+log = logging.getLogger(__name__)
+log_guard = LogGuard(log)
+
+__version__ = '0.1.0'
+
+VALUE = {
+    'pid': 4711, 'ppid': 1, 'user': 'nagios', 'state': 'S',
+    'args': '/usr/sbin/nrpe -c /etc/nagios/nrpe.cfg -d', 'rss': 4096, 'vsz': 65536,
+}
+PERFSTRING = "time=0.002722s;0.000000;0.000000;0.000000;10.000000 size=5121B;;;0"
+
+#==============================================================================
+
+if __name__ == '__main__':
+
+    arg_parser = argparse.ArgumentParser(
+        description="Benchmark of the overhead of disabled debug log records.")
+    arg_parser.add_argument(
+        '-n', '--number', type=int, default=100000,
+        help="Number of log records per variant (Default: %(default)d).")
+    arg_parser.add_argument(
+        '-v', '--verbose', action='count', default=0, help="Increase the verbosity level.")
+    args = arg_parser.parse_args()
+
+    # the overhead is measured with disabled debug messages
+    init_root_logger(0)
+
+    plugin = ExtNagiosPlugin()
+
+    def eager_pp():
+        log.debug("Got process info:\n%s", pp(VALUE))
+
+    def lazy_pp():
+        log.debug("Got process info:\n%s", LazyPP(VALUE))
+
+    def plain():
+        log.debug("Got process info: %r", VALUE)
+
+    def verbose_check():
+        if plugin.verbose > 2:
+            log.debug("Got process info: %r", VALUE)
+
+    def guarded():
+        if log_guard.debug:
+            log.debug("Got process info: %r", VALUE)
+
+    debug = log_guard.verbose_debug(plugin.verbose, 2)
+
+    def cached():
+        if debug:
+            log.debug("Got process info: %r", VALUE)
+
+    variants = (
+        ('eager pp()', eager_pp),
+        ('LazyPP', lazy_pp),
+        ('log.debug()', plain),
+        ('self.verbose > 2', verbose_check),
+        ('log_guard.debug', guarded),
+        ('cached level', cached),
+    )
+
+    for (name, func) in variants:
+        t = timeit.timeit(func, number=args.number)
+        print("%-20s %8.3f µs/record" % (name, (t * 1000000.0 / args.number)))
+
+    number = args.number // 10
+    t = timeit.timeit(lambda: NagiosRange('@~:10.5'), number=number)
+    print("%-20s %8.3f µs/call" % ('NagiosRange()', (t * 1000000.0 / number)))
+    t = timeit.timeit(lambda: NagiosPerformance.parse_perfstring(PERFSTRING), number=number)
+    print("%-20s %8.3f µs/call" % ('parse_perfstring()', (t * 1000000.0 / number)))
+
+#==============================================================================
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
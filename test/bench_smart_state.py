@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+@author: Frank Brehm
+@contact: frank.brehm@profitbricks.com
+@organization: Profitbricks GmbH
+@copyright: © 2010 - 2016 by Profitbricks GmbH
+@license: GPL3
+@summary: benchmark of evaluating the text and the JSON output of smartctl
+          with the fixtures in test/smartctl
+'''
+
+import os
+import sys
+import json
+import timeit
+import logging
+import argparse
+
+libdir = os.path.abspath(os.path.join(os.path.dirname(sys.argv[0]), '..'))
+sys.path.insert(0, libdir)
+
+import general
+from general import ColoredFormatter, init_root_logger
+
+import nagios
+
+from nagios.plugins.check_smart_state import eval_smartctl_output
+from nagios.plugins.check_smart_state import eval_smartctl_json
+
+log = logging.getLogger(__name__)
+
+__version__ = '0.1.0'
+
+FIXTURES = ('sata', 'sas', 'nvme')
+
+#==============================================================================
+
+if __name__ == '__main__':
+
+    arg_parser = argparse.ArgumentParser(
+        description="Benchmark of evaluating the output of smartctl.")
+    arg_parser.add_argument(
+        '-n', '--number', type=int, default=2000,
+        help="Number of evaluations per fixture and format (Default: %(default)d).")
+    arg_parser.add_argument(
+        '-v', '--verbose', action='count', default=0, help="Increase the verbosity level.")
+    args = arg_parser.parse_args()
+
+    init_root_logger(args.verbose)
+
+    fixture_dir = os.path.join(os.path.realpath(os.path.dirname(sys.argv[0])), 'smartctl')
+
+    for name in FIXTURES:
+
+        with open(os.path.join(fixture_dir, name + '.txt')) as fh:
+            txt_output = fh.read()
+        with open(os.path.join(fixture_dir, name + '.json')) as fh:
+            json_output = fh.read()
+
+        t_txt = timeit.timeit(
+            lambda: eval_smartctl_output(txt_output), number=args.number)
+        t_json = timeit.timeit(
+            lambda: eval_smartctl_json(json.loads(json_output)), number=args.number)
+
+        print("%-5s text: %8.2f µs/call, JSON: %8.2f µs/call" % (
+            name, (t_txt * 1000000.0 / args.number), (t_json * 1000000.0 / args.number)))
+
+#==============================================================================
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
@@ -24,6 +24,8 @@ from nagios import FakeExitError
 
 from nagios.color_syslog import ColoredFormatter
 
+from nagios.plugin.logguard import refresh_log_guards
+
 #==============================================================================
 
 log = logging.getLogger(__name__)
@@ -72,6 +74,8 @@ def init_root_logger(verbose = 0):
 
     root_log.addHandler(lh_console)
 
+    refresh_log_guards()
+
 #==============================================================================
 class NagiosPluginTestcase(unittest.TestCase):
 
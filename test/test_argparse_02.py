@@ -200,6 +200,40 @@ class TestNagiosPluginArgparse2(NeedConfig):
 
         log.debug("Evaluated arguments: %r", na.args)
 
+    #--------------------------------------------------------------------------
+    def test_argparse_cached_parser(self):
+
+        log.info("Testing caching of the parser of NagiosPluginArgparse objects.")
+
+        def get_argparse(blurb = 'Senseless sample Nagios plugin.'):
+            na = NagiosPluginArgparse(
+                    usage = '%(prog)s [options] -w <warning_level>',
+                    url = 'http://www.profitbricks.com',
+                    blurb = blurb,
+            )
+            na.add_arg('-w', type = int, required = True, metavar = 'LEVEL',
+                    dest = 'warn', help = "warning threshold")
+            return na
+
+        na1 = get_argparse()
+        na2 = get_argparse()
+        parser = na1.get_parser()
+        self.assertIs(na2.get_parser(), parser)
+        self.assertIsNot(get_argparse('Another plugin.').get_parser(), parser)
+
+        # the help texts are rendered not before they are needed
+        self.assertIsNone(parser.description)
+        help_text = parser.format_help()
+        self.assertIn('Senseless sample Nagios plugin.', help_text)
+        self.assertIn('ABSOLUTELY NO WARRANTY', help_text)
+
+        na1.parse_args(['-w', '10'])
+        na2.parse_args(['-w', '20', '-v'])
+        self.assertEqual(na1.args.warn, 10)
+        self.assertEqual(na1.args.verbose, 0)
+        self.assertEqual(na2.args.warn, 20)
+        self.assertEqual(na2.args.verbose, 1)
+
 #==============================================================================
 
 if __name__ == '__main__':
@@ -226,6 +260,8 @@ if __name__ == '__main__':
             'test_argparse_02.TestNagiosPluginArgparse2.test_argparse_doubled_dest'))
     suite.addTests(loader.loadTestsFromName(
             'test_argparse_02.TestNagiosPluginArgparse2.test_argparse_missing_argument'))
+    suite.addTests(loader.loadTestsFromName(
+            'test_argparse_02.TestNagiosPluginArgparse2.test_argparse_cached_parser'))
 
     runner = unittest.TextTestRunner(verbosity = verbose)
 
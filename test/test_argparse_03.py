@@ -30,6 +30,8 @@ from nagios.common import pp
 
 from nagios.plugin.config import NoConfigfileFound
 from nagios.plugin.config import NagiosPluginConfig
+from nagios.plugin.config import get_config
+from nagios.plugin.config import get_config_section
 
 from nagios.plugin.argparser import NagiosPluginArgparseError
 from nagios.plugin.argparser import NagiosPluginArgparse
@@ -93,6 +95,32 @@ class TestNagiosPluginConfigFile(NeedTmpConfig):
             self.fail("Could not read NagiosPluginConfig by a %s: %s" % (
                     e.__class__.__name__, str(e)))
 
+    #--------------------------------------------------------------------------
+    def test_config_cache(self):
+
+        log.info("Testing the cache of parsed configuration files.")
+
+        cfg = get_config(self.tmp_cfg)
+        self.assertEqual(cfg.files_read, [self.tmp_cfg])
+        self.assertIs(get_config(self.tmp_cfg), cfg)
+        self.assertEqual(
+            get_config_section('silly_options', self.tmp_cfg)['uhu1'], 'banane 1')
+        self.assertEqual(get_config_section('not_existing', self.tmp_cfg), {})
+
+        log.debug("Changing the configuration file ...")
+        with open(self.tmp_cfg, 'a') as f:
+            f.write("[other_options]\nuhu3 = banane 3\n")
+        st = os.stat(self.tmp_cfg)
+        os.utime(self.tmp_cfg, (st.st_atime, st.st_mtime + 10))
+
+        new_cfg = get_config(self.tmp_cfg)
+        self.assertIsNot(new_cfg, cfg)
+        self.assertEqual(get_config_section('other_options', self.tmp_cfg), {'uhu3': 'banane 3'})
+
+        default_cfg = get_config()
+        self.assertEqual(default_cfg.files_read, [self.ini_file])
+        self.assertIs(get_config(), default_cfg)
+
 #==============================================================================
 class TestNagiosArgParseExtraOpts(NeedTmpConfig):
 
@@ -160,6 +188,8 @@ if __name__ == '__main__':
             'test_argparse_03.TestNagiosPluginConfig.test_read_default_paths'))
     suite.addTests(loader.loadTestsFromName(
             'test_argparse_03.TestNagiosPluginConfigFile.test_read_cfgfile'))
+    suite.addTests(loader.loadTestsFromName(
+            'test_argparse_03.TestNagiosPluginConfigFile.test_config_cache'))
     suite.addTests(loader.loadTestsFromName(
             'test_argparse_03.TestNagiosArgParseExtraOpts.test_argparse_perform_args1'))
     suite.addTests(loader.loadTestsFromName(
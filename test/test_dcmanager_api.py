@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+@author: Frank Brehm
+@contact: frank.brehm@profitbricks.com
+@organization: Profitbricks GmbH
+@copyright: © 2010 - 2016 by Profitbricks GmbH
+@license: GPL3
+@summary: test script (and module) for unit tests on the check
+          of the response times of the DcManager API
+'''
+
+import unittest
+import os
+import sys
+import logging
+import socket
+import errno
+
+libdir = os.path.abspath(os.path.join(os.path.dirname(sys.argv[0]), '..'))
+sys.path.insert(0, libdir)
+
+import general
+from general import ColoredFormatter, get_arg_verbose, init_root_logger
+from general import NeedConfig
+
+import nagios
+
+from nagios import FakeExitError
+
+from nagios.plugins.rest_session import TimedApiClient
+
+from nagios.plugins.check_dcmanager_api import percentile
+from nagios.plugins.check_dcmanager_api import CheckDcmanagerApiPlugin
+
+log = logging.getLogger(__name__)
+
+
+#==============================================================================
+class StubClient(object):
+    """
+    A stand-in of the REST API client object of the DcManager client.
+    """
+
+    url = 'http://localhost/api'
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.calls = 0
+
+    def clusters(self):
+        self.calls += 1
+        if self.failures:
+            self.failures -= 1
+            raise socket.error(errno.ECONNRESET, "Connection reset by peer")
+        return []
+
+    def pservers(self):
+        return []
+
+
+#==============================================================================
+class TestDcmanagerApi(NeedConfig):
+
+    #--------------------------------------------------------------------------
+    def run_plugin(self, results, *args):
+        """
+        Runs the plugin with the given results of the requests to the API
+        as tuples of the response time and the error message.
+        """
+
+        results = list(results)
+        requested = []
+
+        def request(endpoint):
+            requested.append(endpoint)
+            return results.pop(0)
+
+        plugin = CheckDcmanagerApiPlugin()
+        plugin.parse_args(['-w', '1', '-c', '2', '--concurrency', '1'] + list(args))
+        plugin.parse_args_second()
+        plugin.api = TimedApiClient(StubClient(), timings=plugin.timings)
+        plugin.request = request
+
+        with self.assertRaises(FakeExitError) as cm:
+            plugin.run()
+        self.assertEqual(results, [])
+
+        return (plugin, cm.exception, requested)
+
+    #--------------------------------------------------------------------------
+    def test_percentile(self):
+
+        log.info("Testing percentile() by the nearest rank method.")
+
+        self.assertIsNone(percentile([], 95))
+        self.assertIsNone(percentile([], 0))
+
+        self.assertEqual(percentile([0.5], 0), 0.5)
+        self.assertEqual(percentile([0.5], 50), 0.5)
+        self.assertEqual(percentile([0.5], 100), 0.5)
+
+        values = [0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0]
+        self.assertEqual(percentile(values, 0), 0.1)
+        self.assertEqual(percentile(values, 10), 0.1)
+        self.assertEqual(percentile(values, 11), 0.2)
+        self.assertEqual(percentile(values, 50), 0.5)
+        self.assertEqual(percentile(values, 95), 1.0)
+        self.assertEqual(percentile(values, 100), 1.0)
+
+    #--------------------------------------------------------------------------
+    def test_ok(self):
+
+        log.info("Testing a check with successful requests.")
+
+        (plugin, result, requested) = self.run_plugin(
+            [(0.4, None), (0.1, None), (0.3, None), (0.2, None)],
+            '-n', '4', '--endpoint', 'clusters', '--endpoint', 'pservers')
+
+        self.assertEqual(result.exit_value, nagios.state.ok)
+        self.assertEqual(requested, ['clusters', 'pservers', 'clusters', 'pservers'])
+        self.assertEqual(plugin.durations, [0.1, 0.2, 0.3, 0.4])
+        self.assertIn("min 0.10, p50 0.20, p95 0.40, max 0.40 sec.", result.msg)
+
+        perfdata = dict((x.label, x) for x in plugin.perfdata)
+        labels = [x.label for x in plugin.perfdata if not x.label.startswith('time_')]
+        self.assertEqual(labels, [
+            'errors', 'resp_time', 'resp_time_min', 'resp_time_p50',
+            'resp_time_p95', 'resp_time_max'])
+        self.assertEqual(perfdata['errors'].value, 0)
+        self.assertEqual(perfdata['errors'].uom, '%')
+        self.assertEqual(perfdata['resp_time'].value, 0.4)
+        self.assertEqual(perfdata['resp_time'].uom, 's')
+        self.assertEqual(perfdata['resp_time_min'].value, 0.1)
+        self.assertEqual(perfdata['resp_time_p50'].value, 0.2)
+
+        log.debug("Testing the thresholds on the given percentile.")
+        (plugin, result, requested) = self.run_plugin(
+            [(0.1, None), (0.2, None), (1.5, None), (2.5, None)], '-n', '4', '-P', '50')
+        self.assertEqual(result.exit_value, nagios.state.ok)
+        (plugin, result, requested) = self.run_plugin(
+            [(0.1, None), (0.2, None), (1.5, None), (2.5, None)], '-n', '4', '-P', '75')
+        self.assertEqual(result.exit_value, nagios.state.warning)
+        (plugin, result, requested) = self.run_plugin(
+            [(0.1, None), (0.2, None), (1.5, None), (2.5, None)], '-n', '4')
+        self.assertEqual(result.exit_value, nagios.state.critical)
+
+    #--------------------------------------------------------------------------
+    def test_errors(self):
+
+        log.info("Testing a check with failed requests.")
+
+        (plugin, result, requested) = self.run_plugin(
+            [(0.1, None), (5.0, 'clusters: timeout'), (0.2, None), (0.3, None)], '-n', '4')
+        self.assertEqual(result.exit_value, nagios.state.warning)
+        self.assertEqual(plugin.errors, ['clusters: timeout'])
+        self.assertEqual(plugin.durations, [0.1, 0.2, 0.3])
+        self.assertIn("1 requests failed, first error: clusters: timeout", result.msg)
+        perfdata = dict((x.label, x) for x in plugin.perfdata)
+        self.assertEqual(perfdata['errors'].value, 25.0)
+
+        log.debug("Testing failed requests with a critical response time.")
+        (plugin, result, requested) = self.run_plugin(
+            [(0.1, None), (0.2, 'clusters: bla'), (3.0, None)], '-n', '3')
+        self.assertEqual(result.exit_value, nagios.state.critical)
+
+        log.debug("Testing only failed requests.")
+        (plugin, result, requested) = self.run_plugin(
+            [(0.1, 'clusters: first'), (0.2, 'clusters: second')], '-n', '2')
+        self.assertEqual(result.exit_value, nagios.state.critical)
+        self.assertIn('clusters: first', result.msg)
+        self.assertEqual(plugin.durations, [])
+        labels = [x.label for x in plugin.perfdata if not x.label.startswith('time_')]
+        self.assertEqual(labels, ['errors'])
+        self.assertEqual(plugin.perfdata[0].value, 100.0)
+
+        log.debug("Testing an unknown endpoint.")
+        (plugin, result, requested) = self.run_plugin([], '--endpoint', 'bla')
+        self.assertEqual(result.exit_value, nagios.state.unknown)
+        self.assertIn("Unknown endpoint 'bla'", result.msg)
+        self.assertEqual(requested, [])
+
+    #--------------------------------------------------------------------------
+    def test_request(self):
+
+        log.info("Testing that failed requests are counted and not repeated.")
+
+        plugin = CheckDcmanagerApiPlugin()
+        plugin.parse_args(['-w', '1', '-c', '2', '-n', '3', '--concurrency', '1'])
+        plugin.parse_args_second()
+        client = StubClient(failures=1)
+        plugin.api = TimedApiClient(client, timings=plugin.timings)
+
+        with self.assertRaises(FakeExitError) as cm:
+            plugin.run()
+        self.assertEqual(cm.exception.exit_value, nagios.state.warning)
+        self.assertEqual(client.calls, 3)
+        self.assertEqual(len(plugin.durations), 2)
+        self.assertEqual(len(plugin.errors), 1)
+        self.assertIn('clusters: ', plugin.errors[0])
+        self.assertIn('Connection reset by peer', plugin.errors[0])
+        perfdata = dict((x.label, x) for x in plugin.perfdata)
+        self.assertEqual(perfdata['errors'].value, 33.3)
+        # no backoff delays in the response times
+        self.assertLess(plugin.durations[-1], 0.1)
+
+#==============================================================================
+
+if __name__ == '__main__':
+
+    verbose = get_arg_verbose()
+    if verbose is None:
+        verbose = 0
+    init_root_logger(verbose)
+
+    log.info("Starting tests ...")
+
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+
+    suite.addTest(TestDcmanagerApi('test_percentile', verbose))
+    suite.addTest(TestDcmanagerApi('test_ok', verbose))
+    suite.addTest(TestDcmanagerApi('test_errors', verbose))
+    suite.addTest(TestDcmanagerApi('test_request', verbose))
+
+    runner = unittest.TextTestRunner(verbosity = verbose)
+
+    result = runner.run(suite)
+
+#==============================================================================
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+@author: Frank Brehm
+@contact: frank.brehm@profitbricks.com
+@organization: Profitbricks GmbH
+@copyright: © 2010 - 2016 by Profitbricks GmbH
+@license: GPL3
+@summary: test script (and module) for unit tests on the functions
+          of nagios.plugin.functions
+'''
+
+import unittest
+import os
+import sys
+import logging
+
+libdir = os.path.abspath(os.path.join(os.path.dirname(sys.argv[0]), '..'))
+sys.path.insert(0, libdir)
+
+import general
+from general import ColoredFormatter, get_arg_verbose, init_root_logger
+from general import NagiosPluginTestcase
+
+import nagios
+
+from nagios.plugin.functions import max_state
+from nagios.plugin.functions import max_state_alt
+
+log = logging.getLogger(__name__)
+
+OK = nagios.state.ok
+WARNING = nagios.state.warning
+CRITICAL = nagios.state.critical
+UNKNOWN = nagios.state.unknown
+DEPENDENT = nagios.state.dependent
+
+#==============================================================================
+class TestMaxState(NagiosPluginTestcase):
+
+    #--------------------------------------------------------------------------
+    def test_max_state(self):
+
+        log.info("Testing max_state() ...")
+
+        self.assertEqual(max_state(OK, WARNING, CRITICAL, UNKNOWN, DEPENDENT), CRITICAL)
+        self.assertEqual(max_state(OK, WARNING, UNKNOWN, DEPENDENT), WARNING)
+        self.assertEqual(max_state(OK, UNKNOWN, DEPENDENT), OK)
+        self.assertEqual(max_state(UNKNOWN, DEPENDENT), UNKNOWN)
+        self.assertEqual(max_state(DEPENDENT), DEPENDENT)
+        self.assertEqual(max_state(DEPENDENT, DEPENDENT), DEPENDENT)
+        self.assertEqual(max_state(), UNKNOWN)
+        self.assertEqual(max_state(17), UNKNOWN)
+
+    #--------------------------------------------------------------------------
+    def test_max_state_alt(self):
+
+        log.info("Testing max_state_alt() ...")
+
+        self.assertEqual(max_state_alt(OK, WARNING, CRITICAL, UNKNOWN, DEPENDENT), CRITICAL)
+        self.assertEqual(max_state_alt(OK, WARNING, UNKNOWN, DEPENDENT), WARNING)
+        self.assertEqual(max_state_alt(OK, UNKNOWN, DEPENDENT), UNKNOWN)
+        self.assertEqual(max_state_alt(OK, DEPENDENT), DEPENDENT)
+        self.assertEqual(max_state_alt(DEPENDENT), DEPENDENT)
+        self.assertEqual(max_state_alt(OK, OK), OK)
+        self.assertEqual(max_state_alt(), UNKNOWN)
+        self.assertEqual(max_state_alt(17), UNKNOWN)
+
+#==============================================================================
+
+if __name__ == '__main__':
+
+    verbose = get_arg_verbose()
+    if verbose is None:
+        verbose = 0
+    init_root_logger(verbose)
+
+    log.info("Starting tests ...")
+
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+
+    suite.addTest(TestMaxState('test_max_state', verbose))
+    suite.addTest(TestMaxState('test_max_state_alt', verbose))
+
+    runner = unittest.TextTestRunner(verbosity = verbose)
+
+    result = runner.run(suite)
+
+#==============================================================================
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+@author: Frank Brehm
+@contact: frank.brehm@profitbricks.com
+@organization: Profitbricks GmbH
+@copyright: © 2010 - 2016 by Profitbricks GmbH
+@license: GPL3
+@summary: test script (and module) for unit tests on reading the state
+          of Infiniband ports out of sysfs
+'''
+
+import unittest
+import os
+import sys
+import logging
+import tempfile
+import shutil
+
+libdir = os.path.abspath(os.path.join(os.path.dirname(sys.argv[0]), '..'))
+sys.path.insert(0, libdir)
+
+import general
+from general import ColoredFormatter, get_arg_verbose, init_root_logger
+from general import NagiosPluginTestcase
+
+import nagios
+
+from nagios.plugins.check_ib_port import list_subdirs
+from nagios.plugins.check_ib_port import read_ib_port
+from nagios.plugins.check_ib_port import scan_ib_ports
+
+from nagios.plugins.ib_counters import IbCounterStateError
+from nagios.plugins.ib_counters import IbCounterState
+from nagios.plugins.ib_counters import counter_delta
+from nagios.plugins.ib_counters import port_rates
+
+log = logging.getLogger(__name__)
+
+#==============================================================================
+class TestIbPortSysfs(NagiosPluginTestcase):
+
+    #--------------------------------------------------------------------------
+    def setUp(self):
+
+        self.base_dir = tempfile.mkdtemp(prefix='ib_sysfs_')
+
+    #--------------------------------------------------------------------------
+    def tearDown(self):
+
+        shutil.rmtree(self.base_dir)
+
+    #--------------------------------------------------------------------------
+    def add_port(self, hca, port, state='4: ACTIVE', phys_state='5: LinkUp',
+            rate='40 Gb/sec (4X QDR)', counters=None, counters_ext=None):
+
+        port_dir = os.path.join(self.base_dir, hca, 'ports', str(port))
+        os.makedirs(os.path.join(port_dir, 'counters'))
+        files = {'state': state, 'phys_state': phys_state, 'rate': rate}
+        for name in files:
+            if files[name] is None:
+                continue
+            with open(os.path.join(port_dir, name), 'w') as fh:
+                fh.write(files[name] + '\n')
+        if counters:
+            for name in counters:
+                with open(os.path.join(port_dir, 'counters', name), 'w') as fh:
+                    fh.write("%s\n" % (counters[name]))
+        if counters_ext:
+            os.makedirs(os.path.join(port_dir, 'counters_ext'))
+            for name in counters_ext:
+                with open(os.path.join(port_dir, 'counters_ext', name), 'w') as fh:
+                    fh.write("%s\n" % (counters_ext[name]))
+        return port_dir
+
+    #--------------------------------------------------------------------------
+    def test_read_port(self):
+
+        log.info("Testing reading a single Infiniband port.")
+
+        port_dir = self.add_port('mlx4_0', 1, counters={
+            'symbol_error': 3, 'link_downed': 1, 'port_xmit_data': 123456789,
+            'port_rcv_data': 'bla'})
+        port = read_ib_port(port_dir)
+        if self.verbose > 2:
+            log.debug("Got port: %r", port)
+
+        self.assertEqual(port['errors'], [])
+        self.assertEqual(port['state_num'], 4)
+        self.assertEqual(port['state'], 'ACTIVE')
+        self.assertEqual(port['phys_state_num'], 5)
+        self.assertEqual(port['phys_state'], 'LinkUp')
+        self.assertEqual(port['rate'], 40)
+        self.assertEqual(port['rate_str'], '40 Gb/sec (4X QDR)')
+        self.assertEqual(port['counters'], {
+            'symbol_error': 3, 'link_downed': 1, 'port_xmit_data': 123456789})
+
+        log.debug("Testing a port with extended counters.")
+        port_dir = self.add_port('mlx4_1', 1, counters={'port_xmit_data': 12},
+            counters_ext={'port_xmit_data_64': 4294967308, 'port_rcv_packets_64': 5})
+        port = read_ib_port(port_dir)
+        self.assertEqual(port['counters'], {
+            'port_xmit_data': 12, 'port_xmit_data_64': 4294967308,
+            'port_rcv_packets_64': 5})
+
+        log.debug("Testing a port with missing and invalid files.")
+        port_dir = self.add_port('mlx4_0', 2, state='bla', rate=None)
+        port = read_ib_port(port_dir)
+        self.assertIsNone(port['state_num'])
+        self.assertIsNone(port['rate'])
+        self.assertEqual(port['phys_state'], 'LinkUp')
+        self.assertEqual(len(port['errors']), 2)
+
+    #--------------------------------------------------------------------------
+    def test_scan_ports(self):
+
+        log.info("Testing scanning all Infiniband ports.")
+
+        self.add_port('mlx4_1', 1)
+        self.add_port('mlx4_0', 2, state='1: DOWN', phys_state='2: Polling')
+        self.add_port('mlx4_0', 1)
+        os.makedirs(os.path.join(self.base_dir, 'mlx4_0', 'ports', 'bla'))
+
+        self.assertEqual(list_subdirs(self.base_dir), ['mlx4_0', 'mlx4_1'])
+        self.assertEqual(list_subdirs(os.path.join(self.base_dir, 'bla')), [])
+
+        ports = scan_ib_ports(self.base_dir)
+        if self.verbose > 2:
+            log.debug("Got ports: %r", ports)
+        self.assertEqual(
+            [(x['hca'], x['port']) for x in ports],
+            [('mlx4_0', 1), ('mlx4_0', 2), ('mlx4_1', 1)])
+        self.assertEqual(ports[1]['state'], 'DOWN')
+        self.assertEqual(ports[1]['phys_state'], 'Polling')
+
+        ports = scan_ib_ports(self.base_dir, 'mlx4_1')
+        self.assertEqual([(x['hca'], x['port']) for x in ports], [('mlx4_1', 1)])
+
+        self.assertEqual(scan_ib_ports(self.base_dir, 'mlx5_0'), [])
+        self.assertEqual(scan_ib_ports(os.path.join(self.base_dir, 'bla')), [])
+
+    #--------------------------------------------------------------------------
+    def test_counter_rates(self):
+
+        log.info("Testing evaluation of the rates of the port counters.")
+
+        self.assertEqual(counter_delta(10, 25), 15)
+        self.assertEqual(counter_delta(10, 10, 32), 0)
+        self.assertEqual(counter_delta(2 ** 32 - 10, 5, 32), 15)
+        self.assertIsNone(counter_delta(25, 10))
+        self.assertIsNone(counter_delta(2 ** 40, 10, 32))
+
+        old = {
+            'port_xmit_data': 2 ** 32 - 100, 'port_rcv_data': 1000,
+            'port_rcv_data_64': 2 ** 40, 'port_xmit_packets': 10,
+            'symbol_error': 5, 'link_downed': 3}
+        new = {
+            'port_xmit_data': 100, 'port_rcv_data': 500,
+            'port_rcv_data_64': 2 ** 40 + 1000, 'port_xmit_packets': 30,
+            'port_rcv_packets': 30, 'symbol_error': 15, 'link_downed': 0}
+        rates = port_rates(old, new, 10.0)
+        if self.verbose > 2:
+            log.debug("Got rates: %r", rates)
+        self.assertEqual(rates, {
+            'xmit_bytes': 80.0, 'rcv_bytes': 400.0, 'xmit_packets': 2.0,
+            'symbol_error': 1.0})
+
+        self.assertEqual(port_rates(old, new, 0), {})
+
+    #--------------------------------------------------------------------------
+    def test_state_file(self):
+
+        log.info("Testing the state file of the port counters.")
+
+        filename = os.path.join(self.base_dir, 'counters.state')
+        counter_state = IbCounterState(filename)
+        self.assertEqual(counter_state.load(), {})
+
+        previous = counter_state.update({
+            'mlx4_0:1': (1000.5, {'port_xmit_data': 12, 'symbol_error': 0}),
+            'mlx4_0:2': (1000.5, {'port_xmit_data': 13})})
+        self.assertEqual(previous, {})
+
+        previous = counter_state.update({'mlx4_0:1': (1010.0, {'port_xmit_data': 42})})
+        self.assertEqual(previous['mlx4_0:1'], (1000.5, {'port_xmit_data': 12, 'symbol_error': 0}))
+
+        samples = counter_state.load()
+        self.assertEqual(sorted(samples.keys()), ['mlx4_0:1', 'mlx4_0:2'])
+        self.assertEqual(samples['mlx4_0:1'], (1010.0, {'port_xmit_data': 42}))
+        self.assertEqual(samples['mlx4_0:2'], (1000.5, {'port_xmit_data': 13}))
+
+        log.debug("Testing an invalid state file.")
+        with open(filename, 'ab') as fh:
+            fh.write(b"mlx4_0:3 bla\n")
+        self.assertEqual(counter_state.load(), {})
+
+        log.debug("Testing a state file in a not existing directory.")
+        counter_state = IbCounterState(os.path.join(self.base_dir, 'bla', 'counters.state'))
+        with self.assertRaises(IbCounterStateError) as cm:
+            counter_state.update({})
+        log.debug("Got error: %s", cm.exception)
+
+#==============================================================================
+
+if __name__ == '__main__':
+
+    verbose = get_arg_verbose()
+    if verbose is None:
+        verbose = 0
+    init_root_logger(verbose)
+
+    log.info("Starting tests ...")
+
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+
+    suite.addTest(TestIbPortSysfs('test_read_port', verbose))
+    suite.addTest(TestIbPortSysfs('test_scan_ports', verbose))
+    suite.addTest(TestIbPortSysfs('test_counter_rates', verbose))
+    suite.addTest(TestIbPortSysfs('test_state_file', verbose))
+
+    runner = unittest.TextTestRunner(verbosity = verbose)
+
+    result = runner.run(suite)
+
+#==============================================================================
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+@author: Frank Brehm
+@contact: frank.brehm@profitbricks.com
+@organization: Profitbricks GmbH
+@copyright: © 2010 - 2016 by Profitbricks GmbH
+@license: GPL3
+@summary: test script (and module) for checking the import time of the
+          plugin modules used by the entry points in bin/
+'''
+
+import unittest
+import os
+import sys
+import re
+import logging
+import subprocess
+
+libdir = os.path.abspath(os.path.join(os.path.dirname(sys.argv[0]), '..'))
+sys.path.insert(0, libdir)
+
+import general
+from general import ColoredFormatter, get_arg_verbose, init_root_logger
+from general import NagiosPluginTestcase
+
+import nagios
+
+log = logging.getLogger(__name__)
+
+# Budget of the cumulative import time in milliseconds of the plugin
+# module of an entry point, the best of some imports is taken
+IMPORT_BUDGETS = {
+    'check_procs': 150,
+    'check_iotop': 150,
+    'check_io_pressure': 150,
+    'check_ib_port': 150,
+    'check_uname': 150,
+    'check_ppd_instance': 150,
+    'check_vcb_instance': 150,
+    'check_smart_state': 150,
+    'check_megaraid_bbu': 150,
+    'check_megaraid_hs': 150,
+    'check_megaraid_ld': 150,
+    'check_megaraid_pd': 150,
+    'check_softwareraid': 150,
+    'check_lvm_vg': 150,
+    'check_dcmanager_api': 250,
+    'check_pb_consistence_storage': 250,
+    'check_pb_storage_exports': 250,
+    'check_ipoib': 250,
+}
+
+# Entry points in bin/ named other than their plugin module
+ENTRY_POINTS = {
+    'check_ipoib': ('check_IPoIB.py', ),
+    'check_megaraid_bbu': ('check_lsi_megaraid_bbu', ),
+    'check_megaraid_hs': ('check_lsi_megaraid_hs', ),
+    'check_megaraid_ld': ('check_lsi_megaraid_ld', ),
+    'check_megaraid_pd': ('check_lsi_megaraid_pd', ),
+    'check_lvm_vg': ('check_vg_free', 'check_vg_state'),
+}
+IMPORT_TRIES = 3
+
+# Modules, which may not be imported only by importing a plugin module
+LAZY_MODULES = ('pprint', 'debian', 'dcmanagerclient', 'sqlite3')
+
+RE_IMPORT_TIME = re.compile(r'^import time:\s+\d+\s+\|\s+(\d+)\s+\|\s+(\S+)\s*$')
+RE_PLUGIN_IMPORT = re.compile(r'^\s*(?:from|import)\s+nagios\.plugins\.(\w+)', re.MULTILINE)
+
+
+#==============================================================================
+class TestImportTime(NagiosPluginTestcase):
+
+    #--------------------------------------------------------------------------
+    def setUp(self):
+
+        if sys.version_info < (3, 7):
+            self.skipTest("Python %d.%d has no '-X importtime'." % sys.version_info[:2])
+
+    #--------------------------------------------------------------------------
+    def import_module(self, modname):
+        """
+        Imports the given module in a new interpreter and gives back
+        the cumulative import time of the module in milliseconds and
+        a list of the lazily loaded modules, which were imported.
+        """
+
+        code = (
+            "import sys, %s\n"
+            "print(' '.join(m for m in %r if m in sys.modules))\n") % (
+            modname, LAZY_MODULES)
+        cmd = [sys.executable, '-X', 'importtime', '-c', code]
+        proc = subprocess.Popen(
+            cmd, cwd=libdir, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            universal_newlines=True)
+        (stdoutdata, stderrdata) = proc.communicate()
+        if proc.returncode:
+            if 'No module named' in stderrdata:
+                self.skipTest("Dependencies of %s are missing: %s" % (
+                    modname, stderrdata.strip().splitlines()[-1]))
+            self.fail("Importing %s failed: %s" % (modname, stderrdata))
+
+        import_time = None
+        for line in stderrdata.splitlines():
+            match = RE_IMPORT_TIME.match(line)
+            if match and match.group(2) == modname:
+                import_time = int(match.group(1)) / 1000.0
+        self.assertIsNotNone(import_time, "No import time of %s found." % (modname))
+
+        return (import_time, stdoutdata.split())
+
+    #--------------------------------------------------------------------------
+    def check_entry_point(self, name):
+
+        modname = 'nagios.plugins.' + name
+        budget = IMPORT_BUDGETS[name]
+        times = []
+        for i in range(IMPORT_TRIES):
+            (import_time, loaded) = self.import_module(modname)
+            self.assertEqual(
+                loaded, [], "%s imports %s on module load." % (modname, ', '.join(loaded)))
+            times.append(import_time)
+
+        log.debug("Import times of %s: %s ms.", modname, ', '.join(
+            '%.1f' % (t) for t in times))
+        self.assertLessEqual(
+            min(times), budget, "Importing %s takes %.1f ms, the budget is %d ms." % (
+                modname, min(times), budget))
+
+    #--------------------------------------------------------------------------
+    def test_import_time(self):
+
+        log.info("Testing the import time of the plugin modules.")
+
+        for name in sorted(IMPORT_BUDGETS.keys()):
+            for entry_point in ENTRY_POINTS.get(name, (name, )):
+                self.assertTrue(
+                    os.path.exists(os.path.join(libdir, 'bin', entry_point)),
+                    "Entry point bin/%s of %s not found." % (entry_point, name))
+            try:
+                self.check_entry_point(name)
+            except unittest.SkipTest as e:
+                log.info("Skipping %s: %s", name, e)
+
+    #--------------------------------------------------------------------------
+    def test_budgets(self):
+
+        log.info("Testing, that every entry point in bin/ has an import budget.")
+
+        bindir = os.path.join(libdir, 'bin')
+        for entry_point in sorted(os.listdir(bindir)):
+            filename = os.path.join(bindir, entry_point)
+            if not os.path.isfile(filename):
+                continue
+            with open(filename, 'rb') as fh:
+                content = fh.read().decode('utf-8', 'replace')
+            for name in RE_PLUGIN_IMPORT.findall(content):
+                self.assertIn(
+                    name, IMPORT_BUDGETS, "No import budget of %s used by bin/%s." % (
+                        name, entry_point))
+                self.assertIn(entry_point, ENTRY_POINTS.get(name, (name, )))
+
+#==============================================================================
+
+if __name__ == '__main__':
+
+    verbose = get_arg_verbose()
+    if verbose is None:
+        verbose = 0
+    init_root_logger(verbose)
+
+    log.info("Starting tests ...")
+
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+
+    suite.addTest(TestImportTime('test_import_time', verbose))
+    suite.addTest(TestImportTime('test_budgets', verbose))
+
+    runner = unittest.TextTestRunner(verbosity = verbose)
+
+    result = runner.run(suite)
+
+#==============================================================================
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
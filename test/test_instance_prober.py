@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+@author: Frank Brehm
+@contact: frank.brehm@profitbricks.com
+@organization: Profitbricks GmbH
+@copyright: © 2010 - 2016 by Profitbricks GmbH
+@license: GPL3
+@summary: test script (and module) for unit tests on the concurrent
+          prober of the PPD and VCB instances
+'''
+
+import unittest
+import os
+import sys
+import logging
+import socket
+import threading
+import time
+import re
+
+libdir = os.path.abspath(os.path.join(os.path.dirname(sys.argv[0]), '..'))
+sys.path.insert(0, libdir)
+
+import general
+from general import ColoredFormatter, get_arg_verbose, init_root_logger
+from general import NagiosPluginTestcase
+
+import nagios
+
+from nagios.plugins.socket_transport import SocketTransportError
+from nagios.plugins.socket_transport import SocketConnectTimeoutError
+from nagios.plugins.socket_transport import NoListeningError
+from nagios.plugins.instance_prober import InstanceProber
+from nagios.plugins.instance_prober import passive_check_result
+
+log = logging.getLogger(__name__)
+
+re_end_of_data = re.compile(r'^\s*end_of_data\s*=\s*true', re.MULTILINE)
+
+
+#==============================================================================
+class FakeDaemon(object):
+    """
+    A listening TCP socket answering every request in its own thread
+    by the given callback.
+    """
+
+    def __init__(self, handler):
+
+        self.handler = handler
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(64)
+        self.port = self.sock.getsockname()[1]
+        self.requests = []
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def serve(self):
+
+        while True:
+            try:
+                (conn, addr) = self.sock.accept()
+            except socket.error:
+                return
+            t = threading.Thread(target=self.handle, args=(conn, ))
+            t.daemon = True
+            t.start()
+
+    def handle(self, conn):
+
+        try:
+            request = conn.recv(4096)
+            self.requests.append(request)
+            self.handler(conn)
+        except socket.error:
+            pass
+        finally:
+            conn.close()
+
+    def close(self):
+
+        self.sock.close()
+
+
+#==============================================================================
+class TestInstanceProber(NagiosPluginTestcase):
+
+    #--------------------------------------------------------------------------
+    def setUp(self):
+
+        self.daemons = []
+
+    #--------------------------------------------------------------------------
+    def tearDown(self):
+
+        for daemon in self.daemons:
+            daemon.close()
+
+    #--------------------------------------------------------------------------
+    def start_daemon(self, handler):
+
+        daemon = FakeDaemon(handler)
+        self.daemons.append(daemon)
+        return daemon
+
+    #--------------------------------------------------------------------------
+    def free_port(self):
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        return port
+
+    #--------------------------------------------------------------------------
+    def test_passive_result(self):
+
+        log.info("Testing formatting of passive check results.")
+
+        cmd = passive_check_result('pserver1', 'VCB', 2, 'Error:\nbla', timestamp=1234.5)
+        self.assertEqual(cmd, '[1234] PROCESS_SERVICE_CHECK_RESULT;pserver1;VCB;2;Error: bla')
+
+    #--------------------------------------------------------------------------
+    def test_replies(self):
+
+        log.info("Testing replies of some daemons.")
+
+        def reply_and_close(conn):
+            conn.sendall(b'1,5,0,PPD Version [0.9.48]')
+
+        def reply_in_chunks(conn):
+            conn.sendall(b'2,3,0,progress\n')
+            time.sleep(0.1)
+            conn.sendall(b'2,5,0,VCB_VERSION=8.6.29\nend_of_data=true\n')
+            time.sleep(5)
+
+        def close_only(conn):
+            pass
+
+        closing = self.start_daemon(reply_and_close)
+        chunked = self.start_daemon(reply_in_chunks)
+        empty = self.start_daemon(close_only)
+        refused = self.free_port()
+
+        def is_complete(data):
+            return bool(re_end_of_data.search(data))
+
+        prober = InstanceProber(2, idle_interval=1, is_complete=is_complete)
+        begin = time.time()
+        probes = prober.run([
+            ('127.0.0.1', closing.port),
+            ('127.0.0.1', chunked.port),
+            ('127.0.0.1', empty.port),
+            ('127.0.0.1', refused),
+            ('not-existing.invalid', refused),
+        ], '<pjd/>')
+        duration = time.time() - begin
+        if self.verbose > 2:
+            log.debug("Got probes: %r", [x.as_dict() for x in probes])
+
+        self.assertEqual(len(probes), 5)
+        self.assertEqual(probes[0].result, '1,5,0,PPD Version [0.9.48]')
+        self.assertIsNone(probes[0].error)
+        self.assertEqual(closing.requests, [b'<pjd/>'])
+
+        self.assertEqual(
+            probes[1].result, '2,3,0,progress\n2,5,0,VCB_VERSION=8.6.29\nend_of_data=true\n')
+        self.assertIsNone(probes[1].error)
+
+        self.assertIsNone(probes[2].result)
+        self.assertIsInstance(probes[2].error, SocketTransportError)
+
+        self.assertIsNone(probes[3].result)
+        self.assertIsInstance(probes[3].error, NoListeningError)
+        self.assertIsInstance(probes[4].error, NoListeningError)
+
+        # the complete reply must not wait for the idle interval or the timeout
+        self.assertLess(duration, 1)
+
+    #--------------------------------------------------------------------------
+    def test_timeouts(self):
+
+        log.info("Testing deadlines of the requests.")
+
+        def silent(conn):
+            time.sleep(5)
+
+        def idle(conn):
+            conn.sendall(b'1,5,0,PPD Version [0.9.48]')
+            time.sleep(5)
+
+        silent_daemon = self.start_daemon(silent)
+        idle_daemon = self.start_daemon(idle)
+
+        prober = InstanceProber(1, idle_interval=0.2)
+        begin = time.time()
+        probes = prober.run([
+            ('127.0.0.1', silent_daemon.port),
+            ('127.0.0.1', idle_daemon.port),
+        ], '<pjd/>')
+        duration = time.time() - begin
+
+        self.assertIsInstance(probes[0].error, SocketTransportError)
+        self.assertNotIsInstance(probes[0].error, SocketConnectTimeoutError)
+        self.assertIn('Timeout', str(probes[0].error))
+        self.assertEqual(probes[1].result, '1,5,0,PPD Version [0.9.48]')
+        self.assertLess(duration, 2)
+
+    #--------------------------------------------------------------------------
+    def test_concurrency(self):
+
+        log.info("Testing many concurrent requests.")
+
+        def slow(conn):
+            time.sleep(0.3)
+            conn.sendall(b'1,5,0,PPD Version [0.9.48]')
+
+        daemon = self.start_daemon(slow)
+
+        prober = InstanceProber(5, concurrency=20, idle_interval=0.1)
+        begin = time.time()
+        probes = prober.run([('127.0.0.1', daemon.port)] * 40, '<pjd/>')
+        duration = time.time() - begin
+
+        self.assertEqual(len(probes), 40)
+        for probe in probes:
+            self.assertIsNone(probe.error)
+            self.assertEqual(probe.result, '1,5,0,PPD Version [0.9.48]')
+        # two rounds of 20 requests instead of 40 sequential ones
+        self.assertLess(duration, 3)
+
+        log.debug("Testing canceling of the requests.")
+        prober = InstanceProber(5, should_stop=lambda: True)
+        probes = prober.run([('127.0.0.1', daemon.port)] * 3, '<pjd/>')
+        for probe in probes:
+            self.assertIsInstance(probe.error, SocketTransportError)
+
+#==============================================================================
+
+if __name__ == '__main__':
+
+    verbose = get_arg_verbose()
+    if verbose is None:
+        verbose = 0
+    init_root_logger(verbose)
+
+    log.info("Starting tests ...")
+
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+
+    suite.addTest(TestInstanceProber('test_passive_result', verbose))
+    suite.addTest(TestInstanceProber('test_replies', verbose))
+    suite.addTest(TestInstanceProber('test_timeouts', verbose))
+    suite.addTest(TestInstanceProber('test_concurrency', verbose))
+
+    runner = unittest.TextTestRunner(verbosity = verbose)
+
+    result = runner.run(suite)
+
+#==============================================================================
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+@author: Frank Brehm
+@contact: frank.brehm@profitbricks.com
+@organization: Profitbricks GmbH
+@copyright: © 2010 - 2016 by Profitbricks GmbH
+@license: GPL3
+@summary: test script (and module) for unit tests on the check of the
+          I/O pressure of the system and of the cgroups
+'''
+
+import unittest
+import os
+import sys
+import logging
+import tempfile
+import shutil
+
+libdir = os.path.abspath(os.path.join(os.path.dirname(sys.argv[0]), '..'))
+sys.path.insert(0, libdir)
+
+import general
+from general import ColoredFormatter, get_arg_verbose, init_root_logger
+from general import NagiosPluginTestcase
+
+import nagios
+
+from nagios.plugins.io_pressure import parse_pressure
+from nagios.plugins.io_pressure import parse_io_stat
+from nagios.plugins.io_pressure import read_cgroups
+
+from nagios.plugins.check_io_pressure import CheckIoPressurePlugin
+from nagios.plugins.check_io_pressure import stall_percent
+
+log = logging.getLogger(__name__)
+
+PRESSURE = """\
+some avg10=1.50 avg60=2.25 avg300=0.10 total=123456789
+full avg10=0.50 avg60=1.00 avg300=0.05 total=23456789
+"""
+
+IO_STAT = """\
+8:0 rbytes=4096 wbytes=8192 rios=1 wios=2 dbytes=0 dios=0
+8:16 rbytes=1024 wbytes=0 rios=1 wios=0 dbytes=0 dios=0
+"""
+
+
+#==============================================================================
+class TestIoPressure(NagiosPluginTestcase):
+
+    #--------------------------------------------------------------------------
+    def setUp(self):
+
+        self.tmp_dir = tempfile.mkdtemp()
+
+    #--------------------------------------------------------------------------
+    def tearDown(self):
+
+        shutil.rmtree(self.tmp_dir)
+
+    #--------------------------------------------------------------------------
+    def write(self, path, content):
+
+        filename = os.path.join(self.tmp_dir, path)
+        if not os.path.isdir(os.path.dirname(filename)):
+            os.makedirs(os.path.dirname(filename))
+        with open(filename, 'w') as fh:
+            fh.write(content)
+
+    #--------------------------------------------------------------------------
+    def test_parse(self):
+
+        log.info("Testing parsing of PSI and io.stat files.")
+
+        pressure = parse_pressure(PRESSURE)
+        self.assertEqual(pressure['some']['avg60'], 2.25)
+        self.assertEqual(pressure['some']['total'], 123456789)
+        self.assertEqual(pressure['full']['total'], 23456789)
+
+        io = parse_io_stat(IO_STAT)
+        self.assertEqual(sorted(io.keys()), ['8:0', '8:16'])
+        self.assertEqual(io['8:0']['wbytes'], 8192)
+
+        self.assertEqual(stall_percent(0, 500000, 10.0), 5.0)
+        self.assertEqual(stall_percent(10, 5, 10.0), None)
+
+    #--------------------------------------------------------------------------
+    def test_read_cgroups(self):
+
+        log.info("Testing reading of the cgroup hierarchy.")
+
+        self.write('io.pressure', PRESSURE)
+        self.write('system.slice/io.pressure', PRESSURE)
+        self.write('system.slice/io.stat', IO_STAT)
+        self.write('system.slice/ssh.service/io.stat', IO_STAT)
+        self.write('system.slice/ssh.service/deep/io.stat', IO_STAT)
+        self.write('empty.slice/cgroup.procs', '')
+
+        cgroups = read_cgroups(self.tmp_dir, max_depth=2)
+        self.assertEqual(
+            sorted(cgroups.keys()), ['/', '/system.slice', '/system.slice/ssh.service'])
+        self.assertEqual(cgroups['/system.slice']['depth'], 1)
+        self.assertEqual(cgroups['/system.slice']['io']['8:16']['rbytes'], 1024)
+        self.assertEqual(cgroups['/system.slice/ssh.service']['pressure'], None)
+
+    #--------------------------------------------------------------------------
+    def test_eval_rates(self):
+
+        log.info("Testing evaluation of the rates since the previous run.")
+
+        self.write('system.slice/io.pressure', PRESSURE)
+        self.write('system.slice/io.stat', IO_STAT)
+        self.write('user.slice/io.pressure', PRESSURE)
+        self.write('user.slice/io.stat', IO_STAT)
+
+        plugin = CheckIoPressurePlugin()
+        plugin.cgroup_root = self.tmp_dir
+        pressure = parse_pressure(PRESSURE)
+        cgroups = read_cgroups(self.tmp_dir)
+        samples = plugin.get_samples(pressure, cgroups)
+        self.assertEqual(samples['device:8:0'][1]['rbytes'], 8192)
+
+        # without a previous sample the averages of the kernel are used
+        plugin.eval_rates(pressure, cgroups, samples, {})
+        self.assertEqual(plugin.interval, None)
+        self.assertEqual(plugin.pressure, {'some': 2.25, 'full': 1.0})
+        self.assertEqual(plugin.cgroups[0]['some'], 2.25)
+        self.assertEqual(plugin.cgroups[0]['rbytes'], None)
+
+        previous = {}
+        for (key, (timestamp, counters)) in samples.items():
+            old_counters = dict((name, value // 2) for (name, value) in counters.items())
+            previous[key] = (timestamp - 1000.0, old_counters)
+        previous['cgroup:/user.slice'][1]['some'] = samples['cgroup:/user.slice'][1]['some']
+
+        plugin.eval_rates(pressure, cgroups, samples, previous)
+        self.assertAlmostEqual(plugin.interval, 1000.0)
+        self.assertAlmostEqual(plugin.pressure['some'], 6.1728395)
+        self.assertAlmostEqual(plugin.pressure['full'], 1.1728395)
+        self.assertEqual(
+            [x['name'] for x in plugin.cgroups], ['system.slice', 'user.slice'])
+        self.assertEqual(plugin.cgroups[1]['some'], 0.0)
+        self.assertAlmostEqual(plugin.cgroups[0]['wbytes'], (8192 - 4096) / 1000.0)
+        self.assertEqual(len(plugin.devices), 2)
+        self.assertAlmostEqual(plugin.devices[0]['rbytes'], 8192 / 2 / 1000.0)
+
+        log.debug("Testing the performance data of the devices.")
+        plugin.devices[1]['wbytes'] = None
+        plugin.add_device_perfdata()
+        self.assertEqual(
+            [(x.label, x.value, x.uom) for x in plugin.perfdata], [
+                ('dev_%s_read_bps' % (plugin.devices[0]['name']), 4, ''),
+                ('dev_%s_write_bps' % (plugin.devices[0]['name']), 8, ''),
+                ('dev_%s_read_bps' % (plugin.devices[1]['name']), 1, ''),
+            ])
+
+    #--------------------------------------------------------------------------
+    def test_leaf_cgroups(self):
+
+        log.info("Testing the top cgroups without their parents.")
+
+        self.write('io.pressure', PRESSURE)
+        self.write('system.slice/io.pressure', PRESSURE)
+        self.write('system.slice/io.stat', IO_STAT)
+        self.write('system.slice/cron.service/io.pressure', PRESSURE)
+        self.write('system.slice/ssh.service/io.pressure', PRESSURE)
+        self.write('system.slice/ssh.service/io.stat', IO_STAT)
+        self.write('user.slice/io.pressure', PRESSURE)
+
+        plugin = CheckIoPressurePlugin()
+        pressure = parse_pressure(PRESSURE)
+
+        cgroups = read_cgroups(self.tmp_dir, max_depth=2)
+        samples = plugin.get_samples(pressure, cgroups)
+        plugin.eval_rates(pressure, cgroups, samples, {})
+        self.assertEqual(
+            sorted(x['name'] for x in plugin.cgroups),
+            ['system.slice/cron.service', 'system.slice/ssh.service', 'user.slice'])
+
+        # the devices are summed up over the top level cgroups only
+        self.assertEqual(samples['device:8:0'][1]['rbytes'], 4096)
+
+        cgroups = read_cgroups(self.tmp_dir, max_depth=1)
+        samples = plugin.get_samples(pressure, cgroups)
+        plugin.eval_rates(pressure, cgroups, samples, {})
+        self.assertEqual(
+            sorted(x['name'] for x in plugin.cgroups), ['system.slice', 'user.slice'])
+
+#==============================================================================
+
+if __name__ == '__main__':
+
+    verbose = get_arg_verbose()
+    if verbose is None:
+        verbose = 0
+    init_root_logger(verbose)
+
+    log.info("Starting tests ...")
+
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+
+    suite.addTest(TestIoPressure('test_parse', verbose))
+    suite.addTest(TestIoPressure('test_read_cgroups', verbose))
+    suite.addTest(TestIoPressure('test_eval_rates', verbose))
+    suite.addTest(TestIoPressure('test_leaf_cgroups', verbose))
+
+    runner = unittest.TextTestRunner(verbosity = verbose)
+
+    result = runner.run(suite)
+
+#==============================================================================
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
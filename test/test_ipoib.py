@@ -0,0 +1,491 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+@author: Frank Brehm
+@contact: frank.brehm@profitbricks.com
+@organization: Profitbricks GmbH
+@copyright: © 2010 - 2016 by Profitbricks GmbH
+@license: GPL3
+@summary: test script (and module) for unit tests on the topology cache,
+          the evaluation of the bird output and the ping sweep of check_IPoIB
+'''
+
+import unittest
+import os
+import sys
+import logging
+import tempfile
+import shutil
+import socket
+import json
+import time
+import subprocess
+
+libdir = os.path.abspath(os.path.join(os.path.dirname(sys.argv[0]), '..'))
+sys.path.insert(0, libdir)
+
+import general
+from general import ColoredFormatter, get_arg_verbose, init_root_logger
+from general import NagiosPluginTestcase
+from general import NeedConfig
+
+import nagios
+
+from nagios import FakeExitError
+
+from nagios.plugin.extended import ExtNagiosPluginError
+
+import nagios.plugins.check_ipoib
+
+from nagios.plugins.check_ipoib import TopologyCacheError
+from nagios.plugins.check_ipoib import read_topology_cache
+from nagios.plugins.check_ipoib import write_topology_cache
+from nagios.plugins.check_ipoib import parse_bird_protocols_all
+from nagios.plugins.check_ipoib import parse_bird_protocol_details
+from nagios.plugins.check_ipoib import map_legacy_options
+from nagios.plugins.check_ipoib import CheckIPoIBPlugin
+
+from nagios.plugins.ping_sweep import PingSweep
+
+log = logging.getLogger(__name__)
+
+# pserver1 is reachable on both fabrics, pserver2 only on ib0 via IPv6
+# and on ib1 only via IPv4, the gateway on its BGP neighbor address
+FAKE_PING = """\
+#!/bin/sh
+case "$6" in
+    pserver1-ib*|pserver2-ib0.*|fc57::1|10.1.0.2)
+        exit 0
+        ;;
+esac
+exit 1
+"""
+
+TOPOLOGY = {
+    'hostname': 'pserver1',
+    'cluster': 'cluster1',
+    'state': 'UP',
+    'pservers': [
+        {'name': 'pserver1', 'state': 'UP', 'ip': '10.1.0.1'},
+        {'name': 'pserver2', 'state': 'UP', 'ip': '10.1.0.2'},
+        {'name': 'pserver3', 'state': 'DOWN', 'ip': '10.1.0.3'},
+    ],
+    'gateways': [
+        {'name': 'gw1', 'state': 'UP', 'ip_addr': '10.1.0.249'},
+    ],
+}
+
+BGP1_DETAILS = """\
+BIRD 1.4.5 ready.
+name     proto    table    state  since       info
+bgp1     BGP      master   up     2016-01-12  Established
+  Description:    gateway-fc57:1:0:1:0:11:2:1 (gw1701)
+  Preference:     100
+  BGP state:          Established
+    Neighbor address: fc57:1:0:1:0:11:2:1
+    Neighbor AS:      64512
+    Neighbor ID:      10.1.171.249
+"""
+
+BGP_NEIGHBORS = {
+    'gw1': {
+        'BGP state': 'Established',
+        'Neighbor address': 'fc57::1',
+        'Neighbor ID': '10.1.0.249',
+    },
+}
+
+
+#==============================================================================
+class StubIPoIBPlugin(CheckIPoIBPlugin):
+    """
+    The plugin with a given topology instead of querying the DcManager
+    and given BGP neighbors instead of calling birdc6.
+    """
+
+    def __init__(self, topology=None, bgp_neighbors=None):
+
+        self.topology = topology
+        self.bgp_neighbors = bgp_neighbors
+        self.queries = 0
+        super(StubIPoIBPlugin, self).__init__()
+
+    def _query_topology(self, hostname):
+
+        self.queries += 1
+        if self.topology is None:
+            raise ExtNagiosPluginError("DcManager not available.")
+        return dict(self.topology, hostname=hostname, timestamp=time.time())
+
+    def get_bgp_neighbors(self, domain):
+
+        return self.bgp_neighbors
+
+
+#==============================================================================
+class TestTopologyCache(NeedConfig):
+
+    #--------------------------------------------------------------------------
+    def setUp(self):
+
+        super(TestTopologyCache, self).setUp()
+        self.tmp_dir = tempfile.mkdtemp(prefix='ipoib_')
+        self.cache_file = os.path.join(self.tmp_dir, 'ipoib_topology.json')
+
+    #--------------------------------------------------------------------------
+    def tearDown(self):
+
+        shutil.rmtree(self.tmp_dir)
+        super(TestTopologyCache, self).tearDown()
+
+    #--------------------------------------------------------------------------
+    def get_topology(self, age=0):
+
+        return dict(TOPOLOGY, timestamp=(time.time() - age))
+
+    #--------------------------------------------------------------------------
+    def get_plugin(self, topology=None, ttl=900):
+
+        plugin = StubIPoIBPlugin(topology)
+        plugin._cache_file = self.cache_file
+        plugin._cache_ttl = ttl
+        return plugin
+
+    #--------------------------------------------------------------------------
+    def test_read_write(self):
+
+        log.info("Testing reading and writing of the topology cache.")
+
+        self.assertIsNone(read_topology_cache(self.cache_file, 'pserver1'))
+
+        topology = self.get_topology()
+        write_topology_cache(self.cache_file, topology)
+        self.assertEqual(read_topology_cache(self.cache_file, 'pserver1'), topology)
+
+        log.debug("Testing a cache of another host.")
+        self.assertIsNone(read_topology_cache(self.cache_file, 'pserver2'))
+
+        log.debug("Testing an incomplete cache.")
+        topology = self.get_topology()
+        del topology['gateways']
+        write_topology_cache(self.cache_file, topology)
+        self.assertIsNone(read_topology_cache(self.cache_file, 'pserver1'))
+
+        log.debug("Testing a corrupted cache.")
+        with open(self.cache_file, 'w') as fh:
+            fh.write('{"hostname": "pserver1", ')
+        self.assertIsNone(read_topology_cache(self.cache_file, 'pserver1'))
+
+        with open(self.cache_file, 'w') as fh:
+            json.dump(['pserver1'], fh)
+        self.assertIsNone(read_topology_cache(self.cache_file, 'pserver1'))
+
+    #--------------------------------------------------------------------------
+    def test_atomic_write(self):
+
+        log.info("Testing the atomic writing of the topology cache.")
+
+        topology = self.get_topology()
+        write_topology_cache(self.cache_file, topology)
+        self.assertEqual(os.listdir(self.tmp_dir), ['ipoib_topology.json'])
+
+        log.debug("Testing a topology, which can't be written as JSON.")
+        with self.assertRaises(TopologyCacheError) as cm:
+            write_topology_cache(self.cache_file, dict(topology, state=object()))
+        log.debug("Got error: %s", cm.exception)
+        self.assertEqual(os.listdir(self.tmp_dir), ['ipoib_topology.json'])
+        self.assertEqual(read_topology_cache(self.cache_file, 'pserver1'), topology)
+
+        log.debug("Testing a not existing directory.")
+        with self.assertRaises(TopologyCacheError) as cm:
+            write_topology_cache(os.path.join(self.tmp_dir, 'bla', 'blub.json'), topology)
+        log.debug("Got error: %s", cm.exception)
+        self.assertEqual(os.listdir(self.tmp_dir), ['ipoib_topology.json'])
+
+    #--------------------------------------------------------------------------
+    def test_ttl(self):
+
+        log.info("Testing the time to live of the topology cache.")
+
+        log.debug("Testing a query without a cache.")
+        plugin = self.get_plugin(TOPOLOGY)
+        topology = plugin.get_topology('pserver1')
+        self.assertEqual(plugin.queries, 1)
+        self.assertEqual(topology['cluster'], 'cluster1')
+        self.assertEqual(read_topology_cache(self.cache_file, 'pserver1'), topology)
+
+        log.debug("Testing a valid cache.")
+        plugin = self.get_plugin(TOPOLOGY)
+        self.assertEqual(plugin.get_topology('pserver1'), topology)
+        self.assertEqual(plugin.queries, 0)
+
+        log.debug("Testing an expired cache.")
+        write_topology_cache(self.cache_file, self.get_topology(age=1000))
+        plugin = self.get_plugin(TOPOLOGY)
+        topology = plugin.get_topology('pserver1')
+        self.assertEqual(plugin.queries, 1)
+        self.assertLess(time.time() - topology['timestamp'], 60)
+        cached = read_topology_cache(self.cache_file, 'pserver1')
+        self.assertEqual(cached['timestamp'], topology['timestamp'])
+
+        log.debug("Testing disabled caching.")
+        write_topology_cache(self.cache_file, self.get_topology(age=1000))
+        plugin = self.get_plugin(TOPOLOGY, ttl=0)
+        topology = plugin.get_topology('pserver1')
+        self.assertEqual(plugin.queries, 1)
+        cached = read_topology_cache(self.cache_file, 'pserver1')
+        self.assertNotEqual(cached['timestamp'], topology['timestamp'])
+
+    #--------------------------------------------------------------------------
+    def test_outdated_cache(self):
+
+        log.info("Testing the fallback to an outdated topology cache.")
+
+        outdated = self.get_topology(age=86400)
+        write_topology_cache(self.cache_file, outdated)
+        plugin = self.get_plugin(None)
+        self.assertEqual(plugin.get_topology('pserver1'), outdated)
+        self.assertEqual(plugin.queries, 1)
+        self.assertEqual(read_topology_cache(self.cache_file, 'pserver1'), outdated)
+
+        log.debug("Testing a failed query without a cache.")
+        os.remove(self.cache_file)
+        plugin = self.get_plugin(None)
+        with self.assertRaises(FakeExitError) as cm:
+            plugin.get_topology('pserver1')
+        log.debug("Got exit: %s", cm.exception)
+        self.assertEqual(cm.exception.exit_value, nagios.state.unknown)
+        self.assertIn("DcManager not available.", cm.exception.msg)
+
+
+#==============================================================================
+class TestBirdOutput(NagiosPluginTestcase):
+
+    #--------------------------------------------------------------------------
+    def setUp(self):
+
+        bdir = os.path.realpath(os.path.dirname(sys.argv[0]))
+        self.fixture_dir = os.path.join(bdir, 'bird')
+        if not os.path.isdir(self.fixture_dir):
+            raise RuntimeError("Directory %r doesn't exists." % (self.fixture_dir))
+
+    #--------------------------------------------------------------------------
+    def get_fixture(self, name):
+
+        fname = os.path.join(self.fixture_dir, name)
+        if self.verbose > 2:
+            log.debug("Reading fixture %r ...", fname)
+        with open(fname) as fh:
+            return fh.read()
+
+    #--------------------------------------------------------------------------
+    def test_protocols_all(self):
+
+        log.info("Testing evaluation of the state of all protocols of bird.")
+
+        protocols = parse_bird_protocols_all(self.get_fixture('protocols_all.txt'))
+        if self.verbose > 2:
+            log.debug("Got protocols: %r", protocols)
+
+        # only numbered BGP protocols
+        self.assertEqual(sorted(protocols.keys()), ['bgp1', 'bgp2', 'bgp3', 'bgp4'])
+
+        self.assertEqual(protocols['bgp1'], {
+            'Description': 'gateway-fc57:1:0:1:0:11:2:1 (gw1701)',
+            'BGP state': 'Established',
+            'Neighbor address': 'fc57:1:0:1:0:11:2:1',
+            'Neighbor ID': '10.1.171.249',
+        })
+
+        log.debug("Testing a protocol in state down without a neighbor ID.")
+        self.assertEqual(protocols['bgp2']['BGP state'], 'Active')
+        self.assertEqual(protocols['bgp2']['Neighbor address'], 'fc57:1:0:1:0:11:2:2')
+        self.assertNotIn('Neighbor ID', protocols['bgp2'])
+
+        log.debug("Testing a protocol without any details.")
+        self.assertEqual(protocols['bgp3'], {})
+
+        log.debug("Testing a protocol without a hostname in its description.")
+        self.assertEqual(protocols['bgp4']['Description'], 'gateway without hostname')
+        self.assertEqual(protocols['bgp4']['Neighbor ID'], '10.1.171.251')
+
+        self.assertEqual(parse_bird_protocols_all(''), {})
+        self.assertEqual(parse_bird_protocols_all('BIRD 1.4.5 ready.\n'), {})
+
+    #--------------------------------------------------------------------------
+    def test_protocol_details(self):
+
+        log.info("Testing evaluation of the details of a single protocol of bird.")
+
+        details = parse_bird_protocol_details(BGP1_DETAILS)
+        self.assertEqual(details, {
+            'Description': 'gateway-fc57:1:0:1:0:11:2:1 (gw1701)',
+            'BGP state': 'Established',
+            'Neighbor address': 'fc57:1:0:1:0:11:2:1',
+            'Neighbor ID': '10.1.171.249',
+        })
+
+        log.debug("Testing missing fields.")
+        output = "  BGP state:          Connect\n    Neighbor AS:      64512\n"
+        self.assertEqual(parse_bird_protocol_details(output), {'BGP state': 'Connect'})
+        self.assertEqual(parse_bird_protocol_details(''), {})
+        self.assertEqual(parse_bird_protocol_details('bgp1 BGP master down\n'), {})
+
+    #--------------------------------------------------------------------------
+    def test_legacy_options(self):
+
+        log.info("Testing the mapping of options of former versions of check_IPoIB.")
+
+        args = [
+            '-v', '--url', 'http://dcmanager.example.com/dc/api',
+            '--auth-token=/etc/dcmanager.conf', '--url-bla', '-C', '10']
+        self.assertEqual(map_legacy_options(args), [
+            '-v', '--api-url', 'http://dcmanager.example.com/dc/api',
+            '--extra-config-file=/etc/dcmanager.conf', '--url-bla', '-C', '10'])
+        self.assertEqual(map_legacy_options([]), [])
+
+        log.debug("Testing the legacy options with the script bin/check_IPoIB.py.")
+        bdir = os.path.realpath(os.path.dirname(sys.argv[0]))
+        script = os.path.join(os.path.dirname(bdir), 'bin', 'check_IPoIB.py')
+        # the options are accepted, if the plugin fails on the concurrency
+        cmd = [
+            sys.executable, script, '--url', 'http://dcmanager.example.com/dc/api',
+            '--auth-token=/etc/dcmanager.conf', '-C', '0']
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        output = proc.communicate()[0].decode('utf-8')
+        log.debug("Got output: %r", output)
+        self.assertEqual(proc.returncode, nagios.state.unknown)
+        self.assertIn("The concurrency must be at least 1.", output)
+
+#==============================================================================
+class TestIPoIBSweep(NeedConfig):
+
+    #--------------------------------------------------------------------------
+    def setUp(self):
+
+        super(TestIPoIBSweep, self).setUp()
+        self.tmp_dir = tempfile.mkdtemp(prefix='ipoib_')
+
+        fake_ping = os.path.join(self.tmp_dir, 'ping')
+        with open(fake_ping, 'w') as fh:
+            fh.write(FAKE_PING)
+        os.chmod(fake_ping, 0o755)
+
+        self.sweeps = []
+        test = self
+
+        # ping commands instead of ICMP sockets
+        class FakePingSweep(PingSweep):
+
+            def __init__(self, **kwargs):
+                kwargs.update(
+                    deadline=0, use_sockets=False, ping6_cmd=fake_ping, ping_cmd=fake_ping)
+                super(FakePingSweep, self).__init__(**kwargs)
+                test.sweeps.append(self)
+
+        self.old_ping_sweep = nagios.plugins.check_ipoib.PingSweep
+        nagios.plugins.check_ipoib.PingSweep = FakePingSweep
+        self.old_getfqdn = socket.getfqdn
+        socket.getfqdn = lambda name=None: 'pserver1.example.com'
+
+    #--------------------------------------------------------------------------
+    def tearDown(self):
+
+        socket.getfqdn = self.old_getfqdn
+        nagios.plugins.check_ipoib.PingSweep = self.old_ping_sweep
+        shutil.rmtree(self.tmp_dir)
+        super(TestIPoIBSweep, self).tearDown()
+
+    #--------------------------------------------------------------------------
+    def run_plugin(self, topology, bgp_neighbors, concurrency=None):
+
+        plugin = StubIPoIBPlugin(topology, bgp_neighbors)
+        plugin._cache_ttl = 0
+        plugin._concurrency = concurrency
+        with self.assertRaises(FakeExitError) as cm:
+            plugin.run()
+        log.debug("Got exit: %s", cm.exception)
+
+        return (plugin, cm.exception)
+
+    #--------------------------------------------------------------------------
+    def test_sweep(self):
+
+        log.info("Testing the ping sweep over all hosts of the cluster.")
+
+        (plugin, result) = self.run_plugin(TOPOLOGY, BGP_NEIGHBORS, concurrency=2)
+        self.assertEqual(self.sweeps[0].concurrency, 2)
+        self.assertEqual(result.exit_value, nagios.state.critical)
+        self.assertIn("1/6 hosts are not reachable (pserver2-ib1)", result.msg)
+        self.assertIn("INFO: 1/6 hosts are down in dcmanager (pserver3)", result.msg)
+
+        perfdata = dict((pdata.label, pdata.value) for pdata in plugin.perfdata)
+        self.assertEqual(perfdata['hosts'], 5)
+        self.assertEqual(perfdata['reached'], 80.0)
+        self.assertEqual(perfdata['failures_ib0'], 0)
+        self.assertEqual(perfdata['failures_ib1'], 1)
+        self.assertEqual(perfdata['failures_gw'], 0)
+
+        log.debug("Testing all hosts being reachable.")
+        topology = dict(TOPOLOGY, pservers=TOPOLOGY['pservers'][:1])
+        (plugin, result) = self.run_plugin(topology, BGP_NEIGHBORS)
+        self.assertEqual(result.exit_value, nagios.state.ok)
+        self.assertIn(
+            "3/3 hosts in cluster cluster1 are reachable (gw1, pserver1-ib0, pserver1-ib1)",
+            result.msg)
+
+    #--------------------------------------------------------------------------
+    def test_bgp_state(self):
+
+        log.info("Testing the BGP state of the gateways.")
+
+        topology = dict(TOPOLOGY, pservers=TOPOLOGY['pservers'][:1])
+        bgp_neighbors = {
+            'gw1': {
+                'BGP state': 'Active',
+                'Neighbor address': 'fc57::1',
+                'Neighbor ID': '10.1.0.250',
+            },
+        }
+        (plugin, result) = self.run_plugin(topology, bgp_neighbors)
+        self.assertEqual(result.exit_value, nagios.state.critical)
+        self.assertIn("1/1 hosts in bird setup have no established BGP state (gw1)", result.msg)
+        self.assertIn("IPv4 address differs for 1/1 hosts", result.msg)
+
+        log.debug("Testing a gateway without a BGP neighbor.")
+        (plugin, result) = self.run_plugin(topology, {})
+        self.assertEqual(result.exit_value, nagios.state.ok)
+        self.assertIn("INFO: 1 hosts not found in bird setup (gw1)", result.msg)
+        self.assertEqual(len(self.sweeps[-1].results['reached']), 2)
+
+#==============================================================================
+
+if __name__ == '__main__':
+
+    verbose = get_arg_verbose()
+    if verbose is None:
+        verbose = 0
+    init_root_logger(verbose)
+
+    log.info("Starting tests ...")
+
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+
+    suite.addTest(TestTopologyCache('test_read_write', verbose))
+    suite.addTest(TestTopologyCache('test_atomic_write', verbose))
+    suite.addTest(TestTopologyCache('test_ttl', verbose))
+    suite.addTest(TestTopologyCache('test_outdated_cache', verbose))
+    suite.addTest(TestBirdOutput('test_protocols_all', verbose))
+    suite.addTest(TestBirdOutput('test_protocol_details', verbose))
+    suite.addTest(TestBirdOutput('test_legacy_options', verbose))
+    suite.addTest(TestIPoIBSweep('test_sweep', verbose))
+    suite.addTest(TestIPoIBSweep('test_bgp_state', verbose))
+
+    runner = unittest.TextTestRunner(verbosity = verbose)
+
+    result = runner.run(suite)
+
+#==============================================================================
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+@author: Frank Brehm
+@contact: frank.brehm@profitbricks.com
+@organization: Profitbricks GmbH
+@copyright: © 2010 - 2016 by Profitbricks GmbH
+@license: GPL3
+@summary: test script (and module) for unit tests on the cached guards
+          of log levels and the deferred formatting of log messages
+'''
+
+import unittest
+import os
+import sys
+import logging
+
+libdir = os.path.abspath(os.path.join(os.path.dirname(sys.argv[0]), '..'))
+sys.path.insert(0, libdir)
+
+import general
+from general import ColoredFormatter, get_arg_verbose, init_root_logger
+from general import NagiosPluginTestcase
+
+import nagios
+
+from nagios.common import pp
+
+from nagios.plugin.logguard import refresh_log_guards
+from nagios.plugin.logguard import LogGuard
+from nagios.plugin.logguard import LazyPP
+from nagios.plugin.logguard import LazyStr
+
+log = logging.getLogger(__name__)
+
+
+#==============================================================================
+class CountingRepr(object):
+
+    def __init__(self):
+        self.count = 0
+
+    def __repr__(self):
+        self.count += 1
+        return 'CountingRepr()'
+
+
+#==============================================================================
+class TestLogGuard(NagiosPluginTestcase):
+
+    #--------------------------------------------------------------------------
+    def setUp(self):
+
+        self.logger = logging.getLogger('test_logguard.guarded')
+        self.logger.setLevel(logging.WARNING)
+
+    #--------------------------------------------------------------------------
+    def tearDown(self):
+
+        self.logger.setLevel(logging.NOTSET)
+        refresh_log_guards()
+
+    #--------------------------------------------------------------------------
+    def test_guard(self):
+
+        log.info("Testing the cached guards of log levels.")
+
+        guard = LogGuard('test_logguard.guarded')
+        self.assertIs(guard.logger, self.logger)
+        self.assertFalse(guard.debug)
+        self.assertFalse(guard.info)
+        self.assertFalse(guard.verbose_debug(4, 2))
+
+        # the guard is cached until the next refresh
+        self.logger.setLevel(logging.DEBUG)
+        self.assertFalse(guard.debug)
+        refresh_log_guards()
+        self.assertTrue(guard.debug)
+        self.assertTrue(guard.info)
+        self.assertTrue(guard.verbose_debug(3, 2))
+        self.assertFalse(guard.verbose_debug(2, 2))
+
+        self.logger.setLevel(logging.INFO)
+        guard.refresh()
+        self.assertFalse(guard.debug)
+        self.assertTrue(guard.info)
+
+    #--------------------------------------------------------------------------
+    def test_lazy(self):
+
+        log.info("Testing the deferred formatting of log messages.")
+
+        value = {'a': [1, 2, 3], 'b': 'x' * 80}
+        self.assertEqual(str(LazyPP(value)), pp(value))
+        self.assertEqual(str(LazyStr(', '.join, ['a', 'b'])), 'a, b')
+
+        obj = CountingRepr()
+        self.logger.debug("Object: %s", LazyPP(obj))
+        self.logger.debug("Object: %s", LazyStr(repr, obj))
+        self.assertEqual(obj.count, 0)
+
+        record = self.logger.makeRecord(
+            self.logger.name, logging.DEBUG, __file__, 1, "Object: %s", (LazyPP(obj),), None)
+        self.assertEqual(record.getMessage(), 'Object: CountingRepr()')
+        self.assertEqual(obj.count, 1)
+
+#==============================================================================
+
+if __name__ == '__main__':
+
+    verbose = get_arg_verbose()
+    if verbose is None:
+        verbose = 0
+    init_root_logger(verbose)
+
+    log.info("Starting tests ...")
+
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+
+    suite.addTest(TestLogGuard('test_guard', verbose))
+    suite.addTest(TestLogGuard('test_lazy', verbose))
+
+    runner = unittest.TextTestRunner(verbosity = verbose)
+
+    result = runner.run(suite)
+
+#==============================================================================
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
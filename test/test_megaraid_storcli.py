@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+@author: Frank Brehm
+@contact: frank.brehm@profitbricks.com
+@organization: Profitbricks GmbH
+@copyright: © 2010 - 2016 by Profitbricks GmbH
+@license: GPL3
+@summary: test script (and module) for unit tests on evaluating the JSON
+          output of storcli for the MegaRaid plugins
+'''
+
+import unittest
+import os
+import sys
+import logging
+
+libdir = os.path.abspath(os.path.join(os.path.dirname(sys.argv[0]), '..'))
+sys.path.insert(0, libdir)
+
+import general
+from general import ColoredFormatter, get_arg_verbose, init_root_logger
+from general import NagiosPluginTestcase
+
+import nagios
+
+from nagios.plugins.check_megaraid import StorCliError
+from nagios.plugins.check_megaraid import storcli_response
+from nagios.plugins.check_megaraid import storcli_drives
+
+from nagios.plugins.check_megaraid_hs import storcli_hotspares
+from nagios.plugins.check_megaraid_ld import storcli_ld_info
+from nagios.plugins.check_megaraid_bbu import storcli_bbu_state
+
+log = logging.getLogger(__name__)
+
+#==============================================================================
+class TestStorCliOutput(NagiosPluginTestcase):
+
+    #--------------------------------------------------------------------------
+    def setUp(self):
+
+        bdir = os.path.realpath(os.path.dirname(sys.argv[0]))
+        self.fixture_dir = os.path.join(bdir, 'storcli')
+        if not os.path.isdir(self.fixture_dir):
+            raise RuntimeError("Directory %r doesn't exists." % (self.fixture_dir))
+
+    #--------------------------------------------------------------------------
+    def get_fixture(self, name):
+
+        fname = os.path.join(self.fixture_dir, name)
+        if self.verbose > 2:
+            log.debug("Reading fixture %r ...", fname)
+        with open(fname) as fh:
+            return fh.read()
+
+    #--------------------------------------------------------------------------
+    def test_response(self):
+
+        log.info("Testing extracting the response data of a controller.")
+
+        output = self.get_fixture('c0_show_all.json')
+        response = storcli_response(output, 0)
+        self.assertIn('PD LIST', response)
+        self.assertEqual(response['Basics']['Controller'], 0)
+
+        log.debug("Testing a not existing controller.")
+        with self.assertRaises(StorCliError) as cm:
+            storcli_response(output, 1)
+        log.debug("Got error: %s", cm.exception)
+
+        log.debug("Testing a failed command.")
+        output = self.get_fixture('c5_show_all_failure.json')
+        with self.assertRaises(StorCliError) as cm:
+            storcli_response(output, 5)
+        log.debug("Got error: %s", cm.exception)
+        self.assertIn('not found', str(cm.exception))
+
+        log.debug("Testing invalid output.")
+        with self.assertRaises(StorCliError):
+            storcli_response('Bla blub', 0)
+
+    #--------------------------------------------------------------------------
+    def test_drives(self):
+
+        log.info("Testing evaluation of the physical drives.")
+
+        output = self.get_fixture('c0_eall_sall_show_all.json')
+        drives = storcli_drives(storcli_response(output, 0))
+        if self.verbose > 2:
+            log.debug("Got drives: %r", drives)
+
+        self.assertEqual(
+            list(drives.keys()),
+            ['[252:0]', '[252:3]', '[252:4]', '[252:6]', '[252:7]'])
+
+        self.assertEqual(drives['[252:0]']['fw_state'], 'Online, Spun Up')
+        self.assertEqual(drives['[252:0]']['foreign_state'], 'None')
+        self.assertEqual(drives['[252:0]']['dev_id'], 7)
+        self.assertEqual(drives['[252:3]']['fw_state'], 'Rebuild')
+        self.assertEqual(drives['[252:3]']['other_errors'], 2)
+        self.assertEqual(drives['[252:4]']['media_errors'], 14)
+        self.assertEqual(drives['[252:4]']['predictive_failures'], 1)
+        self.assertEqual(drives['[252:6]']['fw_state'], 'Hotspare, Spun Down')
+        self.assertEqual(drives['[252:7]']['fw_state'], 'Unconfigured(good), Spun Up')
+        self.assertEqual(drives['[252:7]']['foreign_state'], 'Foreign')
+
+    #--------------------------------------------------------------------------
+    def test_hotspares(self):
+
+        log.info("Testing counting of hotspare drives.")
+
+        output = self.get_fixture('c0_show_all.json')
+        (drives_total, hotspares) = storcli_hotspares(storcli_response(output, 0))
+        self.assertEqual(drives_total, 7)
+        self.assertEqual(hotspares, 1)
+
+    #--------------------------------------------------------------------------
+    def test_ld_info(self):
+
+        log.info("Testing evaluation of a logical drive.")
+
+        output = self.get_fixture('c0_v1_show_all.json')
+        response = storcli_response(output, 0)
+        info = storcli_ld_info(response, 1)
+        if self.verbose > 2:
+            log.debug("Got LD info: %r", info)
+
+        self.assertEqual(info['raid_level'], 1)
+        self.assertEqual(info['span_depth'], 2)
+        self.assertEqual(info['pd_number'], 2)
+        self.assertEqual(info['size_val'], 5.457)
+        self.assertEqual(info['size_unit'], 'TB')
+        self.assertEqual(info['ld_state'], 'Degraded')
+        self.assertEqual(info['ld_cached'], 'No')
+        self.assertEqual(info['consist_percent'], 42)
+        self.assertIsNone(info['consist_min'])
+
+        self.assertIsNone(storcli_ld_info(response, 0))
+
+    #--------------------------------------------------------------------------
+    def test_bbu_state(self):
+
+        log.info("Testing evaluation of the BBU state.")
+
+        output = self.get_fixture('c0_bbu_show_all.json')
+        bbu = storcli_bbu_state(storcli_response(output, 0))
+        if self.verbose > 2:
+            log.debug("Got BBU state: %r", bbu)
+
+        self.assertEqual(bbu['batt_type'], 'iBBU08')
+        self.assertEqual(bbu['batt_state'], 'Optimal')
+        self.assertEqual(bbu['voltage'], 'ok')
+        self.assertEqual(bbu['temperature'], 'ok')
+        self.assertEqual(bbu['lc_state'], 'ok')
+        self.assertEqual(bbu['i2c_err'], 'no')
+        self.assertEqual(bbu['bbu_replace'], 'yes')
+        self.assertEqual(bbu['pack_fail'], 'no')
+
+#==============================================================================
+
+if __name__ == '__main__':
+
+    verbose = get_arg_verbose()
+    if verbose is None:
+        verbose = 0
+    init_root_logger(verbose)
+
+    log.info("Starting tests ...")
+
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+
+    suite.addTest(TestStorCliOutput('test_response', verbose))
+    suite.addTest(TestStorCliOutput('test_drives', verbose))
+    suite.addTest(TestStorCliOutput('test_hotspares', verbose))
+    suite.addTest(TestStorCliOutput('test_ld_info', verbose))
+    suite.addTest(TestStorCliOutput('test_bbu_state', verbose))
+
+    runner = unittest.TextTestRunner(verbosity = verbose)
+
+    result = runner.run(suite)
+
+#==============================================================================
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+@author: Frank Brehm
+@contact: frank.brehm@profitbricks.com
+@organization: Profitbricks GmbH
+@copyright: © 2010 - 2016 by Profitbricks GmbH
+@license: GPL3
+@summary: test script (and module) for unit tests on retrieving the volumes
+          of a storage server from the REST API by the ProfitBricks checks
+'''
+
+import unittest
+import os
+import sys
+import logging
+import tempfile
+import shutil
+import uuid
+
+libdir = os.path.abspath(os.path.join(os.path.dirname(sys.argv[0]), '..'))
+sys.path.insert(0, libdir)
+
+import general
+from general import ColoredFormatter, get_arg_verbose, init_root_logger
+from general import NeedConfig
+
+import nagios
+
+from nagios import FakeExitError
+
+from nagios.plugins.rest_session import TimedApiClient
+
+from nagios.plugins.check_pb_consistence_storage import ApiVolume
+from nagios.plugins.check_pb_consistence_storage import ApiSnapshot
+from nagios.plugins.check_pb_consistence_storage import CheckPbConsistenceStoragePlugin
+
+log = logging.getLogger(__name__)
+
+HOSTNAME = 'storage201'
+VOL_UUID = 'e7abbe07-3d3e-4468-9af4-1bfe8af418dc'
+VOL_GUID = '600144f0-0001-dc9b-0121-e09d11e3920c'
+
+
+#==============================================================================
+def storage_volume(i, hostname=HOSTNAME):
+
+    return {
+        'uuid': str(uuid.UUID(int=i)),
+        'size': 1024,
+        'replicated': True,
+        'replicas': [
+            {'guid': str(uuid.UUID(int=1000 + i)), 'storage_server': 'storage103',
+                'virtual_state': 'AVAILABLE'},
+            {'guid': str(uuid.UUID(int=2000 + i)), 'storage_server': hostname,
+                'virtual_state': 'AVAILABLE'},
+        ],
+    }
+
+
+#==============================================================================
+class StubClient(object):
+    """
+    A stand-in of the REST API client object of the DcManager client, which
+    gives back its lists as generators.
+    """
+
+    def __init__(self, lists):
+        self.url = 'http://localhost/api'
+        self.lists = lists
+        self.fetched = []
+
+    def __getattr__(self, name):
+
+        if name not in self.lists:
+            raise AttributeError(name)
+
+        def api_list(**params):
+            for record in self.lists[name]:
+                if isinstance(record, Exception):
+                    raise record
+                self.fetched.append((name, record))
+                yield record
+
+        return api_list
+
+
+#==============================================================================
+class TestPbChecks(NeedConfig):
+
+    #--------------------------------------------------------------------------
+    def setUp(self):
+
+        super(TestPbChecks, self).setUp()
+        self.tmp_dir = tempfile.mkdtemp()
+        lvm = os.path.join(self.tmp_dir, 'lvm')
+        with open(lvm, 'w') as fh:
+            fh.write('#!/bin/sh\nexit 0\n')
+        os.chmod(lvm, 0o755)
+        self.old_path = os.environ.get('PATH', '')
+        os.environ['PATH'] = self.tmp_dir + os.pathsep + self.old_path
+
+    #--------------------------------------------------------------------------
+    def tearDown(self):
+
+        os.environ['PATH'] = self.old_path
+        shutil.rmtree(self.tmp_dir)
+        super(TestPbChecks, self).tearDown()
+
+    #--------------------------------------------------------------------------
+    def get_plugin(self, plugin_class, lists):
+
+        plugin = plugin_class()
+        plugin._hostname = HOSTNAME
+        plugin.api = TimedApiClient(StubClient(lists), timings=plugin.timings)
+        return plugin
+
+    #--------------------------------------------------------------------------
+    def test_api_records(self):
+
+        log.info("Testing termination of the plugin on errors of the REST API.")
+
+        plugin = self.get_plugin(CheckPbConsistenceStoragePlugin, {
+            'vstorages': [storage_volume(1), RuntimeError("connection lost")],
+        })
+
+        records = plugin.iter_api_records('vstorages', pstorage=HOSTNAME)
+        self.assertEqual(next(records)['size'], 1024)
+        with self.assertRaises(FakeExitError) as cm:
+            next(records)
+        self.assertEqual(cm.exception.exit_value, nagios.state.unknown)
+        self.assertIn("RuntimeError: connection lost", cm.exception.msg)
+
+        log.debug("Testing errors of the caller, which are not caught.")
+        plugin = self.get_plugin(CheckPbConsistenceStoragePlugin, {
+            'vstorages': [storage_volume(1), storage_volume(2)],
+        })
+        records = plugin.iter_api_records('vstorages')
+        next(records)
+        self.assertRaises(ValueError, records.throw, ValueError("bla"))
+
+    #--------------------------------------------------------------------------
+    def test_consistence_storage(self):
+
+        log.info("Testing retrieving the volumes of CheckPbConsistenceStoragePlugin.")
+
+        bad_volume = storage_volume(3)
+        del bad_volume['size']
+        client_lists = {
+            'vstorages': [
+                storage_volume(1), storage_volume(2, 'storage999'), storage_volume(4)],
+            'vsnapshots': [{'guid': VOL_GUID, 'size': 2048, 'virtual_state': 'AVAILABLE'}],
+        }
+        plugin = self.get_plugin(CheckPbConsistenceStoragePlugin, client_lists)
+
+        volumes = plugin.iter_api_storage_volumes()
+        self.assertEqual(
+            next(volumes), ApiVolume(uuid.UUID(int=2001), True, 1028, 'available'))
+        # the volumes are retrieved one by one
+        self.assertEqual(len(plugin.api.client.fetched), 1)
+        self.assertEqual([x.guid for x in volumes], [uuid.UUID(int=2004)])
+        self.assertEqual(len(plugin.api.client.fetched), 3)
+
+        plugin.get_api_snapshot_volumes()
+        self.assertEqual(
+            plugin.api_snapshots, [ApiSnapshot(uuid.UUID(VOL_GUID), 2048, 'available')])
+
+        log.debug("Testing an invalid record, which is not an error of the API.")
+        client_lists['vstorages'] = [storage_volume(1), bad_volume]
+        plugin = self.get_plugin(CheckPbConsistenceStoragePlugin, client_lists)
+        self.assertRaises(KeyError, plugin.get_api_storage_volumes)
+
+        log.debug("Testing an error of the API.")
+        client_lists['vstorages'] = [storage_volume(1), IOError("connection reset")]
+        plugin = self.get_plugin(CheckPbConsistenceStoragePlugin, client_lists)
+        plugin.api._retries = 0
+        with self.assertRaises(FakeExitError) as cm:
+            plugin.get_api_storage_volumes()
+        self.assertIn("connection reset", cm.exception.msg)
+
+    #--------------------------------------------------------------------------
+    def test_storage_exports(self):
+
+        log.info("Testing retrieving the exports of CheckPbStorageExportsPlugin.")
+
+        try:
+            from nagios.plugins.check_pb_storage_exports import CheckPbStorageExportsPlugin
+        except ImportError as e:
+            self.skipTest("Dependencies of check_pb_storage_exports are missing: %s" % (e))
+
+        client_lists = {
+            'vstorages': [storage_volume(1), storage_volume(2)],
+            'vstorage_maps': [
+                {'pstorage_name': HOSTNAME, 'pserver_name': 'pserver117',
+                    'vstorage_uuid': str(uuid.UUID(int=1))},
+                {'pstorage_name': HOSTNAME, 'pserver_name': 'pserver999',
+                    'vstorage_uuid': str(uuid.UUID(int=2))},
+                {'pstorage_name': HOSTNAME, 'pserver_name': 'pserver117',
+                    'vstorage_uuid': VOL_UUID},
+            ],
+        }
+        plugin = self.get_plugin(CheckPbStorageExportsPlugin, client_lists)
+        plugin.valid_pservers = {'pserver117': True}
+        plugin.get_api_storage_exports()
+
+        self.assertEqual(len(plugin.storage_exports), 1)
+        export = plugin.storage_exports[0]
+        self.assertEqual(export['uuid'], uuid.UUID(int=1))
+        self.assertEqual(export['guid'], uuid.UUID(int=2001))
+        self.assertEqual(export['pserver'], 'pserver117')
+
+        log.debug("Testing an invalid mapping, which is not an error of the API.")
+        client_lists['vstorage_maps'] = [{'pstorage_name': HOSTNAME}]
+        plugin = self.get_plugin(CheckPbStorageExportsPlugin, client_lists)
+        self.assertRaises(KeyError, plugin.get_api_storage_exports)
+
+        log.debug("Testing an error of the API.")
+        client_lists['vstorage_maps'] = [RuntimeError("bla")]
+        plugin = self.get_plugin(CheckPbStorageExportsPlugin, client_lists)
+        with self.assertRaises(FakeExitError) as cm:
+            plugin.get_api_storage_exports()
+        self.assertIn("RuntimeError: bla", cm.exception.msg)
+
+#==============================================================================
+
+if __name__ == '__main__':
+
+    verbose = get_arg_verbose()
+    if verbose is None:
+        verbose = 0
+    init_root_logger(verbose)
+
+    log.info("Starting tests ...")
+
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+
+    suite.addTest(TestPbChecks('test_api_records', verbose))
+    suite.addTest(TestPbChecks('test_consistence_storage', verbose))
+    suite.addTest(TestPbChecks('test_storage_exports', verbose))
+
+    runner = unittest.TextTestRunner(verbosity = verbose)
+
+    result = runner.run(suite)
+
+#==============================================================================
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
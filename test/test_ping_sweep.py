@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+@author: Frank Brehm
+@contact: frank.brehm@profitbricks.com
+@organization: Profitbricks GmbH
+@copyright: © 2010 - 2016 by Profitbricks GmbH
+@license: GPL3
+@summary: test script (and module) for unit tests on the ping engine
+          of check_IPoIB
+'''
+
+import unittest
+import os
+import sys
+import logging
+import tempfile
+import shutil
+import socket
+import struct
+
+libdir = os.path.abspath(os.path.join(os.path.dirname(sys.argv[0]), '..'))
+sys.path.insert(0, libdir)
+
+import general
+from general import ColoredFormatter, get_arg_verbose, init_root_logger
+from general import NagiosPluginTestcase
+
+import nagios
+
+from nagios.plugins.ping_sweep import icmp_checksum
+from nagios.plugins.ping_sweep import echo_request
+from nagios.plugins.ping_sweep import parse_echo_reply
+from nagios.plugins.ping_sweep import open_icmp_socket
+from nagios.plugins.ping_sweep import PingSweep
+
+log = logging.getLogger(__name__)
+
+FAKE_PING = """\
+#!/bin/sh
+case "$6" in
+    ::1|127.0.0.1)
+        exit 0
+        ;;
+    sleep)
+        exec sleep 10
+        ;;
+esac
+exit 1
+"""
+
+#==============================================================================
+class TestPingSweep(NagiosPluginTestcase):
+
+    #--------------------------------------------------------------------------
+    def setUp(self):
+
+        self.tmp_dir = tempfile.mkdtemp(prefix='ping_sweep_')
+
+    #--------------------------------------------------------------------------
+    def tearDown(self):
+
+        shutil.rmtree(self.tmp_dir)
+
+    #--------------------------------------------------------------------------
+    def get_hosts(self):
+
+        return [
+            {'hostalias': 'ps1-ib0', 'ping_address': '::1', 'ipv4_address': '127.0.0.1'},
+            {'hostalias': 'ps2-ib0', 'ping_address': '100::1', 'ipv4_address': '127.0.0.1'},
+            {'hostalias': 'ps3-ib0', 'ping_address': '100::2', 'ipv4_address': '0.0.0.1'},
+        ]
+
+    #--------------------------------------------------------------------------
+    def test_packets(self):
+
+        log.info("Testing building and parsing of ICMP packets.")
+
+        self.assertEqual(icmp_checksum(b'\x08\x00\x00\x00\x12\x34\x00\x01'), 0xe5ca)
+        self.assertEqual(icmp_checksum(b'\x08\x00\x00\x00\x12\x34\x00'), 0xe5cb)
+
+        packet = echo_request(socket.AF_INET, 0x1234, 1)
+        self.assertEqual(packet, b'\x08\x00\xe5\xca\x12\x34\x00\x01')
+        self.assertEqual(icmp_checksum(packet), 0)
+
+        packet = echo_request(socket.AF_INET6, 0x1234, 2)
+        self.assertEqual(packet, b'\x80\x00\x00\x00\x12\x34\x00\x02')
+
+        reply = b'\x00\x00\x00\x00\x12\x34\x00\x03'
+        ip_header = struct.pack('!B', 0x45) + b'\x00' * 19
+        self.assertEqual(parse_echo_reply(socket.AF_INET, ip_header + reply), (0x1234, 3))
+        self.assertEqual(parse_echo_reply(socket.AF_INET, reply, raw=False), (0x1234, 3))
+        self.assertIsNone(parse_echo_reply(socket.AF_INET, reply))
+        self.assertIsNone(parse_echo_reply(socket.AF_INET, ip_header + packet))
+
+        reply = b'\x81\x00\x00\x00\x12\x34\x00\x04'
+        self.assertEqual(parse_echo_reply(socket.AF_INET6, reply), (0x1234, 4))
+        self.assertIsNone(parse_echo_reply(socket.AF_INET6, packet))
+        self.assertIsNone(parse_echo_reply(socket.AF_INET6, reply[:6]))
+
+    #--------------------------------------------------------------------------
+    def test_commands(self):
+
+        log.info("Testing pinging by ping commands.")
+
+        fake_ping = os.path.join(self.tmp_dir, 'ping')
+        with open(fake_ping, 'w') as fh:
+            fh.write(FAKE_PING)
+        os.chmod(fake_ping, 0o755)
+
+        hosts = self.get_hosts()
+        hosts.append({'hostalias': 'gw1', 'ping_address': 'sleep', 'ipv4_address': 'sleep'})
+
+        sweep = PingSweep(
+            deadline=0, use_sockets=False, concurrency=2, ping6_cmd=fake_ping,
+            ping_cmd=fake_ping)
+        results = sweep.run(hosts)
+        if self.verbose > 2:
+            log.debug("Got results: %r", results)
+
+        self.assertEqual(results['reached'], set(['ps1-ib0']))
+        self.assertEqual(results['notreached'], set(['ps2-ib0']))
+        self.assertEqual(results['offline'], set(['ps3-ib0', 'gw1']))
+        self.assertEqual(results['failed'], set())
+        self.assertLess(sweep.duration, 5)
+
+        log.debug("Testing a not existing ping command.")
+        sweep = PingSweep(
+            use_sockets=False, ping6_cmd=os.path.join(self.tmp_dir, 'bla'))
+        results = sweep.run(self.get_hosts())
+        self.assertEqual(results['failed'], set(['ps1-ib0', 'ps2-ib0', 'ps3-ib0']))
+
+    #--------------------------------------------------------------------------
+    def test_sockets(self):
+
+        log.info("Testing pinging by ICMP sockets.")
+
+        for family in (socket.AF_INET6, socket.AF_INET):
+            (sock, raw) = open_icmp_socket(family)
+            if sock is None:
+                self.skipTest("No ICMP sockets available.")
+            sock.close()
+
+        sweep = PingSweep(deadline=1)
+        results = sweep.run(self.get_hosts())
+        if self.verbose > 2:
+            log.debug("Got results: %r", results)
+
+        self.assertEqual(results['reached'], set(['ps1-ib0']))
+        self.assertEqual(results['notreached'], set(['ps2-ib0']))
+        self.assertEqual(results['offline'], set(['ps3-ib0']))
+        self.assertEqual(results['failed'], set())
+
+#==============================================================================
+
+if __name__ == '__main__':
+
+    verbose = get_arg_verbose()
+    if verbose is None:
+        verbose = 0
+    init_root_logger(verbose)
+
+    log.info("Starting tests ...")
+
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+
+    suite.addTest(TestPingSweep('test_packets', verbose))
+    suite.addTest(TestPingSweep('test_commands', verbose))
+    suite.addTest(TestPingSweep('test_sockets', verbose))
+
+    runner = unittest.TextTestRunner(verbosity = verbose)
+
+    result = runner.run(suite)
+
+#==============================================================================
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
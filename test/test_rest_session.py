@@ -0,0 +1,377 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+@author: Frank Brehm
+@contact: frank.brehm@profitbricks.com
+@organization: Profitbricks GmbH
+@copyright: © 2010 - 2016 by Profitbricks GmbH
+@license: GPL3
+@summary: test script (and module) for unit tests on the REST session
+          with keep-alive connections
+'''
+
+import unittest
+import os
+import sys
+import logging
+import socket
+import errno
+import threading
+import time
+import gzip
+import json
+import io
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+libdir = os.path.abspath(os.path.join(os.path.dirname(sys.argv[0]), '..'))
+sys.path.insert(0, libdir)
+
+import general
+from general import ColoredFormatter, get_arg_verbose, init_root_logger
+from general import NagiosPluginTestcase
+
+import nagios
+
+from nagios.plugins.rest_session import RestSessionError
+from nagios.plugins.rest_session import RestHttpError
+from nagios.plugins.rest_session import RestSession
+from nagios.plugins.rest_session import JsonArrayDecoder
+from nagios.plugins.rest_session import TimedApiClient
+from nagios.plugins.rest_session import is_connection_error
+from nagios.plugins.rest_session import clear_connection_pool
+
+log = logging.getLogger(__name__)
+
+
+#==============================================================================
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+
+
+#==============================================================================
+class ApiHandler(BaseHTTPRequestHandler):
+    """
+    A stand-in of the REST API answering with JSON.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        log.debug("HTTP server: " + format, *args)
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.server.connections += 1
+
+    def reply(self, status, body, gzipped=False):
+
+        headers = {'Content-Type': 'application/json'}
+        if gzipped:
+            buf = io.BytesIO()
+            f = gzip.GzipFile(fileobj=buf, mode='wb')
+            f.write(body)
+            f.close()
+            body = buf.getvalue()
+            headers['Content-Encoding'] = 'gzip'
+        self.send_response(status)
+        for (name, value) in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+
+        self.server.requests.append(self.path)
+        gzipped = 'gzip' in self.headers.get('Accept-Encoding', '')
+
+        if self.path.startswith('/api/clusters'):
+            body = json.dumps([{'name': 'cluster%d' % (i)} for i in range(500)])
+            self.reply(200, body.encode('utf-8'), gzipped)
+        elif self.path == '/api/object':
+            self.reply(200, b'{"clusters": []}', gzipped)
+        elif self.path == '/api/close':
+            # closes the connection without announcing it
+            self.reply(200, b'{"ok": true}')
+            self.close_connection = True
+        elif self.path == '/api/flaky':
+            self.server.flaky += 1
+            if self.server.flaky < 3:
+                self.reply(503, b'{}')
+            else:
+                self.reply(200, b'{"ok": true}')
+        elif self.path == '/api/drop':
+            self.server.dropped += 1
+            if self.server.dropped < 2:
+                self.close_connection = True
+                self.wfile.flush()
+                self.connection.shutdown(socket.SHUT_RDWR)
+            else:
+                self.reply(200, b'{"ok": true}')
+        else:
+            self.reply(404, b'{"error": "not found"}')
+
+
+#==============================================================================
+class FakeHttpError(IOError):
+    """
+    Like requests.HTTPError an IOError without an error number.
+    """
+
+    pass
+
+
+#==============================================================================
+class FakeApi(object):
+
+    def __init__(self):
+        self.url = 'http://localhost/api'
+        self.failures = 1
+        self.calls = []
+
+    def fail_once(self):
+        if self.failures:
+            self.failures -= 1
+            raise socket.error(errno.ECONNRESET, "Connection reset by peer")
+
+    def clusters(self):
+        self.calls.append('clusters')
+        self.fail_once()
+        return ['cluster1']
+
+    def pservers(self):
+        self.calls.append('pservers')
+        raise FakeHttpError("503 Server Error: Service Unavailable")
+
+    def create_vstorage(self, name):
+        self.calls.append('create_vstorage')
+        self.fail_once()
+        return {'name': name}
+
+
+#==============================================================================
+class TestRestSession(NagiosPluginTestcase):
+
+    #--------------------------------------------------------------------------
+    def setUp(self):
+
+        clear_connection_pool()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), ApiHandler)
+        self.server.requests = []
+        self.server.connections = 0
+        self.server.flaky = 0
+        self.server.dropped = 0
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = 'http://127.0.0.1:%d/api' % (self.server.server_address[1])
+
+    #--------------------------------------------------------------------------
+    def tearDown(self):
+
+        clear_connection_pool()
+        self.server.shutdown()
+        self.server.server_close()
+
+    #--------------------------------------------------------------------------
+    def test_keep_alive(self):
+
+        log.info("Testing reusing of connections.")
+
+        session = RestSession(self.url, timeout=5)
+        for i in range(3):
+            response = session.get('clusters', params={'limit': 500})
+            self.assertEqual(response.status, 200)
+            self.assertEqual(len(response.json()), 500)
+            if i:
+                self.assertNotIn('connect', response.timings)
+            else:
+                self.assertIn('connect', response.timings)
+            self.assertIn('firstbyte', response.timings)
+            self.assertIn('total', response.timings)
+
+        # a further session to the same server shares the pool
+        other = RestSession(self.url, timeout=5)
+        self.assertEqual(other.get_json('/clusters')[0], {'name': 'cluster0'})
+
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(self.server.requests[0], '/api/clusters?limit=500')
+        self.assertEqual(len(session.history), 3)
+
+    #--------------------------------------------------------------------------
+    def test_gzip(self):
+
+        log.info("Testing decompression of responses.")
+
+        session = RestSession(self.url, timeout=5)
+        response = session.get('clusters')
+        self.assertEqual(response.headers.get('content-encoding'), 'gzip')
+        self.assertEqual(response.json()[-1], {'name': 'cluster499'})
+
+        session = RestSession(self.url, timeout=5, headers={'Accept-Encoding': 'identity'})
+        response = session.get('clusters')
+        self.assertNotIn('content-encoding', response.headers)
+        self.assertEqual(len(response.json()), 500)
+
+    #--------------------------------------------------------------------------
+    def test_retries(self):
+
+        log.info("Testing repeating of failed requests.")
+
+        session = RestSession(self.url, timeout=5, retries=2, backoff=0.01)
+        response = session.get('flaky')
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.attempts, 3)
+
+        response = session.get('drop')
+        self.assertEqual(response.status, 200)
+
+        session = RestSession(self.url, timeout=5, retries=0)
+        self.assertRaises(RestHttpError, session.get_json, 'not-existing')
+
+        log.debug("Testing a not listening server.")
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        session = RestSession('http://127.0.0.1:%d/' % (port), timeout=2, backoff=0.01)
+        self.assertRaises(RestSessionError, session.get, 'clusters')
+
+        self.assertRaises(RestSessionError, RestSession, 'ftp://127.0.0.1/')
+
+    #--------------------------------------------------------------------------
+    def test_stale_connection(self):
+
+        log.info("Testing a kept connection closed by the server.")
+
+        session = RestSession(self.url, timeout=5, retries=0)
+        self.assertEqual(session.get('close').status, 200)
+        time.sleep(0.1)
+
+        response = session.get('clusters')
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.attempts, 1)
+        self.assertIn('connect', response.timings)
+        self.assertEqual(self.server.connections, 2)
+
+    #--------------------------------------------------------------------------
+    def test_json_decoder(self):
+
+        log.info("Testing incremental decoding of JSON arrays.")
+
+        records = [{'guid': '600144f0-%04d' % (i), 'name': u'Grüße', 'size': i} for i in range(20)]
+        records += [12345, 1.5, -2e10, None, True, 'x', []]
+        data = json.dumps(records).encode('utf-8')
+        expected = json.loads(data.decode('utf-8'))
+
+        for size in (1, 3, 7, 100, len(data)):
+            decoder = JsonArrayDecoder()
+            result = []
+            for i in range(0, len(data), size):
+                result += decoder.feed(data[i:i + size])
+            result += decoder.close()
+            self.assertEqual(result, expected)
+            self.assertEqual(decoder.count, len(expected))
+
+        decoder = JsonArrayDecoder()
+        self.assertEqual(decoder.feed(b' [ ] '), [])
+        self.assertEqual(decoder.close(), [])
+
+        for data in (b'{}', b'[1,', b'[1 2]', b'[1] 2', b'[1.x]'):
+            decoder = JsonArrayDecoder()
+            self.assertRaises(RestSessionError, lambda: decoder.feed(data) + decoder.close())
+
+    #--------------------------------------------------------------------------
+    def test_stream(self):
+
+        log.info("Testing streaming of JSON arrays.")
+
+        session = RestSession(self.url, timeout=5)
+        for i in range(2):
+            records = session.iter_json('clusters')
+            names = [x['name'] for x in records]
+            self.assertEqual(len(names), 500)
+            self.assertEqual(names[-1], 'cluster499')
+        # the connection was given back into the pool after the body
+        self.assertEqual(self.server.connections, 1)
+        self.assertIn('total', session.history[-1][3])
+
+        # an aborted iteration closes the connection
+        records = session.iter_json('clusters')
+        self.assertEqual(next(records)['name'], 'cluster0')
+        records.close()
+        self.assertEqual(len(list(session.iter_json('clusters'))), 500)
+        self.assertEqual(self.server.connections, 2)
+
+        self.assertRaises(RestSessionError, list, session.iter_json('object'))
+        self.assertRaises(RestHttpError, session.iter_json, 'not-existing')
+
+    #--------------------------------------------------------------------------
+    def test_timed_client(self):
+
+        log.info("Testing measuring of API calls.")
+
+        api = TimedApiClient(FakeApi(), backoff=0.01)
+        self.assertEqual(api.url, 'http://localhost/api')
+        self.assertEqual(api.clusters(), ['cluster1'])
+        self.assertEqual(len(api.calls), 1)
+        self.assertEqual(api.calls[0][0], 'clusters')
+
+        api = TimedApiClient(FakeApi(), retries=0)
+        self.assertRaises(socket.error, api.clusters)
+
+        log.debug("Testing methods and errors, which are not repeated.")
+        fake_api = FakeApi()
+        api = TimedApiClient(fake_api, backoff=0.01)
+        self.assertRaises(socket.error, api.create_vstorage, 'bla')
+        self.assertEqual(fake_api.calls, ['create_vstorage'])
+        self.assertEqual(api.create_vstorage('bla'), {'name': 'bla'})
+
+        fake_api.calls = []
+        self.assertRaises(FakeHttpError, api.pservers)
+        self.assertEqual(fake_api.calls, ['pservers'])
+        self.assertEqual([x[0] for x in api.calls], [
+            'create_vstorage', 'create_vstorage', 'pservers'])
+
+        self.assertTrue(is_connection_error(socket.timeout("timed out")))
+        self.assertTrue(is_connection_error(socket.error(errno.ECONNREFUSED, "refused")))
+        self.assertFalse(is_connection_error(socket.error(errno.ENOENT, "not found")))
+        self.assertFalse(is_connection_error(FakeHttpError("404 Client Error")))
+        self.assertFalse(is_connection_error(ValueError("bla")))
+
+#==============================================================================
+
+if __name__ == '__main__':
+
+    verbose = get_arg_verbose()
+    if verbose is None:
+        verbose = 0
+    init_root_logger(verbose)
+
+    log.info("Starting tests ...")
+
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+
+    suite.addTest(TestRestSession('test_keep_alive', verbose))
+    suite.addTest(TestRestSession('test_gzip', verbose))
+    suite.addTest(TestRestSession('test_retries', verbose))
+    suite.addTest(TestRestSession('test_stale_connection', verbose))
+    suite.addTest(TestRestSession('test_json_decoder', verbose))
+    suite.addTest(TestRestSession('test_stream', verbose))
+    suite.addTest(TestRestSession('test_timed_client', verbose))
+
+    runner = unittest.TextTestRunner(verbosity = verbose)
+
+    result = runner.run(suite)
+
+#==============================================================================
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,703 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+@author: Frank Brehm
+@contact: frank.brehm@profitbricks.com
+@organization: Profitbricks GmbH
+@copyright: © 2010 - 2016 by Profitbricks GmbH
+@license: GPL3
+@summary: test script (and module) for unit tests on evaluating the text
+          and the JSON output of smartctl and on the SMART history
+'''
+
+import unittest
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import logging
+
+libdir = os.path.abspath(os.path.join(os.path.dirname(sys.argv[0]), '..'))
+sys.path.insert(0, libdir)
+
+import general
+from general import ColoredFormatter, get_arg_verbose, init_root_logger
+from general import NagiosPluginTestcase
+from general import NeedConfig
+
+import nagios
+
+from nagios import FakeExitError
+
+from nagios.plugins.check_smart_state import eval_smartctl_output
+from nagios.plugins.check_smart_state import eval_smartctl_json
+from nagios.plugins.check_smart_state import eval_nvme_smart_log
+from nagios.plugins.check_smart_state import nvme_critical_warnings
+from nagios.plugins.check_smart_state import get_nvme_controllers
+from nagios.plugins.check_smart_state import read_nvme_sysfs
+from nagios.plugins.check_smart_state import SmartctlError
+from nagios.plugins.check_smart_state import CheckSmartStatePlugin
+
+from nagios.plugins.smart_history import SmartHistoryError
+from nagios.plugins.smart_history import SmartHistory
+from nagios.plugins.smart_history import defect_rate
+
+log = logging.getLogger(__name__)
+
+FIXTURE_DIR = os.path.join(
+    os.path.realpath(os.path.dirname(sys.argv[0])), 'smartctl')
+
+#==============================================================================
+class CannedSmartStatePlugin(CheckSmartStatePlugin):
+    """
+    The plugin with canned smartctl outputs of the fixtures instead of
+    executing smartctl. The outputs are given by the device files as the
+    name of the fixture or as an exception to raise. A light query of the
+    text output ('-H -A') takes the fixture '<name>_light.txt', if existing.
+    """
+
+    def __init__(self, outputs):
+
+        self.outputs = outputs
+        self.smartctl_calls = []
+        super(CannedSmartStatePlugin, self).__init__()
+
+    def _get_devices_by_glob(self, pattern):
+
+        return sorted(self.outputs.keys())
+
+    def _smartctl_output(self, cmd_list, threaded=False):
+
+        self.smartctl_calls.append(cmd_list[1:])
+        output = self.outputs[cmd_list[-1]]
+        if isinstance(output, Exception):
+            raise output
+        if '--json' in cmd_list:
+            output += '.json'
+        elif '-A' in cmd_list and os.path.exists(
+                os.path.join(FIXTURE_DIR, output + '_light.txt')):
+            output += '_light.txt'
+        else:
+            output += '.txt'
+        with open(os.path.join(FIXTURE_DIR, output)) as fh:
+            return fh.read().strip()
+
+#==============================================================================
+class HangingSmartStatePlugin(CheckSmartStatePlugin):
+    """
+    The plugin executing a smartctl, which hangs, for the given device files.
+    It keeps the processes, which were killed after the timeout.
+    """
+
+    def __init__(self, devices):
+
+        self.glob_devices = devices
+        self.killed_cmds = []
+        super(HangingSmartStatePlugin, self).__init__()
+
+    def _get_devices_by_glob(self, pattern):
+
+        return self.glob_devices
+
+    def _kill_running_cmds(self):
+
+        self.killed_cmds = list(self._running_cmds)
+        super(HangingSmartStatePlugin, self)._kill_running_cmds()
+
+#==============================================================================
+class TestSmartctlOutput(NagiosPluginTestcase):
+
+    #--------------------------------------------------------------------------
+    def setUp(self):
+
+        bdir = os.path.realpath(os.path.dirname(sys.argv[0]))
+        self.fixture_dir = os.path.join(bdir, 'smartctl')
+        if not os.path.isdir(self.fixture_dir):
+            raise RuntimeError("Directory %r doesn't exists." % (self.fixture_dir))
+
+    #--------------------------------------------------------------------------
+    def get_fixture(self, name):
+
+        fname = os.path.join(self.fixture_dir, name)
+        if self.verbose > 2:
+            log.debug("Reading fixture %r ...", fname)
+        with open(fname) as fh:
+            return fh.read()
+
+    #--------------------------------------------------------------------------
+    def eval_both(self, name):
+
+        (is_sas_txt, data_txt, reason) = eval_smartctl_output(
+            self.get_fixture(name + '.txt'))
+        self.assertIsNone(reason)
+        (is_sas_json, data_json, reason) = eval_smartctl_json(
+            json.loads(self.get_fixture(name + '.json')))
+        self.assertIsNone(reason)
+        if self.verbose > 2:
+            log.debug("Got disk data from text output: %r", data_txt)
+            log.debug("Got disk data from JSON output: %r", data_json)
+
+        self.assertEqual(is_sas_txt, is_sas_json)
+        for key in (
+                'health_state', 'nr_grown_defects', 'temperature', 'hours_on', 'model',
+                'serial'):
+            self.assertEqual(data_txt[key], data_json[key], "Different values of %r." % (key))
+
+        return (is_sas_txt, data_txt, data_json)
+
+    #--------------------------------------------------------------------------
+    def test_sata(self):
+
+        log.info("Testing evaluation of the SMART data of a SATA disk.")
+
+        (is_sas, data_txt, data_json) = self.eval_both('sata')
+        self.assertFalse(is_sas)
+        self.assertEqual(data_txt['health_state'], 'PASSED')
+        self.assertEqual(data_txt['model'], 'ST2000NM0033-9ZM175')
+        self.assertEqual(data_txt['realloc_sectors'], 3)
+        self.assertEqual(data_txt['current_pending_sector'], 2)
+        self.assertEqual(data_txt['reported_uncorrect'], 1)
+        self.assertEqual(data_txt['nr_grown_defects'], 6)
+        self.assertEqual(data_txt['temperature'], 32)
+        self.assertEqual(data_txt['hours_on'], 30211)
+
+    #--------------------------------------------------------------------------
+    def test_sata_light(self):
+
+        log.info("Testing evaluation of the attribute table of 'smartctl -H -A'.")
+
+        (is_sas, data_full, reason) = eval_smartctl_output(self.get_fixture('sata.txt'))
+        (is_sas, data_light, reason) = eval_smartctl_output(
+            self.get_fixture('sata_light.txt'))
+        self.assertIsNone(reason)
+        self.assertFalse(is_sas)
+        for key in (
+                'health_state', 'realloc_sectors', 'current_pending_sector',
+                'reported_uncorrect', 'nr_grown_defects', 'temperature', 'hours_on'):
+            self.assertEqual(data_light[key], data_full[key], "Different values of %r." % (key))
+        self.assertEqual(data_light['nr_grown_defects'], 6)
+
+        # a prefailure attribute of the reported uncorrectable errors is ignored
+        output = self.get_fixture('sata_light.txt').replace(
+            '187 Reported_Uncorrect      0x0032   100   100   000    Old_age ',
+            '187 Reported_Uncorrect      0x0033   100   100   000    Pre-fail')
+        self.assertEqual(eval_smartctl_output(output)[1]['nr_grown_defects'], 5)
+
+    #--------------------------------------------------------------------------
+    def test_sas(self):
+
+        log.info("Testing evaluation of the SMART data of a SAS disk.")
+
+        (is_sas, data_txt, data_json) = self.eval_both('sas')
+        self.assertTrue(is_sas)
+        self.assertEqual(data_txt['health_state'], 'OK')
+        self.assertEqual(data_txt['model'], 'SEAGATE ST3000NM0023')
+        self.assertEqual(data_txt['serial'], data_json['serial'])
+        self.assertEqual(data_txt['nr_grown_defects'], 12)
+        self.assertEqual(data_txt['non_medium_errors'], 17)
+        self.assertEqual(data_txt['temperature'], 34)
+        self.assertEqual(data_txt['hours_on'], 25230)
+
+    #--------------------------------------------------------------------------
+    def test_nvme(self):
+
+        log.info("Testing evaluation of the SMART data of a NVMe disk.")
+
+        (is_sas, data_txt, data_json) = self.eval_both('nvme')
+        self.assertFalse(is_sas)
+        self.assertEqual(data_txt['model'], 'INTEL SSDPE2KX040T8')
+        self.assertEqual(data_txt['media_errors'], 0)
+        self.assertEqual(data_json['media_errors'], 0)
+        self.assertEqual(data_txt['temperature'], 35)
+        self.assertEqual(data_txt['hours_on'], 21913)
+        for data in (data_txt, data_json):
+            self.assertEqual(data['protocol'], 'NVMe')
+            self.assertEqual(data['critical_warning'], 0)
+            self.assertEqual(data['percentage_used'], 2)
+            self.assertEqual(data['available_spare'], 100)
+            self.assertEqual(data['available_spare_threshold'], 10)
+
+    #--------------------------------------------------------------------------
+    def test_nvme_smart_log(self):
+
+        log.info("Testing evaluation of the output of 'nvme smart-log'.")
+
+        data = json.loads(self.get_fixture('nvme_smart_log.json'))
+        (is_sas, disk_data, reason) = eval_nvme_smart_log(data)
+        if self.verbose > 2:
+            log.debug("Got disk data: %r", disk_data)
+
+        self.assertFalse(is_sas)
+        self.assertIsNone(reason)
+        self.assertEqual(disk_data['protocol'], 'NVMe')
+        self.assertEqual(disk_data['health_state'], 'FAILED')
+        self.assertEqual(disk_data['critical_warning'], 1)
+        self.assertEqual(disk_data['temperature'], 36)
+        self.assertEqual(disk_data['percentage_used'], 97)
+        self.assertEqual(disk_data['available_spare'], 8)
+        self.assertEqual(disk_data['available_spare_threshold'], 10)
+        self.assertEqual(disk_data['nr_grown_defects'], 3)
+        self.assertEqual(disk_data['hours_on'], 21913)
+
+        self.assertEqual(
+            nvme_critical_warnings(disk_data['critical_warning']),
+            ['available spare below threshold'])
+        self.assertEqual(
+            nvme_critical_warnings(0x0c),
+            ['reliability degraded', 'media in read only mode'])
+        self.assertEqual(nvme_critical_warnings(0), [])
+
+    #--------------------------------------------------------------------------
+    def test_nvme_sysfs(self):
+
+        log.info("Testing reading the information about NVMe controllers out of sysfs.")
+
+        tmp_dir = tempfile.mkdtemp(prefix='sys-class-nvme-')
+        try:
+            for ctrl in ('nvme10', 'nvme0', 'nvme1', 'nvme-subsys0'):
+                os.mkdir(os.path.join(tmp_dir, ctrl))
+            ctrl_dir = os.path.join(tmp_dir, 'nvme0')
+            os.mkdir(os.path.join(ctrl_dir, 'hwmon2'))
+            values = {
+                'state': 'live\n',
+                'model': 'INTEL SSDPE2KX040T8                     \n',
+                'serial': 'PHLJ000000AB4P0DGN  \n',
+                os.path.join('hwmon2', 'temp1_input'): '35850\n',
+            }
+            for (fname, value) in values.items():
+                with open(os.path.join(ctrl_dir, fname), 'w') as fh:
+                    fh.write(value)
+
+            self.assertEqual(get_nvme_controllers(tmp_dir), ['nvme0', 'nvme1', 'nvme10'])
+            info = read_nvme_sysfs(ctrl_dir)
+            if self.verbose > 2:
+                log.debug("Got info: %r", info)
+        finally:
+            shutil.rmtree(tmp_dir, True)
+
+        self.assertEqual(info['state'], 'live')
+        self.assertEqual(info['model'], 'INTEL SSDPE2KX040T8')
+        self.assertEqual(info['serial'], 'PHLJ000000AB4P0DGN')
+        self.assertIsNone(info['firmware_rev'])
+        self.assertEqual(info['temperature'], 35)
+
+    #--------------------------------------------------------------------------
+    def test_no_smart(self):
+
+        log.info("Testing evaluation of a disk without SMART support.")
+
+        output = ("smartctl 6.6 2016-05-31 r4324 [x86_64-linux-4.9.0-8-amd64]\n"
+                  "SMART support is: Unavailable - device lacks SMART capability.\n")
+        (is_sas, disk_data, reason) = eval_smartctl_output(output)
+        self.assertIsNone(disk_data)
+        self.assertIn('Unavailable', reason)
+
+        data = {'device': {'protocol': 'ATA'}, 'smart_support': {'available': False}}
+        (is_sas, disk_data, reason) = eval_smartctl_json(data)
+        self.assertIsNone(disk_data)
+        self.assertIn('Unavailable', reason)
+
+#==============================================================================
+class TestSmartHistory(NagiosPluginTestcase):
+
+    #--------------------------------------------------------------------------
+    def setUp(self):
+
+        self.tmp_dir = tempfile.mkdtemp(prefix='smart-history-')
+        self.history_file = os.path.join(self.tmp_dir, 'smart_history.db')
+
+    #--------------------------------------------------------------------------
+    def tearDown(self):
+
+        shutil.rmtree(self.tmp_dir, True)
+
+    #--------------------------------------------------------------------------
+    def disk_data(self, grown_defects, serial='Z1X0ABCD'):
+
+        return {
+            'health_state': 'PASSED',
+            'nr_grown_defects': grown_defects,
+            'temperature': 32,
+            'hours_on': 30211,
+            'model': 'ST2000NM0033-9ZM175',
+            'serial': serial,
+        }
+
+    #--------------------------------------------------------------------------
+    def test_records(self):
+
+        log.info("Testing recording and reading of the SMART history.")
+
+        now = time.time()
+        history = SmartHistory(self.history_file)
+        history.open()
+        history.add('/dev/sda', False, self.disk_data(2), full=True, timestamp=(now - 86400 * 3))
+        history.add('/dev/sda', False, self.disk_data(3), full=False, timestamp=(now - 86400))
+        history.add('/dev/sda', False, self.disk_data(4), full=True, timestamp=(now - 3600))
+        history.add('/dev/sdb', True, self.disk_data(0), full=False, timestamp=now)
+        history.close()
+
+        history = SmartHistory(self.history_file)
+        history.open()
+        last_full = history.last_full_records()
+        references = history.reference_records(now - 86400 * 2)
+        history.close()
+        if self.verbose > 2:
+            log.debug("Got last full records: %r", last_full)
+            log.debug("Got reference records: %r", references)
+
+        self.assertEqual(list(last_full.keys()), ['/dev/sda'])
+        self.assertEqual(last_full['/dev/sda']['grown_defects'], 4)
+        self.assertTrue(last_full['/dev/sda']['full'])
+        self.assertFalse(last_full['/dev/sda']['is_sas'])
+        self.assertEqual(last_full['/dev/sda']['serial'], 'Z1X0ABCD')
+
+        self.assertEqual(references['/dev/sda']['grown_defects'], 3)
+        self.assertEqual(references['/dev/sdb']['grown_defects'], 0)
+        self.assertTrue(references['/dev/sdb']['is_sas'])
+
+        rate = defect_rate(references['/dev/sda'], 5, now)
+        self.assertAlmostEqual(rate, 2.0)
+        self.assertIsNone(defect_rate(references['/dev/sdb'], 1, now))
+        self.assertIsNone(defect_rate(None, 1, now))
+
+    #--------------------------------------------------------------------------
+    def test_forget_and_retention(self):
+
+        log.info("Testing removing of records out of the SMART history.")
+
+        now = time.time()
+        history = SmartHistory(self.history_file, retention_days=30)
+        history.open()
+        history.add('/dev/sda', False, self.disk_data(1), timestamp=(now - 86400 * 31))
+        history.add('/dev/sdb', False, self.disk_data(1), timestamp=(now - 86400 * 31))
+        history.add('/dev/sdb', False, self.disk_data(2), timestamp=now)
+        history.add('/dev/sdc', False, self.disk_data(3), timestamp=now)
+        history.forget('/dev/sdc')
+        history.close()
+
+        history = SmartHistory(self.history_file)
+        history.open()
+        references = history.reference_records(0)
+        history.close()
+
+        self.assertEqual(list(references.keys()), ['/dev/sdb'])
+        self.assertEqual(references['/dev/sdb']['grown_defects'], 2)
+
+    #--------------------------------------------------------------------------
+    def test_open_error(self):
+
+        log.info("Testing opening a SMART history in a not existing directory.")
+
+        history = SmartHistory(os.path.join(self.tmp_dir, 'blub', 'smart_history.db'))
+        with self.assertRaises(SmartHistoryError) as cm:
+            history.open()
+        log.debug("Got error: %s", cm.exception)
+
+#==============================================================================
+class TestSmartStatePlugin(NeedConfig):
+
+    #--------------------------------------------------------------------------
+    def setUp(self):
+
+        super(TestSmartStatePlugin, self).setUp()
+
+        # a dummy smartctl, so the plugin finds one, it is never executed
+        self.tmp_dir = tempfile.mkdtemp(prefix='smart-state-')
+        smartctl = os.path.join(self.tmp_dir, 'smartctl')
+        with open(smartctl, 'w') as fh:
+            fh.write("#!/bin/sh\nexit 1\n")
+        os.chmod(smartctl, 0o755)
+        self.old_path = os.environ['PATH']
+        os.environ['PATH'] = self.tmp_dir + os.pathsep + self.old_path
+
+    #--------------------------------------------------------------------------
+    def tearDown(self):
+
+        os.environ['PATH'] = self.old_path
+        shutil.rmtree(self.tmp_dir, True)
+        super(TestSmartStatePlugin, self).tearDown()
+
+    #--------------------------------------------------------------------------
+    def run_plugin(self, outputs, args):
+
+        plugin = CannedSmartStatePlugin(outputs)
+        plugin.parse_args(['-G', 'sd*'] + args)
+        with self.assertRaises(FakeExitError) as cm:
+            plugin.check_multiple_disks()
+        log.debug("Got exit: %s", cm.exception)
+
+        return (plugin, cm.exception)
+
+    #--------------------------------------------------------------------------
+    def test_multiple_disks(self):
+
+        log.info("Testing the aggregated state of multiple disks.")
+
+        outputs = {
+            '/dev/sda': 'sata',
+            '/dev/sdb': 'sas',
+            '/dev/sdc': 'sata',
+        }
+        (plugin, result) = self.run_plugin(outputs, ['-w', '8', '-c', '20', '-P', '2'])
+        self.assertEqual(result.exit_value, nagios.state.warning)
+        self.assertIn("SMART state of 3 drives: 2 ok, 1 warning.", result.msg)
+        self.assertIn("Drive /dev/sdb: 12 elements in list of grown defects.", result.msg)
+        self.assertEqual(len(plugin.smartctl_calls), 3)
+
+        perfdata = dict((pdata.label, pdata.value) for pdata in plugin.perfdata)
+        self.assertEqual(perfdata['sda_gd_list'], 6)
+        self.assertEqual(perfdata['sdb_gd_list'], 12)
+        self.assertEqual(perfdata['sdc_temperature'], 32)
+        self.assertEqual(perfdata['drives_total'], 3)
+        self.assertEqual(perfdata['drives_failed'], 1)
+
+        log.debug("Testing a critical disk among them.")
+        (plugin, result) = self.run_plugin(outputs, ['-w', '4', '-c', '10', '--no-json'])
+        self.assertEqual(result.exit_value, nagios.state.critical)
+        self.assertIn("SMART state of 3 drives: 0 ok, 2 warning, 1 critical.", result.msg)
+        for cmd_args in plugin.smartctl_calls:
+            self.assertNotIn('--json', cmd_args)
+
+    #--------------------------------------------------------------------------
+    def test_timeout(self):
+
+        log.info("Testing killing of hanging smartctl processes after the timeout.")
+
+        smartctl = os.path.join(self.tmp_dir, 'smartctl')
+        with open(smartctl, 'w') as fh:
+            fh.write("#!/bin/sh\nexec sleep 60\n")
+
+        devices = ['/dev/sda', '/dev/sdb', '/dev/sdc']
+        plugin = HangingSmartStatePlugin(devices)
+        plugin.parse_args(['-G', 'sd*', '-t', '1', '-P', '2', '-w', '8', '-c', '20'])
+
+        start = time.time()
+        with self.assertRaises(FakeExitError) as cm:
+            plugin.check_multiple_disks()
+        log.debug("Got exit: %s", cm.exception)
+        self.assertEqual(cm.exception.exit_value, nagios.state.unknown)
+        self.assertIn("Timeout after 1 secs on checking 3 disks.", cm.exception.msg)
+
+        self.assertEqual(len(plugin.killed_cmds), 2)
+        for cmd_obj in plugin.killed_cmds:
+            while cmd_obj.poll() is None and time.time() - start < 10:
+                time.sleep(0.05)
+            self.assertIsNotNone(cmd_obj.returncode, "Process %d not killed." % (cmd_obj.pid))
+        self.assertLess(time.time() - start, 10)
+
+        # the worker threads are finished and no other process was started
+        while plugin._running_cmds and time.time() - start < 10:
+            time.sleep(0.05)
+        self.assertEqual(plugin._running_cmds, set())
+
+    #--------------------------------------------------------------------------
+    def test_disk_errors(self):
+
+        log.info("Testing errors on checking single disks out of multiple disks.")
+
+        outputs = {
+            '/dev/sda': 'sata',
+            '/dev/sdb': SmartctlError("Got no output from smartctl /dev/sdb."),
+            '/dev/sdc': RuntimeError("Something unexpected."),
+            '/dev/sdd': 'sas',
+        }
+        (plugin, result) = self.run_plugin(outputs, ['-w', '8', '-c', '20'])
+        self.assertEqual(result.exit_value, nagios.state.warning)
+        self.assertIn("SMART state of 4 drives: 1 ok, 1 warning, 2 unknown.", result.msg)
+        self.assertIn("Drive /dev/sdb: Got no output from smartctl /dev/sdb.", result.msg)
+        self.assertIn("Drive /dev/sdc: RuntimeError: Something unexpected.", result.msg)
+
+        perfdata = dict((pdata.label, pdata.value) for pdata in plugin.perfdata)
+        self.assertNotIn('sdb_gd_list', perfdata)
+        self.assertNotIn('sdc_gd_list', perfdata)
+        self.assertEqual(perfdata['sdd_gd_list'], 12)
+        self.assertEqual(perfdata['drives_failed'], 3)
+
+        log.debug("Testing only errors besides of good disks.")
+        del outputs['/dev/sdd']
+        (plugin, result) = self.run_plugin(outputs, ['-w', '8', '-c', '20'])
+        self.assertEqual(result.exit_value, nagios.state.unknown)
+        self.assertIn("SMART state of 3 drives: 1 ok, 2 unknown.", result.msg)
+
+    #--------------------------------------------------------------------------
+    def fill_history(self, records):
+
+        history = SmartHistory(os.path.join(self.tmp_dir, 'smart_history.db'))
+        history.open()
+        for (disk, disk_data, full, age) in records:
+            history.add(disk, False, disk_data, full=full, timestamp=(time.time() - age))
+        history.close()
+
+    #--------------------------------------------------------------------------
+    def get_history(self):
+
+        history = SmartHistory(os.path.join(self.tmp_dir, 'smart_history.db'))
+        history.open()
+        last_full = history.last_full_records()
+        references = history.reference_records(0)
+        history.close()
+        return (last_full, references)
+
+    #--------------------------------------------------------------------------
+    def sata_data(self, **kwargs):
+
+        with open(os.path.join(FIXTURE_DIR, 'sata.txt')) as fh:
+            disk_data = eval_smartctl_output(fh.read())[1]
+        disk_data.update(kwargs)
+        return disk_data
+
+    #--------------------------------------------------------------------------
+    def test_light_query(self):
+
+        log.info("Testing the choice between a light and a full query of SMART data.")
+
+        history_args = ['--history', os.path.join(self.tmp_dir, 'smart_history.db')]
+        for json_args in ([], ['--no-json']):
+
+            plugin = CannedSmartStatePlugin({'/dev/sda': 'sata'})
+            plugin.parse_args(['-G', 'sd*'] + history_args + json_args)
+            last_full = self.get_history()[0].get('/dev/sda')
+
+            log.debug("Testing a full query without a previous record.")
+            (is_sas, disk_data, reason, full) = plugin.query_smart_data(
+                device='/dev/sda', last_full=None)
+            self.assertTrue(full)
+            self.assertEqual(disk_data['nr_grown_defects'], 6)
+            self.assertEqual(plugin.smartctl_calls[-1][0], '-x')
+
+            log.debug("Testing a light query with an unchanged recent record.")
+            self.fill_history([('/dev/sda', self.sata_data(), True, 3600)])
+            last_full = self.get_history()[0]['/dev/sda']
+            (is_sas, disk_data, reason, full) = plugin.query_smart_data(
+                device='/dev/sda', last_full=last_full)
+            self.assertFalse(full)
+            self.assertEqual(plugin.smartctl_calls[-1][:2], ['-H', '-A'])
+            self.assertEqual(disk_data['serial'], 'Z1X0ABCD')
+            self.assertEqual(disk_data['model'], 'ST2000NM0033-9ZM175')
+            self.assertEqual(disk_data['nr_grown_defects'], 6)
+
+            log.debug("Testing a full query after a changed number of grown defects.")
+            last_full = dict(last_full, grown_defects=5)
+            count = len(plugin.smartctl_calls)
+            (is_sas, disk_data, reason, full) = plugin.query_smart_data(
+                device='/dev/sda', last_full=last_full)
+            self.assertTrue(full)
+            self.assertEqual(
+                [cmd_args[0] for cmd_args in plugin.smartctl_calls[count:]], ['-H', '-x'])
+
+            log.debug("Testing a full query after a changed health state.")
+            last_full = dict(last_full, grown_defects=6, health_state='FAILED')
+            (is_sas, disk_data, reason, full) = plugin.query_smart_data(
+                device='/dev/sda', last_full=last_full)
+            self.assertTrue(full)
+            self.assertEqual(disk_data['health_state'], 'PASSED')
+
+            os.remove(os.path.join(self.tmp_dir, 'smart_history.db'))
+
+    #--------------------------------------------------------------------------
+    def test_history_expiry(self):
+
+        log.info("Testing the expiry of the last full query in the SMART history.")
+
+        history_file = os.path.join(self.tmp_dir, 'smart_history.db')
+        self.fill_history([
+            ('/dev/sda', self.sata_data(), True, 3600 * 2),
+            ('/dev/sdb', self.sata_data(), True, 3600 * 30),
+        ])
+        outputs = {'/dev/sda': 'sata', '/dev/sdb': 'sata'}
+
+        (plugin, result) = self.run_plugin(outputs, ['-w', '8', '--history', history_file])
+        self.assertEqual(result.exit_value, nagios.state.ok)
+        calls = dict((cmd_args[-1], cmd_args[0]) for cmd_args in plugin.smartctl_calls)
+        self.assertEqual(calls, {'/dev/sda': '-H', '/dev/sdb': '-x'})
+
+        (last_full, references) = self.get_history()
+        self.assertLess(time.time() - last_full['/dev/sda']['timestamp'], 3600 * 2 + 60)
+        self.assertGreater(time.time() - last_full['/dev/sda']['timestamp'], 3600 * 2 - 60)
+        self.assertLess(time.time() - last_full['/dev/sdb']['timestamp'], 60)
+
+        log.debug("Testing a shorter interval of full queries.")
+        (plugin, result) = self.run_plugin(
+            outputs, ['--history', history_file, '--full-interval', '1'])
+        calls = dict((cmd_args[-1], cmd_args[0]) for cmd_args in plugin.smartctl_calls)
+        self.assertEqual(calls, {'/dev/sda': '-x', '/dev/sdb': '-H'})
+
+        log.debug("Testing always full queries.")
+        (plugin, result) = self.run_plugin(
+            outputs, ['--history', history_file, '--full-interval', '0'])
+        self.assertEqual([cmd_args[0] for cmd_args in plugin.smartctl_calls], ['-x', '-x'])
+
+    #--------------------------------------------------------------------------
+    def test_replaced_disk(self):
+
+        log.info("Testing the detection of a replaced disk by the SMART history.")
+
+        history_file = os.path.join(self.tmp_dir, 'smart_history.db')
+        self.fill_history([
+            ('/dev/sda', self.sata_data(nr_grown_defects=0), False, 86400 * 3),
+            ('/dev/sda', self.sata_data(nr_grown_defects=2), True, 86400 * 2),
+            ('/dev/sdb', self.sata_data(nr_grown_defects=0, serial='Z1X0OLD0'), False,
+                86400 * 3),
+            ('/dev/sdb', self.sata_data(nr_grown_defects=2, serial='Z1X0OLD0'), True,
+                86400 * 2),
+        ])
+        outputs = {'/dev/sda': 'sata', '/dev/sdb': 'sata'}
+
+        (plugin, result) = self.run_plugin(
+            outputs, ['-w', '8', '--history', history_file, '--rate-warning', '1'])
+        self.assertEqual(result.exit_value, nagios.state.warning)
+        self.assertIn("Drive /dev/sda: Grown defects increasing by 2.00 per day.", result.msg)
+        self.assertNotIn("/dev/sdb", result.msg)
+
+        perfdata = dict((pdata.label, pdata.value) for pdata in plugin.perfdata)
+        self.assertAlmostEqual(perfdata['sda_gd_rate'], 2.0, places=2)
+        self.assertNotIn('sdb_gd_rate', perfdata)
+
+        # the records of the replaced disk are dropped
+        (last_full, references) = self.get_history()
+        self.assertEqual(references['/dev/sda']['grown_defects'], 0)
+        self.assertEqual(references['/dev/sdb']['grown_defects'], 6)
+        self.assertEqual(references['/dev/sdb']['serial'], 'Z1X0ABCD')
+        self.assertEqual(last_full['/dev/sdb']['serial'], 'Z1X0ABCD')
+
+#==============================================================================
+
+if __name__ == '__main__':
+
+    verbose = get_arg_verbose()
+    if verbose is None:
+        verbose = 0
+    init_root_logger(verbose)
+
+    log.info("Starting tests ...")
+
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+
+    suite.addTest(TestSmartctlOutput('test_sata', verbose))
+    suite.addTest(TestSmartctlOutput('test_sata_light', verbose))
+    suite.addTest(TestSmartctlOutput('test_sas', verbose))
+    suite.addTest(TestSmartctlOutput('test_nvme', verbose))
+    suite.addTest(TestSmartctlOutput('test_nvme_smart_log', verbose))
+    suite.addTest(TestSmartctlOutput('test_nvme_sysfs', verbose))
+    suite.addTest(TestSmartctlOutput('test_no_smart', verbose))
+    suite.addTest(TestSmartHistory('test_records', verbose))
+    suite.addTest(TestSmartHistory('test_forget_and_retention', verbose))
+    suite.addTest(TestSmartHistory('test_open_error', verbose))
+    suite.addTest(TestSmartStatePlugin('test_multiple_disks', verbose))
+    suite.addTest(TestSmartStatePlugin('test_timeout', verbose))
+    suite.addTest(TestSmartStatePlugin('test_disk_errors', verbose))
+    suite.addTest(TestSmartStatePlugin('test_light_query', verbose))
+    suite.addTest(TestSmartStatePlugin('test_history_expiry', verbose))
+    suite.addTest(TestSmartStatePlugin('test_replaced_disk', verbose))
+
+    runner = unittest.TextTestRunner(verbosity = verbose)
+
+    result = runner.run(suite)
+
+#==============================================================================
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,322 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+@author: Frank Brehm
+@contact: frank.brehm@profitbricks.com
+@organization: Profitbricks GmbH
+@copyright: © 2010 - 2016 by Profitbricks GmbH
+@license: GPL3
+@summary: test script (and module) for unit tests on the socket transport
+          of the PPD and VCB instance checks
+'''
+
+import unittest
+import os
+import sys
+import logging
+import socket
+import threading
+import time
+import re
+
+libdir = os.path.abspath(os.path.join(os.path.dirname(sys.argv[0]), '..'))
+sys.path.insert(0, libdir)
+
+import general
+from general import ColoredFormatter, get_arg_verbose, init_root_logger
+from general import NagiosPluginTestcase
+
+import nagios
+
+from nagios.plugins.socket_transport import SocketTransportError
+from nagios.plugins.socket_transport import NoListeningError
+from nagios.plugins.socket_transport import RequestStatusError
+from nagios.plugins.socket_transport import RequestStatus
+from nagios.plugins.socket_transport import ReplyReader
+from nagios.plugins.socket_transport import SocketTransport
+from nagios.plugins.socket_transport import sort_addresses
+from nagios.plugins.socket_transport import skip_status_records
+from nagios.plugins.socket_transport import STATUS
+
+log = logging.getLogger(__name__)
+
+re_end_of_data = re.compile(r'^\s*end_of_data\s*=\s*true', re.MULTILINE)
+
+
+def is_complete(data):
+    return bool(re_end_of_data.search(data))
+
+
+#==============================================================================
+class TestSocketTransport(NagiosPluginTestcase):
+
+    #--------------------------------------------------------------------------
+    def setUp(self):
+
+        self.listeners = []
+        self.connections = 0
+
+    #--------------------------------------------------------------------------
+    def tearDown(self):
+
+        for sock in self.listeners:
+            sock.close()
+
+    #--------------------------------------------------------------------------
+    def start_daemon(self, reply, keep_open=True):
+        """
+        Starts a daemon on 127.0.0.1 answering every request on a connection
+        with the given reply.
+        """
+
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(5)
+        self.listeners.append(listener)
+
+        def handle(conn):
+            try:
+                while conn.recv(4096):
+                    conn.sendall(reply)
+                    if not keep_open:
+                        break
+            except socket.error:
+                pass
+            finally:
+                conn.close()
+
+        def serve():
+            while True:
+                try:
+                    (conn, addr) = listener.accept()
+                except socket.error:
+                    return
+                self.connections += 1
+                t = threading.Thread(target=handle, args=(conn, ))
+                t.daemon = True
+                t.start()
+
+        thread = threading.Thread(target=serve)
+        thread.daemon = True
+        thread.start()
+
+        return listener.getsockname()[1]
+
+    #--------------------------------------------------------------------------
+    def test_request_status(self):
+
+        log.info("Testing parsing of status replies.")
+
+        status = RequestStatus.from_message(' 1,5,0,PPD Version [0.9.48]\n')
+        self.assertEqual(status.job_id, '1')
+        self.assertEqual(status.state, 5)
+        self.assertEqual(status.error_code, 0)
+        self.assertEqual(status.message, 'PPD Version [0.9.48]')
+        self.assertEqual(str(status), '1,5,0,PPD Version [0.9.48]')
+
+        self.assertRaises(RequestStatusError, RequestStatus.from_message, None)
+        self.assertRaises(RequestStatusError, RequestStatus.from_message, 'bla')
+        self.assertRaises(RequestStatusError, RequestStatus.from_message, '1,5,0,a\nb')
+
+        regex = re.compile(r'^([^,]+),(\d+),(\d+),(.*)$', re.DOTALL)
+        status = RequestStatus.from_message('1,5,0,a\nb', regex)
+        self.assertEqual(status.message, 'a\nb')
+
+    #--------------------------------------------------------------------------
+    def test_skip_progress(self):
+
+        log.info("Testing skipping of progress records.")
+
+        regex = re.compile(r'^([^,]+),(\d+),(\d+),(.*)$', re.DOTALL)
+
+        def pop_progress_lines(message):
+            # the former way of check_vcb_instance
+            rstatus = RequestStatus.from_message(message, regex)
+            while rstatus.state == STATUS['progress']:
+                lines = message.splitlines()
+                lines.pop(0)
+                message = '\n'.join(lines)
+                rstatus = RequestStatus.from_message(message, regex)
+            return rstatus
+
+        messages = (
+            '2,5,0,VCB ok\nVCB_VERSION=8.6.29',
+            '2,3,0,progress 1\n2,3,0,progress 2\r\n 2,5,0,VCB ok\nVCB_VERSION=8.6.29',
+            '2,3,0,progress\n2,4,1,failed\n2,3,0,not skipped',
+            '2,3,0,progress without comma\nbla\n2,3,0,progress\n2,5,0,ok',
+        )
+        for message in messages:
+            expected = pop_progress_lines(message)
+            got = RequestStatus.from_message(message[skip_status_records(message):], regex)
+            self.assertEqual(str(got), str(expected))
+
+        for message in ('bla', '2,3,0,progress', '2,3,0,progress\n'):
+            self.assertRaises(
+                RequestStatusError, RequestStatus.from_message,
+                message[skip_status_records(message):], regex)
+
+        log.debug("Testing a reply with many progress records.")
+        message = '2,3,0,progress\n' * 50000 + '2,5,0,VCB_VERSION=8.6.29'
+        begin = time.time()
+        pos = skip_status_records(message)
+        duration = time.time() - begin
+        self.assertEqual(message[pos:], '2,5,0,VCB_VERSION=8.6.29')
+        self.assertLess(duration, 2)
+
+    #--------------------------------------------------------------------------
+    def test_sort_addresses(self):
+
+        log.info("Testing the order of the connection attempts.")
+
+        v6 = socket.AF_INET6
+        v4 = socket.AF_INET
+        addresses = [
+            (v6, 1, 6, '', ('::1', 1)),
+            (v6, 1, 6, '', ('::2', 1)),
+            (v6, 1, 6, '', ('::3', 1)),
+            (v4, 1, 6, '', ('127.0.0.1', 1)),
+            (v4, 1, 6, '', ('127.0.0.2', 1)),
+        ]
+        result = [x[4][0] for x in sort_addresses(addresses)]
+        self.assertEqual(result, ['::1', '127.0.0.1', '::2', '127.0.0.2', '::3'])
+
+        result = [x[4][0] for x in sort_addresses(list(reversed(addresses)))]
+        self.assertEqual(result, ['127.0.0.2', '::3', '127.0.0.1', '::2', '::1'])
+
+        self.assertEqual(sort_addresses([]), [])
+
+    #--------------------------------------------------------------------------
+    def test_reader(self):
+
+        log.info("Testing the framed reader of replies.")
+
+        reply = u'2,5,0,Grüße\nend_of_data=true\n'.encode('utf-8')
+        split = reply.index(b'\xc3') + 1
+
+        (left, right) = socket.socketpair()
+        try:
+            reader = ReplyReader(16, is_complete)
+            left.sendall(reply[:split])
+            self.assertEqual(reader.receive(right), split)
+            self.assertFalse(reader.complete)
+
+            left.sendall(reply[split:])
+            while not reader.complete:
+                self.assertTrue(reader.receive(right))
+            self.assertEqual(reader.received, len(reply))
+            if sys.version_info[0] > 2:
+                self.assertEqual(reader.text, reply.decode('utf-8'))
+            else:
+                self.assertEqual(reader.text, reply)
+
+            left.close()
+            self.assertEqual(reader.receive(right), 0)
+            self.assertTrue(reader.eof)
+        finally:
+            left.close()
+            right.close()
+
+    #--------------------------------------------------------------------------
+    def test_keep_alive(self):
+
+        log.info("Testing reusing of the connection.")
+
+        reply = b'2,5,0,VCB_VERSION=8.6.29\nend_of_data=true\n'
+        port = self.start_daemon(reply)
+
+        transport = SocketTransport('127.0.0.1', port, 2, idle_interval=1, is_complete=is_complete)
+        try:
+            for i in range(3):
+                begin = time.time()
+                result = transport.send('<pjd/>')
+                duration = time.time() - begin
+                if self.verbose > 2:
+                    log.debug("Got timings: %r", transport.timings)
+                self.assertEqual(result, reply.decode('utf-8'))
+                self.assertEqual(transport.reused, i > 0)
+                self.assertLess(duration, 0.5)
+                self.assertIn('firstbyte', transport.timings)
+                self.assertIn('total', transport.timings)
+                if i:
+                    self.assertNotIn('connect', transport.timings)
+                else:
+                    self.assertIn('dns', transport.timings)
+                    self.assertIn('connect', transport.timings)
+        finally:
+            transport.close()
+        self.assertEqual(self.connections, 1)
+
+        log.debug("Testing a daemon closing the connection after the reply.")
+        port = self.start_daemon(reply, keep_open=False)
+        transport = SocketTransport('127.0.0.1', port, 2, idle_interval=1, is_complete=is_complete)
+        try:
+            transport.send('<pjd/>')
+            time.sleep(0.1)
+            self.assertEqual(transport.send('<pjd/>'), reply.decode('utf-8'))
+            self.assertFalse(transport.reused)
+        finally:
+            transport.close()
+
+    #--------------------------------------------------------------------------
+    def test_connect(self):
+
+        log.info("Testing connecting to all addresses of a host.")
+
+        port = self.start_daemon(b'1,5,0,PPD Version [0.9.48]\n', keep_open=False)
+        addresses = [x[4][0] for x in socket.getaddrinfo(
+            'localhost', port, socket.AF_UNSPEC, socket.SOCK_STREAM)]
+        if '127.0.0.1' not in addresses:
+            self.skipTest("localhost doesn't resolve to 127.0.0.1.")
+
+        # the daemon is listening on 127.0.0.1 only
+        transport = SocketTransport('localhost', port, 2, idle_interval=0.1)
+        result = transport.send('<pjd/>')
+        self.assertEqual(result, '1,5,0,PPD Version [0.9.48]\n')
+        self.assertEqual(transport.sockaddr[0], '127.0.0.1')
+        self.assertIsNone(transport.sock)
+
+        log.debug("Testing a not listening daemon.")
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        transport = SocketTransport('127.0.0.1', port, 2)
+        self.assertRaises(NoListeningError, transport.send, '<pjd/>')
+
+        transport = SocketTransport('not-existing.invalid', port, 2)
+        self.assertRaises(NoListeningError, transport.send, '<pjd/>')
+
+        log.debug("Testing canceling of a request.")
+        port = self.start_daemon(b'')
+        transport = SocketTransport('127.0.0.1', port, 2, should_stop=lambda: True)
+        self.assertRaises(SocketTransportError, transport.send, '<pjd/>')
+
+#==============================================================================
+
+if __name__ == '__main__':
+
+    verbose = get_arg_verbose()
+    if verbose is None:
+        verbose = 0
+    init_root_logger(verbose)
+
+    log.info("Starting tests ...")
+
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+
+    suite.addTest(TestSocketTransport('test_request_status', verbose))
+    suite.addTest(TestSocketTransport('test_skip_progress', verbose))
+    suite.addTest(TestSocketTransport('test_sort_addresses', verbose))
+    suite.addTest(TestSocketTransport('test_reader', verbose))
+    suite.addTest(TestSocketTransport('test_keep_alive', verbose))
+    suite.addTest(TestSocketTransport('test_connect', verbose))
+
+    runner = unittest.TextTestRunner(verbosity = verbose)
+
+    result = runner.run(suite)
+
+#==============================================================================
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+@author: Frank Brehm
+@contact: frank.brehm@profitbricks.com
+@organization: Profitbricks GmbH
+@copyright: © 2010 - 2016 by Profitbricks GmbH
+@license: GPL3
+@summary: test script (and module) for unit tests on the state store
+          of counter samples between the runs of a plugin
+'''
+
+import unittest
+import os
+import sys
+import logging
+import tempfile
+import shutil
+
+libdir = os.path.abspath(os.path.join(os.path.dirname(sys.argv[0]), '..'))
+sys.path.insert(0, libdir)
+
+import general
+from general import ColoredFormatter, get_arg_verbose, init_root_logger
+from general import NagiosPluginTestcase
+
+import nagios
+
+import nagios.plugin.statestore
+from nagios.plugin.statestore import StateStoreError
+from nagios.plugin.statestore import StateStore
+from nagios.plugin.statestore import Sample
+from nagios.plugin.statestore import counter_rates
+from nagios.plugin.statestore import monotonic
+
+log = logging.getLogger(__name__)
+
+
+#==============================================================================
+class TestStateStore(NagiosPluginTestcase):
+
+    #--------------------------------------------------------------------------
+    def setUp(self):
+
+        self.state_dir = tempfile.mkdtemp()
+        self.boot_id_file = nagios.plugin.statestore.BOOT_ID_FILE
+        self.set_boot_id('6e8b2f4a-0c7d-4b8e-9a1f-3d2c5b7e9f01')
+
+    #--------------------------------------------------------------------------
+    def tearDown(self):
+
+        nagios.plugin.statestore.BOOT_ID_FILE = self.boot_id_file
+        shutil.rmtree(self.state_dir)
+
+    #--------------------------------------------------------------------------
+    def set_boot_id(self, boot_id):
+
+        filename = os.path.join(self.state_dir, 'boot_id')
+        with open(filename, 'w') as fh:
+            fh.write(boot_id + '\n')
+        nagios.plugin.statestore.BOOT_ID_FILE = filename
+
+    #--------------------------------------------------------------------------
+    def test_store(self):
+
+        log.info("Testing saving and loading of samples.")
+
+        store = StateStore('check_test', state_dir=self.state_dir)
+        self.assertEqual(store.filename, os.path.join(self.state_dir, 'check_test.state'))
+        self.assertEqual(store.load(), {})
+
+        samples = {
+            'eth0': Sample(1000.25, {'rx_bytes': 2 ** 64 - 1, 'tx_bytes': 0}),
+            u'/system.slice/Grüße': Sample(1000.5, {'rx_bytes': 12}),
+            'empty': Sample(999.0, {}),
+        }
+        self.assertEqual(store.update(samples), {})
+        self.assertEqual(store.load(), samples)
+
+        previous = store.update({'eth0': Sample(1010.0, {'rx_bytes': 5})})
+        self.assertEqual(previous, samples)
+        loaded = store.load()
+        self.assertEqual(sorted(loaded.keys()), sorted(samples.keys()))
+        self.assertEqual(loaded['eth0'], (1010.0, {'rx_bytes': 5}))
+        self.assertEqual(loaded['eth0'].timestamp, 1010.0)
+
+        store.update({'eth1': (1020.0, {'rx_bytes': 1})}, replace=True)
+        self.assertEqual(list(store.load().keys()), ['eth1'])
+
+        self.assertRaises(StateStoreError, store.save, {'eth0': (1.0, {'rx_bytes': -1})})
+
+        log.debug("Testing a state file in a not existing directory.")
+        store = StateStore('check_test', state_dir=os.path.join(self.state_dir, 'bla'))
+        self.assertRaises(StateStoreError, store.update, {})
+
+    #--------------------------------------------------------------------------
+    def test_invalid(self):
+
+        log.info("Testing invalid and outdated state files.")
+
+        store = StateStore('check_test', filename=os.path.join(self.state_dir, 'test.state'))
+        store.save({'eth0': Sample(1000.0, {'rx_bytes': 42})})
+        with open(store.filename, 'rb') as fh:
+            data = fh.read()
+
+        for garbage in (data[:-1], data + b'\0', b'# some text file\n', b''):
+            with open(store.filename, 'wb') as fh:
+                fh.write(garbage)
+            self.assertEqual(store.load(), {})
+
+        with open(store.filename, 'wb') as fh:
+            fh.write(data)
+        self.assertEqual(len(store.load()), 1)
+
+        self.set_boot_id('0a1b2c3d-4e5f-6071-8293-a4b5c6d7e8f9')
+        self.assertEqual(store.load(), {})
+
+    #--------------------------------------------------------------------------
+    def test_rates(self):
+
+        log.info("Testing evaluation of the rates of counters.")
+
+        old = Sample(100.0, {'a': 10, 'b': 2 ** 32 - 10, 'c': 50, 'd': 1})
+        new = Sample(110.0, {'a': 30, 'b': 10, 'c': 40, 'e': 1})
+        self.assertEqual(counter_rates(old, new, {'b': 32}), {'a': 2.0, 'b': 2.0})
+        self.assertEqual(counter_rates(old, new), {'a': 2.0})
+        self.assertEqual(counter_rates(new, old), {})
+
+        sample = Sample.now({})
+        self.assertLessEqual(sample.timestamp, monotonic())
+
+#==============================================================================
+
+if __name__ == '__main__':
+
+    verbose = get_arg_verbose()
+    if verbose is None:
+        verbose = 0
+    init_root_logger(verbose)
+
+    log.info("Starting tests ...")
+
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+
+    suite.addTest(TestStateStore('test_store', verbose))
+    suite.addTest(TestStateStore('test_invalid', verbose))
+    suite.addTest(TestStateStore('test_rates', verbose))
+
+    runner = unittest.TextTestRunner(verbosity = verbose)
+
+    result = runner.run(suite)
+
+#==============================================================================
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+@author: Frank Brehm
+@contact: frank.brehm@profitbricks.com
+@organization: Profitbricks GmbH
+@copyright: © 2010 - 2016 by Profitbricks GmbH
+@license: GPL3
+@summary: test script (and module) for unit tests on the taskstats sampler
+          of the block I/O delays of processes
+'''
+
+import unittest
+import os
+import sys
+import logging
+import struct
+import errno
+import tempfile
+import shutil
+
+libdir = os.path.abspath(os.path.join(os.path.dirname(sys.argv[0]), '..'))
+sys.path.insert(0, libdir)
+
+import general
+from general import ColoredFormatter, get_arg_verbose, init_root_logger
+from general import NagiosPluginTestcase
+
+import nagios
+
+from nagios.plugins.taskstats import TaskStatsError
+from nagios.plugins.taskstats import TaskStatsConnection
+from nagios.plugins.taskstats import BlkioDelaySampler
+from nagios.plugins.taskstats import parse_replies
+from nagios.plugins.taskstats import list_pids
+from nagios.plugins.taskstats import NLMSG_ERROR
+
+from nagios.plugin.statestore import Sample
+
+log = logging.getLogger(__name__)
+
+FAMILY_ID = 22
+
+
+def stats_reply(seq, pid, delay):
+    """Builds a taskstats reply like the kernel."""
+
+    stats = bytearray(328)
+    struct.pack_into('=Q', stats, 40, delay)
+    stats = bytes(stats)
+    inner = struct.pack('=HHI', 8, 2, pid)
+    inner += struct.pack('=HH', 4 + len(stats), 3) + stats
+    attrs = struct.pack('=HH', 4 + len(inner), 5) + inner
+    body = struct.pack('=BBH', 1, 1, 0) + attrs
+    return struct.pack('=IHHII', 16 + len(body), FAMILY_ID, 0, seq, 0) + body
+
+
+def error_reply(seq, error):
+    body = struct.pack('=i', -error) + struct.pack('=IHHII', 28, FAMILY_ID, 1, seq, 0)
+    return struct.pack('=IHHII', 16 + len(body), NLMSG_ERROR, 0, seq, 0) + body
+
+
+#==============================================================================
+class FakeConnection(object):
+
+    def __init__(self, delays):
+        self.delays = delays
+        self.closed = False
+
+    def blkio_delays(self, pids):
+        return [float(self.delays.get(pid, -1)) for pid in pids]
+
+    def close(self):
+        self.closed = True
+
+
+#==============================================================================
+class TestTaskStats(NagiosPluginTestcase):
+
+    #--------------------------------------------------------------------------
+    def setUp(self):
+
+        self.proc_dir = tempfile.mkdtemp()
+
+    #--------------------------------------------------------------------------
+    def tearDown(self):
+
+        shutil.rmtree(self.proc_dir)
+
+    #--------------------------------------------------------------------------
+    def set_pids(self, pids):
+
+        for name in os.listdir(self.proc_dir):
+            os.rmdir(os.path.join(self.proc_dir, name))
+        for pid in pids:
+            os.mkdir(os.path.join(self.proc_dir, str(pid)))
+
+    #--------------------------------------------------------------------------
+    def test_parse_replies(self):
+
+        log.info("Testing parsing of taskstats replies.")
+
+        data = stats_reply(7, 100, 123456789) + error_reply(8, errno.ESRCH)
+        data += stats_reply(9, 300, 0)
+        buf = bytearray(len(data) + 100)
+        buf[:len(data)] = data
+
+        results = {}
+        parse_replies(buf, len(data), FAMILY_ID, results)
+        self.assertEqual(results, {7: 123456789, 8: -1, 9: 0})
+
+        data = error_reply(10, errno.EPERM)
+        self.assertRaises(
+            TaskStatsError, parse_replies, bytearray(data), len(data), FAMILY_ID, {})
+
+    #--------------------------------------------------------------------------
+    def test_sampler(self):
+
+        log.info("Testing sampling of block I/O delays.")
+
+        self.set_pids([1, 2, 3, 'self'])
+        delays = {1: 0, 2: 1000, 3: 5000}
+        conn = FakeConnection(delays)
+        sampler = BlkioDelaySampler(conn, proc_dir=self.proc_dir)
+        sampler.sample()
+        self.assertEqual(sorted(sampler.pids), [1, 2, 3])
+
+        # process 3 vanished, process 4 is new
+        self.set_pids([1, 2, 4])
+        delays.update({2: 1000 + 10 ** 9, 4: 10 ** 9})
+        sampler.sample()
+        sampler.last_time = sampler.first_time[sampler.slots[1]] + 2.0
+
+        alive_pids = [pid for (pid, alive) in zip(sampler.pids, sampler.alive) if alive]
+        percents = dict(zip(alive_pids, sampler.delay_percents()))
+        self.assertEqual(sorted(percents.keys()), [1, 2, 4])
+        self.assertEqual(percents[1], 0.0)
+        self.assertAlmostEqual(percents[2], 50.0)
+        self.assertEqual(percents[4], 0.0)
+
+        sampler.close()
+        self.assertTrue(conn.closed)
+
+    #--------------------------------------------------------------------------
+    def test_restore(self):
+
+        log.info("Testing restoring of the samples of a previous run.")
+
+        self.set_pids([1, 2, 5])
+        conn = FakeConnection({1: 10 ** 9, 2: 4 * 10 ** 9, 5: 0})
+        sampler = BlkioDelaySampler(conn, proc_dir=self.proc_dir)
+        sampler.restore({
+            1: Sample(sampler.last_time or 0.0, {'blkio_delay': 10 ** 9}),
+            2: Sample(0.0, {'blkio_delay': 2 * 10 ** 9}),
+            3: Sample(0.0, {'blkio_delay': 0}),
+        })
+        sampler.sample()
+        for pid in (1, 2, 3):
+            sampler.first_time[sampler.slots[pid]] = sampler.last_time - 4.0
+
+        alive_pids = [pid for (pid, alive) in zip(sampler.pids, sampler.alive) if alive]
+        percents = dict(zip(alive_pids, sampler.delay_percents()))
+        self.assertEqual(percents, {1: 0.0, 2: 50.0, 5: 0.0})
+
+        snapshot = sampler.snapshot()
+        self.assertEqual(sorted(snapshot.keys()), [1, 2, 5])
+        self.assertEqual(snapshot[2], (sampler.last_time, {'blkio_delay': 4 * 10 ** 9}))
+
+    #--------------------------------------------------------------------------
+    def test_netlink(self):
+
+        log.info("Testing requests to the taskstats netlink family.")
+
+        try:
+            conn = TaskStatsConnection(batch_size=8)
+        except TaskStatsError as e:
+            self.skipTest(str(e))
+
+        try:
+            pids = list_pids()
+            self.assertIn(os.getpid(), pids)
+            try:
+                delays = conn.blkio_delays(pids)
+            except TaskStatsError as e:
+                self.skipTest(str(e))
+            self.assertEqual(len(delays), len(pids))
+            self.assertGreaterEqual(delays[list(pids).index(os.getpid())], 0)
+
+            self.assertEqual(list(conn.blkio_delays([2 ** 22 + 1])), [-1.0])
+        finally:
+            conn.close()
+
+#==============================================================================
+
+if __name__ == '__main__':
+
+    verbose = get_arg_verbose()
+    if verbose is None:
+        verbose = 0
+    init_root_logger(verbose)
+
+    log.info("Starting tests ...")
+
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+
+    suite.addTest(TestTaskStats('test_parse_replies', verbose))
+    suite.addTest(TestTaskStats('test_sampler', verbose))
+    suite.addTest(TestTaskStats('test_restore', verbose))
+    suite.addTest(TestTaskStats('test_netlink', verbose))
+
+    runner = unittest.TextTestRunner(verbosity = verbose)
+
+    result = runner.run(suite)
+
+#==============================================================================
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+@author: Frank Brehm
+@contact: frank.brehm@profitbricks.com
+@organization: Profitbricks GmbH
+@copyright: © 2010 - 2016 by Profitbricks GmbH
+@license: GPL3
+@summary: test script (and module) for unit tests on the timed spans
+          of a plugin run
+'''
+
+import unittest
+import os
+import sys
+import logging
+import tempfile
+import shutil
+import json
+
+libdir = os.path.abspath(os.path.join(os.path.dirname(sys.argv[0]), '..'))
+sys.path.insert(0, libdir)
+
+import general
+from general import ColoredFormatter, get_arg_verbose, init_root_logger
+from general import NeedConfig
+
+import nagios
+
+from nagios.plugin.extended import ExtNagiosPlugin
+
+from nagios.plugin.timing import Timings
+from nagios.plugin.timing import timed
+
+log = logging.getLogger(__name__)
+
+
+#==============================================================================
+class TimedPlugin(ExtNagiosPlugin):
+
+    @timed()
+    def collect(self):
+        return self.exec_cmd(['true'])
+
+    @timed('evaluate')
+    def eval_data(self, data):
+        return len(data)
+
+
+#==============================================================================
+class TestTimings(NeedConfig):
+
+    #--------------------------------------------------------------------------
+    def setUp(self):
+
+        super(TestTimings, self).setUp()
+        self.tmp_dir = tempfile.mkdtemp()
+
+    #--------------------------------------------------------------------------
+    def tearDown(self):
+
+        shutil.rmtree(self.tmp_dir)
+        super(TestTimings, self).tearDown()
+
+    #--------------------------------------------------------------------------
+    def test_spans(self):
+
+        log.info("Testing measuring of timed spans.")
+
+        timings = Timings()
+        with timings.span('outer') as outer:
+            with timings.span('inner'):
+                pass
+            with timings.span('inner'):
+                pass
+        timings.add('api:vstorages', 0.5)
+
+        self.assertEqual(
+            [(span.name, span.depth) for span in timings.spans],
+            [('inner', 1), ('inner', 1), ('outer', 0), ('api:vstorages', 0)])
+        self.assertEqual(outer.duration, timings.spans[2].duration)
+        self.assertGreaterEqual(timings.spans[0].start, timings.spans[2].start)
+        self.assertEqual(
+            [(name, count) for (name, count, duration) in timings.totals()],
+            [('inner', 2), ('outer', 1), ('api:vstorages', 1)])
+        self.assertEqual(timings.as_dict()['totals']['api:vstorages']['duration'], 0.5)
+
+        log.debug("Testing spans of iterators.")
+        self.assertEqual(list(timings.timed_iter('list', range(3))), [0, 1, 2])
+        records = timings.timed_iter('aborted', range(3))
+        self.assertEqual(next(records), 0)
+        records.close()
+        self.assertEqual([span.name for span in timings.spans[-2:]], ['list', 'aborted'])
+
+        try:
+            with timings.span('failed'):
+                raise ValueError('bla')
+        except ValueError:
+            pass
+        self.assertEqual(timings.spans[-1].name, 'failed')
+        self.assertEqual(timings.spans[-1].depth, 0)
+
+    #--------------------------------------------------------------------------
+    def test_plugin(self):
+
+        log.info("Testing the timed spans of a plugin.")
+
+        filename = os.path.join(self.tmp_dir, 'timings.json')
+        plugin = TimedPlugin(usage='%(prog)s', verbose=self.verbose)
+        plugin.parse_args(['--timings', '--timings-json', filename])
+        plugin.collect()
+        plugin.read_file(__file__)
+        self.assertEqual(plugin.eval_data('bla'), 3)
+
+        names = [span.name for span in plugin.timings.spans]
+        self.assertEqual(names, ['argparse', 'exec:true', 'collect', 'read_file', 'evaluate'])
+
+        plugin.report_timings()
+        labels = [pdata.label for pdata in plugin.perfdata]
+        self.assertEqual(labels, [
+            'time_argparse', 'time_exec:true', 'time_collect', 'time_read_file',
+            'time_evaluate'])
+        self.assertEqual(plugin.perfdata[0].uom, 'ms')
+
+        with open(filename) as fh:
+            data = json.loads(fh.readline())
+        self.assertEqual(data['plugin'], plugin.shortname)
+        self.assertEqual([span['name'] for span in data['spans']], names)
+
+        log.debug("Testing a plugin without reporting of the timings.")
+        plugin = TimedPlugin(usage='%(prog)s', verbose=self.verbose)
+        plugin.parse_args([])
+        plugin.report_timings()
+        self.assertEqual(plugin.perfdata, [])
+
+#==============================================================================
+
+if __name__ == '__main__':
+
+    verbose = get_arg_verbose()
+    if verbose is None:
+        verbose = 0
+    init_root_logger(verbose)
+
+    log.info("Starting tests ...")
+
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+
+    suite.addTest(TestTimings('test_spans', verbose))
+    suite.addTest(TestTimings('test_plugin', verbose))
+
+    runner = unittest.TextTestRunner(verbosity = verbose)
+
+    result = runner.run(suite)
+
+#==============================================================================
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4